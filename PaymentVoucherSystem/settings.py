@@ -118,6 +118,41 @@ else:
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/6.0/topics/cache/
+# CACHE_BACKEND: 'locmem' (per process), 'file' (shared by processes on one host)
+# or 'redis' (any Redis-compatible server at CACHE_URL; needs the redis package).
+# vouchers.cache invalidates by bumping version keys in this cache, so every web
+# worker must share it: locmem is only the default with DEBUG on (single runserver
+# process); otherwise the default is 'file', and 'redis' is needed across hosts.
+CACHE_BACKEND = env('CACHE_BACKEND', default='locmem' if DEBUG else 'file')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': env('CACHE_URL', default='redis://127.0.0.1:6379/1'),
+            'KEY_PREFIX': 'pvs',
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': env('CACHE_DIR', default=str(BASE_DIR / 'cache')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'payment-voucher-system',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -162,6 +197,19 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Rendered voucher / form PDFs (vouchers.pdf_cache), evicted least recently used past the size cap
+PDF_CACHE_DIR = env('PDF_CACHE_DIR', default=str(BASE_DIR / 'pdf_cache'))
+PDF_CACHE_MAX_MB = env.int('PDF_CACHE_MAX_MB', default=500)
+
+# run_pdf_workers: processes rendering approved documents' PDF attachments, and renders
+# before a process is replaced (WeasyPrint memory is only returned when a process exits)
+PDF_RENDER_WORKERS = env.int('PDF_RENDER_WORKERS', default=2)
+PDF_RENDER_MAX_TASKS = env.int('PDF_RENDER_MAX_TASKS', default=50)
+
+# run_export_jobs: processes rendering the documents of a signature batch PDF bundle
+# (vouchers.bundles), started on the first bundle and kept for the next ones
+PDF_BUNDLE_WORKERS = env.int('PDF_BUNDLE_WORKERS', default=4)
+
 # Custom User Model
 AUTH_USER_MODEL = 'accounts.User'
 
@@ -1,7 +1,7 @@
 """
 Context processors for making data available to all templates.
 """
-from vouchers.models import PaymentVoucher, PaymentForm, SignatureBatch
+from vouchers.pending import get_pending_counts
 
 
 def pending_approvals(request):
@@ -10,37 +10,14 @@ def pending_approvals(request):
     Available as {{ pending_count }} in all templates.
 
     Counts both Payment Vouchers (PV) and Payment Forms (PF) pending user's approval.
-    For MD (role_level 5), shows ALL documents at PENDING_L5 (shared approval).
+    MD users (role_level 6) only see pending signature batches.
     For other levels, shows only documents assigned to them.
+
+    Counts are cached per user and invalidated on workflow changes (see vouchers.pending),
+    so most renders cost no queries.
     """
     if request.user.is_authenticated:
-        # System Admin — badge shows ALL pending documents across every level
-        if request.user.role_level == 99:
-            pv_count = PaymentVoucher.objects.filter(status__startswith='PENDING').count()
-            pf_count = PaymentForm.objects.filter(status__startswith='PENDING').count()
-            batch_count = 0
-        # MD users only work through batches - they don't see individual documents
-        elif request.user.role_level == 6:
-            pv_count = 0
-            pf_count = 0
-            batch_count = SignatureBatch.objects.filter(status='PENDING').count()
-        else:
-            # For other role levels, show only documents assigned to them
-            pv_count = PaymentVoucher.objects.filter(
-                current_approver=request.user
-            ).count()
-            pf_count = PaymentForm.objects.filter(
-                current_approver=request.user
-            ).count()
-            batch_count = 0
-
-        # Total pending count (only batches for MD, documents for others)
-        pending_count = pv_count + pf_count + batch_count
-
-        return {
-            'pending_count': pending_count,
-            'pending_batches': batch_count,
-        }
+        return get_pending_counts(request.user)
 
     return {
         'pending_count': 0,
@@ -0,0 +1,210 @@
+"""
+Combined PV/PF document listing for the dashboard.
+
+Payment Vouchers and Payment Forms live in two tables, but every dashboard list
+shows them mixed together. IndexedDocumentList lists them from the single
+DocumentIndex table instead: filtering, counting and ordering hit one narrow
+table, and only the documents on the requested page are loaded.
+
+Two pagination modes are supported:
+    - Offset: slice the list (what Django's Paginator does); good for numbered pages.
+    - Keyset: keyset_page() walks the list from an opaque cursor, so next/previous
+      navigation costs the same at any depth and never needs a COUNT.
+"""
+import base64
+import json
+
+from django.db.models import Q
+
+from vouchers.models import PaymentVoucher, PaymentForm, DocumentIndex
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded or belongs to another ordering"""
+
+
+def encode_cursor(sort, sort_key, pk, tag, forward):
+    """Serialize a list position as an opaque, URL-safe token"""
+    payload = [
+        sort,
+        sort_key.isoformat() if hasattr(sort_key, 'isoformat') else sort_key,
+        pk,
+        tag,
+        'n' if forward else 'p',
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, sort, field):
+    """
+    Return (sort_key, pk, tag, forward) for a token from encode_cursor().
+
+    Raises:
+        InvalidCursor: if the token is malformed or was issued for another sort
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        cursor_sort, sort_key, pk, tag, direction = json.loads(base64.urlsafe_b64decode(padded))
+        sort_key = field.to_python(sort_key)
+        pk = int(pk)
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {e}")
+
+    if cursor_sort != sort or direction not in ('n', 'p'):
+        raise InvalidCursor("Cursor does not match this list")
+
+    return sort_key, pk, tag, direction == 'n'
+
+
+def load_documents(keys):
+    """
+    Load PaymentVoucher / PaymentForm instances for (doc_type, id) pairs, preserving order.
+
+    One query per document type, with the creator and line items the list
+    templates show. Pairs whose document no longer exists are skipped.
+    """
+    keys = list(keys)
+    ids = {'pv': [], 'pf': []}
+    for doc_type, pk in keys:
+        ids[doc_type].append(pk)
+
+    documents = {}
+    for doc_type, model in (('pv', PaymentVoucher), ('pf', PaymentForm)):
+        if not ids[doc_type]:
+            continue
+        queryset = (
+            model.objects
+            .filter(pk__in=ids[doc_type])
+            .select_related('created_by')
+            .prefetch_related('line_items')
+        )
+        for document in queryset:
+            documents[(doc_type, document.pk)] = document
+
+    return [documents[key] for key in keys if key in documents]
+
+
+class KeysetPage:
+    """One page of a keyset-paginated IndexedDocumentList"""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class IndexedDocumentList:
+    """
+    Lazy, sliceable list over a DocumentIndex queryset.
+
+    Supports counting and slicing (what Django's Paginator needs) and
+    keyset_page(), all on one narrow table. It yields DocumentIndex rows, or
+    with hydrate=True loads the documents of the requested page only (what the
+    dashboard list templates need).
+
+    Usage:
+        IndexedDocumentList(DocumentIndex.objects.all(), doc_type='pf')
+        IndexedDocumentList(index_queryset).keyset_page(request.GET.get('cursor'))
+        IndexedDocumentList(index_queryset, sort='number', descending=False, hydrate=True)
+    """
+
+    SORT_FIELDS = ('created_at', 'updated_at', 'payment_date', 'payee_name', 'number')
+
+    # Sort keys that can be used with keyset pagination (non-nullable columns only)
+    KEYSET_SORTS = ('created_at', 'updated_at', 'payment_date')
+
+    ordered = True
+
+    def __init__(self, queryset, doc_type='all', sort='created_at', descending=True, hydrate=False):
+        if sort not in self.SORT_FIELDS:
+            raise ValueError(f"Unsupported sort field '{sort}'")
+
+        if doc_type in ('pv', 'pf'):
+            queryset = queryset.filter(doc_type=doc_type)
+        self.queryset = queryset
+        self.sort = sort
+        self.descending = descending
+        self.hydrate = hydrate
+
+    def _ordering(self, descending=None):
+        if descending is None:
+            descending = self.descending
+        prefix = '-' if descending else ''
+        return [f'{prefix}{self.sort}', f'{prefix}id']
+
+    def _documents(self, rows):
+        """The rows themselves, or their documents when hydrating"""
+        if not self.hydrate:
+            return rows
+        return load_documents((row.doc_type, row.document_id) for row in rows)
+
+    # ── Paginator interface ──
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def __getitem__(self, key):
+        rows = self.queryset.order_by(*self._ordering())[key]
+        if isinstance(key, int):
+            return self._documents([rows])[0] if self.hydrate else rows
+        return self._documents(rows)
+
+    # ── Keyset pagination ──
+
+    def keyset_page(self, cursor=None, page_size=20):
+        """Return a KeysetPage of DocumentIndex rows (or documents) starting at the given cursor"""
+        if self.sort not in self.KEYSET_SORTS:
+            raise ValueError(f"Keyset pagination is not supported for sort field '{self.sort}'")
+
+        queryset = self.queryset
+        forward = True
+        position = None
+        if cursor:
+            field = DocumentIndex._meta.get_field(self.sort)
+            sort_key, pk, tag, forward = decode_cursor(cursor, self.sort, field)
+            if tag != 'ix':
+                raise InvalidCursor("Cursor does not match this list")
+            position = (sort_key, pk)
+
+            op = 'lt' if self.descending == forward else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.sort}__{op}': sort_key}) |
+                Q(**{self.sort: sort_key, f'id__{op}': pk})
+            )
+
+        descending = self.descending if forward else not self.descending
+        rows = list(queryset.order_by(*self._ordering(descending))[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if not forward:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or not forward:
+                next_cursor = encode_cursor(self.sort, getattr(rows[-1], self.sort), rows[-1].pk, 'ix', True)
+            if (has_more and not forward) or (forward and position is not None):
+                previous_cursor = encode_cursor(self.sort, getattr(rows[0], self.sort), rows[0].pk, 'ix', False)
+
+        return KeysetPage(self._documents(rows), next_cursor, previous_cursor)
@@ -0,0 +1,205 @@
+"""
+Dashboard stat counters.
+
+Every counter on the home page comes from one conditional-aggregation query over
+the DocumentIndex table, which holds Payment Vouchers and Payment Forms side by
+side, so adding a counter adds a COUNT(...) FILTER column, not a query. MDs get
+one extra query for the signature batches waiting for them.
+
+The fiscal-year and department charts are read from the MonthlyDisbursement
+rollup (amounts converted to USD at the date-effective ExchangeRate) and cached
+until it changes (get_chart_context).
+
+Usage:
+    stats = get_dashboard_stats(request.user)
+    stats['pending_my_action'], stats['in_progress'], ...
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db.models import Count, Q, Sum
+
+from vouchers import cache as app_cache
+from vouchers.models import DocumentIndex, MonthlyDisbursement, SignatureBatch
+
+DRAFT_STATUSES = ['DRAFT', 'ON_REVISION']
+
+# The charts only change with the MonthlyDisbursement rollup (ROLLUP scope)
+CHARTS_TTL = 3600
+
+
+def can_see_all_documents(user):
+    """Staff, MD (role 6) and System Admin (role 99) count every document"""
+    return user.is_staff or user.role_level in [6, 99]
+
+
+def dashboard_index_queryset(user):
+    """DocumentIndex rows the dashboard counters are computed over"""
+    if can_see_all_documents(user):
+        return DocumentIndex.objects.all()
+    return DocumentIndex.accessible_by(user)
+
+
+def get_dashboard_stats(user):
+    """
+    Compute all dashboard counters for a user.
+
+    Returns:
+        dict with pending_my_action, pending_batches, my_created_count,
+        in_progress, approved_count and draft_count
+    """
+    pending = Q(status__startswith='PENDING')
+
+    counts = dashboard_index_queryset(user).aggregate(
+        assigned=Count('pk', filter=Q(current_approver=user)),
+        in_progress=Count('pk', filter=pending),
+        approved_count=Count('pk', filter=Q(status='APPROVED')),
+        my_created_count=Count('pk', filter=Q(created_by=user)),
+        draft_count=Count('pk', filter=Q(created_by=user, status__in=DRAFT_STATUSES)),
+    )
+
+    pending_batches = 0
+    if user.role_level == 99:
+        # System Admin sees total pending across the whole system (their base is every document)
+        pending_documents = counts['in_progress']
+    elif user.role_level == 6:
+        pending_documents = 0
+        pending_batches = SignatureBatch.objects.filter(status='PENDING').count()
+    else:
+        pending_documents = counts['assigned']
+
+    return {
+        'pending_my_action': pending_documents + pending_batches,
+        'pending_batches': pending_batches,
+        'my_created_count': counts['my_created_count'],
+        'in_progress': counts['in_progress'],
+        'approved_count': counts['approved_count'],
+        'draft_count': counts['draft_count'],
+    }
+
+
+def get_pending_documents(user, limit=5):
+    """Newest pending DocumentIndex rows for the home page's pending approvals panel"""
+    if user.role_level == 6:
+        return []
+
+    queryset = DocumentIndex.objects.filter(status__startswith='PENDING')
+    if user.role_level != 99:
+        queryset = queryset.filter(current_approver=user)
+    return list(queryset.order_by('-created_at', '-id')[:limit])
+
+
+def compute_chart_context(today):
+    """
+    Fiscal-year bar chart and current-month department donut, read from the
+    MonthlyDisbursement rollup. The same for every user.
+    """
+    charts = {}
+
+    # ── Fiscal year setup (Apr → Mar) ──
+    if today.month >= 4:
+        fy_start = date(today.year, 4, 1)
+    else:
+        fy_start = date(today.year - 1, 4, 1)
+    fy_end = date(fy_start.year + 1, 3, 31)
+
+    # Fiscal month order: APR=4, MAY=5 ... MAR=3
+    fiscal_months = [4, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2, 3]
+    month_abbr = {1: 'JAN', 2: 'FEB', 3: 'MAR', 4: 'APR', 5: 'MAY', 6: 'JUN',
+                  7: 'JUL', 8: 'AUG', 9: 'SEP', 10: 'OCT', 11: 'NOV', 12: 'DEC'}
+
+    # ── Monthly Disbursement (Multi-Currency, converted to USD) ──
+    # Submitted documents (in workflow or approved), pre-aggregated per month and
+    # currency in the MonthlyDisbursement rollup: at most 12 x 4 cells to read.
+    # total_usd is already converted at the ExchangeRate in effect on each payment date.
+    monthly = {
+        currency: {m: Decimal('0') for m in fiscal_months}
+        for currency in ('USD', 'KHR', 'THB', 'RMB')
+    }
+    for row in (
+        MonthlyDisbursement.objects
+        .filter(month__gte=fy_start, month__lte=fy_end)
+        .values('month', 'currency')
+        .annotate(total_usd=Sum('total_usd'))
+        .order_by()
+    ):
+        if row['currency'] in monthly:
+            monthly[row['currency']][row['month'].month] += row['total_usd']
+
+    # USD equivalent of each currency, then summed into a single combined series
+    monthly_combined = {
+        m: sum(monthly[currency][m] for currency in monthly)
+        for m in fiscal_months
+    }
+
+    charts['chart_labels'] = [month_abbr[m] for m in fiscal_months]
+    charts['chart_data_usd'] = [float(monthly['USD'][m]) for m in fiscal_months]
+    charts['chart_data_khr'] = [float(monthly['KHR'][m]) for m in fiscal_months]
+    charts['chart_data_thb'] = [float(monthly['THB'][m]) for m in fiscal_months]
+    charts['chart_data_rmb'] = [float(monthly['RMB'][m]) for m in fiscal_months]
+    charts['chart_data_combined'] = [float(monthly_combined[m]) for m in fiscal_months]
+    charts['chart_current_month'] = month_abbr[today.month]
+
+    # ── By Department Donut (current month, submitted/approved docs, Multi-Currency) ──
+    # One grouped query over this month's rollup cells, split per currency below
+    month_start = date(today.year, today.month, 1)
+    dept_cells = MonthlyDisbursement.department_totals(
+        MonthlyDisbursement.objects.filter(month=month_start)
+    )
+
+    def get_dept_totals_by_currency(currency_code):
+        """Top 5 departments + Other for a specific currency"""
+        sorted_depts = sorted(
+            ((name, totals[currency_code]) for name, totals in dept_cells.items() if currency_code in totals),
+            key=lambda x: x[1],
+            reverse=True
+        )
+        top5 = sorted_depts[:5]
+        others = sorted_depts[5:]
+        if others:
+            other_total = sum(v for _, v in others)
+            top5.append(('Other', other_total))
+
+        return top5
+
+    # Calculate for each currency
+    dept_usd = get_dept_totals_by_currency('USD')
+    dept_khr = get_dept_totals_by_currency('KHR')
+    dept_thb = get_dept_totals_by_currency('THB')
+    dept_rmb = get_dept_totals_by_currency('RMB')
+
+    # Build donut data for USD (primary display)
+    grand_total_usd = sum(v for _, v in dept_usd) or Decimal('1')
+    colors = ['#06b6d4', '#22c55e', '#f59e0b', '#8b5cf6', '#ef4444', '#3b82f6']
+
+    donut_data = [
+        {
+            'name': name,
+            'total': float(total),
+            'pct': round(float(total / grand_total_usd * 100), 1),
+            'color': colors[i % len(colors)],
+        }
+        for i, (name, total) in enumerate(dept_usd)
+        if total > 0
+    ]
+
+    charts['donut_data'] = donut_data
+    charts['donut_grand_usd'] = float(grand_total_usd)
+
+    # Add KHR, THB, and RMB totals for display
+    grand_total_khr = sum(v for _, v in dept_khr)
+    grand_total_thb = sum(v for _, v in dept_thb)
+    grand_total_rmb = sum(v for _, v in dept_rmb)
+    charts['donut_grand_khr'] = float(grand_total_khr)
+    charts['donut_grand_thb'] = float(grand_total_thb)
+    charts['donut_grand_rmb'] = float(grand_total_rmb)
+
+    return charts
+
+
+def get_chart_context(today):
+    """Chart data for a given day, cached until the rollup changes"""
+    return app_cache.get_or_compute(
+        f'dashboard-charts:{today.isoformat()}', app_cache.ROLLUP, CHARTS_TTL,
+        lambda: compute_chart_context(today),
+    )
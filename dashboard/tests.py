@@ -1,3 +1,230 @@
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db.models import Q
 from django.test import TestCase
+from django.urls import reverse
+
+from accounts.models import User
+from vouchers.models import Department, PaymentForm, PaymentVoucher, SignatureBatch, VoucherLineItem
+from workflow.models import ApprovalHistory
+from .stats import DRAFT_STATUSES, compute_chart_context, get_dashboard_stats
+
+
+class DashboardListTestCase(TestCase):
+    """An MD who sees every document, and a helper to create vouchers"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.md = User.objects.create_user(
+            username='md', password='x', role_level=6,
+            is_approved=True, email_verified=True,
+        )
+
+    def add_vouchers(self, count, payee='Payee', status='APPROVED', **fields):
+        return [
+            PaymentVoucher.objects.create(
+                pv_number=f'{payee[:4].upper()}-{i:04d}' if status == 'APPROVED' else None,
+                created_by=self.md, payee_name=f'{payee} {i}',
+                payment_date=date.today(), status=status, **fields,
+            )
+            for i in range(count)
+        ]
+
+
+class CursorLinkTests(DashboardListTestCase):
+    """Next / previous cursor links keep the list's filters"""
+
+    def test_cursor_links_keep_filters(self):
+        self.add_vouchers(25, payee='Acme')
+        self.client.force_login(self.md)
+
+        response = self.client.get(reverse('dashboard:home'), {
+            'paginate': 'cursor', 'doc_type': 'pv', 'search': 'acme', 'page': '3',
+        })
+
+        page = response.context['cursor_page']
+        self.assertEqual(len(page), 20)
+        self.assertTrue(page.has_next)
+        next_link = f'?paginate=cursor&amp;doc_type=pv&amp;search=acme&amp;cursor={page.next_cursor}'
+        self.assertContains(response, f'href="{next_link}"')
+
+        response = self.client.get(reverse('dashboard:home'), {
+            'paginate': 'cursor', 'doc_type': 'pv', 'search': 'acme', 'cursor': page.next_cursor,
+        })
+        self.assertEqual(len(response.context['cursor_page']), 5)
+        self.assertContains(response, 'search=acme&amp;cursor=')
+
+
+class IndexedListViewTests(DashboardListTestCase):
+    """The dashboard lists are filtered and paginated on the DocumentIndex"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.clerk = User.objects.create_user(
+            username='clerk', password='x', role_level=2,
+            is_approved=True, email_verified=True,
+        )
+
+    def list_documents(self, user, name, **params):
+        self.client.force_login(user)
+        response = self.client.get(reverse(f'dashboard:{name}'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['vouchers']
+
+    def test_lists_show_the_visible_documents(self):
+        approved = self.add_vouchers(3, payee='Acme')
+        pending = self.add_vouchers(2, payee='Pending', status='PENDING_L2', current_approver=self.clerk)
+
+        self.assertEqual(list(self.list_documents(self.md, 'approved')), approved)
+        self.assertEqual(set(self.list_documents(self.clerk, 'all_vouchers')), set(pending))
+        self.assertEqual(set(self.list_documents(self.clerk, 'pending')), set(pending))
+        self.assertEqual(list(self.list_documents(self.clerk, 'approved')), [])
+
+    def test_filters_apply_to_the_index(self):
+        acme = self.add_vouchers(2, payee='Acme')
+        self.add_vouchers(2, payee='Other')
+
+        self.assertEqual(set(self.list_documents(self.md, 'all_vouchers', search='acme')), set(acme))
+        self.assertEqual(
+            list(self.list_documents(self.md, 'all_vouchers', pv_number=acme[1].pv_number)), [acme[1]]
+        )
+        self.assertEqual(list(self.list_documents(self.md, 'approved', doc_type='pf')), [])
+
+    def test_page_loads_only_its_documents(self):
+        self.add_vouchers(45)
+        self.client.force_login(self.md)
+
+        response = self.client.get(reverse('dashboard:approved'), {'paginate': 'offset', 'page': 3})
+
+        self.assertEqual(len(response.context['vouchers']), 5)
+        self.assertEqual(response.context['page_obj'].paginator.count, 45)
+        self.assertIsInstance(response.context['vouchers'][0], PaymentVoucher)
+
+
+class DashboardStatsTests(DashboardListTestCase):
+    """The single-query counters match one count per counter on the document tables"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.clerk = User.objects.create_user(
+            username='clerk', password='x', role_level=2,
+            is_approved=True, email_verified=True,
+        )
+
+    def setUp(self):
+        approved = self.add_vouchers(3, payee='Acme')
+        self.add_vouchers(1, payee='Draft', status='DRAFT')
+        self.add_vouchers(2, payee='Assigned', status='PENDING_L2', current_approver=self.clerk)
+        self.add_vouchers(1, payee='Elsewhere', status='PENDING_L3')
+        PaymentVoucher.objects.create(
+            created_by=self.clerk, payee_name='Own draft', payment_date=date.today(), status='DRAFT',
+        )
+        for status in ('ON_REVISION', 'PENDING_L4', 'APPROVED'):
+            PaymentForm.objects.create(
+                pf_number=f'PF-{status}', created_by=self.clerk if status == 'ON_REVISION' else self.md,
+                payee_name=f'Vendor {status}', payment_date=date.today(), status=status,
+            )
+        # The clerk keeps seeing a document they acted on
+        ApprovalHistory.objects.create(voucher=approved[0], action='APPROVE', actor=self.clerk, actor_role_level=2)
+        SignatureBatch.objects.create(created_by=self.md)
+
+    def per_counter(self, user, privileged):
+        """The counters as separate counts on PaymentVoucher and PaymentForm"""
+        def count(*filters, **lookups):
+            total = 0
+            for model in (PaymentVoucher, PaymentForm):
+                visible = Q() if privileged else (
+                    Q(created_by=user) | Q(current_approver=user) | Q(approval_history__actor=user)
+                )
+                total += model.objects.filter(visible, *filters, **lookups).distinct().count()
+            return total
+
+        return {
+            'assigned': count(current_approver=user),
+            'my_created_count': count(created_by=user),
+            'in_progress': count(status__startswith='PENDING'),
+            'approved_count': count(status='APPROVED'),
+            'draft_count': count(created_by=user, status__in=DRAFT_STATUSES),
+        }
+
+    def test_privileged_user_counts_every_document(self):
+        expected = self.per_counter(self.md, privileged=True)
+        stats = get_dashboard_stats(self.md)
+
+        self.assertEqual(expected['in_progress'], 4)
+        self.assertEqual(expected['approved_count'], 4)
+        for counter in ('my_created_count', 'in_progress', 'approved_count', 'draft_count'):
+            self.assertEqual(stats[counter], expected[counter], counter)
+        # An MD acts through signature batches only
+        self.assertEqual(stats['pending_batches'], 1)
+        self.assertEqual(stats['pending_my_action'], 1)
+
+    def test_restricted_user_counts_visible_documents(self):
+        expected = self.per_counter(self.clerk, privileged=False)
+        stats = get_dashboard_stats(self.clerk)
+
+        self.assertEqual(expected['in_progress'], 2)
+        self.assertEqual(expected['approved_count'], 1)
+        self.assertEqual(expected['draft_count'], 2)
+        for counter in ('my_created_count', 'in_progress', 'approved_count', 'draft_count'):
+            self.assertEqual(stats[counter], expected[counter], counter)
+        self.assertEqual(stats['pending_my_action'], expected['assigned'])
+        self.assertEqual(stats['pending_batches'], 0)
+
+    def test_stats_endpoint_returns_the_counters(self):
+        self.client.force_login(self.clerk)
+        response = self.client.get(reverse('dashboard:dashboard_stats'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'success': True, 'stats': get_dashboard_stats(self.clerk)})
+        self.assertEqual(response.json()['stats']['pending_my_action'], 2)
+
+
+class DepartmentDonutTests(DashboardListTestCase):
+    """The current month's department donut: the top 5 departments by USD, then Other"""
+
+    def add_voucher(self, lines, status='APPROVED', payment_date=None):
+        voucher = PaymentVoucher.objects.create(
+            created_by=self.md, payee_name='Payee', payment_date=payment_date or date.today(), status=status,
+        )
+        for number, (department, amount, currency) in enumerate(lines, start=1):
+            VoucherLineItem.objects.create(
+                voucher=voucher, line_number=number, description='Line', department=department,
+                amount=Decimal(amount), currency=currency,
+            )
+        return voucher
+
+    def test_top_five_and_other(self):
+        departments = [Department.objects.create(name=f'Dept {i}', code=f'D{i}') for i in range(7)]
+        for i, department in enumerate(departments):
+            self.add_voucher([(department, 100 * (7 - i), 'USD')])
+        self.add_voucher([(departments[6], 50, 'USD'), (departments[0], 41000, 'KHR')])
+        # Not counted: drafts and other months
+        self.add_voucher([(departments[6], 5000, 'USD')], status='DRAFT')
+        self.add_voucher([(departments[6], 5000, 'USD')], payment_date=date.today().replace(day=1) - timedelta(days=1))
+
+        charts = compute_chart_context(date.today())
+
+        donut = charts['donut_data']
+        self.assertEqual(
+            [(row['name'], row['total']) for row in donut],
+            [('Dept 0', 700.0), ('Dept 1', 600.0), ('Dept 2', 500.0), ('Dept 3', 400.0), ('Dept 4', 300.0),
+             ('Other', 350.0)],
+        )
+        self.assertEqual(charts['donut_grand_usd'], 2850.0)
+        self.assertEqual(charts['donut_grand_khr'], 41000.0)
+        self.assertEqual(charts['donut_grand_thb'], 0.0)
+        self.assertEqual(donut[0]['pct'], round(700 / 2850 * 100, 1))
+        self.assertAlmostEqual(sum(row['pct'] for row in donut), 100, delta=0.5)
+        self.assertEqual(len({row['color'] for row in donut}), 6)
+
+    def test_few_departments_have_no_other(self):
+        operations = Department.objects.create(name='Operations', code='OPS')
+        self.add_voucher([(operations, 250, 'USD'), (operations, 50, 'USD')])
+
+        donut = compute_chart_context(date.today())['donut_data']
 
-# Create your tests here.
+        self.assertEqual(donut, [{'name': 'Operations', 'total': 300.0, 'pct': 100.0, 'color': '#06b6d4'}])
@@ -14,4 +14,5 @@ urlpatterns = [
     path('all-vouchers/', views.AllVouchersView.as_view(), name='all_vouchers'),
     path('bulk-submit-drafts/', views.bulk_submit_drafts, name='bulk_submit_drafts'),
     path('search/', views.dashboard_search, name='dashboard_search'),
+    path('stats/', views.dashboard_stats, name='dashboard_stats'),
 ]
@@ -3,22 +3,21 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.generic import ListView
-from django.db.models import Q
-from django.http import JsonResponse
-from vouchers.models import PaymentVoucher, PaymentForm, SignatureBatch
+from django.http import Http404, JsonResponse
+from django.utils.functional import SimpleLazyObject
+from vouchers.models import PaymentVoucher, PaymentForm, DocumentIndex
+from vouchers.search import filter_index, search_index
 from workflow.state_machine import VoucherStateMachine, FormStateMachine
-from itertools import chain
-from operator import attrgetter
+from .document_list import IndexedDocumentList, InvalidCursor, KeysetPage
+from .stats import (
+    DRAFT_STATUSES, dashboard_index_queryset, get_chart_context, get_dashboard_stats,
+    get_pending_documents,
+)
 from collections import defaultdict
 from datetime import date
 import json
 
 
-KHR_TO_USD = 4100
-THB_TO_USD = 0.028
-RMB_TO_USD = 0.138
-
-
 def apply_month_filter(queryset, month_str):
     """
     Helper function to filter queryset by month.
@@ -36,7 +35,92 @@ def apply_month_filter(queryset, month_str):
         return queryset
 
 
-class DashboardView(LoginRequiredMixin, ListView):
+class KeysetPaginationMixin:
+    """
+    Adds cursor (keyset) pagination to a ListView over an IndexedDocumentList.
+
+    Views opt in with keyset_pagination = True; any view can be switched per
+    request with ?paginate=cursor or ?paginate=offset. A ?cursor= parameter
+    always means keyset mode. Lists sorted by a key that cannot be walked by
+    cursor (e.g. document number) fall back to numbered pages.
+    """
+    keyset_pagination = False
+
+    def use_keyset_pagination(self, queryset):
+        if not isinstance(queryset, IndexedDocumentList):
+            return False
+        if queryset.sort not in queryset.KEYSET_SORTS:
+            return False
+
+        mode = self.request.GET.get('paginate')
+        if self.request.GET.get('cursor') or mode == 'cursor':
+            return True
+        if mode == 'offset':
+            return False
+        return self.keyset_pagination
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_keyset_pagination(queryset):
+            return super().paginate_queryset(queryset, page_size)
+
+        try:
+            page = queryset.keyset_page(self.request.GET.get('cursor') or None, page_size)
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+
+        self.cursor_page = page
+        return (None, None, page.object_list, False)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cursor_page'] = getattr(self, 'cursor_page', None)
+        return context
+
+
+class DocumentSearchMixin:
+    """Applies the list views' month, ?search= / ?search_field= and legacy filters to DocumentIndex rows"""
+
+    def _apply_search_filter(self, queryset, query, field):
+        """Apply search filters based on selected field"""
+        return filter_index(queryset, query, field)
+
+    def filter_index_rows(self, queryset, legacy_filters=True, status_filter=True):
+        """Narrow a DocumentIndex queryset by the request's list filters"""
+        search_query = self.request.GET.get('search', '').strip()
+        search_field = self.request.GET.get('search_field', 'all')
+        month_filter = self.request.GET.get('month', '').strip()
+
+        # Apply month filter
+        if month_filter:
+            queryset = apply_month_filter(queryset, month_filter)
+
+        # Apply search filter BEFORE pagination
+        if search_query:
+            queryset = self._apply_search_filter(queryset, search_query, search_field)
+
+        if not legacy_filters:
+            return queryset
+
+        # Legacy filters (for backward compatibility)
+        pv_number = self.request.GET.get('pv_number', '').strip()
+        if pv_number:
+            queryset = queryset.filter(number__icontains=pv_number)
+        payee_name = self.request.GET.get('payee_name', '').strip()
+        if payee_name:
+            queryset = queryset.filter(payee_name__icontains=payee_name)
+        date_from = self.request.GET.get('date_from')
+        if date_from:
+            queryset = queryset.filter(payment_date__gte=date_from)
+        date_to = self.request.GET.get('date_to')
+        if date_to:
+            queryset = queryset.filter(payment_date__lte=date_to)
+        status = self.request.GET.get('status')
+        if status and status_filter:
+            queryset = queryset.filter(status=status)
+        return queryset
+
+
+class DashboardView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     """Main dashboard - MD/Admins see ALL vouchers, regular users see their own"""
     template_name = 'dashboard/dashboard.html'
     context_object_name = 'vouchers'
@@ -45,389 +129,36 @@ class DashboardView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         user = self.request.user
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
 
-        # Base querysets
+        # Base rows
         # Account Payable (role 1), MD (role 6), System Admin (role 99), and staff see ALL documents
         if user.is_staff or user.role_level in [1, 6, 99]:
-            pv_queryset = PaymentVoucher.objects.all()
-            pf_queryset = PaymentForm.objects.all()
+            queryset = DocumentIndex.objects.all()
         else:
             # Other roles only see documents they're involved with
-            pv_queryset = PaymentVoucher.objects.filter(
-                Q(created_by=user) |
-                Q(current_approver=user) |
-                Q(approval_history__actor=user)
-            ).distinct()
-            pf_queryset = PaymentForm.objects.filter(
-                Q(created_by=user) |
-                Q(current_approver=user) |
-                Q(approval_history__actor=user)
-            ).distinct()
+            queryset = DocumentIndex.accessible_by(user)
 
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
+        queryset = self.filter_index_rows(queryset, legacy_filters=False)
 
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Filter by doc_type
-        if doc_type == 'pv':
-            combined = sorted(pv_queryset, key=attrgetter('created_at'), reverse=True)
-        elif doc_type == 'pf':
-            combined = sorted(pf_queryset, key=attrgetter('created_at'), reverse=True)
-        else:
-            combined = sorted(
-                chain(pv_queryset, pf_queryset),
-                key=attrgetter('created_at'),
-                reverse=True
-            )
-        return combined
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            # Search in document number
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-
-        elif field == 'payee':
-            # Search in payee name
-            return queryset.filter(payee_name__icontains=query)
-
-        elif field == 'amount':
-            # Search in amount
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-
-        elif field == 'date':
-            # Search in dates
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-
-        else:  # field == 'all'
-            # Search in all fields
-            q_filter = Q()
-
-            # Document number
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-
-            # Payee name
-            q_filter |= Q(payee_name__icontains=query)
-
-            # Amount
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-
-            # Date
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-
-            return queryset.filter(q_filter).distinct()
+        # Filtered, ordered and paginated on the DocumentIndex; only the page's documents are loaded
+        return IndexedDocumentList(queryset, doc_type, hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
 
-        from itertools import chain
-        from operator import attrgetter
         from datetime import date
-        from decimal import Decimal
-        from django.db.models import Sum, Case, When, F, DecimalField
-        from django.db.models.functions import TruncMonth
-
-        # ── Base querysets ──
-        if user.is_staff or user.role_level in [6, 99]:
-            pv_base = PaymentVoucher.objects.all()
-            pf_base = PaymentForm.objects.all()
-        else:
-            pv_base = PaymentVoucher.objects.filter(
-                Q(created_by=user) |
-                Q(current_approver=user) |
-                Q(approval_history__actor=user)
-            ).distinct()
-            pf_base = PaymentForm.objects.filter(
-                Q(created_by=user) |
-                Q(current_approver=user) |
-                Q(approval_history__actor=user)
-            ).distinct()
-
-        # ── Stat counts ──
-        if user.role_level == 99:
-            # System Admin sees total pending across the whole system
-            pending_vouchers = PaymentVoucher.objects.filter(status__startswith='PENDING').count()
-            pending_forms = PaymentForm.objects.filter(status__startswith='PENDING').count()
-            pending_batches = 0
-        elif user.role_level == 6:
-            pending_vouchers = 0
-            pending_forms = 0
-            pending_batches = SignatureBatch.objects.filter(status='PENDING').count()
-        else:
-            pending_vouchers = pv_base.filter(current_approver=user).count()
-            pending_forms = pf_base.filter(current_approver=user).count()
-            pending_batches = 0
-
-        context['pending_my_action'] = pending_vouchers + pending_forms + pending_batches
-        context['pending_batches'] = pending_batches
-        context['my_created_count'] = (
-                pv_base.filter(created_by=user).count() +
-                pf_base.filter(created_by=user).count()
-        )
-        context['in_progress'] = (
-                pv_base.filter(status__startswith='PENDING').count() +
-                pf_base.filter(status__startswith='PENDING').count()
-        )
-        context['approved_count'] = (
-                pv_base.filter(status='APPROVED').count() +
-                pf_base.filter(status='APPROVED').count()
-        )
-        context['draft_count'] = (
-                pv_base.filter(created_by=user, status__in=['DRAFT', 'ON_REVISION']).count() +
-                pf_base.filter(created_by=user, status__in=['DRAFT', 'ON_REVISION']).count()
-        )
-
-        # ── Pending docs panel ──
-        if user.role_level == 6:
-            context['pending_docs'] = []
-        elif user.role_level == 99:
-            # System Admin sees all pending documents across every level
-            pending_pvs = PaymentVoucher.objects.filter(
-                status__startswith='PENDING'
-            ).order_by('-created_at')
-            pending_pfs = PaymentForm.objects.filter(
-                status__startswith='PENDING'
-            ).order_by('-created_at')
-            context['pending_docs'] = sorted(
-                chain(pending_pvs, pending_pfs),
-                key=attrgetter('created_at'),
-                reverse=True
-            )[:5]
-        else:
-            pending_pvs = PaymentVoucher.objects.filter(
-                current_approver=user,
-                status__startswith='PENDING'
-            ).order_by('-created_at')
-
-            pending_pfs = PaymentForm.objects.filter(
-                current_approver=user,
-                status__startswith='PENDING'
-            ).order_by('-created_at')
-
-            context['pending_docs'] = sorted(
-                chain(pending_pvs, pending_pfs),
-                key=attrgetter('created_at'),
-                reverse=True
-            )[:5]
-
-        # ── Fiscal year setup (Apr → Mar) ──
+
+        # ── Stat counts (one aggregate query, see dashboard.stats) ──
+        context.update(get_dashboard_stats(user))
+
+        # ── Pending docs panel (index rows, no document or line item queries) ──
+        context['pending_docs'] = get_pending_documents(user)
+
+        # ── Charts (computed lazily: skipped entirely when the cached fragments hit) ──
         today = date.today()
-        if today.month >= 4:
-            fy_start = date(today.year, 4, 1)
-        else:
-            fy_start = date(today.year - 1, 4, 1)
-        fy_end = date(fy_start.year + 1, 3, 31)
-
-        # Fiscal month order: APR=4, MAY=5 ... MAR=3
-        fiscal_months = [4, 5, 6, 7, 8, 9, 10, 11, 12, 1, 2, 3]
-        month_abbr = {1: 'JAN', 2: 'FEB', 3: 'MAR', 4: 'APR', 5: 'MAY', 6: 'JUN',
-                      7: 'JUL', 8: 'AUG', 9: 'SEP', 10: 'OCT', 11: 'NOV', 12: 'DEC'}
-
-        # VAT-aware total expression
-        vat_expr = Sum(
-            Case(
-                When(vat_applicable=True, then=F('amount') * Decimal('1.1')),
-                default=F('amount'),
-                output_field=DecimalField(max_digits=14, decimal_places=2)
-            )
-        )
-
-        # ── Monthly Disbursement (Multi-Currency, converted to USD) ──
-        # Show submitted documents (in workflow or approved), exclude drafts and rejected
-        # Each currency is fetched separately, then converted to USD for the combined total.
-
-        from django.db.models import Q as DQ
-
-        ACTIVE_STATUSES = ['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
-
-        def get_monthly_by_currency(currency_code):
-            """Get monthly totals (in native currency) for a specific currency."""
-            vat_sum = lambda prefix: Sum(
-                Case(
-                    When(**{f'{prefix}vat_applicable': True},
-                         then=F(f'{prefix}amount') * Decimal('1.1')),
-                    default=F(f'{prefix}amount'),
-                    output_field=DecimalField(max_digits=14, decimal_places=2)
-                ),
-                filter=DQ(**{f'{prefix}currency': currency_code})
-            )
-
-            pv_monthly = (
-                PaymentVoucher.objects.filter(
-                    payment_date__gte=fy_start,
-                    payment_date__lte=fy_end,
-                    status__in=ACTIVE_STATUSES,
-                )
-                .annotate(month=TruncMonth('payment_date'))
-                .values('month')
-                .annotate(total=vat_sum('line_items__'))
-                .values('month', 'total')
-            )
-
-            pf_monthly = (
-                PaymentForm.objects.filter(
-                    payment_date__gte=fy_start,
-                    payment_date__lte=fy_end,
-                    status__in=ACTIVE_STATUSES,
-                )
-                .annotate(month=TruncMonth('payment_date'))
-                .values('month')
-                .annotate(total=vat_sum('line_items__'))
-                .values('month', 'total')
-            )
-
-            monthly_totals = {m: Decimal('0') for m in fiscal_months}
-            for row in pv_monthly:
-                if row['month'] and row['total']:
-                    monthly_totals[row['month'].month] += row['total']
-            for row in pf_monthly:
-                if row['month'] and row['total']:
-                    monthly_totals[row['month'].month] += row['total']
-            return monthly_totals
-
-        # Get totals for each currency in their native units
-        monthly_usd = get_monthly_by_currency('USD')
-        monthly_khr = get_monthly_by_currency('KHR')
-        monthly_thb = get_monthly_by_currency('THB')
-        monthly_rmb = get_monthly_by_currency('RMB')
-
-        # Convert all currencies to USD, then sum into a single combined series
-        monthly_combined = {
-            m: (
-                monthly_usd[m]
-                + monthly_khr[m] / Decimal(str(KHR_TO_USD))
-                + monthly_thb[m] * Decimal(str(THB_TO_USD))
-                + monthly_rmb[m] * Decimal(str(RMB_TO_USD))
-            )
-            for m in fiscal_months
-        }
-
-        context['chart_labels'] = [month_abbr[m] for m in fiscal_months]
-        context['chart_data_usd'] = [float(monthly_usd[m]) for m in fiscal_months]
-        context['chart_data_khr'] = [float(monthly_khr[m] / Decimal(str(KHR_TO_USD))) for m in fiscal_months]
-        context['chart_data_thb'] = [float(monthly_thb[m] * Decimal(str(THB_TO_USD))) for m in fiscal_months]
-        context['chart_data_rmb'] = [float(monthly_rmb[m] * Decimal(str(RMB_TO_USD))) for m in fiscal_months]
-        context['chart_data_combined'] = [float(monthly_combined[m]) for m in fiscal_months]
-        context['chart_current_month'] = month_abbr[today.month]
-
-        # ── By Department Donut (current month, submitted/approved docs, Multi-Currency) ──
-        month_start = date(today.year, today.month, 1)
-        if today.month == 12:
-            month_end = date(today.year + 1, 1, 1)
-        else:
-            month_end = date(today.year, today.month + 1, 1)
-
-        from vouchers.models import VoucherLineItem, FormLineItem
-
-        def get_dept_totals_by_currency(currency_code):
-            """Get department breakdown for a specific currency"""
-            pv_dept = (
-                VoucherLineItem.objects
-                .filter(
-                    voucher__payment_date__gte=month_start,
-                    voucher__payment_date__lt=month_end,
-                    voucher__status__in=['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED'],
-                    currency=currency_code
-                )
-                .values('department__name')
-                .annotate(total=vat_expr)
-                .order_by('-total')
-            )
-
-            pf_dept = (
-                FormLineItem.objects
-                .filter(
-                    payment_form__payment_date__gte=month_start,
-                    payment_form__payment_date__lt=month_end,
-                    payment_form__status__in=['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED'],
-                    currency=currency_code
-                )
-                .values('department__name')
-                .annotate(total=vat_expr)
-                .order_by('-total')
-            )
-
-            # Merge department totals
-            dept_totals = {}
-            for row in list(pv_dept) + list(pf_dept):
-                name = row['department__name'] or 'Unknown'
-                dept_totals[name] = dept_totals.get(name, Decimal('0')) + (row['total'] or Decimal('0'))
-
-            # Sort, top 5 + Other
-            sorted_depts = sorted(dept_totals.items(), key=lambda x: x[1], reverse=True)
-            top5 = sorted_depts[:5]
-            others = sorted_depts[5:]
-            if others:
-                other_total = sum(v for _, v in others)
-                top5.append(('Other', other_total))
-
-            return top5
-
-        # Calculate for each currency
-        dept_usd = get_dept_totals_by_currency('USD')
-        dept_khr = get_dept_totals_by_currency('KHR')
-        dept_thb = get_dept_totals_by_currency('THB')
-        dept_rmb = get_dept_totals_by_currency('RMB')
-
-        # Build donut data for USD (primary display)
-        grand_total_usd = sum(v for _, v in dept_usd) or Decimal('1')
-        colors = ['#06b6d4', '#22c55e', '#f59e0b', '#8b5cf6', '#ef4444', '#3b82f6']
-
-        donut_data = [
-            {
-                'name': name,
-                'total': float(total),
-                'pct': round(float(total / grand_total_usd * 100), 1),
-                'color': colors[i % len(colors)],
-            }
-            for i, (name, total) in enumerate(dept_usd)
-            if total > 0
-        ]
-
-        context['donut_data'] = donut_data
-        context['donut_grand_usd'] = float(grand_total_usd)
-
-        # Add KHR, THB, and RMB totals for display
-        grand_total_khr = sum(v for _, v in dept_khr)
-        grand_total_thb = sum(v for _, v in dept_thb)
-        grand_total_rmb = sum(v for _, v in dept_rmb)
-        context['donut_grand_khr'] = float(grand_total_khr)
-        context['donut_grand_thb'] = float(grand_total_thb)
-        context['donut_grand_rmb'] = float(grand_total_rmb)
+        context['chart_day'] = today.isoformat()
+        context['charts'] = SimpleLazyObject(lambda: get_chart_context(today))
 
         # Add search parameters to context
         context['search_query'] = self.request.GET.get('search', '')
@@ -436,9 +167,7 @@ class DashboardView(LoginRequiredMixin, ListView):
         return context
 
 
-# ── All other list views unchanged ──
-
-class PendingActionView(LoginRequiredMixin, ListView):
+class PendingActionView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     template_name = 'dashboard/voucher_list.html'
     context_object_name = 'vouchers'
     paginate_by = 20
@@ -453,100 +182,14 @@ class PendingActionView(LoginRequiredMixin, ListView):
     def get_queryset(self):
         user = self.request.user
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
 
         # System Admin sees ALL pending documents across every level (view-only monitor)
         if user.role_level == 99:
-            pv_queryset = PaymentVoucher.objects.filter(status__startswith='PENDING')
-            pf_queryset = PaymentForm.objects.filter(status__startswith='PENDING')
+            queryset = DocumentIndex.objects.filter(status__startswith='PENDING')
         else:
-            pv_queryset = PaymentVoucher.objects.filter(current_approver=user, status__startswith='PENDING')
-            pf_queryset = PaymentForm.objects.filter(current_approver=user, status__startswith='PENDING')
-
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
-
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Legacy filters
-        pv_number = self.request.GET.get('pv_number', '').strip()
-        if pv_number:
-            pv_queryset = pv_queryset.filter(pv_number__icontains=pv_number)
-            pf_queryset = pf_queryset.filter(pf_number__icontains=pv_number)
-        payee_name = self.request.GET.get('payee_name', '').strip()
-        if payee_name:
-            pv_queryset = pv_queryset.filter(payee_name__icontains=payee_name)
-            pf_queryset = pf_queryset.filter(payee_name__icontains=payee_name)
-        date_from = self.request.GET.get('date_from')
-        if date_from:
-            pv_queryset = pv_queryset.filter(payment_date__gte=date_from)
-            pf_queryset = pf_queryset.filter(payment_date__gte=date_from)
-        date_to = self.request.GET.get('date_to')
-        if date_to:
-            pv_queryset = pv_queryset.filter(payment_date__lte=date_to)
-            pf_queryset = pf_queryset.filter(payment_date__lte=date_to)
-        status = self.request.GET.get('status')
-        if status:
-            pv_queryset = pv_queryset.filter(status=status)
-            pf_queryset = pf_queryset.filter(status=status)
+            queryset = DocumentIndex.objects.filter(current_approver=user, status__startswith='PENDING')
 
-        if doc_type == 'pv':
-            return sorted(pv_queryset, key=attrgetter('created_at'), reverse=True)
-        elif doc_type == 'pf':
-            return sorted(pf_queryset, key=attrgetter('created_at'), reverse=True)
-        return sorted(chain(pv_queryset, pf_queryset), key=attrgetter('created_at'), reverse=True)
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-        elif field == 'payee':
-            return queryset.filter(payee_name__icontains=query)
-        elif field == 'description':
-            return queryset.filter(line_items__description__icontains=query).distinct()
-        elif field == 'amount':
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-        elif field == 'date':
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-        else:  # field == 'all'
-            q_filter = Q()
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-            q_filter |= Q(payee_name__icontains=query)
-            q_filter |= Q(line_items__description__icontains=query)
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-            return queryset.filter(q_filter).distinct()
+        return IndexedDocumentList(self.filter_index_rows(queryset), doc_type, hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -556,111 +199,15 @@ class PendingActionView(LoginRequiredMixin, ListView):
         return context
 
 
-class InProgressView(LoginRequiredMixin, ListView):
+class InProgressView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     template_name = 'dashboard/voucher_list.html'
     context_object_name = 'vouchers'
     paginate_by = 20
 
     def get_queryset(self):
-        user = self.request.user
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
-
-        if user.is_staff or user.role_level in [6, 99]:
-            pv_queryset = PaymentVoucher.objects.filter(status__startswith='PENDING')
-            pf_queryset = PaymentForm.objects.filter(status__startswith='PENDING')
-        else:
-            pv_queryset = PaymentVoucher.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).filter(status__startswith='PENDING').distinct()
-            pf_queryset = PaymentForm.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).filter(status__startswith='PENDING').distinct()
-
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
-
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Legacy filters
-        pv_number = self.request.GET.get('pv_number', '').strip()
-        if pv_number:
-            pv_queryset = pv_queryset.filter(pv_number__icontains=pv_number)
-            pf_queryset = pf_queryset.filter(pf_number__icontains=pv_number)
-        payee_name = self.request.GET.get('payee_name', '').strip()
-        if payee_name:
-            pv_queryset = pv_queryset.filter(payee_name__icontains=payee_name)
-            pf_queryset = pf_queryset.filter(payee_name__icontains=payee_name)
-        date_from = self.request.GET.get('date_from')
-        if date_from:
-            pv_queryset = pv_queryset.filter(payment_date__gte=date_from)
-            pf_queryset = pf_queryset.filter(payment_date__gte=date_from)
-        date_to = self.request.GET.get('date_to')
-        if date_to:
-            pv_queryset = pv_queryset.filter(payment_date__lte=date_to)
-            pf_queryset = pf_queryset.filter(payment_date__lte=date_to)
-        status = self.request.GET.get('status')
-        if status:
-            pv_queryset = pv_queryset.filter(status=status)
-            pf_queryset = pf_queryset.filter(status=status)
-
-        if doc_type == 'pv':
-            return sorted(pv_queryset, key=attrgetter('created_at'), reverse=True)
-        elif doc_type == 'pf':
-            return sorted(pf_queryset, key=attrgetter('created_at'), reverse=True)
-        return sorted(chain(pv_queryset, pf_queryset), key=attrgetter('created_at'), reverse=True)
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-        elif field == 'payee':
-            return queryset.filter(payee_name__icontains=query)
-        elif field == 'description':
-            return queryset.filter(line_items__description__icontains=query).distinct()
-        elif field == 'amount':
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-        elif field == 'date':
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-        else:  # field == 'all'
-            q_filter = Q()
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-            q_filter |= Q(payee_name__icontains=query)
-            q_filter |= Q(line_items__description__icontains=query)
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-            return queryset.filter(q_filter).distinct()
+        queryset = dashboard_index_queryset(self.request.user).filter(status__startswith='PENDING')
+        return IndexedDocumentList(self.filter_index_rows(queryset), doc_type, hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -670,107 +217,19 @@ class InProgressView(LoginRequiredMixin, ListView):
         return context
 
 
-class ApprovedView(LoginRequiredMixin, ListView):
+class ApprovedView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     template_name = 'dashboard/voucher_list.html'
     context_object_name = 'vouchers'
     paginate_by = 20
 
     def get_queryset(self):
-        user = self.request.user
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
+        queryset = dashboard_index_queryset(self.request.user).filter(status='APPROVED')
+        queryset = self.filter_index_rows(queryset, status_filter=False)
 
-        if user.is_staff or user.role_level in [6, 99]:
-            pv_queryset = PaymentVoucher.objects.filter(status='APPROVED')
-            pf_queryset = PaymentForm.objects.filter(status='APPROVED')
-        else:
-            pv_queryset = PaymentVoucher.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).filter(status='APPROVED').distinct()
-            pf_queryset = PaymentForm.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).filter(status='APPROVED').distinct()
-
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
-
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Legacy filters
-        pv_number = self.request.GET.get('pv_number', '').strip()
-        if pv_number:
-            pv_queryset = pv_queryset.filter(pv_number__icontains=pv_number)
-            pf_queryset = pf_queryset.filter(pf_number__icontains=pv_number)
-        payee_name = self.request.GET.get('payee_name', '').strip()
-        if payee_name:
-            pv_queryset = pv_queryset.filter(payee_name__icontains=payee_name)
-            pf_queryset = pf_queryset.filter(payee_name__icontains=payee_name)
-        date_from = self.request.GET.get('date_from')
-        if date_from:
-            pv_queryset = pv_queryset.filter(payment_date__gte=date_from)
-            pf_queryset = pf_queryset.filter(payment_date__gte=date_from)
-        date_to = self.request.GET.get('date_to')
-        if date_to:
-            pv_queryset = pv_queryset.filter(payment_date__lte=date_to)
-            pf_queryset = pf_queryset.filter(payment_date__lte=date_to)
-
-        if doc_type == 'pv':
-            return sorted(pv_queryset, key=attrgetter('pv_number'), reverse=False)
-        elif doc_type == 'pf':
-            return sorted(pf_queryset, key=attrgetter('pf_number'), reverse=False)
-        return sorted(chain(pv_queryset, pf_queryset), key=attrgetter('created_at'), reverse=False)
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-        elif field == 'payee':
-            return queryset.filter(payee_name__icontains=query)
-        elif field == 'description':
-            return queryset.filter(line_items__description__icontains=query).distinct()
-        elif field == 'amount':
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-        elif field == 'date':
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-        else:  # field == 'all'
-            q_filter = Q()
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-            q_filter |= Q(payee_name__icontains=query)
-            q_filter |= Q(line_items__description__icontains=query)
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-            return queryset.filter(q_filter).distinct()
+        # Single-type lists are sorted by document number, the mixed list by creation date
+        sort = 'number' if doc_type in ('pv', 'pf') else 'created_at'
+        return IndexedDocumentList(queryset, doc_type, sort=sort, descending=False, hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -780,107 +239,15 @@ class ApprovedView(LoginRequiredMixin, ListView):
         return context
 
 
-class CancelledView(LoginRequiredMixin, ListView):
+class CancelledView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     template_name = 'dashboard/voucher_list.html'
     context_object_name = 'vouchers'
     paginate_by = 20
 
     def get_queryset(self):
-        user = self.request.user
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
-
-        if user.is_staff or user.role_level in [6, 99]:
-            pv_queryset = PaymentVoucher.objects.filter(status='REJECTED')
-            pf_queryset = PaymentForm.objects.filter(status='REJECTED')
-        else:
-            pv_queryset = PaymentVoucher.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).filter(status='REJECTED').distinct()
-            pf_queryset = PaymentForm.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).filter(status='REJECTED').distinct()
-
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
-
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Legacy filters
-        pv_number = self.request.GET.get('pv_number', '').strip()
-        if pv_number:
-            pv_queryset = pv_queryset.filter(pv_number__icontains=pv_number)
-            pf_queryset = pf_queryset.filter(pf_number__icontains=pv_number)
-        payee_name = self.request.GET.get('payee_name', '').strip()
-        if payee_name:
-            pv_queryset = pv_queryset.filter(payee_name__icontains=payee_name)
-            pf_queryset = pf_queryset.filter(payee_name__icontains=payee_name)
-        date_from = self.request.GET.get('date_from')
-        if date_from:
-            pv_queryset = pv_queryset.filter(payment_date__gte=date_from)
-            pf_queryset = pf_queryset.filter(payment_date__gte=date_from)
-        date_to = self.request.GET.get('date_to')
-        if date_to:
-            pv_queryset = pv_queryset.filter(payment_date__lte=date_to)
-            pf_queryset = pf_queryset.filter(payment_date__lte=date_to)
-
-        if doc_type == 'pv':
-            return sorted(pv_queryset, key=attrgetter('created_at'), reverse=True)
-        elif doc_type == 'pf':
-            return sorted(pf_queryset, key=attrgetter('created_at'), reverse=True)
-        return sorted(chain(pv_queryset, pf_queryset), key=attrgetter('created_at'), reverse=True)
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-        elif field == 'payee':
-            return queryset.filter(payee_name__icontains=query)
-        elif field == 'description':
-            return queryset.filter(line_items__description__icontains=query).distinct()
-        elif field == 'amount':
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-        elif field == 'date':
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-        else:  # field == 'all'
-            q_filter = Q()
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-            q_filter |= Q(payee_name__icontains=query)
-            q_filter |= Q(line_items__description__icontains=query)
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-            return queryset.filter(q_filter).distinct()
+        queryset = dashboard_index_queryset(self.request.user).filter(status='REJECTED')
+        return IndexedDocumentList(self.filter_index_rows(queryset), doc_type, hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -890,102 +257,15 @@ class CancelledView(LoginRequiredMixin, ListView):
         return context
 
 
-class MyVouchersView(LoginRequiredMixin, ListView):
+class MyVouchersView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     template_name = 'dashboard/voucher_list.html'
     context_object_name = 'vouchers'
     paginate_by = 20
 
     def get_queryset(self):
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
-
-        pv_queryset = PaymentVoucher.objects.filter(created_by=self.request.user)
-        pf_queryset = PaymentForm.objects.filter(created_by=self.request.user)
-
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
-
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Legacy filters
-        pv_number = self.request.GET.get('pv_number', '').strip()
-        if pv_number:
-            pv_queryset = pv_queryset.filter(pv_number__icontains=pv_number)
-            pf_queryset = pf_queryset.filter(pf_number__icontains=pv_number)
-        payee_name = self.request.GET.get('payee_name', '').strip()
-        if payee_name:
-            pv_queryset = pv_queryset.filter(payee_name__icontains=payee_name)
-            pf_queryset = pf_queryset.filter(payee_name__icontains=payee_name)
-        date_from = self.request.GET.get('date_from')
-        if date_from:
-            pv_queryset = pv_queryset.filter(payment_date__gte=date_from)
-            pf_queryset = pf_queryset.filter(payment_date__gte=date_from)
-        date_to = self.request.GET.get('date_to')
-        if date_to:
-            pv_queryset = pv_queryset.filter(payment_date__lte=date_to)
-            pf_queryset = pf_queryset.filter(payment_date__lte=date_to)
-        status = self.request.GET.get('status')
-        if status:
-            pv_queryset = pv_queryset.filter(status=status)
-            pf_queryset = pf_queryset.filter(status=status)
-
-        if doc_type == 'pv':
-            return sorted(pv_queryset, key=attrgetter('created_at'), reverse=True)
-        elif doc_type == 'pf':
-            return sorted(pf_queryset, key=attrgetter('created_at'), reverse=True)
-        return sorted(chain(pv_queryset, pf_queryset), key=attrgetter('created_at'), reverse=True)
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-        elif field == 'payee':
-            return queryset.filter(payee_name__icontains=query)
-        elif field == 'description':
-            return queryset.filter(line_items__description__icontains=query).distinct()
-        elif field == 'amount':
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-        elif field == 'date':
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-        else:  # field == 'all'
-            q_filter = Q()
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-            q_filter |= Q(payee_name__icontains=query)
-            q_filter |= Q(line_items__description__icontains=query)
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-            return queryset.filter(q_filter).distinct()
+        queryset = DocumentIndex.objects.filter(created_by=self.request.user)
+        return IndexedDocumentList(self.filter_index_rows(queryset), doc_type, hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -995,102 +275,15 @@ class MyVouchersView(LoginRequiredMixin, ListView):
         return context
 
 
-class MyDraftsView(LoginRequiredMixin, ListView):
+class MyDraftsView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     template_name = 'dashboard/voucher_list.html'
     context_object_name = 'vouchers'
     paginate_by = 20
 
     def get_queryset(self):
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
-
-        pv_queryset = PaymentVoucher.objects.filter(created_by=self.request.user, status__in=['DRAFT', 'ON_REVISION'])
-        pf_queryset = PaymentForm.objects.filter(created_by=self.request.user, status__in=['DRAFT', 'ON_REVISION'])
-
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
-
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Legacy filters
-        pv_number = self.request.GET.get('pv_number', '').strip()
-        if pv_number:
-            pv_queryset = pv_queryset.filter(pv_number__icontains=pv_number)
-            pf_queryset = pf_queryset.filter(pf_number__icontains=pv_number)
-        payee_name = self.request.GET.get('payee_name', '').strip()
-        if payee_name:
-            pv_queryset = pv_queryset.filter(payee_name__icontains=payee_name)
-            pf_queryset = pf_queryset.filter(payee_name__icontains=payee_name)
-        date_from = self.request.GET.get('date_from')
-        if date_from:
-            pv_queryset = pv_queryset.filter(payment_date__gte=date_from)
-            pf_queryset = pf_queryset.filter(payment_date__gte=date_from)
-        date_to = self.request.GET.get('date_to')
-        if date_to:
-            pv_queryset = pv_queryset.filter(payment_date__lte=date_to)
-            pf_queryset = pf_queryset.filter(payment_date__lte=date_to)
-        status = self.request.GET.get('status')
-        if status:
-            pv_queryset = pv_queryset.filter(status=status)
-            pf_queryset = pf_queryset.filter(status=status)
-
-        if doc_type == 'pv':
-            return sorted(pv_queryset, key=attrgetter('updated_at'), reverse=True)
-        elif doc_type == 'pf':
-            return sorted(pf_queryset, key=attrgetter('updated_at'), reverse=True)
-        return sorted(chain(pv_queryset, pf_queryset), key=attrgetter('updated_at'), reverse=True)
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-        elif field == 'payee':
-            return queryset.filter(payee_name__icontains=query)
-        elif field == 'description':
-            return queryset.filter(line_items__description__icontains=query).distinct()
-        elif field == 'amount':
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-        elif field == 'date':
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-        else:  # field == 'all'
-            q_filter = Q()
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-            q_filter |= Q(payee_name__icontains=query)
-            q_filter |= Q(line_items__description__icontains=query)
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-            return queryset.filter(q_filter).distinct()
+        queryset = DocumentIndex.objects.filter(created_by=self.request.user, status__in=DRAFT_STATUSES)
+        return IndexedDocumentList(self.filter_index_rows(queryset), doc_type, sort='updated_at', hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1100,134 +293,18 @@ class MyDraftsView(LoginRequiredMixin, ListView):
         return context
 
 
-class AllVouchersView(LoginRequiredMixin, ListView):
+class AllVouchersView(LoginRequiredMixin, DocumentSearchMixin, KeysetPaginationMixin, ListView):
     template_name = 'dashboard/voucher_list.html'
     context_object_name = 'vouchers'
     paginate_by = 20
+    # The full archive is the deepest list; walk it by cursor instead of OFFSET
+    keyset_pagination = True
 
     def get_queryset(self):
-        user = self.request.user
         doc_type = self.request.GET.get('doc_type', 'all')
-        search_query = self.request.GET.get('search', '').strip()
-        search_field = self.request.GET.get('search_field', 'all')
-        month_filter = self.request.GET.get('month', '').strip()
-
-        # Base querysets
-        if user.is_staff or user.role_level in [6, 99]:
-            pv_queryset = PaymentVoucher.objects.all()
-            pf_queryset = PaymentForm.objects.all()
-        else:
-            pv_queryset = PaymentVoucher.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).distinct()
-            pf_queryset = PaymentForm.objects.filter(
-                Q(created_by=user)|Q(current_approver=user)|Q(approval_history__actor=user)
-            ).distinct()
-
-        # Apply month filter
-        if month_filter:
-            pv_queryset = apply_month_filter(pv_queryset, month_filter)
-            pf_queryset = apply_month_filter(pf_queryset, month_filter)
-
-        # Apply search filter BEFORE pagination
-        if search_query:
-            pv_queryset = self._apply_search_filter(pv_queryset, search_query, search_field, 'pv')
-            pf_queryset = self._apply_search_filter(pf_queryset, search_query, search_field, 'pf')
-
-        # Legacy filters (for backward compatibility)
-        pv_number = self.request.GET.get('pv_number', '').strip()
-        if pv_number:
-            pv_queryset = pv_queryset.filter(pv_number__icontains=pv_number)
-            pf_queryset = pf_queryset.filter(pf_number__icontains=pv_number)
-        payee_name = self.request.GET.get('payee_name', '').strip()
-        if payee_name:
-            pv_queryset = pv_queryset.filter(payee_name__icontains=payee_name)
-            pf_queryset = pf_queryset.filter(payee_name__icontains=payee_name)
-        date_from = self.request.GET.get('date_from')
-        if date_from:
-            pv_queryset = pv_queryset.filter(payment_date__gte=date_from)
-            pf_queryset = pf_queryset.filter(payment_date__gte=date_from)
-        date_to = self.request.GET.get('date_to')
-        if date_to:
-            pv_queryset = pv_queryset.filter(payment_date__lte=date_to)
-            pf_queryset = pf_queryset.filter(payment_date__lte=date_to)
-        status = self.request.GET.get('status')
-        if status:
-            pv_queryset = pv_queryset.filter(status=status)
-            pf_queryset = pf_queryset.filter(status=status)
-
-        if doc_type == 'pv':
-            return sorted(pv_queryset, key=attrgetter('created_at'), reverse=True)
-        elif doc_type == 'pf':
-            return sorted(pf_queryset, key=attrgetter('created_at'), reverse=True)
-        return sorted(chain(pv_queryset, pf_queryset), key=attrgetter('created_at'), reverse=True)
-
-    def _apply_search_filter(self, queryset, query, field, doc_type):
-        """Apply search filters based on selected field"""
-        from decimal import Decimal, InvalidOperation
-
-        if field == 'number':
-            # Search in document number
-            if doc_type == 'pv':
-                return queryset.filter(pv_number__icontains=query)
-            else:
-                return queryset.filter(pf_number__icontains=query)
-
-        elif field == 'payee':
-            # Search in payee name
-            return queryset.filter(payee_name__icontains=query)
-
-        elif field == 'description':
-            # Search in line item descriptions
-            return queryset.filter(line_items__description__icontains=query).distinct()
-
-        elif field == 'amount':
-            # Search in amount
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                return queryset.filter(
-                    Q(line_items__amount=amount_decimal) |
-                    Q(line_items__amount__icontains=query)
-                ).distinct()
-            except (InvalidOperation, ValueError):
-                return queryset.filter(line_items__amount__icontains=query).distinct()
-
-        elif field == 'date':
-            # Search in dates
-            return queryset.filter(
-                Q(created_at__icontains=query) |
-                Q(payment_date__icontains=query)
-            )
-
-        else:  # field == 'all'
-            # Search in all fields
-            q_filter = Q()
-
-            # Document number
-            if doc_type == 'pv':
-                q_filter |= Q(pv_number__icontains=query)
-            else:
-                q_filter |= Q(pf_number__icontains=query)
-
-            # Payee name
-            q_filter |= Q(payee_name__icontains=query)
-
-            # Description
-            q_filter |= Q(line_items__description__icontains=query)
-
-            # Amount
-            try:
-                amount_decimal = Decimal(query.replace(',', ''))
-                q_filter |= Q(line_items__amount=amount_decimal)
-            except (InvalidOperation, ValueError):
-                pass
-            q_filter |= Q(line_items__amount__icontains=query)
-
-            # Date
-            q_filter |= Q(created_at__icontains=query)
-            q_filter |= Q(payment_date__icontains=query)
-
-            return queryset.filter(q_filter).distinct()
+        # Staff, MD and System Admin see every document, other roles the ones they're involved with
+        queryset = dashboard_index_queryset(self.request.user)
+        return IndexedDocumentList(self.filter_index_rows(queryset), doc_type, hydrate=True)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1355,74 +432,52 @@ def dashboard_search(request):
 
     user = request.user
 
-    # Base querysets - same logic as DashboardView
-    if user.is_staff or user.role_level in [6, 99]:
-        pv_queryset = PaymentVoucher.objects.all()
-        pf_queryset = PaymentForm.objects.all()
-    else:
-        pv_queryset = PaymentVoucher.objects.filter(
-            Q(created_by=user) |
-            Q(current_approver=user) |
-            Q(approval_history__actor=user)
-        ).distinct()
-        pf_queryset = PaymentForm.objects.filter(
-            Q(created_by=user) |
-            Q(current_approver=user) |
-            Q(approval_history__actor=user)
-        ).distinct()
-
-    # Search across number and payee
-    # Search PV
-    pv_queryset = pv_queryset.filter(
-        Q(pv_number__icontains=query) |
-        Q(payee_name__icontains=query)
-    )
-
-    # Search PF
-    pf_queryset = pf_queryset.filter(
-        Q(pf_number__icontains=query) |
-        Q(payee_name__icontains=query)
-    )
-
-    # Filter by doc_type
-    if doc_type == 'pv':
-        combined = list(pv_queryset)
-    elif doc_type == 'pf':
-        combined = list(pf_queryset)
-    else:
-        combined = list(chain(pv_queryset, pf_queryset))
+    # Base queryset - same access rules as the dashboard counters, on the single DocumentIndex table
+    index_queryset = dashboard_index_queryset(user)
 
-    # Sort by created_at descending
-    combined = sorted(combined, key=attrgetter('created_at'), reverse=True)
+    # Full-text search across number, payee and line items (prefix match on every word)
+    index_queryset = search_index(query, 'all', index_queryset)
 
-    # Limit to 100 results to avoid performance issues
-    combined = combined[:100]
+    cursor = request.GET.get('cursor') or None
+    if cursor or request.GET.get('sort') == 'recent':
+        # Newest first, 100 results per page, walked by cursor
+        try:
+            page = IndexedDocumentList(index_queryset, doc_type).keyset_page(cursor, page_size=100)
+        except InvalidCursor:
+            return JsonResponse({'success': False, 'error': 'Invalid page cursor'})
+    else:
+        # Best matches first (ties broken by newest)
+        if doc_type in ('pv', 'pf'):
+            index_queryset = index_queryset.filter(doc_type=doc_type)
+        page = KeysetPage(list(index_queryset.order_by('search_rank', '-created_at', '-id')[:100]))
 
-    # Build JSON response
+    # Build JSON response straight from the index rows (no document or line item queries)
     results = []
-    for doc in combined:
-        is_pf = hasattr(doc, 'pf_number') and doc.pf_number
-
-        # Get currency from first line item
-        currency = 'USD'
-        if doc.line_items.exists():
-            currency = doc.line_items.first().currency
-
+    for row in page:
+        is_pf = row.doc_type == 'pf'
         results.append({
-            'id': doc.pk,
-            'type': 'pf' if is_pf else 'pv',
-            'number': doc.pf_number if is_pf else doc.pv_number or 'DRAFT',
-            'payee': doc.payee_name,
-            'amount': doc.get_grand_total_display(),
-            'status': doc.status,
-            'status_display': doc.get_status_display(),
-            'date': doc.created_at.strftime('%b %d, %Y'),
-            'detail_url': f'/vouchers/pf/{doc.pk}/' if is_pf else f'/vouchers/pv/{doc.pk}/',
-            'repeat_url': f'/vouchers/pf/{doc.pk}/repeat/' if is_pf else f'/vouchers/pv/{doc.pk}/repeat/',
+            'id': row.document_id,
+            'type': row.doc_type,
+            'number': row.number or 'DRAFT',
+            'payee': row.payee_name,
+            'amount': row.get_grand_total_display(),
+            'status': row.status,
+            'status_display': row.get_status_display(),
+            'date': row.created_at.strftime('%b %d, %Y'),
+            'detail_url': f'/vouchers/pf/{row.document_id}/' if is_pf else f'/vouchers/pv/{row.document_id}/',
+            'repeat_url': f'/vouchers/pf/{row.document_id}/repeat/' if is_pf else f'/vouchers/pv/{row.document_id}/repeat/',
         })
 
     return JsonResponse({
         'success': True,
         'count': len(results),
-        'results': results
-    })
\ No newline at end of file
+        'results': results,
+        'next_cursor': page.next_cursor,
+        'previous_cursor': page.previous_cursor,
+    })
+
+
+@login_required
+def dashboard_stats(request):
+    """Dashboard stat counters as JSON (same numbers as the home page cards)"""
+    return JsonResponse({'success': True, 'stats': get_dashboard_stats(request.user)})
@@ -123,6 +123,12 @@ if ('scrollRestoration' in history) history.scrollRestoration = 'manual';
     applyFilters(false); // Don't scroll on pagination
     };
 
+    // Keyset pagination: cursors are opaque tokens issued by the server
+    window.goToCursor = function(cursor) {
+    currentFilters.cursor = cursor;
+    applyFilters(false); // Don't scroll on pagination
+    };
+
     /* ─── Initialize Filter Buttons with proper event listeners for mobile ─── */
     function initializeFilterButtons() {
         document.querySelectorAll('.filter-tab').forEach(btn => {
@@ -186,7 +192,7 @@ if ('scrollRestoration' in history) history.scrollRestoration = 'manual';
             number: 'Search by doc number e.g. 2603-0004…',
             payee:  'Search by payee name…',
             description: 'Search by line item description…',
-            amount: 'Search by amount e.g. 244.20…',
+            amount: 'Amount e.g. 244.20, 1000-2000, >500, $250, ៛40000…',
             date:   'Search by date e.g. Mar 12 or 2026…'
         };
         if (searchInput) {
@@ -212,7 +218,7 @@ if ('scrollRestoration' in history) history.scrollRestoration = 'manual';
             number: 'Search by doc number e.g. 2603-0004…',
             payee:  'Search by payee name…',
             description: 'Search by line item description…',
-            amount: 'Search by amount e.g. 244.20…',
+            amount: 'Amount e.g. 244.20, 1000-2000, >500, $250, ៛40000…',
             date:   'Search by date e.g. Mar 12 or 2026…'
         };
         const input = document.getElementById('searchInput');
@@ -419,7 +425,11 @@ function applyFilters(shouldScroll = false) {
         params.set('search_field', currentFilters.search_field);
     if (currentFilters.month)
         params.set('month', currentFilters.month);
-    if (currentFilters.page > 1)
+    if (currentFilters.cursor) {
+        // A cursor is only valid for the navigation it was issued for
+        params.set('cursor', currentFilters.cursor);
+        currentFilters.cursor = '';
+    } else if (currentFilters.page > 1)
         params.set('page', currentFilters.page);
 
     const newUrl = window.location.pathname + (params.toString() ? '?' + params.toString() : '');
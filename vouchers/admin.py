@@ -1,11 +1,35 @@
 from django.contrib import admin
+from django.utils import timezone
 from .models import (
     CompanyBankAccount,
     Department,
     PaymentVoucher, VoucherLineItem, VoucherAttachment,
     PaymentForm, FormLineItem, FormAttachment,
-    SignatureBatch, BatchVoucherItem, BatchFormItem
+    SignatureBatch, BatchVoucherItem, BatchFormItem,
+    DocumentIndex, DocumentAccess, MonthlyDisbursement, ExchangeRate, ReportSnapshot,
+    ExportJob, PDFRenderJob
 )
+from . import cache as app_cache
+from .analytics import report_states, schedule_snapshot_update
+
+
+def update_documents(model, queryset, **changes):
+    """
+    queryset.update() for the PaymentVoucher / PaymentForm bulk actions, keeping the
+    DocumentIndex, DocumentAccess, rollup and reports snapshot in sync as the
+    post_save signals would. Returns the number of documents updated.
+    """
+    doc_type = DocumentIndex.doc_type_for(model())
+    ids = list(queryset.values_list('pk', flat=True))
+    before = report_states(doc_type, ids)
+    updated = queryset.update(**changes)
+    DocumentIndex.sync_many(model.objects.filter(pk__in=ids))
+    DocumentAccess.sync_many(model.objects.filter(pk__in=ids))
+    MonthlyDisbursement.refresh_documents(model, ids)
+    schedule_snapshot_update(doc_type, ids, before)
+    app_cache.bump(app_cache.DOCUMENTS, app_cache.WORKFLOW, app_cache.ROLLUP,
+                   *(app_cache.document_scope(model(pk=pk)) for pk in ids))
+    return updated
 
 
 @admin.register(CompanyBankAccount)
@@ -26,6 +50,15 @@ class CompanyBankAccountAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    """Admin interface for date-effective exchange rates (units per 1 USD)"""
+    list_display = ['currency', 'effective_date', 'rate', 'created_at']
+    list_filter = ['currency']
+    date_hierarchy = 'effective_date'
+    ordering = ['currency', '-effective_date']
+
+
 @admin.register(Department)
 class DepartmentAdmin(admin.ModelAdmin):
     """Admin interface for Department model"""
@@ -265,13 +298,13 @@ class PaymentVoucherAdmin(admin.ModelAdmin):
             ApprovalHistory.objects.filter(voucher=voucher, action='APPROVE').delete()
             voucher.revision_return_level = None
             voucher.save()
-        updated = queryset.update(status='DRAFT', current_approver=None)
+        updated = update_documents(PaymentVoucher, queryset, status='DRAFT', current_approver=None)
         self.message_user(request, f'{updated} voucher(s) reset to DRAFT')
 
     @admin.action(description='Mark as Approved')
     def mark_approved(self, request, queryset):
         """Mark documents as APPROVED"""
-        updated = queryset.update(status='APPROVED', current_approver=None)
+        updated = update_documents(PaymentVoucher, queryset, status='APPROVED', current_approver=None)
         self.message_user(request, f'{updated} voucher(s) marked as APPROVED')
 
 
@@ -506,13 +539,13 @@ class PaymentFormAdmin(admin.ModelAdmin):
             FormApprovalHistory.objects.filter(payment_form=form, action='APPROVE').delete()
             form.revision_return_level = None
             form.save()
-        updated = queryset.update(status='DRAFT', current_approver=None)
+        updated = update_documents(PaymentForm, queryset, status='DRAFT', current_approver=None)
         self.message_user(request, f'{updated} payment form(s) reset to DRAFT')
 
     @admin.action(description='Mark as Approved')
     def mark_approved(self, request, queryset):
         """Mark documents as APPROVED"""
-        updated = queryset.update(status='APPROVED', current_approver=None)
+        updated = update_documents(PaymentForm, queryset, status='APPROVED', current_approver=None)
         self.message_user(request, f'{updated} payment form(s) marked as APPROVED')
 
 
@@ -571,4 +604,81 @@ class SignatureBatchAdmin(admin.ModelAdmin):
         """Only allow deleting pending batches"""
         if obj and obj.status == 'PENDING':
             return True
-        return False
\ No newline at end of file
+        return False
+
+@admin.register(DocumentIndex)
+class DocumentIndexAdmin(admin.ModelAdmin):
+    """Read-only view of the document listing index (maintained automatically)"""
+    list_display = ['doc_type', 'number', 'payee_name', 'status', 'current_approver', 'created_by', 'payment_date', 'created_at']
+    list_filter = ['doc_type', 'status']
+    search_fields = ['number', 'payee_name']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        """Rows are created from document saves or rebuild_document_index"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(MonthlyDisbursement)
+class MonthlyDisbursementAdmin(admin.ModelAdmin):
+    """Read-only view of the monthly disbursement rollup (maintained automatically)"""
+    list_display = ['month', 'doc_type', 'currency', 'department', 'total', 'total_usd', 'count']
+    list_filter = ['doc_type', 'currency', 'department']
+    date_hierarchy = 'month'
+
+    def has_add_permission(self, request):
+        """Rows are created from document saves or rebuild_monthly_disbursements"""
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ReportSnapshot)
+class ReportSnapshotAdmin(admin.ModelAdmin):
+    """Read-only view of the stored reports page figures (maintained automatically)"""
+    list_display = ['name', 'computed_at', 'version']
+    readonly_fields = ['name', 'data', 'version', 'computed_at']
+
+    def has_add_permission(self, request):
+        """Snapshots are created by refresh_report_snapshot or the first reports page visit"""
+        return False
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    """Background report exports (queued from the reports page, run by run_export_jobs)"""
+    list_display = ['id', 'kind', 'status', 'progress', 'requested_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['kind', 'filters', 'fingerprint', 'status', 'progress', 'file', 'filename', 'error',
+                       'requested_by', 'created_at', 'started_at', 'finished_at']
+
+    def has_add_permission(self, request):
+        """Jobs are queued from the reports page"""
+        return False
+
+
+@admin.register(PDFRenderJob)
+class PDFRenderJobAdmin(admin.ModelAdmin):
+    """PDF attachments of approved documents (queued on approval, rendered by run_pdf_workers)"""
+    list_display = ['id', 'doc_type', 'document_id', 'status', 'attempts', 'available_at', 'requested_by',
+                    'created_at', 'finished_at']
+    list_filter = ['status', 'doc_type']
+    search_fields = ['document_id']
+    readonly_fields = ['doc_type', 'document_id', 'status', 'attempts', 'available_at', 'error', 'requested_by',
+                       'created_at', 'started_at', 'finished_at']
+    actions = ['retry_jobs']
+
+    def has_add_permission(self, request):
+        """Jobs are queued by the approval workflow"""
+        return False
+
+    @admin.action(description='Render again')
+    def retry_jobs(self, request, queryset):
+        count = queryset.exclude(status='RUNNING').update(
+            status='PENDING', attempts=0, available_at=timezone.now(), error='',
+        )
+        self.message_user(request, f'{count} PDF render(s) queued again')
@@ -0,0 +1,427 @@
+"""
+Reports page analytics as set-based queries.
+
+Every figure on the reports page comes from a grouped aggregate over the
+DocumentIndex (one row per PaymentVoucher / PaymentForm) or the
+MonthlyDisbursement rollup, and the documents table is one paginated index
+query plus one line item query per document type for the rows on the page.
+The number of queries does not depend on how many documents there are.
+
+The aggregates are also materialized in a ReportSnapshot row, which the reports
+page reads instead of recomputing them. A commit that touches documents in
+REPORT_STATUSES moves the snapshot by those documents' shares only
+(schedule_snapshot_update, called from vouchers.signals and the admin bulk
+actions): their DocumentIndex rows are read before the first change and at
+commit, and the difference is added to the totals, months and creators in one
+update per transaction. Exchange rate changes recompute it in full
+(schedule_snapshot_refresh), as does the nightly refresh_report_snapshot command.
+
+Usage:
+    analytics = ReportAnalytics()
+    analytics.totals(), analytics.monthly(), analytics.departments(),
+    analytics.creators(), analytics.records_page(page_number, per_page)
+
+    snapshot = get_report_snapshot()            # stored figures
+    snapshot = get_report_snapshot(live=True)   # recompute now
+
+    before = report_states('pv', ids)
+    ...  # change the documents
+    schedule_snapshot_update('pv', ids, before)
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import chain
+
+from django.core.paginator import Paginator
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import cache as app_cache
+from .currency import document_usd, to_usd
+from .models import (
+    CURRENCY_TOTAL_FIELDS, DocumentIndex, MonthlyDisbursement, ReportSnapshot,
+    VoucherLineItem, FormLineItem,
+)
+from accounts.models import User
+
+# Documents after L2 (Account Supervisor) approval
+REPORT_STATUSES = ['PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
+
+RECORDS_PER_PAGE = 25
+RECORDS_PER_PAGE_CHOICES = [25, 50, 100]
+
+MONTHLY_WINDOW_DAYS = 180
+
+SNAPSHOT_NAME = 'reports'
+
+# DocumentIndex columns a document's share of the snapshot is computed from
+REPORT_FIELDS = ('document_id', 'payment_date', 'created_by_id', *CURRENCY_TOTAL_FIELDS.values())
+
+
+def display_name(first_name, last_name, username):
+    """Same as User.get_full_name() or username, from values() columns"""
+    return f'{first_name} {last_name}'.strip() or username
+
+
+def monthly_since():
+    """First payment date of the monthly series"""
+    return datetime.now() - timedelta(days=MONTHLY_WINDOW_DAYS)
+
+
+class ReportAnalytics:
+    """Aggregates for the reports page over documents in the given statuses"""
+
+    def __init__(self, statuses=None):
+        self.statuses = statuses or REPORT_STATUSES
+
+    def documents(self):
+        return DocumentIndex.objects.filter(status__in=self.statuses)
+
+    def totals(self):
+        """
+        Document counts and per-currency totals in one aggregate query.
+
+        Returns:
+            dict with total, pv, pf and one float per currency code
+        """
+        sums = self.documents().aggregate(
+            total=Count('pk'),
+            pv=Count('pk', filter=Q(doc_type='pv')),
+            pf=Count('pk', filter=Q(doc_type='pf')),
+            **{currency: Sum(field) for currency, field in CURRENCY_TOTAL_FIELDS.items()}
+        )
+        totals = {key: sums[key] for key in ('total', 'pv', 'pf')}
+        for currency in CURRENCY_TOTAL_FIELDS:
+            totals[currency] = float(sums[currency] or 0)
+        return totals
+
+    def monthly(self, since=None):
+        """
+        Documents per month and their USD equivalent, one grouped query.
+
+        Returns:
+            {'YYYY-MM': {'PV': int, 'PF': int, 'amount': float}} for the last
+            MONTHLY_WINDOW_DAYS days (or since the given date)
+        """
+        since = since or monthly_since()
+        monthly_data = defaultdict(lambda: {'PV': 0, 'PF': 0, 'amount': 0})
+
+        rows = (
+            self.documents()
+            .filter(payment_date__gte=since)
+            .annotate(month=TruncMonth('payment_date'))
+            .values('month', 'doc_type')
+            .annotate(count=Count('pk'), amount=Sum(document_usd()))
+            .order_by()
+        )
+        for row in rows:
+            month_key = row['month'].strftime('%Y-%m')
+            monthly_data[month_key][row['doc_type'].upper()] += row['count']
+            monthly_data[month_key]['amount'] += float(row['amount'] or 0)
+        return monthly_data
+
+    def departments(self):
+        """Per-department line counts and USD equivalents from the rollup, largest first"""
+        dept_totals = MonthlyDisbursement.department_totals(
+            MonthlyDisbursement.objects.filter(status__in=self.statuses)
+        )
+        grand_total_usd = sum(float(data['usd_equivalent']) for data in dept_totals.values())
+
+        breakdown = []
+        for dept_name, data in dept_totals.items():
+            total_usd = float(data['usd_equivalent'])
+            breakdown.append({
+                'name': dept_name,
+                'count': data['line_count'],
+                'total_usd': total_usd,
+                'percentage': (total_usd / grand_total_usd * 100) if grand_total_usd > 0 else 0,
+            })
+
+        breakdown.sort(key=lambda x: x['total_usd'], reverse=True)
+        return breakdown
+
+    def creators(self):
+        """Documents and USD equivalent per creator, one grouped query, largest first"""
+        rows = (
+            self.documents()
+            .values('created_by__first_name', 'created_by__last_name', 'created_by__username')
+            .annotate(
+                pv_count=Count('pk', filter=Q(doc_type='pv')),
+                pf_count=Count('pk', filter=Q(doc_type='pf')),
+                total_usd=Sum(document_usd()),
+            )
+            .order_by()
+        )
+
+        # Creators sharing a display name are listed together, as before
+        creators = defaultdict(lambda: {'pv_count': 0, 'pf_count': 0, 'total_usd': 0})
+        for row in rows:
+            name = display_name(
+                row['created_by__first_name'], row['created_by__last_name'], row['created_by__username']
+            )
+            creators[name]['pv_count'] += row['pv_count']
+            creators[name]['pf_count'] += row['pf_count']
+            creators[name]['total_usd'] += float(row['total_usd'] or 0)
+
+        breakdown = [{'name': name, **data} for name, data in creators.items()]
+        breakdown.sort(key=lambda x: x['total_usd'], reverse=True)
+        return breakdown
+
+    def records_page(self, page_number=1, per_page=RECORDS_PER_PAGE):
+        """
+        One page of the documents table, newest payment date first.
+
+        Returns:
+            (page, records): the Paginator page and its rows as dicts for the template
+        """
+        queryset = (
+            self.documents()
+            .select_related('created_by')
+            .order_by('-payment_date', '-id')
+        )
+        page = Paginator(queryset, per_page).get_page(page_number)
+        first_lines = self._first_line_items(page.object_list)
+
+        records = []
+        for row in page.object_list:
+            line = first_lines.get((row.doc_type, row.document_id), {})
+            records.append({
+                'pk': row.document_id,
+                'doc_type': row.doc_type.upper(),
+                'doc_number': row.number or 'DRAFT',
+                'payee_name': row.payee_name,
+                'description': line.get('description') or '-',
+                'department': line.get('department__name') or '-',
+                'payment_date': row.payment_date,
+                'created_by': row.created_by.get_full_name() or row.created_by.username,
+                'status': row.status,
+                'get_status_display': row.get_status_display(),
+                'total_usd': row.total_usd,
+                'total_khr': row.total_khr,
+                'total_thb': row.total_thb,
+            })
+        return page, records
+
+    @staticmethod
+    def _first_line_items(rows):
+        """{(doc_type, document_id): first line item values} for a page, one query per document type"""
+        ids = defaultdict(list)
+        for row in rows:
+            ids[row.doc_type].append(row.document_id)
+
+        first_lines = {}
+        for doc_type, line_model, fk_name in (
+            ('pv', VoucherLineItem, 'voucher_id'),
+            ('pf', FormLineItem, 'payment_form_id'),
+        ):
+            if not ids[doc_type]:
+                continue
+            lines = (
+                line_model.objects
+                .filter(**{f'{fk_name}__in': ids[doc_type]})
+                .order_by(fk_name, 'line_number')
+                .values(fk_name, 'description', 'department__name')
+            )
+            for line in lines:
+                first_lines.setdefault((doc_type, line[fk_name]), line)
+        return first_lines
+
+
+# ── Snapshot ──
+
+def build_snapshot():
+    """All reports page aggregates as JSON-serializable data"""
+    analytics = ReportAnalytics()
+    monthly = analytics.monthly()
+    return {
+        'totals': analytics.totals(),
+        'monthly': {month: monthly[month] for month in sorted(monthly)},
+        'departments': analytics.departments(),
+        'creators': analytics.creators(),
+    }
+
+
+def refresh_report_snapshot(only_if_changed=False):
+    """
+    Recompute and store the report snapshot.
+
+    Args:
+        only_if_changed: Skip (and return None) when the snapshot was already
+            computed at the current REPORTS version
+    """
+    version = str(app_cache.scope_versions(app_cache.REPORTS)[0])
+    if only_if_changed and ReportSnapshot.objects.filter(name=SNAPSHOT_NAME, version=version).exists():
+        return None
+
+    snapshot, _ = ReportSnapshot.objects.update_or_create(
+        name=SNAPSHOT_NAME,
+        defaults={'data': build_snapshot(), 'version': version, 'computed_at': timezone.now()},
+    )
+    # The recompute already counts the changes the current transaction has made
+    pending = getattr(transaction.get_connection(), 'pending_snapshot_update', None)
+    if pending is not None:
+        pending.discard()
+    return snapshot
+
+
+def get_report_snapshot(live=False):
+    """The stored snapshot (computed on first use), or a fresh one when live is set"""
+    if not live:
+        snapshot = ReportSnapshot.objects.filter(name=SNAPSHOT_NAME).first()
+        if snapshot:
+            return snapshot
+    return refresh_report_snapshot()
+
+
+def report_states(doc_type, ids):
+    """
+    The snapshot's view of some documents: {document_id: REPORT_FIELDS values}
+    of those currently in the report statuses, read from the DocumentIndex.
+    """
+    rows = DocumentIndex.objects.filter(
+        doc_type=doc_type, document_id__in=ids, status__in=REPORT_STATUSES
+    ).values(*REPORT_FIELDS)
+    return {row['document_id']: row for row in rows}
+
+
+def _add(mapping, key, value):
+    mapping[key] = round(mapping.get(key, 0) + value, 3)
+
+
+def _add_documents(data, doc_type, states, sign, names):
+    """Add (sign=1) or remove (sign=-1) the shares of documents in their report_states()"""
+    totals, monthly = data['totals'], data['monthly']
+    creators = {row['name']: row for row in data['creators']}
+    since = monthly_since().date()
+
+    for state in states.values():
+        document_totals = {
+            currency: state[field] for currency, field in CURRENCY_TOTAL_FIELDS.items() if state[field]
+        }
+        usd = float(to_usd(document_totals, state['payment_date'])) * sign
+
+        totals['total'] += sign
+        totals[doc_type] += sign
+        for currency, amount in document_totals.items():
+            _add(totals, currency, float(amount) * sign)
+
+        if state['payment_date'] >= since:
+            month = monthly.setdefault(state['payment_date'].strftime('%Y-%m'), {'PV': 0, 'PF': 0, 'amount': 0})
+            month[doc_type.upper()] += sign
+            _add(month, 'amount', usd)
+
+        name = names[state['created_by_id']]
+        creator = creators.setdefault(name, {'name': name, 'pv_count': 0, 'pf_count': 0, 'total_usd': 0})
+        creator[f'{doc_type}_count'] += sign
+        _add(creator, 'total_usd', usd)
+
+    # Entries left without documents are dropped, as a full recompute would not list them
+    data['monthly'] = {
+        month: values for month, values in sorted(monthly.items()) if values['PV'] or values['PF']
+    }
+    data['creators'] = sorted(
+        (row for row in creators.values() if row['pv_count'] or row['pf_count']),
+        key=lambda x: x['total_usd'], reverse=True,
+    )
+
+
+def apply_snapshot_update(changes):
+    """
+    Move the stored snapshot from the documents' before to their after states.
+
+    Departments are re-read from the MonthlyDisbursement rollup, whose size does
+    not depend on the number of documents. Without a stored snapshot there is
+    nothing to update (the first reports page visit computes it).
+
+    Args:
+        changes: {doc_type: (before, after)} report_states() of the changed documents
+    """
+    with transaction.atomic():
+        snapshot = ReportSnapshot.objects.select_for_update().filter(name=SNAPSHOT_NAME).first()
+        if snapshot is None:
+            return None
+
+        states = [chain(before.values(), after.values()) for before, after in changes.values()]
+        user_ids = {state['created_by_id'] for state in chain.from_iterable(states)}
+        names = {
+            user['pk']: display_name(user['first_name'], user['last_name'], user['username'])
+            for user in User.objects.filter(pk__in=user_ids).values('pk', 'first_name', 'last_name', 'username')
+        }
+        for doc_type, (before, after) in changes.items():
+            _add_documents(snapshot.data, doc_type, before, -1, names)
+            _add_documents(snapshot.data, doc_type, after, 1, names)
+        snapshot.data['departments'] = ReportAnalytics().departments()
+        snapshot.computed_at = timezone.now()
+        snapshot.save(update_fields=['data', 'computed_at'])
+    return snapshot
+
+
+class PendingSnapshotUpdate:
+    """The documents one transaction changed, with their report_states() before its first change"""
+
+    def __init__(self):
+        self.before = {'pv': {}, 'pf': {}}
+
+    def add(self, doc_type, ids, before):
+        changed = self.before[doc_type]
+        for document_id in ids:
+            changed.setdefault(document_id, before.get(document_id))
+
+    def discard(self):
+        """Forget the changes (the snapshot counts them already) and let the next change start anew"""
+        self.before = {'pv': {}, 'pf': {}}
+        connection = transaction.get_connection()
+        if getattr(connection, 'pending_snapshot_update', None) is self:
+            connection.pending_snapshot_update = None
+
+    def apply(self):
+        changed_before = self.before
+        self.discard()
+
+        changes = {}
+        for doc_type, changed in changed_before.items():
+            before = {document_id: state for document_id, state in changed.items() if state}
+            after = report_states(doc_type, list(changed)) if changed else {}
+            if before != after:
+                changes[doc_type] = (before, after)
+        if changes:
+            apply_snapshot_update(changes)
+
+
+def schedule_snapshot_update(doc_type, ids, before):
+    """
+    Apply a change of documents to the snapshot once the current transaction commits.
+
+    All changes of a transaction are applied as one update: each document keeps
+    the state read before its first change, and the after states are read at
+    commit, so saving a formset of line items moves the snapshot once.
+
+    Args:
+        doc_type: 'pv' or 'pf'
+        ids: the changed documents
+        before: their report_states() read before the change
+    """
+    connection = transaction.get_connection()
+    pending = getattr(connection, 'pending_snapshot_update', None)
+    # A rollback (of the transaction or the savepoint it was scheduled in) drops its commit hook
+    if pending is not None and any(hook[1] == pending.apply for hook in connection.run_on_commit):
+        pending.add(doc_type, ids, before)
+        return
+
+    pending = connection.pending_snapshot_update = PendingSnapshotUpdate()
+    pending.add(doc_type, ids, before)
+    transaction.on_commit(pending.apply)
+
+
+def schedule_snapshot_refresh():
+    """
+    Recompute the snapshot once the current transaction commits (after exchange rate changes).
+
+    The REPORTS bump is registered first, so the first refresh after a commit
+    sees a new version and recomputes; further refreshes scheduled by the same
+    transaction find the snapshot up to date and skip.
+    """
+    app_cache.bump(app_cache.REPORTS)
+    transaction.on_commit(lambda: refresh_report_snapshot(only_if_changed=True))
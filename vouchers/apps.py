@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class VouchersConfig(AppConfig):
     name = 'vouchers'
+
+    def ready(self):
+        """Import signals and register system checks when app is ready"""
+        from django.core import checks
+        import vouchers.signals  # noqa
+        from vouchers.cache import check_shared_backend
+        checks.register(check_shared_backend, checks.Tags.caches, deploy=True)
@@ -6,20 +6,18 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db.models import Q, Sum
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, Http404, JsonResponse
 from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 from datetime import timedelta
 from decimal import Decimal
-from io import BytesIO
-
-# Excel imports
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
 
 from .models import (
     PaymentVoucher, PaymentForm,
     SignatureBatch, BatchVoucherItem, BatchFormItem
 )
+from .currency import to_usd
+from .excel_export import COMPANY_NAME, ExcelSheet, iter_documents
 
 
 # ============================================================================
@@ -190,136 +188,138 @@ def md_dashboard(request):
 
     # Calculate statistics
     pending_count = pending_batches.count()
-    signed_count = SignatureBatch.objects.filter(status='SIGNED').count()
-    rejected_count = SignatureBatch.objects.filter(status='REJECTED').count()
-
-    # Get signed this week
-    week_ago = timezone.now() - timedelta(days=7)
-    signed_this_week = SignatureBatch.objects.filter(
-        status='SIGNED',
-        signed_at__gte=week_ago
-    ).count()
-
-    # Calculate total signed amount (multi-currency)
-    signed_batches_all = SignatureBatch.objects.filter(status='SIGNED').prefetch_related(
-        'voucher_items__voucher',
-        'form_items__payment_form'
-    )
 
-    # Initialize totals for each currency
-    total_amounts = {'USD': Decimal('0'), 'KHR': Decimal('0'), 'THB': Decimal('0')}
-
-    for batch in signed_batches_all:
-        batch_totals = batch.get_total_amount()
-        for currency in total_amounts.keys():
-            total_amounts[currency] += batch_totals.get(currency, Decimal('0'))
-
-    # Format total amount (prioritize USD, show others if significant)
-    usd_total = total_amounts['USD']
-    khr_total = total_amounts['KHR']
-    thb_total = total_amounts['THB']
-
-    # Format USD with K/M suffix
-    if usd_total >= 1000000:
-        usd_display = f"${usd_total / 1000000:.2f}M"
-    elif usd_total >= 1000:
-        usd_display = f"${usd_total / 1000:.1f}K"
-    else:
-        usd_display = f"${usd_total:,.0f}"
-
-    # Add other currencies if they have values
-    currency_parts = [usd_display]
-    if khr_total > 0:
-        if khr_total >= 1000000:
-            currency_parts.append(f"៛{khr_total / 1000000:.1f}M")
-        elif khr_total >= 1000:
-            currency_parts.append(f"៛{khr_total / 1000:.0f}K")
-    if thb_total > 0:
-        if thb_total >= 1000000:
-            currency_parts.append(f"฿{thb_total / 1000000:.1f}M")
-        elif thb_total >= 1000:
-            currency_parts.append(f"฿{thb_total / 1000:.0f}K")
-
-    total_signed_amount = " + ".join(currency_parts)
-
-    # Get recent batches for "Recent Decisions" table (last 10 signed or rejected)
-    recent_batches = SignatureBatch.objects.filter(
-        status__in=['SIGNED', 'REJECTED']
-    ).select_related('created_by', 'signed_by').prefetch_related(
-        'voucher_items__voucher',
-        'form_items__payment_form'
-    ).order_by('-signed_at')[:10]
-
-    # Build activity feed (last 15 events)
-    activity_feed = []
-
-    # Get recent signed batches
-    recent_signed = SignatureBatch.objects.filter(
-        status='SIGNED'
-    ).select_related('created_by', 'signed_by').order_by('-signed_at')[:5]
-
-    for batch in recent_signed:
-        activity_feed.append({
-            'type': 'signed',
-            'action': 'Approved',
-            'user_name': batch.signed_by.get_full_name() if batch.signed_by else "MD",
-            'user_initials': ''.join([n[0].upper() for n in batch.signed_by.get_full_name().split()[:2]]) if batch.signed_by else "MD",
-            'batch_number': batch.batch_number,
-            'batch_id': batch.id,
-            'doc_count': batch.get_document_count(),
-            'total_amount': batch.get_total_amount_display(),
-            'timestamp': batch.signed_at
-        })
+    # Everything below only depends on batches and is rendered inside cached
+    # fragments (see md_dashboard.html), so it is computed lazily: on a cache
+    # hit none of these queries run.
+    def signed_this_week():
+        week_ago = timezone.now() - timedelta(days=7)
+        return SignatureBatch.objects.filter(
+            status='SIGNED',
+            signed_at__gte=week_ago
+        ).count()
+
+    def total_signed_amount():
+        # Calculate total signed amount (multi-currency) from the stored document totals
+        total_amounts = {'USD': Decimal('0'), 'KHR': Decimal('0'), 'THB': Decimal('0')}
+
+        for item_model, prefix in ((BatchVoucherItem, 'voucher'), (BatchFormItem, 'payment_form')):
+            sums = item_model.objects.filter(batch__status='SIGNED').aggregate(
+                USD=Sum(f'{prefix}__total_usd'),
+                KHR=Sum(f'{prefix}__total_khr'),
+                THB=Sum(f'{prefix}__total_thb'),
+            )
+            for currency in total_amounts.keys():
+                total_amounts[currency] += sums[currency] or Decimal('0')
+
+        # Format total amount (prioritize USD, show others if significant)
+        usd_total = total_amounts['USD']
+        khr_total = total_amounts['KHR']
+        thb_total = total_amounts['THB']
+
+        # Format USD with K/M suffix
+        if usd_total >= 1000000:
+            usd_display = f"${usd_total / 1000000:.2f}M"
+        elif usd_total >= 1000:
+            usd_display = f"${usd_total / 1000:.1f}K"
+        else:
+            usd_display = f"${usd_total:,.0f}"
+
+        # Add other currencies if they have values
+        currency_parts = [usd_display]
+        if khr_total > 0:
+            if khr_total >= 1000000:
+                currency_parts.append(f"៛{khr_total / 1000000:.1f}M")
+            elif khr_total >= 1000:
+                currency_parts.append(f"៛{khr_total / 1000:.0f}K")
+        if thb_total > 0:
+            if thb_total >= 1000000:
+                currency_parts.append(f"฿{thb_total / 1000000:.1f}M")
+            elif thb_total >= 1000:
+                currency_parts.append(f"฿{thb_total / 1000:.0f}K")
+
+        return " + ".join(currency_parts)
+
+    def recent_batches():
+        # Last 10 signed or rejected batches for the "Recent Decisions" table
+        return list(SignatureBatch.objects.filter(
+            status__in=['SIGNED', 'REJECTED']
+        ).select_related('created_by', 'signed_by').prefetch_related(
+            'voucher_items__voucher',
+            'form_items__payment_form'
+        ).order_by('-signed_at')[:10])
+
+    def activity_feed():
+        # Build activity feed (last 15 events)
+        activity_feed = []
+
+        # Get recent signed batches
+        recent_signed = SignatureBatch.objects.filter(
+            status='SIGNED'
+        ).select_related('created_by', 'signed_by').order_by('-signed_at')[:5]
+
+        for batch in recent_signed:
+            activity_feed.append({
+                'type': 'signed',
+                'action': 'Approved',
+                'user_name': batch.signed_by.get_full_name() if batch.signed_by else "MD",
+                'user_initials': ''.join([n[0].upper() for n in batch.signed_by.get_full_name().split()[:2]]) if batch.signed_by else "MD",
+                'batch_number': batch.batch_number,
+                'batch_id': batch.id,
+                'doc_count': batch.get_document_count(),
+                'total_amount': batch.get_total_amount_display(),
+                'timestamp': batch.signed_at
+            })
 
-    # Get recent rejected batches
-    recent_rejected = SignatureBatch.objects.filter(
-        status='REJECTED'
-    ).select_related('created_by', 'signed_by').order_by('-signed_at')[:5]
-
-    for batch in recent_rejected:
-        activity_feed.append({
-            'type': 'rejected',
-            'action': 'Rejected',
-            'user_name': batch.signed_by.get_full_name() if batch.signed_by else "MD",
-            'user_initials': ''.join([n[0].upper() for n in batch.signed_by.get_full_name().split()[:2]]) if batch.signed_by else "MD",
-            'batch_number': batch.batch_number,
-            'batch_id': batch.id,
-            'doc_count': batch.get_document_count(),
-            'total_amount': batch.get_total_amount_display(),
-            'timestamp': batch.signed_at
-        })
+        # Get recent rejected batches
+        recent_rejected = SignatureBatch.objects.filter(
+            status='REJECTED'
+        ).select_related('created_by', 'signed_by').order_by('-signed_at')[:5]
+
+        for batch in recent_rejected:
+            activity_feed.append({
+                'type': 'rejected',
+                'action': 'Rejected',
+                'user_name': batch.signed_by.get_full_name() if batch.signed_by else "MD",
+                'user_initials': ''.join([n[0].upper() for n in batch.signed_by.get_full_name().split()[:2]]) if batch.signed_by else "MD",
+                'batch_number': batch.batch_number,
+                'batch_id': batch.id,
+                'doc_count': batch.get_document_count(),
+                'total_amount': batch.get_total_amount_display(),
+                'timestamp': batch.signed_at
+            })
 
-    # Get recently created batches
-    recent_created = SignatureBatch.objects.filter(
-        status='PENDING'
-    ).select_related('created_by').order_by('-created_at')[:5]
-
-    for batch in recent_created:
-        activity_feed.append({
-            'type': 'created',
-            'action': 'Created',
-            'user_name': batch.created_by.get_full_name() if batch.created_by else "Finance",
-            'user_initials': ''.join([n[0].upper() for n in batch.created_by.get_full_name().split()[:2]]) if batch.created_by else "FN",
-            'batch_number': batch.batch_number,
-            'batch_id': batch.id,
-            'doc_count': batch.get_document_count(),
-            'total_amount': batch.get_total_amount_display(),
-            'timestamp': batch.created_at
-        })
+        # Get recently created batches
+        recent_created = SignatureBatch.objects.filter(
+            status='PENDING'
+        ).select_related('created_by').order_by('-created_at')[:5]
+
+        for batch in recent_created:
+            activity_feed.append({
+                'type': 'created',
+                'action': 'Created',
+                'user_name': batch.created_by.get_full_name() if batch.created_by else "Finance",
+                'user_initials': ''.join([n[0].upper() for n in batch.created_by.get_full_name().split()[:2]]) if batch.created_by else "FN",
+                'batch_number': batch.batch_number,
+                'batch_id': batch.id,
+                'doc_count': batch.get_document_count(),
+                'total_amount': batch.get_total_amount_display(),
+                'timestamp': batch.created_at
+            })
 
-    # Sort activity feed by timestamp (most recent first) and limit to 15
-    activity_feed.sort(key=lambda x: x['timestamp'] if x['timestamp'] else timezone.now(), reverse=True)
-    activity_feed = activity_feed[:15]
+        # Sort activity feed by timestamp (most recent first) and limit to 15
+        activity_feed.sort(key=lambda x: x['timestamp'] if x['timestamp'] else timezone.now(), reverse=True)
+        return activity_feed[:15]
 
     context = {
         'pending_batches': pending_batches,
         'pending_count': pending_count,
-        'signed_count': signed_count,
-        'rejected_count': rejected_count,
-        'signed_this_week': signed_this_week,
-        'total_signed_amount': total_signed_amount,
-        'recent_batches': recent_batches,
-        'activity_feed': activity_feed,
+        'signed_count': SimpleLazyObject(SignatureBatch.objects.filter(status='SIGNED').count),
+        'rejected_count': SimpleLazyObject(SignatureBatch.objects.filter(status='REJECTED').count),
+        'signed_this_week': SimpleLazyObject(signed_this_week),
+        'total_signed_amount': SimpleLazyObject(total_signed_amount),
+        'recent_batches': SimpleLazyObject(recent_batches),
+        'activity_feed': SimpleLazyObject(activity_feed),
     }
 
     return render(request, 'vouchers/batch/md_dashboard.html', context)
@@ -414,6 +414,7 @@ def batch_detail(request, batch_id):
         'batch': batch,
         'total_amount': batch.get_total_amount(),
         'total_amount_display': batch.get_total_amount_display(),
+        'total_usd_equivalent': batch.get_total_usd(),
         'document_count': batch.get_document_count(),
     }
 
@@ -836,25 +837,17 @@ def batch_export_excel(request, batch_id):
     Export a signature batch to Excel format
     Shows all documents in the batch with details
     All authenticated users can export for transparency and record keeping
+    Rows are streamed through the shared write-only engine in excel_export
     """
     batch = get_object_or_404(
-        SignatureBatch.objects.prefetch_related(
-            'voucher_items__voucher__line_items__department',
-            'form_items__payment_form__line_items__department'
-        ),
+        SignatureBatch.objects.select_related('created_by', 'signed_by'),
         id=batch_id
     )
 
     # All authenticated users can export batches
     # No permission check - transparency for all users
 
-    # Create workbook
-    wb = Workbook()
-    ws = wb.active
-    ws.title = f"Batch {batch.batch_number}"
-
-    # Column widths
-    column_widths = {
+    sheet = ExcelSheet(f"Batch {batch.batch_number}", {
         'A': 3.71,   # No
         'B': 15.14,  # Doc No
         'C': 25.0,   # Supplier
@@ -864,143 +857,57 @@ def batch_export_excel(request, batch_id):
         'G': 25.0,   # Account Name
         'H': 20.0,   # Account Number
         'I': 20.0    # Remark
-    }
-
-    for col, width in column_widths.items():
-        ws.column_dimensions[col].width = width
-
-    # Styles
-    header_font = Font(name='Calibri', size=11, bold=True, color='000000')
-    company_font = Font(name='Calibri', size=14, bold=True, color='000000')
-    title_font = Font(name='Calibri', size=13, bold=True, color='000000')
-    data_font = Font(name='Calibri', size=11, color='000000')
-    header_fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
-
-    border = Border(
-        left=Side(style='thin', color='000000'),
-        right=Side(style='thin', color='000000'),
-        top=Side(style='thin', color='000000'),
-        bottom=Side(style='thin', color='000000')
-    )
+    })
 
-    center_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    left_alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-    right_alignment = Alignment(horizontal='right', vertical='center')
-
-    # Row 1: Company name
-    ws.merge_cells('A1:I1')
-    company_cell = ws['A1']
-    company_cell.value = "Phat Phnom Penh  Co.,LTD  (Garden City Water Park)"
-    company_cell.font = company_font
-    company_cell.alignment = center_alignment
-
-    # Row 2: Title
-    ws.merge_cells('A2:I2')
-    title_cell = ws['A2']
-    title_cell.value = f"Signature Batch - {batch.batch_number}"
-    title_cell.font = title_font
-    title_cell.alignment = center_alignment
+    # Rows 1-2: Company name and title
+    sheet.append({'A': (COMPANY_NAME, 'company')}, merge=['A:I'])
+    sheet.append({'A': (f"Signature Batch - {batch.batch_number}", 'report_title')}, merge=['A:I'])
 
     # Row 3: Batch info
     batch_info = f"Created by: {batch.created_by.get_full_name() or batch.created_by.username} | Date: {batch.created_at.strftime('%Y-%m-%d')} | Status: {batch.get_status_display()}"
     if batch.status == 'SIGNED' and batch.signed_by:
         batch_info += f" | Signed by: {batch.signed_by.get_full_name() or batch.signed_by.username} on {batch.signed_at.strftime('%Y-%m-%d')}"
-
-    ws.merge_cells('A3:I3')
-    info_cell = ws['A3']
-    info_cell.value = batch_info
-    info_cell.font = Font(name='Calibri', size=10, color='666666')
-    info_cell.alignment = left_alignment
+    sheet.append({'A': (batch_info, 'note')}, merge=['A:I'])
 
     # Row 4: FM Notes (if any)
     if batch.fm_notes:
-        ws.merge_cells('A4:I4')
-        notes_cell = ws['A4']
-        notes_cell.value = f"FM Notes: {batch.fm_notes}"
-        notes_cell.font = Font(name='Calibri', size=10, italic=True)
-        notes_cell.alignment = left_alignment
-        header_row_start = 6
-    else:
-        header_row_start = 5
+        sheet.append({'A': (f"FM Notes: {batch.fm_notes}", 'note_italic')}, merge=['A:I'])
+    sheet.skip()
 
     # Header rows
-    merge_ranges = [
-        f'A{header_row_start}:A{header_row_start+1}',
-        f'B{header_row_start}:B{header_row_start+1}',
-        f'C{header_row_start}:C{header_row_start+1}',
-        f'D{header_row_start}:D{header_row_start+1}',
-        f'E{header_row_start}:E{header_row_start+1}',
-        f'F{header_row_start}:F{header_row_start+1}',
-        f'G{header_row_start}:H{header_row_start}',
-        f'I{header_row_start}:I{header_row_start+1}'
-    ]
-
-    for merge_range in merge_ranges:
-        ws.merge_cells(merge_range)
-
-    # Header row 1
-    headers_row1 = [
-        (f'A{header_row_start}', 'No'),
-        (f'B{header_row_start}', 'Doc No.'),
-        (f'C{header_row_start}', 'Supplier'),
-        (f'D{header_row_start}', 'Description'),
-        (f'E{header_row_start}', 'Amount'),
-        (f'F{header_row_start}', 'Transfer Account'),
-        (f'G{header_row_start}', 'Receiver Bank Account'),
-        (f'I{header_row_start}', 'Remark')
-    ]
-
-    for cell_ref, value in headers_row1:
-        cell = ws[cell_ref]
-        cell.value = value
-        cell.font = header_font
-        cell.alignment = center_alignment
-        cell.fill = header_fill
-        cell.border = border
-
-    # Header row 2 (sub-headers)
-    headers_row2 = [
-        (f'G{header_row_start+1}', 'Account Name'),
-        (f'H{header_row_start+1}', 'Account Number')
-    ]
-
-    for cell_ref, value in headers_row2:
-        cell = ws[cell_ref]
-        cell.value = value
-        cell.font = header_font
-        cell.alignment = center_alignment
-        cell.fill = header_fill
-        cell.border = border
-
-    # Apply borders to all header cells
-    for row in [header_row_start, header_row_start+1]:
-        for col in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 'I']:
-            cell = ws[f'{col}{row}']
-            if not cell.border.left.style:
-                cell.border = border
-                cell.fill = header_fill
-
-    # Data rows
-    row = header_row_start + 2
-    total_amount = Decimal('0')
-    idx = 0
-
-    # Collect all documents (vouchers and forms)
-    all_documents = []
-
-    for item in batch.voucher_items.all():
-        all_documents.append(('PV', item.voucher))
-
-    for item in batch.form_items.all():
-        all_documents.append(('PF', item.payment_form))
+    header_row_start = sheet.next_row
+    for column in 'ABCDEFI':
+        sheet.merge(f'{column}{header_row_start}:{column}{header_row_start+1}')
+
+    sheet.append({
+        **sheet.blank_cells('header'),
+        'A': ('No', 'header'),
+        'B': ('Doc No.', 'header'),
+        'C': ('Supplier', 'header'),
+        'D': ('Description', 'header'),
+        'E': ('Amount (USD)', 'header'),
+        'F': ('Transfer Account', 'header'),
+        'G': ('Receiver Bank Account', 'header'),
+        'I': ('Remark', 'header'),
+    }, merge=['G:H'])
+    sheet.append({
+        **sheet.blank_cells('header'),
+        'G': ('Account Name', 'header'),
+        'H': ('Account Number', 'header'),
+    })
+
+    # Data rows: vouchers and forms merged by created date, read in chunks
+    vouchers = (PaymentVoucher.objects.filter(batch_items__batch=batch)
+                .select_related('company_bank_account').prefetch_related('line_items')
+                .order_by('created_at', 'id'))
+    forms = (PaymentForm.objects.filter(batch_items__batch=batch)
+             .select_related('company_bank_account').prefetch_related('line_items')
+             .order_by('created_at', 'id'))
 
-    # Sort by created date
-    all_documents.sort(key=lambda x: x[1].created_at)
-
-    for doc_type, doc in all_documents:
-        idx += 1
+    total_amount = Decimal('0')
 
-        doc_number = doc.pv_number if doc_type == 'PV' else doc.pf_number
+    for idx, doc in enumerate(iter_documents(vouchers, forms, key=lambda doc: doc.created_at), 1):
+        doc_number = doc.pv_number if isinstance(doc, PaymentVoucher) else doc.pf_number
 
         # Get transfer account
         if doc.company_bank_account:
@@ -1008,152 +915,84 @@ def batch_export_excel(request, batch_id):
         else:
             transfer_account = "No Transfer Account"
 
-        # Calculate totals
-        totals = doc.calculate_grand_total()
-
         # Combine descriptions
         descriptions = [item.description for item in doc.line_items.all()]
-        combined_description = '\n'.join(descriptions) if descriptions else ''
 
-        # Calculate USD amount
-        amount = totals.get('USD', Decimal('0'))
+        # Amount in USD, every currency converted at the rate in effect on the payment date
+        amount = to_usd(doc.get_stored_totals(), doc.payment_date)
         total_amount += amount
 
-        # Payee bank info
-        account_name = doc.bank_name or ''
-        account_number = doc.bank_account_number or ''
-
-        # Column A: No
-        cell_a = ws.cell(row=row, column=1)
-        cell_a.value = idx
-        cell_a.font = data_font
-        cell_a.alignment = center_alignment
-        cell_a.border = border
-
-        # Column B: Doc Number
-        cell_b = ws.cell(row=row, column=2)
-        cell_b.value = doc_number or 'DRAFT'
-        cell_b.font = data_font
-        cell_b.alignment = left_alignment
-        cell_b.border = border
-
-        # Column C: Supplier
-        cell_c = ws.cell(row=row, column=3)
-        cell_c.value = doc.payee_name
-        cell_c.font = data_font
-        cell_c.alignment = left_alignment
-        cell_c.border = border
-
-        # Column D: Description
-        cell_d = ws.cell(row=row, column=4)
-        cell_d.value = combined_description
-        cell_d.font = data_font
-        cell_d.alignment = left_alignment
-        cell_d.border = border
-
-        # Column E: Amount
-        cell_e = ws.cell(row=row, column=5)
-        cell_e.value = float(amount)
-        cell_e.font = data_font
-        cell_e.alignment = right_alignment
-        cell_e.border = border
-        cell_e.number_format = '#,##0.00'
-
-        # Column F: Transfer Account
-        cell_f = ws.cell(row=row, column=6)
-        cell_f.value = transfer_account
-        cell_f.font = data_font
-        cell_f.alignment = left_alignment
-        cell_f.border = border
-
-        # Column G: Account Name
-        cell_g = ws.cell(row=row, column=7)
-        cell_g.value = account_name
-        cell_g.font = data_font
-        cell_g.alignment = left_alignment
-        cell_g.border = border
-
-        # Column H: Account Number
-        cell_h = ws.cell(row=row, column=8)
-        cell_h.value = account_number
-        cell_h.font = data_font
-        cell_h.alignment = left_alignment
-        cell_h.border = border
-
-        # Column I: Remark
-        cell_i = ws.cell(row=row, column=9)
-        cell_i.value = ''
-        cell_i.font = data_font
-        cell_i.alignment = left_alignment
-        cell_i.border = border
-
-        row += 1
+        sheet.append({
+            'A': (idx, 'cell_center'),
+            'B': (doc_number or 'DRAFT', 'cell'),
+            'C': (doc.payee_name, 'cell'),
+            'D': ('\n'.join(descriptions), 'cell'),
+            'E': (float(amount), 'cell_amount'),
+            'F': (transfer_account, 'cell'),
+            'G': (doc.bank_name or '', 'cell'),           # Payee account name
+            'H': (doc.bank_account_number or '', 'cell'),  # Payee account number
+            'I': ('', 'cell'),                              # Remark
+        })
 
     # Grand total row
-    total_label_cell = ws.cell(row=row, column=4)
-    total_label_cell.value = "GRAND TOTAL:"
-    total_label_cell.font = Font(name='Calibri', size=12, bold=True, color='FFFFFF')
-    total_label_cell.alignment = right_alignment
-    total_label_cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-    total_label_cell.border = border
-
-    total_amount_cell = ws.cell(row=row, column=5)
-    total_amount_cell.value = float(total_amount)
-    total_amount_cell.font = Font(name='Calibri', size=12, bold=True, color='FFFFFF')
-    total_amount_cell.alignment = right_alignment
-    total_amount_cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-    total_amount_cell.border = border
-    total_amount_cell.number_format = '#,##0.00'
-
-    for col in [1, 2, 3, 6, 7, 8, 9]:
-        cell = ws.cell(row=row, column=col)
-        cell.border = border
-        cell.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-
-    row += 3
+    sheet.append({
+        **sheet.blank_cells('grand_total'),
+        'D': ("GRAND TOTAL:", 'grand_total'),
+        'E': (float(total_amount), 'grand_total_amount'),
+    })
 
     # Signature section
-    ws.merge_cells(f'B{row}:C{row}')
-    prepared_cell = ws.cell(row=row, column=2)
-    prepared_cell.value = "Prepared by"
-    prepared_cell.font = header_font
-    prepared_cell.alignment = center_alignment
-
-    ws.merge_cells(f'E{row}:F{row}')
-    checked_cell = ws.cell(row=row, column=5)
-    checked_cell.value = "Checked by"
-    checked_cell.font = header_font
-    checked_cell.alignment = center_alignment
-
-    ws.merge_cells(f'H{row}:I{row}')
-    approved_cell = ws.cell(row=row, column=8)
-    approved_cell.value = "Approved by"
-    approved_cell.font = header_font
-    approved_cell.alignment = center_alignment
-
-    # Page setup
-    ws.page_setup.paperSize = 9  # A4
-    ws.page_setup.orientation = 'landscape'
-    ws.page_setup.fitToPage = True
-    ws.page_setup.fitToHeight = 0
-    ws.page_setup.fitToWidth = 1
-    ws.print_options.horizontalCentered = True
-    ws.page_margins.left = 0.4
-    ws.page_margins.right = 0.4
-    ws.page_margins.top = 0.5
-    ws.page_margins.bottom = 0.5
-
-    # Save to response
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    filename = f'Batch_{batch.batch_number}_{timezone.now().strftime("%Y%m%d")}.xlsx'
-
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    sheet.skip(2)
+    sheet.append({
+        'B': ("Prepared by", 'bold_center'),
+        'E': ("Checked by", 'bold_center'),
+        'H': ("Approved by", 'bold_center'),
+    }, merge=['B:C', 'E:F', 'H:I'])
+
+    sheet.landscape_a4()
+
+    return sheet.response(f'Batch_{batch.batch_number}_{timezone.now().strftime("%Y%m%d")}.xlsx')
+
+
+@login_required
+def batch_bundle_pdf(request, batch_id):
+    """
+    One print-ready PDF of a signed signature batch: cover, table of contents and the
+    approved vouchers / forms the user may open, with their attachments (see vouchers.bundles)
+    The bundle is built by the run_export_jobs worker: until it is ready this page
+    polls the job (JSON for XHR requests), then the PDF is served inline
+    """
+    from .bundles import batch_documents, request_bundle
+    from .export_jobs import job_payload
+
+    batch = get_object_or_404(
+        SignatureBatch.objects.select_related('created_by', 'signed_by'),
+        id=batch_id
     )
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
 
-    return response
\ No newline at end of file
+    if batch.status != 'SIGNED':
+        messages.error(request, 'The bundle PDF is available once the MD has signed the batch')
+        return redirect('vouchers:batch_detail', batch_id=batch.id)
+
+    documents = batch_documents(batch, request.user)
+    if not documents:
+        messages.error(request, 'This batch has no approved documents you can access')
+        return redirect('vouchers:batch_detail', batch_id=batch.id)
+
+    job, created = request_bundle(batch, request.user, documents)
+
+    if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return JsonResponse(job_payload(job))
+
+    if job.status == 'DONE':
+        try:
+            # Shown inline for review and printing; the response closes the file
+            return FileResponse(job.file.open('rb'), filename=job.filename, content_type='application/pdf')
+        except FileNotFoundError:
+            raise Http404("Bundle file not found")
+
+    return render(request, 'vouchers/batch/bundle_wait.html', {
+        'batch': batch,
+        'job': job_payload(job),
+        'document_count': len(documents),
+    })
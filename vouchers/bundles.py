@@ -0,0 +1,314 @@
+"""
+Signature batch PDF bundles: the approved vouchers and forms of a SignatureBatch
+in one print-ready PDF, after a cover page with the summary and a table of
+contents (page numbers, plus a PDF bookmark per document).
+
+Bundles exist for SIGNED batches, whose documents are APPROVED. A bundle holds
+the documents the user may open, with the rules of voucher_pdf / form_pdf:
+staff open everything, Account Payable, MD and System Admin every voucher,
+others the documents they have DocumentAccess to.
+
+Bundles are built outside the request: the batch_bundle_pdf view queues an
+ExportJob of kind 'batch_bundle' (request_bundle, see vouchers.export_jobs) for
+the run_export_jobs worker, and serves the job's file once it is done. Document
+PDFs come from the render cache (vouchers.pdf_cache), where run_pdf_workers
+has usually put them on approval; the worker renders the missing ones in
+parallel, in a process pool of PDF_BUNDLE_WORKERS processes kept for the next
+bundles.
+
+The bundle is cached too, under a fingerprint of the batch, the amounts on its
+cover and every document's render key, so it is served from disk until the
+batch, one of its documents or an attachment changes.
+
+Usage:
+    job, created = request_bundle(batch, request.user, documents)    # in the view
+    pdf_file, filename = open_bundle(batch, documents)              # in the worker
+"""
+import hashlib
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.template.loader import render_to_string
+from pypdf import PdfReader, PdfWriter
+
+from . import cache as app_cache
+from . import pdf_pool
+from .currency import to_usd
+from .excel_export import iter_documents
+from .models import DocumentAccess, PaymentForm, PaymentVoucher, SignatureBatch
+from .pdf_cache import RENDER_VERSION, field_values, render_cache, template_digest, user_values
+from .pdf_jobs import doc_type_of
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE = 'vouchers/batch/bundle_pdf.html'
+
+CURRENCY_SYMBOLS = {'USD': '$', 'KHR': '៛', 'THB': '฿', 'RMB': '¥'}
+
+
+# ── Documents ──
+
+def sees_all_documents(user, doc_type):
+    """
+    Whether the user may open every voucher ('pv') or payment form ('pf'):
+    staff open both, Account Payable, MD and System Admin every voucher (see voucher_pdf / form_pdf)
+    """
+    if doc_type == 'pv':
+        return user.is_staff or user.role_level in [1, 6, 99]
+    return user.is_staff
+
+
+def batch_documents(batch, user=None):
+    """
+    Approved vouchers and forms of a batch the user may open (all of them without
+    a user), merged by created date (the order of the Excel export)
+    """
+    querysets = {
+        'pv': PaymentVoucher.objects.filter(batch_items__batch=batch, status='APPROVED'),
+        'pf': PaymentForm.objects.filter(batch_items__batch=batch, status='APPROVED'),
+    }
+    for doc_type, queryset in querysets.items():
+        if user is not None and not sees_all_documents(user, doc_type):
+            querysets[doc_type] = queryset.filter(Exists(DocumentAccess.objects.filter(
+                user=user, doc_type=doc_type, document_id=OuterRef('pk'),
+            )))
+    vouchers, forms = querysets['pv'], querysets['pf']
+    vouchers = vouchers.select_related('created_by').order_by('created_at', 'id')
+    forms = forms.select_related('created_by').order_by('created_at', 'id')
+    return list(iter_documents(vouchers, forms, key=lambda doc: doc.created_at))
+
+
+def generator_for(document):
+    from .pdf_generator import FormPDFGenerator, VoucherPDFGenerator
+
+    return VoucherPDFGenerator if isinstance(document, PaymentVoucher) else FormPDFGenerator
+
+
+def contents_entry(document):
+    """Table of contents row of a document (its page is filled in once the PDFs are counted)"""
+    if isinstance(document, PaymentVoucher):
+        label = f'PV {document.pv_number}'
+    else:
+        label = f'PF {document.pf_number}'
+    return {
+        'label': label,
+        'payee': document.payee_name,
+        'usd': to_usd(document.get_stored_totals(), document.payment_date),
+        'page': None,
+    }
+
+
+def bundle_key(batch, document_keys, entries):
+    """Render cache key of a batch bundle"""
+    payload = {
+        'version': RENDER_VERSION,
+        'template': [TEMPLATE, template_digest(TEMPLATE)],
+        'batch': field_values(batch),
+        'users': [user_values(user) for user in (batch.created_by, batch.signed_by) if user],
+        'documents': document_keys,
+        'contents': [[entry['label'], entry['payee'], entry['usd']] for entry in entries],
+    }
+    data = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+# ── Render pool ──
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """The bundle render pool of this process (a forked child starts its own)"""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # spawn: fresh processes without the parent's database connections
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PDF_BUNDLE_WORKERS,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=pdf_pool.init_process,
+                max_tasks_per_child=settings.PDF_RENDER_MAX_TASKS,
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def reset_pool():
+    """Drop a broken pool; the next bundle starts a new one"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def render_missing(documents, keys, progress=None):
+    """
+    Render the documents whose PDF is not in the render cache in the pool.
+
+    Failures are only logged: the merge renders those documents again in this
+    process, which raises the error.
+
+    Args:
+        progress: Optional callable(done, total) told about every document in the cache
+    """
+    missing = [
+        document for document, key in zip(documents, keys)
+        if not os.path.exists(render_cache.path(key))
+    ]
+    cached = len(documents) - len(missing)
+    if not missing:
+        return
+
+    try:
+        pool = get_pool()
+        futures = [
+            pool.submit(pdf_pool.render_document, doc_type_of(document), document.pk)
+            for document in missing
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                future.result()
+            except BrokenProcessPool:
+                raise
+            except Exception:
+                logger.exception('Bundle render of a document failed in the pool')
+            if progress:
+                progress(cached + done, len(documents))
+    except BrokenProcessPool:
+        # A process was killed (e.g. out of memory): the rest is rendered in this process
+        logger.exception('PDF bundle pool stopped')
+        reset_pool()
+
+
+# ── Bundle ──
+
+def totals_display(documents):
+    """Per-currency total of the documents, formatted like SignatureBatch.get_total_amount_display()"""
+    totals = {}
+    for document in documents:
+        for currency, amount in document.get_stored_totals().items():
+            totals[currency] = totals.get(currency, 0) + amount
+    parts = [
+        f"{CURRENCY_SYMBOLS.get(currency, currency)}{totals[currency]:,.2f}"
+        for currency in sorted(totals) if totals[currency] > 0
+    ]
+    return " + ".join(parts) if parts else "$0.00"
+
+
+def render_cover(batch, documents, entries):
+    """Cover page and table of contents PDF bytes (a few pages at most)"""
+    from .pdf_renderer import get_renderer
+
+    html_string = render_to_string(TEMPLATE, {
+        'batch': batch,
+        'entries': entries,
+        'total_amount_display': totals_display(documents),
+        'total_usd': sum(entry['usd'] for entry in entries),
+        # Part of the document keys, unlike the render time (the bundle is cached)
+        'updated_at': max(document.updated_at for document in documents),
+    })
+    return get_renderer().render(html_string, TEMPLATE)
+
+
+def write_bundle(batch, documents, keys, entries, output, progress=None):
+    """
+    Write the cover, contents and every document PDF of a batch to output,
+    rendering the documents missing from the render cache in the pool first.
+
+    Args:
+        progress: Optional callable(done, total) told about the rendered documents
+    """
+    render_missing(documents, keys, progress)
+
+    with ExitStack() as open_files:
+        readers = []
+        for document in documents:
+            pdf_file, _ = generator_for(document).open_pdf_file(document)
+            readers.append(PdfReader(open_files.enter_context(pdf_file)))
+
+        # The contents' page numbers depend on the cover's length: render until it is stable
+        cover_pages = 1
+        for _ in range(3):
+            page = cover_pages + 1
+            for entry, reader in zip(entries, readers):
+                entry['page'] = page
+                page += len(reader.pages)
+            cover = PdfReader(io.BytesIO(render_cover(batch, documents, entries)))
+            if len(cover.pages) == cover_pages:
+                break
+            cover_pages = len(cover.pages)
+
+        pdf_writer = PdfWriter()
+        for page in cover.pages:
+            pdf_writer.add_page(page)
+        for entry, reader in zip(entries, readers):
+            start = len(pdf_writer.pages)
+            for page in reader.pages:
+                pdf_writer.add_page(page)
+            pdf_writer.add_outline_item(f"{entry['label']} - {entry['payee']}", start)
+
+        pdf_writer.write(output)
+
+
+def open_bundle(batch, documents, progress=None):
+    """
+    Open the bundle PDF of some documents of a batch (see batch_documents) from
+    the render cache, building it on a miss.
+
+    Returns tuple of (binary file, filename); the caller closes the file
+    """
+    keys = [generator_for(document).cache_key(document)[0] for document in documents]
+    entries = [contents_entry(document) for document in documents]
+
+    key = bundle_key(batch, keys, entries)
+    pdf_file = render_cache.get_or_render(
+        key, lambda output: write_bundle(batch, documents, keys, entries, output, progress)
+    )
+    return pdf_file, f'Batch_{batch.batch_number}.pdf'
+
+
+# ── Background job ──
+
+def request_bundle(batch, user, documents):
+    """
+    Queue the bundle of a batch for a user (documents: batch_documents(batch, user)),
+    or return the job of an identical earlier request.
+
+    Staff, who see every document, share one bundle. The job is reused until the
+    batch, one of the documents (or its attachments) or an exchange rate changes.
+
+    Returns:
+        (job, created)
+    """
+    from .export_jobs import request_export
+
+    sees_all = all(sees_all_documents(user, doc_type) for doc_type in ('pv', 'pf'))
+    filters = {'batch': batch.pk, 'user': None if sees_all else user.pk}
+    scopes = [app_cache.BATCHES, *(app_cache.document_scope(document) for document in documents)]
+    return request_export('batch_bundle', filters, user, scopes)
+
+
+def build_bundle(filters, progress):
+    """Exporter of 'batch_bundle' jobs (see request_bundle and export_jobs.EXPORTERS)"""
+    from accounts.models import User
+
+    batch = SignatureBatch.objects.select_related('created_by', 'signed_by').get(
+        pk=filters['batch'], status='SIGNED'
+    )
+    user = User.objects.get(pk=filters['user']) if filters['user'] else None
+    documents = batch_documents(batch, user)
+    if not documents:
+        raise ValueError('The batch has no approved documents to bundle')
+    return open_bundle(batch, documents, progress)
@@ -0,0 +1,199 @@
+"""
+Application cache facade: versioned keys on top of Django's cache framework.
+
+Cached values are grouped into version scopes. A key is stored under the current
+version of every scope it depends on, so invalidation never has to find or delete
+keys - bump() moves the scope to a new version and old entries are never read again
+(they age out through their TTL).
+
+Scopes:
+    DOCUMENTS   - any voucher / form / line item change
+    WORKFLOW    - a document changing status or current approver
+    ROLLUP      - the MonthlyDisbursement rollup changing (dashboard charts)
+    BATCHES     - signature batches and their items
+    RATES       - the ExchangeRate table (in-memory rate table in vouchers.currency)
+    REPORTS     - documents in the report statuses (vouchers.analytics report snapshot)
+    document_scope(doc) - one document (detail page fragments)
+
+The backend is whatever settings.CACHES['default'] is (local memory, file-based
+or Redis, see CACHE_BACKEND in settings). Version keys must be shared by every
+web worker, or a bump in one process leaves the others serving stale entries;
+check_shared_backend() (a deploy check) warns about a per-process cache.
+Hits and misses are counted per key namespace (the part before the first ':');
+see get_stats() and the cache_stats management command.
+
+Usage:
+    counts = get_or_compute(f'pending-counts:{user.pk}', (WORKFLOW, BATCHES), 300,
+                            lambda: compute_pending_counts(user))
+    bump(WORKFLOW)
+"""
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import transaction
+
+DOCUMENTS = 'documents'
+WORKFLOW = 'workflow'
+ROLLUP = 'rollup'
+BATCHES = 'batches'
+RATES = 'rates'
+REPORTS = 'reports'
+
+VERSION_PREFIX = 'cache-version:'
+STATS_PREFIX = 'cache-stats:'
+STATS_NAMESPACES_KEY = f'{STATS_PREFIX}namespaces'
+
+# Cached "no value" marker, so a computed None is not recomputed on every call
+_MISSING = object()
+
+
+def document_scope(document):
+    """Version scope of one PaymentVoucher / PaymentForm (also accepts a DocumentIndex row)"""
+    from .models import DocumentIndex, PaymentForm
+
+    if isinstance(document, DocumentIndex):
+        return f'document:{document.doc_type}:{document.document_id}'
+    doc_type = 'pf' if isinstance(document, PaymentForm) else 'pv'
+    return f'document:{doc_type}:{document.pk}'
+
+
+def _scopes(version_scope):
+    if not version_scope:
+        return ()
+    if isinstance(version_scope, str):
+        return (version_scope,)
+    return tuple(version_scope)
+
+
+# ── Configuration ──
+
+def check_shared_backend(app_configs=None, **kwargs):
+    """System check: the default cache must be shared between processes outside DEBUG"""
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.DEBUG or not backend.endswith('LocMemCache'):
+        return []
+    return [checks.Warning(
+        'The default cache is per process (LocMemCache), so cache invalidation only '
+        'reaches the process that made the change; other workers serve stale counts '
+        'and fragments until their TTL.',
+        hint="Set CACHE_BACKEND to 'file' (one host) or 'redis'.",
+        id='vouchers.W001',
+    )]
+
+
+# ── Versions ──
+
+def scope_versions(version_scope):
+    """Current version of each scope, creating missing ones (one cache round trip when warm)"""
+    scopes = _scopes(version_scope)
+    keys = [f'{VERSION_PREFIX}{scope}' for scope in scopes]
+    versions = cache.get_many(keys)
+
+    for key in keys:
+        if key not in versions:
+            # Start from the clock so a lost version key never resurrects old entries
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+
+    return [versions[key] for key in keys]
+
+
+def versioned_key(key, version_scope):
+    """
+    The cache key for `key` under the current versions of its scopes.
+
+    The scope names are part of the key, so values cached under different scopes
+    (e.g. the sidebar fragments of two documents) never share an entry.
+    """
+    scopes = _scopes(version_scope)
+    if not scopes:
+        return key
+    versions = scope_versions(scopes)
+    return f"{key}@{','.join(f'{scope}={version}' for scope, version in zip(scopes, versions))}"
+
+
+def _bump_now(scopes):
+    for scope in scopes:
+        key = f'{VERSION_PREFIX}{scope}'
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump(*scopes):
+    """
+    Invalidate everything cached under the given scopes.
+
+    Inside a transaction the bump happens on commit, so a concurrent request
+    cannot cache data that is about to be rolled back, or re-cache the old state.
+    """
+    transaction.on_commit(lambda: _bump_now(scopes))
+
+
+# ── Values ──
+
+def get_or_compute(key, version_scope, ttl, compute):
+    """
+    Return the cached value for key, or compute, cache and return it.
+
+    Args:
+        key: Cache key; the part before the first ':' names the stats namespace
+        version_scope: Scope name or iterable of scope names the value depends on
+        ttl: Seconds to keep the value (None = until its scopes are bumped)
+        compute: Zero-argument callable producing the value
+    """
+    full_key = versioned_key(key, version_scope)
+    value = cache.get(full_key, _MISSING)
+    if value is not _MISSING:
+        record(key, hit=True)
+        return value
+
+    record(key, hit=False)
+    value = compute()
+    cache.set(full_key, value, ttl)
+    return value
+
+
+# ── Hit / miss counters ──
+
+def namespace_of(key):
+    return key.split(':', 1)[0]
+
+
+def record(key, hit):
+    """Count a hit or miss for the key's namespace"""
+    namespace = namespace_of(key)
+    counter = f"{STATS_PREFIX}{namespace}:{'hits' if hit else 'misses'}"
+    try:
+        cache.incr(counter)
+    except ValueError:
+        if not cache.add(counter, 1, None):
+            cache.incr(counter)
+        namespaces = cache.get(STATS_NAMESPACES_KEY) or set()
+        if namespace not in namespaces:
+            cache.set(STATS_NAMESPACES_KEY, namespaces | {namespace}, None)
+
+
+def get_stats():
+    """{namespace: {'hits': int, 'misses': int}} for every namespace seen so far"""
+    namespaces = sorted(cache.get(STATS_NAMESPACES_KEY) or ())
+    keys = [f'{STATS_PREFIX}{ns}:{kind}' for ns in namespaces for kind in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    return {
+        ns: {
+            'hits': values.get(f'{STATS_PREFIX}{ns}:hits', 0),
+            'misses': values.get(f'{STATS_PREFIX}{ns}:misses', 0),
+        }
+        for ns in namespaces
+    }
+
+
+def reset_stats():
+    namespaces = cache.get(STATS_NAMESPACES_KEY) or ()
+    cache.delete_many(
+        [f'{STATS_PREFIX}{ns}:{kind}' for ns in namespaces for kind in ('hits', 'misses')]
+        + [STATS_NAMESPACES_KEY]
+    )
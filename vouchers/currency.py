@@ -0,0 +1,173 @@
+"""
+Currency conversion to USD with the date-effective ExchangeRate table.
+
+Amounts are converted at the rate in effect on their payment date: the
+ExchangeRate row with the latest effective_date on or before that day, or the
+earliest row for dates before the first one. A rate is units per 1 USD, so
+usd = amount / rate. A currency with no rate at all converts to 0.
+
+Two ways to convert many amounts at once:
+    SQL    - usd_amount() / document_usd() are query expressions, so a queryset is
+             converted inside the annotation or aggregate that reads it
+    Python - convert_totals() converts a list of (payment_date, totals) pairs
+             against an in-memory copy of the rate table (get_rate_table())
+
+Usage:
+    PaymentVoucher.objects.filter(...).aggregate(usd=Sum(document_usd()))
+    BatchVoucherItem.objects.annotate(usd=document_usd('voucher__'))
+    VoucherLineItem.objects.aggregate(usd=Sum(usd_amount(F('amount'), 'currency', 'voucher__payment_date')))
+    convert_totals([(voucher.payment_date, voucher.get_stored_totals()), ...])
+"""
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, Func, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from . import cache as app_cache
+from .models import CURRENCY_TOTAL_FIELDS, ExchangeRate
+
+BASE_CURRENCY = 'USD'
+
+AMOUNT_FIELD = DecimalField(max_digits=18, decimal_places=3)
+RATE_FIELD = DecimalField(max_digits=18, decimal_places=6)
+
+
+# ── SQL ──
+
+class Divide(Func):
+    """
+    amount / rate in fractional arithmetic.
+
+    SQLite stores whole-number decimals as integers and would divide them as
+    integers (4000 / 4100 = 0); multiplying by 1.0 first is a no-op elsewhere.
+    """
+    arg_joiner = ' * 1.0 / '
+    template = '(%(expressions)s)'
+    output_field = AMOUNT_FIELD
+
+
+def rate_on(currency, day):
+    """
+    Subquery expression: units of currency per USD on day.
+
+    Args:
+        currency: A currency code or an expression (e.g. OuterRef('currency'))
+        day: An expression for the date (e.g. OuterRef('payment_date'))
+    """
+    rates = ExchangeRate.objects.filter(currency=currency)
+    in_effect = rates.filter(effective_date__lte=day).order_by('-effective_date').values('rate')[:1]
+    earliest = rates.order_by('effective_date').values('rate')[:1]
+    return Coalesce(Subquery(in_effect), Subquery(earliest), output_field=RATE_FIELD)
+
+
+def usd_amount(amount, currency_field, date_field):
+    """
+    Expression converting a per-row amount in the row's own currency to USD.
+
+    Args:
+        amount: Amount expression (e.g. F('amount'))
+        currency_field: Path of the currency column (e.g. 'currency')
+        date_field: Path of the payment date (e.g. 'voucher__payment_date')
+    """
+    return Case(
+        When(**{currency_field: BASE_CURRENCY}, then=amount),
+        default=Divide(amount, rate_on(OuterRef(currency_field), OuterRef(date_field))),
+        output_field=AMOUNT_FIELD,
+    )
+
+
+def document_usd(prefix=''):
+    """
+    Expression for the USD equivalent of a document's stored per-currency totals.
+
+    Works on anything with total_usd / total_khr / ... and payment_date columns
+    (PaymentVoucher, PaymentForm, DocumentIndex), or through a relation via prefix
+    (e.g. 'voucher__' on BatchVoucherItem).
+    """
+    day = OuterRef(f'{prefix}payment_date')
+    parts = []
+    for currency, field in CURRENCY_TOTAL_FIELDS.items():
+        total = F(f'{prefix}{field}')
+        if currency != BASE_CURRENCY:
+            total = Coalesce(Divide(total, rate_on(currency, day)), Value(Decimal('0')), output_field=AMOUNT_FIELD)
+        parts.append(total)
+
+    expression = parts[0]
+    for part in parts[1:]:
+        expression = expression + part
+    return Coalesce(expression, Value(Decimal('0')), output_field=AMOUNT_FIELD)
+
+
+# ── In memory ──
+
+class RateTable:
+    """Snapshot of the ExchangeRate table for converting many amounts in Python"""
+
+    def __init__(self, rows):
+        """rows: (currency, effective_date, rate) tuples"""
+        self.dates = {}
+        self.rates = {}
+        for currency, effective_date, rate in sorted(rows):
+            self.dates.setdefault(currency, []).append(effective_date)
+            self.rates.setdefault(currency, []).append(rate)
+
+    def rate(self, currency, day):
+        """Units of currency per USD on day (None if the currency has no rate)"""
+        if currency == BASE_CURRENCY:
+            return Decimal('1')
+        dates = self.dates.get(currency)
+        if not dates:
+            return None
+        index = bisect_right(dates, day) - 1 if day else len(dates) - 1
+        return self.rates[currency][max(index, 0)]
+
+    def to_usd(self, totals, day):
+        """USD equivalent of a {currency: amount} dict on day"""
+        usd = Decimal('0')
+        for currency, amount in totals.items():
+            if not amount:
+                continue
+            rate = self.rate(currency, day)
+            if rate:
+                usd += Decimal(amount) / rate
+        return usd
+
+
+_rate_table = None
+_rate_table_version = None
+
+
+def get_rate_table():
+    """
+    The current RateTable, cached in process memory.
+
+    The copy is reused until the RATES cache scope is bumped (any ExchangeRate
+    change, see vouchers.signals), so each call costs one cache read.
+    """
+    global _rate_table, _rate_table_version
+
+    version = app_cache.scope_versions(app_cache.RATES)[0]
+    if _rate_table is None or version != _rate_table_version:
+        _rate_table = RateTable(ExchangeRate.objects.values_list('currency', 'effective_date', 'rate'))
+        _rate_table_version = version
+    return _rate_table
+
+
+def convert_totals(rows):
+    """
+    Convert many documents at once.
+
+    Args:
+        rows: Iterable of (payment_date, {currency: amount}) pairs
+
+    Returns:
+        List of USD Decimals, in the same order
+    """
+    table = get_rate_table()
+    return [table.to_usd(totals, day) for day, totals in rows]
+
+
+def to_usd(totals, day):
+    """USD equivalent of one {currency: amount} dict on day"""
+    return get_rate_table().to_usd(totals, day)
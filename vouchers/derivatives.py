@@ -0,0 +1,150 @@
+"""
+PDF derivatives of image attachments.
+
+Merging an image attachment into a document PDF used to decode the full
+resolution photo, flatten its alpha and re-encode it on every render. Instead,
+each JPG / PNG / GIF / BMP / TIFF attachment gets a one-page PDF derivative,
+stored next to the original (receipt.jpg -> receipt.jpg.pdf) in its
+pdf_derivative field:
+
+    - EXIF orientation applied, alpha flattened onto white, converted to RGB
+    - downscaled to fit an A4 page at DERIVATIVE_DPI; smaller images keep their
+      pixels and the old 100 dpi page size
+
+It is created in a background thread once the upload commits (the post_save
+signal in vouchers.signals calls schedule_derivative), so the upload request
+does no image work. The PDF merge only reads derivatives; one that does not
+exist yet (upload still converting, or attachments older than this) is created
+there once and kept. Existing attachments can be converted ahead with:
+    python manage.py create_attachment_derivatives
+
+Usage:
+    schedule_derivative(attachment)             # after an upload
+    pdf_file = open_derivative(attachment)      # in the merge; the caller closes it
+"""
+import logging
+import os
+import tempfile
+import threading
+
+from django.core.files import File
+from django.db import connection, transaction
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'tif']
+
+# Resolution of downscaled images; an A4 page holds 1240 x 1754 pixels at 150 dpi
+DERIVATIVE_DPI = 150
+
+# Resolution of images that already fit on an A4 page at this resolution (unchanged page size)
+MIN_DPI = 100
+
+A4_INCHES = (8.27, 11.69)
+
+
+def is_image(attachment):
+    return attachment.get_file_extension() in IMAGE_EXTENSIONS
+
+
+def convert_image_to_pdf(source, output):
+    """
+    Write an image as a normalized one-page PDF.
+
+    Args:
+        source: Path or binary file of the image
+        output: Binary file the PDF is written to
+    """
+    with Image.open(source) as img:
+        img = ImageOps.exif_transpose(img)
+
+        # Convert to RGB if necessary (for PNG with transparency)
+        if img.mode in ('RGBA', 'LA', 'P'):
+            if img.mode == 'P':
+                img = img.convert('RGBA')
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            img = background
+        elif img.mode != 'RGB':
+            img = img.convert('RGB')
+
+        # Fit an A4 page (turned to the image's orientation) at DERIVATIVE_DPI
+        page = A4_INCHES if img.height >= img.width else A4_INCHES[::-1]
+        scale = min(1, page[0] * DERIVATIVE_DPI / img.width, page[1] * DERIVATIVE_DPI / img.height)
+        if scale < 1:
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            img = img.resize(size, Image.LANCZOS)
+
+        resolution = max(MIN_DPI, img.width / page[0], img.height / page[1])
+        img.save(output, 'PDF', resolution=resolution)
+
+
+def create_derivative(attachment):
+    """
+    Convert an image attachment and store its derivative (kept if another
+    thread or process stored one first).
+
+    Returns:
+        The attachment's derivative FieldFile, or None for non-image attachments
+    """
+    if not is_image(attachment) or not attachment.file:
+        return None
+    if attachment.pdf_derivative:
+        return attachment.pdf_derivative
+
+    with tempfile.TemporaryFile() as pdf_file:
+        with attachment.file.open('rb') as image_file:
+            convert_image_to_pdf(image_file, pdf_file)
+        pdf_file.seek(0)
+        name = os.path.basename(attachment.file.name) + '.pdf'
+        attachment.pdf_derivative.save(name, File(pdf_file), save=False)
+
+    # Conditional update: the first stored derivative wins, and none is set on a deleted attachment
+    model = type(attachment)
+    if not model.objects.filter(pk=attachment.pk, pdf_derivative='').update(
+        pdf_derivative=attachment.pdf_derivative.name
+    ):
+        attachment.pdf_derivative.delete(save=False)
+        stored = model.objects.filter(pk=attachment.pk).values_list('pdf_derivative', flat=True).first()
+        attachment.pdf_derivative = stored or None
+    return attachment.pdf_derivative or None
+
+
+def open_derivative(attachment):
+    """The attachment's derivative PDF opened for binary reading (created if missing), or None"""
+    derivative = create_derivative(attachment)
+    if derivative is None:
+        return None
+    try:
+        return derivative.open('rb')
+    except FileNotFoundError:
+        # The file was removed from storage: convert again
+        type(attachment).objects.filter(pk=attachment.pk).update(pdf_derivative='')
+        attachment.pdf_derivative = None
+        return create_derivative(attachment).open('rb')
+
+
+def schedule_derivative(attachment):
+    """Create the derivative of a new image attachment in a background thread, after commit"""
+    if not is_image(attachment):
+        return
+    model, pk = type(attachment), attachment.pk
+
+    def _create_in_background():
+        try:
+            create_derivative(model.objects.get(pk=pk))
+        except model.DoesNotExist:
+            pass
+        except Exception:
+            # The merge converts it instead
+            logger.exception('Could not create the PDF derivative of %s #%s', model.__name__, pk)
+        finally:
+            connection.close()
+
+    def _start():
+        thread = threading.Thread(target=_create_in_background)
+        thread.daemon = True  # Thread will close when main program exits
+        thread.start()
+
+    transaction.on_commit(_start)
@@ -0,0 +1,231 @@
+"""
+Streaming Excel export engine shared by the report, template and batch exporters.
+
+Workbooks are written in openpyxl write-only mode: every appended row goes
+straight to a temporary file, so memory does not grow with the number of rows.
+Cell formatting uses the named styles in STYLES, registered once per workbook,
+instead of Font / Border / Alignment objects assigned cell by cell. Documents
+are read from the database in chunks (iter_documents), and the finished .xlsx
+is streamed to the client from a temporary file (ExcelSheet.response).
+
+Write-only sheets are written top to bottom, so a row's merged ranges and
+styles have to be known when it is appended.
+
+Usage:
+    sheet = ExcelSheet('Payment Summary', {'A': 5.0, 'B': 15.0, ...})
+    sheet.append({'A': ('Company name', 'company')}, merge=['A:H'])
+    for doc in iter_documents(vouchers, forms, key=lambda doc: doc.payment_date):
+        sheet.append({'A': (idx, 'cell_center'), 'B': (doc.pv_number, 'cell'), ...})
+    return sheet.response('report.xlsx')
+"""
+import heapq
+import tempfile
+
+from django.http import FileResponse
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import column_index_from_string
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Documents fetched per query while streaming rows (line items are prefetched per chunk)
+CHUNK_SIZE = 500
+
+COMPANY_NAME = "Phat Phnom Penh  Co.,LTD  (Garden City Water Park)"
+
+AMOUNT_FORMAT = '#,##0.00'
+
+
+# ── Named styles ──
+
+THIN_BORDER = Border(
+    left=Side(style='thin', color='000000'),
+    right=Side(style='thin', color='000000'),
+    top=Side(style='thin', color='000000'),
+    bottom=Side(style='thin', color='000000')
+)
+
+ALIGNMENTS = {
+    'center': Alignment(horizontal='center', vertical='center', wrap_text=True),
+    'left': Alignment(horizontal='left', vertical='top', wrap_text=True),
+    'right': Alignment(horizontal='right', vertical='center'),
+}
+
+FILLS = {
+    'header': 'D9E1F2',         # Light blue column headers
+    'section': 'FDB462',        # Orange bank section headers
+    'table_header': 'B3CDE3',   # Blue section table headers
+    'subtotal': 'E6F3FF',       # Light blue subtotals
+    'grand_total': '4472C4',    # Dark blue grand totals
+}
+
+# name: (font size, bold, alignment, fill, bordered, extra font / cell options)
+STYLES = {
+    'company': (14, True, 'center', None, False, {}),
+    'report_title': (13, True, 'center', None, False, {}),
+    'text': (11, False, 'left', None, False, {}),
+    'text_center': (11, False, 'center', None, False, {}),
+    'bold_left': (11, True, 'left', None, False, {}),
+    'bold_center': (11, True, 'center', None, False, {}),
+    'bold_right': (11, True, 'right', None, False, {}),
+    'note': (10, False, 'left', None, False, {'color': '666666'}),
+    'note_italic': (10, False, 'left', None, False, {'italic': True}),
+    'header': (11, True, 'center', 'header', True, {}),
+    'table_header': (10, True, 'center', 'table_header', True, {}),
+    'section': (11, True, 'left', 'section', True, {}),
+    'section_title': (12, True, 'center', 'section', True, {}),
+    'cell': (11, False, 'left', None, True, {}),
+    'cell_center': (11, False, 'center', None, True, {}),
+    'cell_right': (11, False, 'right', None, True, {}),
+    'cell_amount': (11, False, 'right', None, True, {'number_format': AMOUNT_FORMAT}),
+    'total_label': (11, True, 'right', None, True, {}),
+    'subtotal': (11, True, 'right', 'subtotal', True, {}),
+    'grand_total': (12, True, 'right', 'grand_total', True, {'color': 'FFFFFF'}),
+    'grand_total_amount': (12, True, 'right', 'grand_total', True, {'color': 'FFFFFF', 'number_format': AMOUNT_FORMAT}),
+}
+
+
+def named_styles():
+    """A fresh NamedStyle per STYLES entry (a NamedStyle can only belong to one workbook)"""
+    styles = []
+    for name, (size, bold, align, fill, bordered, options) in STYLES.items():
+        style = NamedStyle(name=name)
+        style.font = Font(
+            name='Calibri', size=size, bold=bold,
+            italic=options.get('italic', False), color=options.get('color', '000000'),
+        )
+        style.alignment = ALIGNMENTS[align]
+        if fill:
+            style.fill = PatternFill(start_color=FILLS[fill], end_color=FILLS[fill], fill_type='solid')
+        if bordered:
+            style.border = THIN_BORDER
+        if 'number_format' in options:
+            style.number_format = options['number_format']
+        styles.append(style)
+    return styles
+
+
+# ── Sheet ──
+
+class ExcelSheet:
+    """A single-sheet write-only workbook, written one row at a time"""
+
+    def __init__(self, title, column_widths):
+        """
+        Args:
+            title: Worksheet title
+            column_widths: {column letter: width}, in column order
+        """
+        self.workbook = Workbook(write_only=True)
+        for style in named_styles():
+            self.workbook.add_named_style(style)
+
+        self.worksheet = self.workbook.create_sheet(title[:31])
+        for column, width in column_widths.items():
+            self.worksheet.column_dimensions[column].width = width
+
+        self.columns = list(column_widths)
+        self.last_row = 0
+
+    @property
+    def next_row(self):
+        """Number of the row the next append() writes"""
+        return self.last_row + 1
+
+    def append(self, cells=None, merge=()):
+        """
+        Write the next row.
+
+        Args:
+            cells: {column letter: (value, style name)}; style may be None
+            merge: Column spans to merge in this row, e.g. ['A:D', 'G:H']
+
+        Returns:
+            The row number written
+        """
+        row = self.next_row
+        for span in merge:
+            first, last = span.split(':')
+            self.merge(f'{first}{row}:{last}{row}')
+
+        values = []
+        for column, (value, style) in sorted(
+            (cells or {}).items(), key=lambda item: column_index_from_string(item[0])
+        ):
+            values.extend([None] * (column_index_from_string(column) - 1 - len(values)))
+            cell = WriteOnlyCell(self.worksheet, value)
+            if style:
+                cell.style = style
+            values.append(cell)
+
+        self.worksheet.append(values)
+        self.last_row = row
+        return row
+
+    def skip(self, count=1):
+        """Write empty rows"""
+        for _ in range(count):
+            self.append()
+
+    def merge(self, cell_range):
+        """Merge a range (e.g. 'A5:A6'); may cover rows not written yet"""
+        self.worksheet.merged_cells.add(cell_range)
+
+    def blank_cells(self, style, columns=None):
+        """{column: (None, style)} for bordered or filled empty cells (default: every column)"""
+        return {column: (None, style) for column in (columns or self.columns)}
+
+    def landscape_a4(self, print_area=None):
+        """Fit-to-width landscape A4 page setup used by every export"""
+        ws = self.worksheet
+        ws.page_setup.paperSize = 9  # A4
+        ws.page_setup.orientation = 'landscape'
+        ws.page_setup.fitToHeight = 0
+        ws.page_setup.fitToWidth = 1
+        ws.sheet_properties.pageSetUpPr.fitToPage = True
+        ws.print_options.horizontalCentered = True
+        ws.print_options.verticalCentered = False
+        ws.print_options.gridLines = False
+        ws.page_margins.left = 0.4
+        ws.page_margins.right = 0.4
+        ws.page_margins.top = 0.5
+        ws.page_margins.bottom = 0.5
+        if print_area:
+            ws.print_area = print_area
+
+    def save(self, target):
+        """Write the workbook to a path or binary file object"""
+        self.workbook.save(target)
+
+    def to_file(self):
+        """The finished workbook in an anonymous temporary file, positioned at the start"""
+        output = tempfile.TemporaryFile(suffix='.xlsx')
+        self.save(output)
+        output.seek(0)
+        return output
+
+    def response(self, filename):
+        """Stream the workbook as a download (the temporary file is removed once sent)"""
+        return xlsx_response(self.to_file(), filename)
+
+
+def xlsx_response(file, filename):
+    """Streaming download response for an .xlsx file object"""
+    return FileResponse(file, as_attachment=True, filename=filename, content_type=XLSX_CONTENT_TYPE)
+
+
+# ── Reading documents ──
+
+def iter_documents(*querysets, key=None):
+    """
+    Iterate querysets in CHUNK_SIZE batches (prefetch_related runs per batch).
+
+    With several querysets and a key, their rows are merged into one sequence
+    ordered by key; each queryset must already be ordered by it. Rows with equal
+    keys keep the order of the querysets.
+    """
+    iterators = [queryset.iterator(chunk_size=CHUNK_SIZE) for queryset in querysets]
+    if len(iterators) == 1:
+        return iterators[0]
+    return heapq.merge(*iterators, key=key)
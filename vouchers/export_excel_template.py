@@ -1,19 +1,16 @@
 """
 Excel Export View with Custom Template Format
-Exports Payment Vouchers to Excel matching the exact template specification
+Exports Payment Vouchers to Excel matching the exact template specification.
+Rows are streamed through the shared write-only engine in excel_export.
 """
 
-from django.http import HttpResponse
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
-from datetime import datetime
-from io import BytesIO
+from itertools import chain
 
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
-
-from .models import PaymentVoucher, PaymentForm
+from .excel_export import COMPANY_NAME, ExcelSheet, iter_documents
+from .models import PaymentVoucher, PaymentForm, MonthlyDisbursement
+from .search import filter_documents
 
 
 @login_required
@@ -31,6 +28,25 @@ def export_excel_template_view(request):
         - payee_name: Filter by payee name (partial match)
         - bank_account: Filter by specific company bank account ID
     """
+    return build_template_sheet(request.GET).response(template_filename())
+
+
+def template_filename():
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return f'Payment_Voucher_Summary_{timestamp}.xlsx'
+
+
+def build_template_sheet(params, progress=None):
+    """
+    Build the template workbook (also run by background export jobs).
+
+    Args:
+        params: The export_excel_template_view GET parameters (any mapping)
+        progress: Optional callable(done, total) called after every document row
+
+    Returns:
+        The written ExcelSheet
+    """
 
     # ===========================================================================
     # 1. APPLY FILTERS
@@ -40,8 +56,8 @@ def export_excel_template_view(request):
     forms_qs = PaymentForm.objects.all()
 
     # Date range filter
-    date_from = request.GET.get('date_from')
-    date_to = request.GET.get('date_to')
+    date_from = params.get('date_from')
+    date_to = params.get('date_to')
 
     if date_from:
         vouchers_qs = vouchers_qs.filter(payment_date__gte=date_from)
@@ -52,65 +68,57 @@ def export_excel_template_view(request):
         forms_qs = forms_qs.filter(payment_date__lte=date_to)
 
     # Status filter - default to APPROVED only
-    status = request.GET.get('status', 'APPROVED')
+    status = params.get('status', 'APPROVED')
     if status and status != 'ALL':
         vouchers_qs = vouchers_qs.filter(status=status)
         forms_qs = forms_qs.filter(status=status)
 
     # Creator filter
-    creator_id = request.GET.get('creator')
+    creator_id = params.get('creator')
     if creator_id:
         vouchers_qs = vouchers_qs.filter(created_by_id=creator_id)
         forms_qs = forms_qs.filter(created_by_id=creator_id)
 
     # Department filter
-    department_name = request.GET.get('department')
+    department_name = params.get('department')
     if department_name:
-        vouchers_qs = vouchers_qs.filter(line_items__department__name=department_name).distinct()
-        forms_qs = forms_qs.filter(line_items__department__name=department_name).distinct()
+        vouchers_qs = vouchers_qs.filter(
+            MonthlyDisbursement.department_filter(PaymentVoucher, department__name=department_name))
+        forms_qs = forms_qs.filter(
+            MonthlyDisbursement.department_filter(PaymentForm, department__name=department_name))
 
     # Payee filter
-    payee_name = request.GET.get('payee_name')
+    payee_name = params.get('payee_name')
     if payee_name:
-        vouchers_qs = vouchers_qs.filter(payee_name__icontains=payee_name)
-        forms_qs = forms_qs.filter(payee_name__icontains=payee_name)
+        vouchers_qs = filter_documents(vouchers_qs, payee_name, 'payee', 'pv')
+        forms_qs = filter_documents(forms_qs, payee_name, 'payee', 'pf')
 
     # Bank account filter
-    bank_account_id = request.GET.get('bank_account')
+    bank_account_id = params.get('bank_account')
     if bank_account_id:
         vouchers_qs = vouchers_qs.filter(company_bank_account_id=bank_account_id)
         forms_qs = forms_qs.filter(company_bank_account_id=bank_account_id)
 
     # Document type filter
-    doc_type = request.GET.get('doc_type', 'ALL')
+    doc_type = params.get('doc_type', 'ALL')
     if doc_type == 'PV':
         forms_qs = PaymentForm.objects.none()
     elif doc_type == 'PF':
         vouchers_qs = PaymentVoucher.objects.none()
 
-    # Prefetch related data
-    vouchers = vouchers_qs.select_related('created_by', 'company_bank_account').prefetch_related('line_items')
-    forms = forms_qs.select_related('created_by', 'company_bank_account').prefetch_related('line_items')
-
-    # Combine vouchers and forms into a single list
-    all_documents = list(vouchers) + list(forms)
-
-    # Sort by payment date
-    all_documents.sort(key=lambda x: x.payment_date)
-
-    # ===========================================================================
-    # 2. CREATE WORKBOOK
-    # ===========================================================================
-
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Payment Voucher Summary"
+    # Merge vouchers and forms by payment date while streaming them in chunks
+    vouchers = (vouchers_qs.select_related('created_by', 'company_bank_account').prefetch_related('line_items')
+                .order_by('payment_date', '-created_at'))
+    forms = (forms_qs.select_related('created_by', 'company_bank_account').prefetch_related('line_items')
+             .order_by('payment_date', '-created_at'))
+    all_documents = iter_documents(vouchers, forms, key=lambda doc: doc.payment_date)
+    first_document = next(all_documents, None)
 
     # ===========================================================================
-    # 3. SET COLUMN WIDTHS (EXACT MATCH TO TEMPLATE)
+    # 2. CREATE WORKBOOK (COLUMN WIDTHS EXACT MATCH TO TEMPLATE)
     # ===========================================================================
 
-    column_widths = {
+    sheet = ExcelSheet("Payment Voucher Summary", {
         'A': 3.71,   # No
         'B': 15.14,  # PV No
         'C': 35.86,  # Supplier
@@ -119,330 +127,126 @@ def export_excel_template_view(request):
         'F': 32.86,  # Account Name
         'G': 25.86,  # Account Number
         'H': 22.0    # Remark
-    }
-
-    for col, width in column_widths.items():
-        ws.column_dimensions[col].width = width
-
-    # ===========================================================================
-    # 4. DEFINE STYLES
-    # ===========================================================================
-
-    # Font styles
-    header_font = Font(name='Calibri', size=11, bold=True, color='000000')
-    company_font = Font(name='Calibri', size=14, bold=True, color='000000')
-    title_font = Font(name='Calibri', size=13, bold=True, color='000000')
-    data_font = Font(name='Calibri', size=11, color='000000')
-
-    # Fill styles
-    header_fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
-
-    # Border styles
-    thin_border = Border(
-        left=Side(style='thin', color='000000'),
-        right=Side(style='thin', color='000000'),
-        top=Side(style='thin', color='000000'),
-        bottom=Side(style='thin', color='000000')
-    )
-
-    # Alignment styles
-    center_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-    left_alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-    right_alignment = Alignment(horizontal='right', vertical='center')
-
-    # ===========================================================================
-    # 5. ROW 1: COMPANY NAME
-    # ===========================================================================
-
-    ws.merge_cells('A1:H1')
-    company_cell = ws['A1']
-    # TODO: Customize company name here
-    company_cell.value = "Phat Phnom Penh  Co.,LTD  (Garden City Water Park)"
-    company_cell.font = company_font
-    company_cell.alignment = center_alignment
+    })
 
     # ===========================================================================
-    # 6. ROW 2: TITLE
+    # 3. ROWS 1-2: COMPANY NAME AND TITLE
     # ===========================================================================
 
-    ws.merge_cells('A2:H2')
-    title_cell = ws['A2']
-    title_cell.value = "Summary Payment Voucher"
-    title_cell.font = title_font
-    title_cell.alignment = center_alignment
+    # TODO: Customize company name in excel_export.COMPANY_NAME
+    sheet.append({'A': (COMPANY_NAME, 'company')}, merge=['A:H'])
+    sheet.append({'A': ("Summary Payment Voucher", 'report_title')}, merge=['A:H'])
 
     # ===========================================================================
-    # 7. ROW 3: ACCOUNT NUMBER AND DATE
+    # 4. ROWS 3-4: ACCOUNT NUMBER, DATE AND TRANSFER BY ACCOUNT
     # ===========================================================================
 
-    # Account number (Column D)
-    account_cell = ws['D3']
     # TODO: This should be dynamic based on filtered bank account
     # For now, we'll use the first document's account if available
-    if all_documents and hasattr(all_documents[0], 'company_bank_account') and all_documents[0].company_bank_account:
-        account_cell.value = all_documents[0].company_bank_account.account_number
-    else:
-        account_cell.value = "N/A"  # Fallback if no account selected
-    account_cell.font = data_font
-    account_cell.alignment = left_alignment
-
-    # "Date" label (Column G)
-    date_label_cell = ws['G3']
-    date_label_cell.value = "Date"
-    date_label_cell.font = header_font
-    date_label_cell.alignment = right_alignment
-
-    # Current date (Column H)
-    date_cell = ws['H3']
-    date_cell.value = timezone.now().strftime('%Y-%m-%d')
-    date_cell.font = data_font
-    date_cell.alignment = left_alignment
+    bank_acc = first_document.company_bank_account if first_document else None
 
-    # ===========================================================================
-    # 8. ROW 4: TRANSFER BY ACCOUNT
-    # ===========================================================================
-
-    ws.merge_cells('A4:H4')
-    transfer_cell = ws['A4']
+    sheet.append({
+        'D': (bank_acc.account_number if bank_acc else "N/A", 'text'),
+        'G': ("Date", 'bold_right'),
+        'H': (timezone.now().strftime('%Y-%m-%d'), 'text'),
+    })
 
-    # Get transfer account info from first document
-    if all_documents and hasattr(all_documents[0], 'company_bank_account') and all_documents[0].company_bank_account:
-        bank_acc = all_documents[0].company_bank_account
-        transfer_cell.value = f"Transfer by Account:  {bank_acc.company_name}, Account Number '{bank_acc.account_number} ({bank_acc.currency}) {bank_acc.bank}"
+    if bank_acc:
+        transfer = f"Transfer by Account:  {bank_acc.company_name}, Account Number '{bank_acc.account_number} ({bank_acc.currency}) {bank_acc.bank}"
     else:
-        transfer_cell.value = "Transfer by Account:  [Not Specified]"
-
-    transfer_cell.font = Font(name='Calibri', size=11, bold=False)
-    transfer_cell.alignment = left_alignment
+        transfer = "Transfer by Account:  [Not Specified]"
+    sheet.append({'A': (transfer, 'text')}, merge=['A:H'])
 
     # ===========================================================================
-    # 9. ROWS 5-6: COLUMN HEADERS (WITH MERGED CELLS)
+    # 5. ROWS 5-6: COLUMN HEADERS (WITH MERGED CELLS)
     # ===========================================================================
 
-    # Define header structure
-    headers_row5 = [
-        ('A5', 'No'),
-        ('B5', 'PV No.'),
-        ('C5', 'Supplier'),
-        ('D5', 'Description'),
-        ('E5', 'Amount'),
-        ('F5', 'Receiver Bank Account'),  # This will be merged F5:G5
-        ('H5', 'Remark')
-    ]
-
-    headers_row6 = [
-        ('F6', 'Account Name'),
-        ('G6', 'Account Number')
-    ]
-
-    # Merge cells for row 5
-    merge_ranges = [
-        'A5:A6',  # No
-        'B5:B6',  # PV No
-        'C5:C6',  # Supplier
-        'D5:D6',  # Description
-        'E5:E6',  # Amount
-        'F5:G5',  # Receiver Bank Account (merged horizontally)
-        'H5:H6'   # Remark
-    ]
-
-    for merge_range in merge_ranges:
-        ws.merge_cells(merge_range)
-
-    # Apply row 5 headers
-    for cell_ref, value in headers_row5:
-        cell = ws[cell_ref]
-        cell.value = value
-        cell.font = header_font
-        cell.alignment = center_alignment
-        cell.fill = header_fill
-        cell.border = thin_border
-
-    # Apply row 6 sub-headers
-    for cell_ref, value in headers_row6:
-        cell = ws[cell_ref]
-        cell.value = value
-        cell.font = header_font
-        cell.alignment = center_alignment
-        cell.fill = header_fill
-        cell.border = thin_border
-
-    # Apply borders to all merged header cells
-    for row in [5, 6]:
-        for col in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']:
-            cell = ws[f'{col}{row}']
-            if not cell.value:  # Only apply if not already set
-                cell.border = thin_border
-                cell.fill = header_fill
+    for merge_range in ['A5:A6', 'B5:B6', 'C5:C6', 'D5:D6', 'E5:E6', 'H5:H6']:
+        sheet.merge(merge_range)
+
+    sheet.append({
+        **sheet.blank_cells('header'),
+        'A': ('No', 'header'),
+        'B': ('PV No.', 'header'),
+        'C': ('Supplier', 'header'),
+        'D': ('Description', 'header'),
+        'E': ('Amount', 'header'),
+        'F': ('Receiver Bank Account', 'header'),
+        'H': ('Remark', 'header'),
+    }, merge=['F:G'])
+    sheet.append({
+        **sheet.blank_cells('header'),
+        'F': ('Account Name', 'header'),
+        'G': ('Account Number', 'header'),
+    })
 
     # ===========================================================================
-    # 10. DATA ROWS (STARTING FROM ROW 7)
+    # 6. DATA ROWS (STARTING FROM ROW 7)
     # ===========================================================================
 
-    current_row = 7
-    total_amounts = {'USD': 0, 'KHR': 0, 'THB': 0}  # Track all currencies
-
-    for idx, doc in enumerate(all_documents, start=1):
-        # Get document type
-        doc_type_str = 'PV' if isinstance(doc, PaymentVoucher) else 'PF'
+    currencies = ['USD', 'KHR', 'THB']
+    symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
+    total_amounts = {currency: 0 for currency in currencies}  # Track all currencies
 
+    documents = chain([first_document], all_documents) if first_document else []
+    total_documents = vouchers.count() + forms.count() if progress else 0
+    for idx, doc in enumerate(documents, start=1):
         # Get voucher/form number
         doc_number = doc.pv_number if isinstance(doc, PaymentVoucher) else doc.pf_number
 
         # Combine all line item descriptions
-        descriptions = []
-        for item in doc.line_items.all():
-            descriptions.append(item.description)
-        combined_description = '\n'.join(descriptions) if descriptions else ''
+        descriptions = [item.description for item in doc.line_items.all()]
 
-        # Calculate total amount for ALL currencies
-        totals = doc.calculate_grand_total()
-
-        # Currency symbols
-        symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
-
-        # Build amount string with all currencies using symbols
+        # Amounts for ALL currencies (stored totals, no line item query), with symbols
+        totals = doc.get_stored_totals()
         amount_parts = []
-        for currency in ['USD', 'KHR', 'THB']:
+        for currency in currencies:
             if currency in totals and totals[currency] > 0:
                 amount_parts.append(f"{symbols[currency]}{totals[currency]:,.2f}")
                 total_amounts[currency] += float(totals[currency])
 
-        amount_display = '\n'.join(amount_parts) if amount_parts else '0.00'
-
         # Get bank account information
         if doc.company_bank_account:
             account_name = f"{doc.company_bank_account.company_name}"
             account_number = doc.company_bank_account.account_number
-        elif doc.bank_name or doc.bank_account_number:
+        else:
             # Fallback to manual entry
             account_name = doc.bank_name or ''
             account_number = doc.bank_account_number or ''
-        else:
-            account_name = ''
-            account_number = ''
-
-        # Column A: Sequential number
-        cell_a = ws[f'A{current_row}']
-        cell_a.value = idx
-        cell_a.font = data_font
-        cell_a.alignment = center_alignment
-        cell_a.border = thin_border
-
-        # Column B: Voucher number
-        cell_b = ws[f'B{current_row}']
-        cell_b.value = doc_number or 'DRAFT'
-        cell_b.font = data_font
-        cell_b.alignment = left_alignment
-        cell_b.border = thin_border
-
-        # Column C: Supplier/Payee
-        cell_c = ws[f'C{current_row}']
-        cell_c.value = doc.payee_name
-        cell_c.font = data_font
-        cell_c.alignment = left_alignment
-        cell_c.border = thin_border
-
-        # Column D: Description
-        cell_d = ws[f'D{current_row}']
-        cell_d.value = combined_description
-        cell_d.font = data_font
-        cell_d.alignment = left_alignment
-        cell_d.border = thin_border
-
-        # Column E: Amount (right-aligned, show all currencies)
-        cell_e = ws[f'E{current_row}']
-        cell_e.value = amount_display
-        cell_e.font = data_font
-        cell_e.alignment = right_alignment
-        cell_e.border = thin_border
-
-        # Column F: Account Name
-        cell_f = ws[f'F{current_row}']
-        cell_f.value = account_name
-        cell_f.font = data_font
-        cell_f.alignment = left_alignment
-        cell_f.border = thin_border
-
-        # Column G: Account Number
-        cell_g = ws[f'G{current_row}']
-        cell_g.value = account_number
-        cell_g.font = data_font
-        cell_g.alignment = left_alignment
-        cell_g.border = thin_border
-
-        # Column H: Remark (blank for manual entry)
-        cell_h = ws[f'H{current_row}']
-        cell_h.value = ''
-        cell_h.font = data_font
-        cell_h.alignment = left_alignment
-        cell_h.border = thin_border
-
-        current_row += 1
+
+        sheet.append({
+            'A': (idx, 'cell_center'),
+            'B': (doc_number or 'DRAFT', 'cell'),
+            'C': (doc.payee_name, 'cell'),
+            'D': ('\n'.join(descriptions), 'cell'),
+            'E': ('\n'.join(amount_parts) if amount_parts else '0.00', 'cell_right'),
+            'F': (account_name, 'cell'),
+            'G': (account_number, 'cell'),
+            'H': ('', 'cell'),  # Remark (blank for manual entry)
+        })
+        if progress:
+            progress(idx, total_documents)
 
     # ===========================================================================
-    # 11. TOTAL ROWS - One row per currency
+    # 7. TOTAL ROWS - One row per currency
     # ===========================================================================
 
-    symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
-
-    for currency in ['USD', 'KHR', 'THB']:
+    for currency in currencies:
         if total_amounts[currency] > 0:
-            # Column D: "Total (Currency):" label
-            total_label_cell = ws[f'D{current_row}']
-            total_label_cell.value = f"Total ({currency}):"
-            total_label_cell.font = header_font
-            total_label_cell.alignment = right_alignment
-            total_label_cell.border = thin_border
-
-            # Column E: Total amount for this currency
-            total_amount_cell = ws[f'E{current_row}']
-            total_amount_cell.value = f"{symbols[currency]}{total_amounts[currency]:,.2f}"
-            total_amount_cell.font = header_font
-            total_amount_cell.alignment = right_alignment
-            total_amount_cell.border = thin_border
-
-            # Apply borders to other cells in total row
-            for col in ['A', 'B', 'C', 'F', 'G', 'H']:
-                cell = ws[f'{col}{current_row}']
-                cell.border = thin_border
-
-            current_row += 1
+            sheet.append({
+                **sheet.blank_cells('cell'),
+                'D': (f"Total ({currency}):", 'total_label'),
+                'E': (f"{symbols[currency]}{total_amounts[currency]:,.2f}", 'total_label'),
+            })
 
     # ===========================================================================
-    # 12. SIGNATURE SECTION (3 ROWS AFTER TOTAL)
+    # 8. SIGNATURE SECTION (3 ROWS AFTER TOTAL)
     # ===========================================================================
 
-    signature_row = current_row + 3
-
-    # Merge B:C for "Prepared by"
-    ws.merge_cells(f'B{signature_row}:C{signature_row}')
-    prepared_cell = ws[f'B{signature_row}']
-    prepared_cell.value = "Prepared by"
-    prepared_cell.font = header_font
-    prepared_cell.alignment = center_alignment
+    sheet.skip(3)
+    sheet.append({'B': ("Prepared by", 'bold_center')}, merge=['B:C'])
 
     # You can add more signature sections here if needed
     # For example: "Checked by", "Approved by", etc.
 
-    # ===========================================================================
-    # 13. GENERATE RESPONSE
-    # ===========================================================================
-
-    # Create filename with timestamp
-    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'Payment_Voucher_Summary_{timestamp}.xlsx'
-
-    # Save workbook to BytesIO
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    # Create HTTP response
-    response = HttpResponse(
-        output.read(),
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-    return response
+    return sheet
@@ -0,0 +1,282 @@
+"""
+Background report exports.
+
+The reports page queues an ExportJob instead of rendering the export inside the
+request. The run_export_jobs management command claims queued jobs, writes the
+file under MEDIA_ROOT/exports/ and records progress on the job row, which the
+page polls (export_job_status view) until it can link to the download.
+
+Identical requests share one job: the fingerprint covers the kind, the filters
+and the DOCUMENTS / RATES cache versions (vouchers.cache), so a request is
+answered with the queued, running or recently finished job for the same
+fingerprint until a document or exchange rate changes. Exports of a few
+documents (the signature batch bundles of vouchers.bundles) name narrower
+scopes instead, so unrelated documents do not start them over.
+
+While a job runs, its worker touches heartbeat_at every HEARTBEAT_INTERVAL; a
+job whose heartbeat is older than RUNNING_TIMEOUT belongs to a worker that died
+and is queued again. A claim is identified by the job's started_at, and every
+change after the claim is a conditional update on it, so a worker that lost its
+claim cannot overwrite the newer attempt (vouchers.pdf_jobs works the same way).
+
+Usage:
+    job, created = request_export('report_excel', filters, request.user)
+    job = claim_next_job()      # in the worker
+    run_job(job)
+"""
+import hashlib
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import connection
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from . import cache as app_cache
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# Query parameters an export can be filtered by (ReportGenerator filters plus bank_account for the template)
+FILTER_KEYS = ['date_from', 'date_to', 'status', 'creator', 'department', 'payee_name', 'doc_type', 'bank_account']
+
+# Finished exports are reused and kept this long, then purged with their files
+RETENTION = timedelta(hours=24)
+
+# A working export worker touches its job this often
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+
+# A running job without a heartbeat for this long is assumed to belong to a dead worker and is queued again
+RUNNING_TIMEOUT = timedelta(minutes=5)
+
+# Progress is saved when it moves by at least this many percent
+PROGRESS_STEP = 5
+
+
+# ── Exporters ──
+
+def export_report_excel(filters, progress):
+    from .reports import ReportGenerator
+
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return ReportGenerator(filters, progress).export_to_excel(), f'vouchers_report_{timestamp}.xlsx'
+
+
+def export_report_pdf(filters, progress):
+    from .reports import ReportGenerator
+
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    return ReportGenerator(filters, progress).export_to_pdf(), f'vouchers_report_{timestamp}.pdf'
+
+
+def export_template_excel(filters, progress):
+    from .export_excel_template import build_template_sheet, template_filename
+
+    return build_template_sheet(filters, progress).to_file(), template_filename()
+
+
+def export_batch_bundle(filters, progress):
+    from .bundles import build_bundle
+
+    return build_bundle(filters, progress)
+
+
+# kind: callable(filters, progress) -> (file object positioned at the start, download file name)
+EXPORTERS = {
+    'report_excel': export_report_excel,
+    'report_pdf': export_report_pdf,
+    'template_excel': export_template_excel,
+    'batch_bundle': export_batch_bundle,
+}
+
+# Kinds the reports page may queue (bundles are queued by the batch_bundle_pdf view, which checks access)
+REPORT_KINDS = ['report_excel', 'report_pdf', 'template_excel']
+
+
+# ── Requesting ──
+
+def clean_filters(params):
+    """The non-empty FILTER_KEYS values of a query dict, as a plain dict"""
+    return {key: params.get(key) for key in FILTER_KEYS if params.get(key)}
+
+
+def fingerprint(kind, filters, scopes=None):
+    """Hash of the kind, filters and current version of the data scopes (all documents and rates by default)"""
+    versions = app_cache.scope_versions(scopes or (app_cache.DOCUMENTS, app_cache.RATES))
+    payload = json.dumps([kind, filters, versions], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def request_export(kind, filters, user, scopes=None):
+    """
+    Queue an export, or return the existing job for an identical request.
+
+    Args:
+        scopes: vouchers.cache scopes the export reads, when narrower than every document
+
+    Returns:
+        (job, created)
+    """
+    if kind not in EXPORTERS:
+        raise ValueError(f'Unknown export kind: {kind}')
+
+    key = fingerprint(kind, filters, scopes)
+    existing = (
+        ExportJob.objects
+        .filter(fingerprint=key, created_at__gte=timezone.now() - RETENTION)
+        .filter(Q(status__in=['PENDING', 'RUNNING']) | Q(status='DONE') & ~Q(file=''))
+        .first()
+    )
+    if existing:
+        return existing, False
+
+    job = ExportJob.objects.create(kind=kind, filters=filters, fingerprint=key, requested_by=user)
+    return job, True
+
+
+# ── Worker ──
+
+def claim_next_job():
+    """Mark the oldest queued job RUNNING and return it (None when the queue is empty)"""
+    for job in ExportJob.objects.filter(status='PENDING').order_by('created_at')[:10]:
+        # Conditional update, so two workers never claim the same job
+        now = timezone.now()
+        claimed = ExportJob.objects.filter(pk=job.pk, status='PENDING').update(
+            status='RUNNING', started_at=now, heartbeat_at=now, progress=0,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def holding_claim(job):
+    """The job's row, as long as the claim the job instance was loaded with still holds"""
+    return ExportJob.objects.filter(pk=job.pk, status='RUNNING', started_at=job.started_at)
+
+
+def finish(job, **changes):
+    """
+    Apply changes to a claimed job (and to the instance) if the claim still holds.
+
+    Returns:
+        True if applied; otherwise the job is reloaded with its current state
+    """
+    if holding_claim(job).update(**changes):
+        for field, value in changes.items():
+            setattr(job, field, value)
+        return True
+    logger.warning('Export job %s was claimed again meanwhile; result of this attempt dropped', job.pk)
+    job.refresh_from_db()
+    return False
+
+
+@contextmanager
+def heartbeat(job):
+    """Touch the job's heartbeat_at every HEARTBEAT_INTERVAL while the block runs"""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+                holding_claim(job).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()  # this thread's own connection
+
+    thread = threading.Thread(target=beat, name=f'export-job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+class JobProgress:
+    """progress(done, total) callback saving the job's percentage every PROGRESS_STEP percent"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def __call__(self, done, total):
+        # 100 is saved with the file
+        percent = min(99, done * 100 // total) if total else 0
+        if percent >= self.job.progress + PROGRESS_STEP:
+            self.job.progress = percent
+            holding_claim(self.job).update(progress=percent)
+
+
+def run_job(job):
+    """Produce a claimed job's file; failures are recorded on the job, not raised"""
+    try:
+        with heartbeat(job):
+            output, filename = EXPORTERS[job.kind](job.filters, JobProgress(job))
+            with output:
+                job.file.save(filename, File(output, name=filename), save=False)
+    except Exception as e:
+        logger.exception('Export job %s failed', job.pk)
+        finish(job, status='FAILED', error=str(e), finished_at=timezone.now())
+        return job
+
+    stored = job.file.name
+    if not finish(
+        job, file=stored, filename=filename, status='DONE', progress=100, error='', finished_at=timezone.now(),
+    ):
+        # The newer attempt keeps its own file
+        job.file.storage.delete(stored)
+    return job
+
+
+def requeue_stale_jobs():
+    """Queue again jobs left RUNNING by a worker that died; returns how many"""
+    stale = ExportJob.objects.filter(
+        status='RUNNING', heartbeat_at__lt=timezone.now() - RUNNING_TIMEOUT,
+    )
+    count = 0
+    for job in stale:
+        # Skipped if the worker finished or beat meanwhile
+        count += holding_claim(job).filter(heartbeat_at=job.heartbeat_at).update(status='PENDING', progress=0)
+    return count
+
+
+def purge_expired_jobs():
+    """Delete finished jobs older than RETENTION and their files; returns how many"""
+    expired = ExportJob.objects.filter(
+        status__in=['DONE', 'FAILED'], finished_at__lt=timezone.now() - RETENTION,
+    )
+    count = 0
+    for job in expired:
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
+
+
+# ── Polling ──
+
+def download_url(job):
+    """Bundles are served inline by their batch's view, other exports as attachments"""
+    if job.kind == 'batch_bundle':
+        return reverse('vouchers:batch_bundle_pdf', args=[job.filters['batch']])
+    return reverse('vouchers:export_job_download', args=[job.pk])
+
+
+def job_payload(job):
+    """JSON state of a job for the polling endpoint"""
+    return {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'progress': job.progress,
+        'error': job.error,
+        'filename': job.filename,
+        'status_url': reverse('vouchers:export_job_status', args=[job.pk]),
+        'download_url': download_url(job) if job.status == 'DONE' else None,
+    }
@@ -10,7 +10,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from vouchers.models import PaymentVoucher, PaymentForm, VoucherAttachment, FormAttachment
 from vouchers.pdf_generator import VoucherPDFGenerator, FormPDFGenerator
-from django.core.files.base import ContentFile
+from django.core.files import File
 
 User = get_user_model()
 
@@ -91,15 +91,15 @@ class Command(BaseCommand):
                     # Generate and attach PDF
                     try:
                         if not dry_run:
-                            pdf_bytes, filename = VoucherPDFGenerator.generate_pdf_file(voucher)
-
-                            attachment = VoucherAttachment(
-                                voucher=voucher,
-                                filename=filename,
-                                file_size=len(pdf_bytes),
-                                uploaded_by=system_user
-                            )
-                            attachment.file.save(filename, ContentFile(pdf_bytes), save=True)
+                            pdf_file, filename = VoucherPDFGenerator.open_pdf_file(voucher)
+                            with File(pdf_file, name=filename) as pdf_content:
+                                attachment = VoucherAttachment(
+                                    voucher=voucher,
+                                    filename=filename,
+                                    file_size=pdf_content.size,
+                                    uploaded_by=system_user
+                                )
+                                attachment.file.save(filename, pdf_content, save=True)
 
                         self.stdout.write(
                             self.style.SUCCESS(f'[OK] {voucher.pv_number} - PDF attached ({pdf_filename})')
@@ -142,15 +142,15 @@ class Command(BaseCommand):
                     # Generate and attach PDF
                     try:
                         if not dry_run:
-                            pdf_bytes, filename = FormPDFGenerator.generate_pdf_file(form)
-
-                            attachment = FormAttachment(
-                                payment_form=form,
-                                filename=filename,
-                                file_size=len(pdf_bytes),
-                                uploaded_by=system_user
-                            )
-                            attachment.file.save(filename, ContentFile(pdf_bytes), save=True)
+                            pdf_file, filename = FormPDFGenerator.open_pdf_file(form)
+                            with File(pdf_file, name=filename) as pdf_content:
+                                attachment = FormAttachment(
+                                    payment_form=form,
+                                    filename=filename,
+                                    file_size=pdf_content.size,
+                                    uploaded_by=system_user
+                                )
+                                attachment.file.save(filename, pdf_content, save=True)
 
                         self.stdout.write(
                             self.style.SUCCESS(f'[OK] {form.pf_number} - PDF attached ({pdf_filename})')
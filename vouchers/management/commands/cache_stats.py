@@ -0,0 +1,53 @@
+"""
+Django management command to show application cache hit/miss counters per key
+namespace (see vouchers.cache).
+Usage: python manage.py cache_stats [--reset]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from vouchers import cache as app_cache
+
+
+class Command(BaseCommand):
+    help = 'Show application cache hits and misses per namespace'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Clear the counters after printing them',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING('APPLICATION CACHE STATISTICS'))
+        self.stdout.write('=' * 70)
+        self.stdout.write(f"\nBackend: {settings.CACHES['default']['BACKEND']}\n")
+
+        stats = app_cache.get_stats()
+        if not stats:
+            self.stdout.write('No cache activity recorded yet')
+        else:
+            self.stdout.write(f"{'Namespace':<36}{'Hits':>10}{'Misses':>10}{'Hit rate':>12}")
+            self.stdout.write('-' * 68)
+            total_hits = total_misses = 0
+            for namespace, counts in stats.items():
+                hits, misses = counts['hits'], counts['misses']
+                total_hits += hits
+                total_misses += misses
+                self.stdout.write(
+                    f"{namespace:<36}{hits:>10}{misses:>10}{self._rate(hits, misses):>12}"
+                )
+            self.stdout.write('-' * 68)
+            self.stdout.write(
+                f"{'Total':<36}{total_hits:>10}{total_misses:>10}{self._rate(total_hits, total_misses):>12}"
+            )
+
+        if options['reset']:
+            app_cache.reset_stats()
+            self.stdout.write('\n' + '=' * 70)
+            self.stdout.write(self.style.SUCCESS('✓ Counters reset'))
+
+    def _rate(self, hits, misses):
+        lookups = hits + misses
+        return f'{hits / lookups:.1%}' if lookups else '—'
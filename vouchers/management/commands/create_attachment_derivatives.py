@@ -0,0 +1,58 @@
+"""
+Django management command to create the PDF derivatives (vouchers.derivatives)
+of image attachments that do not have one yet, e.g. uploaded before derivatives
+existed or whose background conversion failed. Without it they are converted
+the first time a document PDF merges them.
+
+Usage:
+    python manage.py create_attachment_derivatives
+    python manage.py create_attachment_derivatives --dry-run
+"""
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from vouchers.derivatives import IMAGE_EXTENSIONS, create_derivative
+from vouchers.models import VoucherAttachment, FormAttachment
+
+
+class Command(BaseCommand):
+    help = 'Create missing PDF derivatives of image attachments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Show how many attachments would be converted without converting them',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING('CREATING ATTACHMENT PDF DERIVATIVES'))
+        self.stdout.write('=' * 70)
+
+        image_filter = Q()
+        for extension in IMAGE_EXTENSIONS:
+            image_filter |= Q(filename__iendswith=f'.{extension}')
+
+        created = errors = 0
+        for model in (VoucherAttachment, FormAttachment):
+            attachments = model.objects.filter(image_filter, pdf_derivative='').order_by('pk')
+            total = attachments.count()
+            self.stdout.write(f'\n{total} {model._meta.verbose_name_plural} without a derivative')
+            if dry_run:
+                continue
+
+            for attachment in attachments.iterator():
+                try:
+                    create_derivative(attachment)
+                    created += 1
+                except Exception as e:
+                    errors += 1
+                    self.stdout.write(self.style.ERROR(f'[ERROR] {attachment.file.name} - {e}'))
+
+        self.stdout.write('\n' + '=' * 70)
+        if dry_run:
+            self.stdout.write(self.style.WARNING('DRY RUN - nothing converted'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Created {created} derivative(s), {errors} error(s)'))
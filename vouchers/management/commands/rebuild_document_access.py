@@ -0,0 +1,49 @@
+"""
+Django management command to rebuild the DocumentAccess visibility table from
+document creators, current approvers and approval history.
+Usage: python manage.py rebuild_document_access
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from vouchers.models import PaymentVoucher, PaymentForm, DocumentAccess
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DocumentAccess visibility table for all payment vouchers and forms'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of documents processed per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING('REBUILDING DOCUMENT ACCESS'))
+        self.stdout.write('=' * 70)
+
+        with transaction.atomic():
+            deleted, _ = DocumentAccess.objects.all().delete()
+            self.stdout.write(f'\nRemoved {deleted} existing access row(s)')
+
+            for model in (PaymentVoucher, PaymentForm):
+                ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+                created = 0
+
+                for start in range(0, len(ids), batch_size):
+                    rows = DocumentAccess.rows_for(model, ids[start:start + batch_size])
+                    DocumentAccess.objects.bulk_create(rows, batch_size=batch_size)
+                    created += len(rows)
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ {created} access row(s) for {len(ids)} {model._meta.verbose_name_plural}'
+                ))
+
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Document access table contains {DocumentAccess.objects.count()} row(s)'
+        ))
@@ -0,0 +1,75 @@
+"""
+Django management command to rebuild the DocumentIndex table from
+PaymentVoucher and PaymentForm.
+Usage: python manage.py rebuild_document_index
+"""
+from collections import defaultdict
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from vouchers.models import (
+    PaymentVoucher, PaymentForm,
+    VoucherLineItem, FormLineItem,
+    DocumentIndex,
+)
+from vouchers.search import install_search_index, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DocumentIndex listing table from all payment vouchers and forms'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of documents indexed per batch (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING('REBUILDING DOCUMENT INDEX'))
+        self.stdout.write('=' * 70)
+
+        with transaction.atomic():
+            deleted, _ = DocumentIndex.objects.all().delete()
+            self.stdout.write(f'\nRemoved {deleted} existing index row(s)')
+
+            for model, line_model, fk_name in (
+                (PaymentVoucher, VoucherLineItem, 'voucher_id'),
+                (PaymentForm, FormLineItem, 'payment_form_id'),
+            ):
+                doc_type = DocumentIndex.doc_type_for(model)
+                ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+
+                for start in range(0, len(ids), batch_size):
+                    chunk = ids[start:start + batch_size]
+
+                    # Line item search text for the whole chunk in one query
+                    details = defaultdict(list)
+                    for doc_id, description, program, department in line_model.objects.filter(
+                        **{f'{fk_name}__in': chunk}
+                    ).values_list(fk_name, 'description', 'program', 'department__name'):
+                        details[doc_id].append((description, program, department))
+
+                    DocumentIndex.objects.bulk_create([
+                        DocumentIndex(
+                            doc_type=doc_type,
+                            document_id=document.pk,
+                            search_details=DocumentIndex.details_from_rows(details[document.pk]),
+                            **DocumentIndex.values_for(document)
+                        )
+                        for document in model.objects.filter(pk__in=chunk)
+                    ])
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ Indexed {len(ids)} {model._meta.verbose_name_plural}'
+                ))
+
+            # Restore missing full-text triggers, then re-index from the reloaded table
+            install_search_index()
+            rebuild_search_index()
+
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(self.style.SUCCESS(f'✓ Document index contains {DocumentIndex.objects.count()} row(s)'))
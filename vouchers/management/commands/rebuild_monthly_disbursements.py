@@ -0,0 +1,44 @@
+"""
+Django management command to rebuild the MonthlyDisbursement rollup from
+submitted payment vouchers and forms.
+Usage: python manage.py rebuild_monthly_disbursements
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from vouchers.models import PaymentVoucher, PaymentForm, DocumentIndex, MonthlyDisbursement, DisbursementShare
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the monthly disbursement rollup used by the dashboard charts'
+
+    def handle(self, *args, **options):
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING('REBUILDING MONTHLY DISBURSEMENTS'))
+        self.stdout.write('=' * 70)
+
+        with transaction.atomic():
+            deleted, _ = MonthlyDisbursement.objects.all().delete()
+            DisbursementShare.objects.all().delete()
+            self.stdout.write(f'\nRemoved {deleted} existing rollup row(s)')
+
+            for model in (PaymentVoucher, PaymentForm):
+                months = sorted({
+                    MonthlyDisbursement.month_of(day)
+                    for day in model.objects.filter(
+                        status__in=MonthlyDisbursement.DISBURSED_STATUSES
+                    ).values_list('payment_date', flat=True).distinct()
+                    if day
+                })
+
+                for month in months:
+                    MonthlyDisbursement.refresh_month(model, month)
+                cells = MonthlyDisbursement.objects.filter(doc_type=DocumentIndex.doc_type_for(model)).count()
+
+                self.stdout.write(self.style.SUCCESS(
+                    f'✓ {cells} cell(s) over {len(months)} month(s) of {model._meta.verbose_name_plural}'
+                ))
+
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rollup contains {MonthlyDisbursement.objects.count()} row(s)'
+        ))
@@ -11,8 +11,9 @@ Usage:
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
 from vouchers.models import PaymentVoucher, PaymentForm, VoucherAttachment, FormAttachment
+from vouchers.pdf_cache import render_cache
 from vouchers.pdf_generator import VoucherPDFGenerator, FormPDFGenerator
-from django.core.files.base import ContentFile
+from django.core.files import File
 
 User = get_user_model()
 
@@ -57,6 +58,12 @@ class Command(BaseCommand):
         self.stdout.write(f'Using system user: {system_user.username} for upload attribution')
         self.stdout.write('')
 
+        # Regenerating means rendering again, not reading the render cache
+        if not dry_run:
+            render_cache.clear()
+            self.stdout.write('Cleared the PDF render cache')
+            self.stdout.write('')
+
         pv_processed = 0
         pv_skipped = 0
         pv_errors = 0
@@ -118,19 +125,19 @@ class Command(BaseCommand):
                                 pass
 
                             # Generate new PDF with attachments
-                            pdf_bytes, filename = VoucherPDFGenerator.generate_pdf_file(
+                            pdf_file, filename = VoucherPDFGenerator.open_pdf_file(
                                 voucher,
                                 include_attachments=True
                             )
-
-                            # Create new attachment
-                            attachment = VoucherAttachment(
-                                voucher=voucher,
-                                filename=filename,
-                                file_size=len(pdf_bytes),
-                                uploaded_by=system_user
-                            )
-                            attachment.file.save(filename, ContentFile(pdf_bytes), save=True)
+                            with File(pdf_file, name=filename) as pdf_content:
+                                # Create new attachment
+                                attachment = VoucherAttachment(
+                                    voucher=voucher,
+                                    filename=filename,
+                                    file_size=pdf_content.size,
+                                    uploaded_by=system_user
+                                )
+                                attachment.file.save(filename, pdf_content, save=True)
 
                         attachment_count = user_attachments.count()
                         self.stdout.write(
@@ -201,19 +208,19 @@ class Command(BaseCommand):
                                 pass
 
                             # Generate new PDF with attachments
-                            pdf_bytes, filename = FormPDFGenerator.generate_pdf_file(
+                            pdf_file, filename = FormPDFGenerator.open_pdf_file(
                                 form,
                                 include_attachments=True
                             )
-
-                            # Create new attachment
-                            attachment = FormAttachment(
-                                payment_form=form,
-                                filename=filename,
-                                file_size=len(pdf_bytes),
-                                uploaded_by=system_user
-                            )
-                            attachment.file.save(filename, ContentFile(pdf_bytes), save=True)
+                            with File(pdf_file, name=filename) as pdf_content:
+                                # Create new attachment
+                                attachment = FormAttachment(
+                                    payment_form=form,
+                                    filename=filename,
+                                    file_size=pdf_content.size,
+                                    uploaded_by=system_user
+                                )
+                                attachment.file.save(filename, pdf_content, save=True)
 
                         attachment_count = user_attachments.count()
                         self.stdout.write(
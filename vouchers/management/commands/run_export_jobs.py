@@ -0,0 +1,88 @@
+"""
+Django management command running the background export worker: it produces
+queued ExportJob files (report Excel / PDF, template Excel, batch bundles) under
+MEDIA_ROOT/exports/, requeues jobs left running by a dead worker and purges
+finished exports after export_jobs.RETENTION.
+
+Run it next to the web server, e.g. as a systemd service or supervisor program:
+    python manage.py run_export_jobs
+
+Usage:
+    python manage.py run_export_jobs                 # poll forever
+    python manage.py run_export_jobs --once          # drain the queue and exit
+    python manage.py run_export_jobs --sleep 5       # seconds between polls
+"""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from vouchers.export_jobs import claim_next_job, purge_expired_jobs, requeue_stale_jobs, run_job
+
+# Requeue / purge housekeeping runs every this many seconds
+HOUSEKEEPING_INTERVAL = 300
+
+
+class Command(BaseCommand):
+    help = 'Produce queued report exports in the background'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Process every queued job, then exit',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when the queue is empty (default: 2)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING('EXPORT WORKER'))
+        self.stdout.write('=' * 70)
+
+        processed = failed = 0
+        last_housekeeping = 0
+
+        try:
+            while True:
+                close_old_connections()
+
+                if time.monotonic() - last_housekeeping >= HOUSEKEEPING_INTERVAL:
+                    self.housekeeping()
+                    last_housekeeping = time.monotonic()
+
+                job = claim_next_job()
+                if job is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                started = time.monotonic()
+                run_job(job)
+                elapsed = time.monotonic() - started
+
+                if job.status == 'DONE':
+                    processed += 1
+                    self.stdout.write(self.style.SUCCESS(
+                        f'✓ #{job.pk} {job.get_kind_display()} → {job.file.name} ({elapsed:.1f}s)'
+                    ))
+                else:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f'✗ #{job.pk} {job.get_kind_display()}: {job.error}'))
+        except KeyboardInterrupt:
+            self.stdout.write('\nStopping')
+
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(self.style.SUCCESS(f'✓ {processed} export(s) produced, {failed} failed'))
+
+    def housekeeping(self):
+        requeued = requeue_stale_jobs()
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s)'))
+        purged = purge_expired_jobs()
+        if purged:
+            self.stdout.write(f'Purged {purged} expired export(s)')
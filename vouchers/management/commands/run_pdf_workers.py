@@ -0,0 +1,142 @@
+"""
+Django management command running the PDF render worker pool: it renders the
+PDF attachment of every approved document queued in PDFRenderJob (see
+vouchers.pdf_jobs) in a bounded pool of worker processes, retries failed
+renders with backoff and recovers jobs left running by a worker that died.
+
+Run it next to the web server, e.g. as a systemd service or supervisor program:
+    python manage.py run_pdf_workers
+
+Usage:
+    python manage.py run_pdf_workers                  # settings.PDF_RENDER_WORKERS processes
+    python manage.py run_pdf_workers --workers 4      # render 4 documents at a time
+    python manage.py run_pdf_workers --once           # drain the queue and exit
+    python manage.py run_pdf_workers --max-tasks 20   # replace each process after 20 renders
+"""
+import multiprocessing
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from vouchers import pdf_pool
+from vouchers.models import PDFRenderJob
+from vouchers.pdf_jobs import claim_jobs, record_failure, requeue_stale_jobs
+
+# Stale job recovery runs every this many seconds
+HOUSEKEEPING_INTERVAL = 60
+
+
+class Command(BaseCommand):
+    help = "Render approved documents' PDF attachments in a pool of worker processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.PDF_RENDER_WORKERS,
+            help=f'Worker processes, i.e. documents rendered at a time (default: {settings.PDF_RENDER_WORKERS})',
+        )
+        parser.add_argument(
+            '--max-tasks',
+            type=int,
+            default=settings.PDF_RENDER_MAX_TASKS,
+            help=f'Renders before a worker process is replaced (default: {settings.PDF_RENDER_MAX_TASKS})',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Render every due job, then exit',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=2.0,
+            help='Seconds to wait between polls when the queue is empty (default: 2)',
+        )
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        self.max_tasks = options['max_tasks'] or None
+
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING(f'PDF RENDER WORKERS ({workers} processes)'))
+        self.stdout.write('=' * 70)
+
+        self.rendered = self.failed = 0
+        running = {}  # future: job id
+        last_housekeeping = 0
+        pool = self.start_pool(workers)
+
+        try:
+            while True:
+                close_old_connections()
+
+                if time.monotonic() - last_housekeeping >= HOUSEKEEPING_INTERVAL:
+                    requeued = requeue_stale_jobs()
+                    if requeued:
+                        self.stdout.write(self.style.WARNING(f'Requeued {requeued} stale job(s)'))
+                    last_housekeeping = time.monotonic()
+
+                # Only claim what the pool can start now; the rest stays queued for other workers
+                for job_id in claim_jobs(workers - len(running)):
+                    running[pool.submit(pdf_pool.render, job_id)] = job_id
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['sleep'])
+                    continue
+
+                done, _ = wait(running, timeout=options['sleep'], return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job_id = running.pop(future)
+                    try:
+                        self.report(*future.result())
+                    except BrokenProcessPool:
+                        broken = True
+                        self.process_died(job_id)
+                    except Exception as e:
+                        self.process_died(job_id, e)
+
+                if broken:
+                    # A process was killed (e.g. out of memory): the pool cannot be used again
+                    for future, job_id in running.items():
+                        future.cancel()
+                        self.process_died(job_id)
+                    running.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self.start_pool(workers)
+        except KeyboardInterrupt:
+            self.stdout.write('\nStopping (jobs in progress are requeued once stale)')
+        finally:
+            pool.shutdown(wait=not running, cancel_futures=True)
+
+        self.stdout.write('\n' + '=' * 70)
+        self.stdout.write(self.style.SUCCESS(f'✓ {self.rendered} PDF(s) attached, {self.failed} failed'))
+
+    def start_pool(self, workers):
+        # spawn: fresh processes without the parent's database connections
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=pdf_pool.init_process,
+            max_tasks_per_child=self.max_tasks,
+        )
+
+    def report(self, job_id, status, error):
+        if status == 'DONE':
+            self.rendered += 1
+            self.stdout.write(self.style.SUCCESS(f'✓ Job #{job_id} attached'))
+        elif status == 'PENDING':
+            self.stdout.write(self.style.WARNING(f'Job #{job_id} will be retried: {error}'))
+        else:
+            self.failed += 1
+            self.stdout.write(self.style.ERROR(f'✗ Job #{job_id} failed: {error}'))
+
+    def process_died(self, job_id, error='Worker process stopped while rendering'):
+        job = record_failure(PDFRenderJob.objects.get(pk=job_id), error)
+        self.report(job.pk, job.status, job.error)
@@ -0,0 +1,110 @@
+"""
+Django management command to backfill and verify the denormalized document totals
+(total_usd, total_khr, total_thb, total_rmb, line_count) on vouchers and forms.
+
+Usage:
+    python manage.py sync_document_totals            # recalculate and store
+    python manage.py sync_document_totals --verify   # report drift only
+"""
+from collections import defaultdict
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from vouchers.models import (
+    PaymentVoucher, PaymentForm,
+    VoucherLineItem, FormLineItem,
+    CURRENCY_TOTAL_FIELDS, compute_line_totals,
+)
+
+
+TOTAL_FIELDS = list(CURRENCY_TOTAL_FIELDS.values()) + ['line_count']
+
+
+class Command(BaseCommand):
+    help = 'Backfill or verify the stored per-currency totals on payment vouchers and forms'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only compare stored totals with line items; do not write anything',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Number of documents processed per batch (default: 500)',
+        )
+
+    def handle(self, *args, **options):
+        verify = options['verify']
+        batch_size = options['batch_size']
+
+        self.stdout.write('=' * 70)
+        self.stdout.write(self.style.WARNING(
+            'VERIFYING DOCUMENT TOTALS' if verify else 'SYNCING DOCUMENT TOTALS'
+        ))
+        self.stdout.write('=' * 70)
+
+        mismatched = 0
+        for model, line_model, fk_name, number_field in (
+            (PaymentVoucher, VoucherLineItem, 'voucher_id', 'pv_number'),
+            (PaymentForm, FormLineItem, 'payment_form_id', 'pf_number'),
+        ):
+            mismatched += self._process(model, line_model, fk_name, number_field, verify, batch_size)
+
+        self.stdout.write('\n' + '=' * 70)
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS('✓ All stored totals match their line items'))
+        elif verify:
+            raise CommandError(
+                f'{mismatched} document(s) have stale totals. '
+                f'Run "python manage.py sync_document_totals" to fix them.'
+            )
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Updated totals on {mismatched} document(s)'))
+
+    def _process(self, model, line_model, fk_name, number_field, verify, batch_size):
+        """Check one document type in batches; returns the number of stale documents"""
+        label = model._meta.verbose_name_plural.title()
+        self.stdout.write(f'\n{label}:')
+
+        ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+        mismatched = 0
+
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+
+            # One query for all line items in the chunk
+            rows = defaultdict(list)
+            for doc_id, currency, amount, vat in line_model.objects.filter(
+                **{f'{fk_name}__in': chunk}
+            ).values_list(fk_name, 'currency', 'amount', 'vat_applicable'):
+                rows[doc_id].append((currency, amount, vat))
+
+            stale = []
+            for doc in model.objects.filter(pk__in=chunk).only('pk', number_field, *TOTAL_FIELDS):
+                expected = compute_line_totals(rows[doc.pk])
+                if all(getattr(doc, field) == expected[field] for field in TOTAL_FIELDS):
+                    continue
+
+                if verify:
+                    self.stdout.write(self.style.ERROR(
+                        f'  ✗ {getattr(doc, number_field) or "DRAFT"} (ID: {doc.pk}): '
+                        + ', '.join(
+                            f'{field} {getattr(doc, field)} != {expected[field]}'
+                            for field in TOTAL_FIELDS
+                            if getattr(doc, field) != expected[field]
+                        )
+                    ))
+                for field in TOTAL_FIELDS:
+                    setattr(doc, field, expected[field])
+                stale.append(doc)
+
+            if stale and not verify:
+                with transaction.atomic():
+                    model.objects.bulk_update(stale, TOTAL_FIELDS)
+
+            mismatched += len(stale)
+
+        self.stdout.write(f'  Checked: {len(ids)}  Stale: {mismatched}')
+        return mismatched
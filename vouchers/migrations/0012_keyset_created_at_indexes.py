@@ -0,0 +1,31 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:14
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0011_data_migrate_finance_controller'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='paymentform',
+            name='vouchers_pa_created_5cce26_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='paymentvoucher',
+            name='vouchers_pa_created_f91ec8_idx',
+        ),
+        migrations.AddIndex(
+            model_name='paymentform',
+            index=models.Index(fields=['created_at', 'id'], name='vouchers_pa_created_7a6164_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentvoucher',
+            index=models.Index(fields=['created_at', 'id'], name='vouchers_pa_created_add0d2_idx'),
+        ),
+    ]
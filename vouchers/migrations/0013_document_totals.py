@@ -0,0 +1,92 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:16
+
+from decimal import Decimal
+from django.db import migrations, models
+
+
+def backfill_document_totals(apps, schema_editor):
+    """Populate the new per-currency totals and line_count from existing line items"""
+    fields = {'USD': 'total_usd', 'KHR': 'total_khr', 'THB': 'total_thb', 'RMB': 'total_rmb'}
+
+    for model_name, line_model_name, fk_name in (
+        ('PaymentVoucher', 'VoucherLineItem', 'voucher_id'),
+        ('PaymentForm', 'FormLineItem', 'payment_form_id'),
+    ):
+        Document = apps.get_model('vouchers', model_name)
+        LineItem = apps.get_model('vouchers', line_model_name)
+
+        values = {}
+        for doc_id, currency, amount, vat in LineItem.objects.values_list(
+            fk_name, 'currency', 'amount', 'vat_applicable'
+        ):
+            doc = values.setdefault(doc_id, {'line_count': 0})
+            if vat:
+                amount = amount * Decimal('1.1')
+            field = fields.get(currency)
+            if field:
+                doc[field] = doc.get(field, Decimal('0')) + amount
+            doc['line_count'] += 1
+
+        for doc_id, doc_values in values.items():
+            Document.objects.filter(pk=doc_id).update(**doc_values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0012_keyset_created_at_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentform',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentform',
+            name='total_khr',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='paymentform',
+            name='total_rmb',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='paymentform',
+            name='total_thb',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='paymentform',
+            name='total_usd',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='paymentvoucher',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='paymentvoucher',
+            name='total_khr',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='paymentvoucher',
+            name='total_rmb',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='paymentvoucher',
+            name='total_thb',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.AddField(
+            model_name='paymentvoucher',
+            name='total_usd',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18),
+        ),
+        migrations.RunPython(backfill_document_totals, migrations.RunPython.noop),
+    ]
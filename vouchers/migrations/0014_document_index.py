@@ -0,0 +1,66 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:18
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_document_index(apps, schema_editor):
+    """Create one DocumentIndex row for every existing voucher and form"""
+    DocumentIndex = apps.get_model('vouchers', 'DocumentIndex')
+    fields = ['payee_name', 'status', 'created_by_id', 'current_approver_id', 'payment_date',
+              'created_at', 'updated_at', 'total_usd', 'total_khr', 'total_thb', 'total_rmb']
+
+    for model_name, doc_type, number_field in (
+        ('PaymentVoucher', 'pv', 'pv_number'),
+        ('PaymentForm', 'pf', 'pf_number'),
+    ):
+        Document = apps.get_model('vouchers', model_name)
+        rows = [
+            DocumentIndex(
+                doc_type=doc_type,
+                document_id=doc.pk,
+                number=getattr(doc, number_field),
+                **{field: getattr(doc, field) for field in fields}
+            )
+            for doc in Document.objects.all().iterator()
+        ]
+        DocumentIndex.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0013_document_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentIndex',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('pv', 'Payment Voucher'), ('pf', 'Payment Form')], max_length=2)),
+                ('document_id', models.PositiveBigIntegerField()),
+                ('number', models.CharField(blank=True, max_length=20, null=True)),
+                ('payee_name', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('DRAFT', 'Draft'), ('PENDING_L2', 'Pending Account Supervisor'), ('PENDING_L3', 'Pending Finance Manager'), ('PENDING_L4', 'Pending Finance Controller'), ('PENDING_L5', 'Pending General Manager'), ('PENDING_L6', 'Pending Managing Director'), ('ON_REVISION', 'On Revision'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected')], max_length=20)),
+                ('payment_date', models.DateField()),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('total_usd', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18)),
+                ('total_khr', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18)),
+                ('total_thb', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18)),
+                ('total_rmb', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18)),
+                ('created_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('current_approver', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['created_at', 'id'], name='vouchers_do_created_977198_idx'), models.Index(fields=['status', 'current_approver'], name='vouchers_do_status_ccc6f6_idx'), models.Index(fields=['created_by', 'created_at'], name='vouchers_do_created_dc6a66_idx'), models.Index(fields=['payment_date'], name='vouchers_do_payment_92ea0d_idx'), models.Index(fields=['number'], name='vouchers_do_number_b6d1b8_idx')],
+                'unique_together': {('doc_type', 'document_id')},
+            },
+        ),
+        migrations.RunPython(populate_document_index, migrations.RunPython.noop),
+    ]
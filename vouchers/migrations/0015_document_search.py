@@ -0,0 +1,114 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:40
+
+from django.db import migrations, models
+
+
+INDEX_TABLE = 'vouchers_documentindex'
+FTS_TABLE = 'vouchers_documentindex_fts'
+
+# SQLite: FTS5 external-content table over the index, kept in sync by triggers
+SQLITE_CREATE = [
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        number, payee_name, search_details,
+        content='{INDEX_TABLE}', content_rowid='id',
+        tokenize='unicode61', prefix='2 3'
+    )""",
+    f"""CREATE TRIGGER {INDEX_TABLE}_fts_insert AFTER INSERT ON {INDEX_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, number, payee_name, search_details)
+        VALUES (new.id, new.number, new.payee_name, new.search_details);
+    END""",
+    f"""CREATE TRIGGER {INDEX_TABLE}_fts_delete AFTER DELETE ON {INDEX_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, number, payee_name, search_details)
+        VALUES ('delete', old.id, old.number, old.payee_name, old.search_details);
+    END""",
+    f"""CREATE TRIGGER {INDEX_TABLE}_fts_update AFTER UPDATE OF number, payee_name, search_details
+        ON {INDEX_TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, number, payee_name, search_details)
+        VALUES ('delete', old.id, old.number, old.payee_name, old.search_details);
+        INSERT INTO {FTS_TABLE}(rowid, number, payee_name, search_details)
+        VALUES (new.id, new.number, new.payee_name, new.search_details);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+SQLITE_DROP = [
+    f"DROP TRIGGER IF EXISTS {INDEX_TABLE}_fts_insert",
+    f"DROP TRIGGER IF EXISTS {INDEX_TABLE}_fts_delete",
+    f"DROP TRIGGER IF EXISTS {INDEX_TABLE}_fts_update",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+# PostgreSQL: weighted tsvector (A=number, B=payee, C=line items) generated from the columns
+POSTGRES_CREATE = [
+    f"""ALTER TABLE {INDEX_TABLE} ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(number, '')), 'A') ||
+        setweight(to_tsvector('simple', payee_name), 'B') ||
+        setweight(to_tsvector('simple', search_details), 'C')
+    ) STORED""",
+    f"CREATE INDEX {INDEX_TABLE}_search_gin ON {INDEX_TABLE} USING GIN (search_vector)",
+]
+POSTGRES_DROP = [
+    f"DROP INDEX IF EXISTS {INDEX_TABLE}_search_gin",
+    f"ALTER TABLE {INDEX_TABLE} DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_CREATE)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_CREATE)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        _run(schema_editor, SQLITE_DROP)
+    elif vendor == 'postgresql':
+        _run(schema_editor, POSTGRES_DROP)
+
+
+def populate_search_details(apps, schema_editor):
+    """Fill search_details from existing line items (descriptions, programs, departments)"""
+    DocumentIndex = apps.get_model('vouchers', 'DocumentIndex')
+
+    for line_model_name, fk_name, doc_type in (
+        ('VoucherLineItem', 'voucher_id', 'pv'),
+        ('FormLineItem', 'payment_form_id', 'pf'),
+    ):
+        LineItem = apps.get_model('vouchers', line_model_name)
+        details = {}
+        for doc_id, description, program, department in LineItem.objects.order_by(
+            fk_name, 'line_number'
+        ).values_list(fk_name, 'description', 'program', 'department__name'):
+            parts = details.setdefault(doc_id, [])
+            for value in (description, program, department):
+                if value and value not in parts:
+                    parts.append(value)
+
+        for doc_id, parts in details.items():
+            DocumentIndex.objects.filter(doc_type=doc_type, document_id=doc_id).update(
+                search_details='\n'.join(parts)
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0014_document_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentindex',
+            name='search_details',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(populate_search_details, migrations.RunPython.noop),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-16 21:05
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0015_document_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentindex',
+            index=models.Index(fields=['doc_type', 'total_usd'], name='vouchers_do_doc_typ_359c5e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentindex',
+            index=models.Index(fields=['doc_type', 'total_khr'], name='vouchers_do_doc_typ_9d896d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentindex',
+            index=models.Index(fields=['doc_type', 'total_thb'], name='vouchers_do_doc_typ_9bf5fe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='documentindex',
+            index=models.Index(fields=['doc_type', 'total_rmb'], name='vouchers_do_doc_typ_8ed86d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formlineitem',
+            index=models.Index(fields=['amount'], name='vouchers_fo_amount_5c8402_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='formlineitem',
+            index=models.Index(fields=['currency', 'amount'], name='vouchers_fo_currenc_f5dbcc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucherlineitem',
+            index=models.Index(fields=['amount'], name='vouchers_vo_amount_15185f_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucherlineitem',
+            index=models.Index(fields=['currency', 'amount'], name='vouchers_vo_currenc_83ac22_idx'),
+        ),
+    ]
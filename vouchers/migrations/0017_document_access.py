@@ -0,0 +1,56 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def populate_document_access(apps, schema_editor):
+    """Grant access to every creator, current approver and history actor of existing documents"""
+    DocumentAccess = apps.get_model('vouchers', 'DocumentAccess')
+
+    for model_name, doc_type, history_name, fk_name in (
+        ('PaymentVoucher', 'pv', 'ApprovalHistory', 'voucher_id'),
+        ('PaymentForm', 'pf', 'FormApprovalHistory', 'payment_form_id'),
+    ):
+        Document = apps.get_model('vouchers', model_name)
+        History = apps.get_model('workflow', history_name)
+
+        pairs = set(History.objects.values_list('actor_id', fk_name))
+        for pk, created_by_id, approver_id in Document.objects.values_list(
+            'pk', 'created_by_id', 'current_approver_id'
+        ).iterator():
+            pairs.add((created_by_id, pk))
+            if approver_id:
+                pairs.add((approver_id, pk))
+
+        DocumentAccess.objects.bulk_create(
+            [DocumentAccess(user_id=user_id, doc_type=doc_type, document_id=pk) for user_id, pk in pairs],
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0016_amount_search_indexes'),
+        ('workflow', '0004_remove_backuphistory_workflow_ba_created_5996ca_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('pv', 'Payment Voucher'), ('pf', 'Payment Form')], max_length=2)),
+                ('document_id', models.PositiveBigIntegerField()),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='document_access', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['doc_type', 'document_id'], name='vouchers_do_doc_typ_af0db4_idx')],
+                'unique_together': {('user', 'doc_type', 'document_id')},
+            },
+        ),
+        migrations.RunPython(populate_document_access, migrations.RunPython.noop),
+    ]
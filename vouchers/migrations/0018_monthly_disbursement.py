@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:28
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+DISBURSED_STATUSES = ['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
+
+
+def populate_monthly_disbursements(apps, schema_editor):
+    """Aggregate line items of submitted documents into (month, doc_type, currency, department) cells"""
+    MonthlyDisbursement = apps.get_model('vouchers', 'MonthlyDisbursement')
+
+    for line_model_name, doc_type, fk_name in (
+        ('VoucherLineItem', 'pv', 'voucher'),
+        ('FormLineItem', 'pf', 'payment_form'),
+    ):
+        LineItem = apps.get_model('vouchers', line_model_name)
+        rows = (
+            LineItem.objects
+            .filter(**{f'{fk_name}__status__in': DISBURSED_STATUSES})
+            .annotate(month=TruncMonth(f'{fk_name}__payment_date'))
+            .values('month', 'currency', 'department_id')
+            .annotate(
+                total=models.Sum(models.Case(
+                    models.When(vat_applicable=True, then=models.F('amount') * Decimal('1.1')),
+                    default=models.F('amount'),
+                    output_field=models.DecimalField(max_digits=18, decimal_places=3),
+                )),
+                count=models.Count(fk_name, distinct=True),
+            )
+            .order_by()
+        )
+        MonthlyDisbursement.objects.bulk_create([
+            MonthlyDisbursement(
+                month=row['month'], doc_type=doc_type, currency=row['currency'],
+                department_id=row['department_id'], total=row['total'] or Decimal('0'), count=row['count'],
+            )
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0017_document_access'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyDisbursement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the payment month')),
+                ('doc_type', models.CharField(choices=[('pv', 'Payment Voucher'), ('pf', 'Payment Form')], max_length=2)),
+                ('currency', models.CharField(choices=[('USD', 'US Dollar ($)'), ('KHR', 'Cambodian Riel (៛)'), ('THB', 'Thai Baht (฿)'), ('RMB', 'Chinese Yuan (¥)')], max_length=3)),
+                ('total', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18)),
+                ('count', models.PositiveIntegerField(default=0, help_text='Number of documents in this cell')),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vouchers.department')),
+            ],
+            options={
+                'ordering': ['month', 'doc_type', 'currency'],
+                'unique_together': {('month', 'doc_type', 'currency', 'department')},
+            },
+        ),
+        migrations.RunPython(populate_monthly_disbursements, migrations.RunPython.noop),
+    ]
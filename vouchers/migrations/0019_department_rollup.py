@@ -0,0 +1,90 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:29
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import TruncMonth
+
+DISBURSED_STATUSES = ['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
+
+
+def clear_monthly_disbursements(apps, schema_editor):
+    """Existing cells have no status; they are rebuilt at the end of this migration"""
+    apps.get_model('vouchers', 'MonthlyDisbursement').objects.all().delete()
+
+
+def populate_monthly_disbursements(apps, schema_editor):
+    """Aggregate line items of submitted documents into (month, doc_type, status, currency, department) cells"""
+    MonthlyDisbursement = apps.get_model('vouchers', 'MonthlyDisbursement')
+
+    for line_model_name, doc_type, fk_name in (
+        ('VoucherLineItem', 'pv', 'voucher'),
+        ('FormLineItem', 'pf', 'payment_form'),
+    ):
+        LineItem = apps.get_model('vouchers', line_model_name)
+        rows = (
+            LineItem.objects
+            .filter(**{f'{fk_name}__status__in': DISBURSED_STATUSES})
+            .annotate(month=TruncMonth(f'{fk_name}__payment_date'))
+            .values('month', f'{fk_name}__status', 'currency', 'department_id')
+            .annotate(
+                total=models.Sum(models.Case(
+                    models.When(vat_applicable=True, then=models.F('amount') * Decimal('1.1')),
+                    default=models.F('amount'),
+                    output_field=models.DecimalField(max_digits=18, decimal_places=3),
+                )),
+                count=models.Count(fk_name, distinct=True),
+                line_count=models.Count('pk'),
+            )
+            .order_by()
+        )
+        MonthlyDisbursement.objects.bulk_create([
+            MonthlyDisbursement(
+                month=row['month'], doc_type=doc_type, status=row[f'{fk_name}__status'],
+                currency=row['currency'], department_id=row['department_id'],
+                total=row['total'] or Decimal('0'), count=row['count'], line_count=row['line_count'],
+            )
+            for row in rows
+        ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0018_monthly_disbursement'),
+    ]
+
+    operations = [
+        migrations.RunPython(clear_monthly_disbursements, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='monthlydisbursement',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='monthlydisbursement',
+            name='line_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of line items in this cell'),
+        ),
+        migrations.AddField(
+            model_name='monthlydisbursement',
+            name='status',
+            field=models.CharField(choices=[('DRAFT', 'Draft'), ('PENDING_L2', 'Pending Account Supervisor'), ('PENDING_L3', 'Pending Finance Manager'), ('PENDING_L4', 'Pending Finance Controller'), ('PENDING_L5', 'Pending General Manager'), ('PENDING_L6', 'Pending Managing Director'), ('ON_REVISION', 'On Revision'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected')], default='APPROVED', max_length=20),
+            preserve_default=False,
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlydisbursement',
+            unique_together={('month', 'doc_type', 'status', 'currency', 'department')},
+        ),
+        migrations.AddIndex(
+            model_name='formlineitem',
+            index=models.Index(fields=['department', 'payment_form'], name='vouchers_fo_departm_543798_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='monthlydisbursement',
+            index=models.Index(fields=['department', 'month'], name='vouchers_mo_departm_4b328d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='voucherlineitem',
+            index=models.Index(fields=['department', 'voucher'], name='vouchers_vo_departm_741dca_idx'),
+        ),
+        migrations.RunPython(populate_monthly_disbursements, clear_monthly_disbursements),
+    ]
@@ -0,0 +1,101 @@
+# Generated by Django 6.0.1 on 2026-10-16 20:37
+
+import datetime
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models.functions import Coalesce, TruncMonth
+
+# The rates that used to be hard-coded in dashboard/views.py (KHR_TO_USD = 4100,
+# THB_TO_USD = 0.028, RMB_TO_USD = 0.138), as units per 1 USD
+INITIAL_RATES = {
+    'KHR': Decimal('4100'),
+    'THB': Decimal('35.714286'),
+    'RMB': Decimal('7.246377'),
+}
+INITIAL_EFFECTIVE_DATE = datetime.date(2020, 1, 1)
+
+DISBURSED_STATUSES = ['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
+
+
+class Divide(models.Func):
+    """amount / rate without SQLite's integer division (same as vouchers.currency.Divide)"""
+    arg_joiner = ' * 1.0 / '
+    template = '(%(expressions)s)'
+    output_field = models.DecimalField(max_digits=18, decimal_places=3)
+
+
+def seed_exchange_rates(apps, schema_editor):
+    ExchangeRate = apps.get_model('vouchers', 'ExchangeRate')
+    ExchangeRate.objects.bulk_create([
+        ExchangeRate(currency=currency, effective_date=INITIAL_EFFECTIVE_DATE, rate=rate)
+        for currency, rate in INITIAL_RATES.items()
+    ])
+
+
+def populate_total_usd(apps, schema_editor):
+    """Convert the existing rollup cells from their line items at the seeded rates"""
+    MonthlyDisbursement = apps.get_model('vouchers', 'MonthlyDisbursement')
+    amount_field = models.DecimalField(max_digits=18, decimal_places=3)
+
+    for line_model_name, doc_type, fk_name in (
+        ('VoucherLineItem', 'pv', 'voucher'),
+        ('FormLineItem', 'pf', 'payment_form'),
+    ):
+        LineItem = apps.get_model('vouchers', line_model_name)
+        amount = models.Case(
+            models.When(vat_applicable=True, then=models.F('amount') * Decimal('1.1')),
+            default=models.F('amount'),
+            output_field=amount_field,
+        )
+        rate = models.Case(
+            *[models.When(currency=currency, then=models.Value(value)) for currency, value in INITIAL_RATES.items()],
+            output_field=models.DecimalField(max_digits=18, decimal_places=6),
+        )
+        rows = (
+            LineItem.objects
+            .filter(**{f'{fk_name}__status__in': DISBURSED_STATUSES})
+            .annotate(month=TruncMonth(f'{fk_name}__payment_date'))
+            .values('month', f'{fk_name}__status', 'currency', 'department_id')
+            .annotate(total_usd=models.Sum(models.Case(
+                models.When(currency='USD', then=amount),
+                default=Coalesce(Divide(amount, rate), models.Value(Decimal('0'))),
+                output_field=amount_field,
+            )))
+            .order_by()
+        )
+        for row in rows:
+            MonthlyDisbursement.objects.filter(
+                month=row['month'], doc_type=doc_type, status=row[f'{fk_name}__status'],
+                currency=row['currency'], department_id=row['department_id'],
+            ).update(total_usd=row['total_usd'] or Decimal('0'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0019_department_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='monthlydisbursement',
+            name='total_usd',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0'), help_text='total converted to USD at the rate in effect on each payment date', max_digits=18),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('KHR', 'Cambodian Riel (៛)'), ('THB', 'Thai Baht (฿)'), ('RMB', 'Chinese Yuan (¥)')], max_length=3)),
+                ('effective_date', models.DateField()),
+                ('rate', models.DecimalField(decimal_places=6, help_text='Units of this currency per 1 USD (e.g. 4100 for KHR)', max_digits=18)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['currency', '-effective_date'],
+                'unique_together': {('currency', 'effective_date')},
+            },
+        ),
+        migrations.RunPython(seed_exchange_rates, migrations.RunPython.noop),
+        migrations.RunPython(populate_total_usd, migrations.RunPython.noop),
+    ]
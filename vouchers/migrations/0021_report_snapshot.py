@@ -0,0 +1,26 @@
+# Generated by Django 6.0.1 on 2026-10-16 21:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0020_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('version', models.CharField(blank=True, default='', max_length=40)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+    ]
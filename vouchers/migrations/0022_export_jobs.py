@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-16 21:20
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0021_report_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('report_excel', 'Report (Excel)'), ('report_pdf', 'Report (PDF)'), ('template_excel', 'Payment Voucher Summary (Excel)')], max_length=20)),
+                ('filters', models.JSONField(blank=True, default=dict)),
+                ('fingerprint', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PENDING', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Ready'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('progress', models.PositiveSmallIntegerField(default=0, help_text='Percent complete')),
+                ('file', models.FileField(blank=True, upload_to='exports/%Y/%m/')),
+                ('filename', models.CharField(blank=True, help_text='Download file name', max_length=255)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='export_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['fingerprint', 'status'], name='vouchers_ex_fingerp_f7eaf1_idx'), models.Index(fields=['status', 'created_at'], name='vouchers_ex_status_ff4e87_idx')],
+            },
+        ),
+    ]
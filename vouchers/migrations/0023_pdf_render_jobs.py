@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-16 21:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0022_export_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PDFRenderJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('pv', 'Payment Voucher'), ('pf', 'Payment Form')], max_length=2)),
+                ('document_id', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('PENDING', 'Queued'), ('RUNNING', 'Rendering'), ('DONE', 'Attached'), ('FAILED', 'Failed')], default='PENDING', max_length=10)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Not claimed before this time (retry backoff)')),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('requested_by', models.ForeignKey(blank=True, help_text='Recorded as the uploader of the attachment (the final approver)', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pdf_render_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'available_at'], name='vouchers_pd_status_811bfd_idx')],
+                'unique_together': {('doc_type', 'document_id')},
+            },
+        ),
+    ]
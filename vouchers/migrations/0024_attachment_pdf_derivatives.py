@@ -0,0 +1,24 @@
+# Generated by Django 6.0.1 on 2026-10-16 21:50
+
+import vouchers.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0023_pdf_render_jobs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='formattachment',
+            name='pdf_derivative',
+            field=models.FileField(blank=True, help_text='Images only: the image as a downscaled PDF page, merged into the document PDF', upload_to=vouchers.models.attachment_derivative_path),
+        ),
+        migrations.AddField(
+            model_name='voucherattachment',
+            name='pdf_derivative',
+            field=models.FileField(blank=True, help_text='Images only: the image as a downscaled PDF page, merged into the document PDF', upload_to=vouchers.models.attachment_derivative_path),
+        ),
+    ]
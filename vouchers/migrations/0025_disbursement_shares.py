@@ -0,0 +1,107 @@
+# Generated by Django 6.0.1 on 2026-10-16 22:14
+
+import django.db.models.deletion
+from bisect import bisect_right
+from decimal import Decimal
+from django.db import migrations, models
+
+DISBURSED_STATUSES = ['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
+
+
+def populate_shares(apps, schema_editor):
+    """Record every counted document's shares and rebuild the rollup cells as their sums"""
+    DisbursementShare = apps.get_model('vouchers', 'DisbursementShare')
+    MonthlyDisbursement = apps.get_model('vouchers', 'MonthlyDisbursement')
+    ExchangeRate = apps.get_model('vouchers', 'ExchangeRate')
+
+    dates, rates = {}, {}
+    for currency, effective_date, rate in ExchangeRate.objects.order_by('currency', 'effective_date').values_list(
+        'currency', 'effective_date', 'rate'
+    ):
+        dates.setdefault(currency, []).append(effective_date)
+        rates.setdefault(currency, []).append(rate)
+
+    def to_usd(amount, currency, day):
+        if currency == 'USD':
+            return amount
+        if currency not in dates:
+            return Decimal('0')
+        return amount / rates[currency][max(bisect_right(dates[currency], day) - 1, 0)]
+
+    places = Decimal('0.001')
+    shares = []
+    for line_model_name, doc_type, fk_name in (
+        ('VoucherLineItem', 'pv', 'voucher'),
+        ('FormLineItem', 'pf', 'payment_form'),
+    ):
+        LineItem = apps.get_model('vouchers', line_model_name)
+        rows = (
+            LineItem.objects
+            .filter(**{f'{fk_name}__status__in': DISBURSED_STATUSES})
+            .values(fk_name, f'{fk_name}__payment_date', f'{fk_name}__status', 'currency', 'department_id')
+            .annotate(
+                total=models.Sum(models.Case(
+                    models.When(vat_applicable=True, then=models.F('amount') * Decimal('1.1')),
+                    default=models.F('amount'),
+                    output_field=models.DecimalField(max_digits=18, decimal_places=3),
+                )),
+                line_count=models.Count('pk'),
+            )
+            .order_by()
+        )
+        for row in rows:
+            day = row[f'{fk_name}__payment_date']
+            total = row['total'] or Decimal('0')
+            shares.append(DisbursementShare(
+                doc_type=doc_type, document_id=row[fk_name], month=day.replace(day=1),
+                status=row[f'{fk_name}__status'], currency=row['currency'], department_id=row['department_id'],
+                total=total.quantize(places), total_usd=to_usd(total, row['currency'], day).quantize(places),
+                line_count=row['line_count'],
+            ))
+
+    cells = {}
+    for share in shares:
+        key = (share.month, share.doc_type, share.status, share.currency, share.department_id)
+        cell = cells.setdefault(key, MonthlyDisbursement(
+            month=share.month, doc_type=share.doc_type, status=share.status,
+            currency=share.currency, department_id=share.department_id,
+            total=Decimal('0'), total_usd=Decimal('0'), count=0, line_count=0,
+        ))
+        cell.total += share.total
+        cell.total_usd += share.total_usd
+        cell.count += 1
+        cell.line_count += share.line_count
+
+    MonthlyDisbursement.objects.all().delete()
+    DisbursementShare.objects.bulk_create(shares, batch_size=1000)
+    MonthlyDisbursement.objects.bulk_create(cells.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0024_attachment_pdf_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisbursementShare',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('doc_type', models.CharField(choices=[('pv', 'Payment Voucher'), ('pf', 'Payment Form')], max_length=2)),
+                ('document_id', models.PositiveBigIntegerField()),
+                ('month', models.DateField()),
+                ('status', models.CharField(choices=[('DRAFT', 'Draft'), ('PENDING_L2', 'Pending Account Supervisor'), ('PENDING_L3', 'Pending Finance Manager'), ('PENDING_L4', 'Pending Finance Controller'), ('PENDING_L5', 'Pending General Manager'), ('PENDING_L6', 'Pending Managing Director'), ('ON_REVISION', 'On Revision'), ('APPROVED', 'Approved'), ('REJECTED', 'Rejected')], max_length=20)),
+                ('currency', models.CharField(choices=[('USD', 'US Dollar ($)'), ('KHR', 'Cambodian Riel (៛)'), ('THB', 'Thai Baht (฿)'), ('RMB', 'Chinese Yuan (¥)')], max_length=3)),
+                ('total', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18)),
+                ('total_usd', models.DecimalField(decimal_places=3, default=Decimal('0'), max_digits=18)),
+                ('line_count', models.PositiveIntegerField(default=0)),
+                ('department', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='vouchers.department')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['month', 'doc_type'], name='vouchers_di_month_aab5dd_idx')],
+                'unique_together': {('doc_type', 'document_id', 'currency', 'department')},
+            },
+        ),
+        migrations.RunPython(populate_shares, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-16 23:10
+
+from django.db import migrations, models
+
+
+def start_heartbeats(apps, schema_editor):
+    """Jobs running during the upgrade count from their claim"""
+    PDFRenderJob = apps.get_model('vouchers', 'PDFRenderJob')
+    PDFRenderJob.objects.filter(status='RUNNING').update(heartbeat_at=models.F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0025_disbursement_shares'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfrenderjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last sign of life of the worker rendering it', null=True),
+        ),
+        migrations.RunPython(start_heartbeats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-16 15:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vouchers', '0026_pdf_render_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='exportjob',
+            name='kind',
+            field=models.CharField(choices=[('report_excel', 'Report (Excel)'), ('report_pdf', 'Report (PDF)'), ('template_excel', 'Payment Voucher Summary (Excel)'), ('batch_bundle', 'Signature Batch Bundle (PDF)')], max_length=20),
+        ),
+    ]
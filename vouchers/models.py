@@ -1,7 +1,8 @@
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
 from django.utils import timezone
 from decimal import Decimal
+from datetime import timedelta
 import os
 
 # Cambodian Banks Choices
@@ -21,6 +22,35 @@ CURRENCY_CHOICES = [
     ('RMB', 'Chinese Yuan (¥)'),
 ]
 
+# Currency -> denormalized total column on PaymentVoucher / PaymentForm
+CURRENCY_TOTAL_FIELDS = {
+    'USD': 'total_usd',
+    'KHR': 'total_khr',
+    'THB': 'total_thb',
+    'RMB': 'total_rmb',
+}
+
+
+def compute_line_totals(rows):
+    """
+    Compute denormalized totals from (currency, amount, vat_applicable) rows.
+
+    Returns a dict of {total field name: Decimal} plus 'line_count', ready to be
+    written to PaymentVoucher / PaymentForm. Uses the same VAT rule as
+    get_total() on the line item models.
+    """
+    values = {field: Decimal('0') for field in CURRENCY_TOTAL_FIELDS.values()}
+    count = 0
+    for currency, amount, vat_applicable in rows:
+        if vat_applicable:
+            amount = amount * Decimal('1.1')
+        field = CURRENCY_TOTAL_FIELDS.get(currency)
+        if field:
+            values[field] += amount
+        count += 1
+    values['line_count'] = count
+    return values
+
 
 class CompanyBankAccount(models.Model):
     """Company bank accounts for transfer"""
@@ -178,12 +208,19 @@ class PaymentVoucher(models.Model):
         help_text="Role level of approver who returned for revision. Resubmission routes back to this level."
     )
 
+    # Denormalized line item totals (incl. VAT), kept in sync by vouchers.signals
+    total_usd = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_khr = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_thb = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_rmb = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    line_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['pv_number']),
             models.Index(fields=['status', 'current_approver']),
-            models.Index(fields=['created_at']),
+            models.Index(fields=['created_at', 'id']),
         ]
 
     def __str__(self):
@@ -199,9 +236,32 @@ class PaymentVoucher(models.Model):
 
         return dict(totals)
 
+    def get_stored_totals(self):
+        """Totals grouped by currency from the denormalized columns (no line item query)"""
+        totals = {}
+        for currency, field in CURRENCY_TOTAL_FIELDS.items():
+            amount = getattr(self, field)
+            if amount:
+                totals[currency] = amount
+        return totals
+
+    def refresh_totals(self):
+        """Recalculate the denormalized totals from line items and store them"""
+        values = compute_line_totals(
+            self.line_items.values_list('currency', 'amount', 'vat_applicable')
+        )
+        type(self).objects.filter(pk=self.pk).update(**values)
+        for field, value in values.items():
+            setattr(self, field, value)
+
+        index_values = {field: values[field] for field in CURRENCY_TOTAL_FIELDS.values()}
+        DocumentIndex.objects.filter(
+            doc_type=DocumentIndex.doc_type_for(self), document_id=self.pk
+        ).update(**index_values)
+
     def get_grand_total_display(self):
         """Return formatted grand total string for display"""
-        totals = self.calculate_grand_total()
+        totals = self.get_stored_totals()
         symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿', 'RMB': '¥'}
 
         if not totals:
@@ -276,6 +336,13 @@ class VoucherLineItem(models.Model):
     class Meta:
         ordering = ['line_number']
         unique_together = [['voucher', 'line_number']]
+        indexes = [
+            # Amount search (vouchers.search.AmountQuery)
+            models.Index(fields=['amount']),
+            models.Index(fields=['currency', 'amount']),
+            # Department drill-down (MonthlyDisbursement.department_filter)
+            models.Index(fields=['department', 'voucher']),
+        ]
 
     def __str__(self):
         return f"Line {self.line_number}: {self.description[:50]}"
@@ -315,6 +382,15 @@ def voucher_attachment_path(instance, filename):
     return os.path.join('voucher_attachments', pv_number, filename)
 
 
+def attachment_derivative_path(instance, filename):
+    """
+    Upload path of an image attachment's PDF derivative (vouchers.derivatives):
+    next to the original file.
+    Example: voucher_attachments/2601-0001/receipt.jpg.pdf
+    """
+    return os.path.join(os.path.dirname(instance.file.name), os.path.basename(filename))
+
+
 class VoucherAttachment(models.Model):
     """File attachments for vouchers"""
     voucher = models.ForeignKey(
@@ -323,6 +399,11 @@ class VoucherAttachment(models.Model):
         related_name='attachments'
     )
     file = models.FileField(upload_to=voucher_attachment_path)
+    pdf_derivative = models.FileField(
+        upload_to=attachment_derivative_path,
+        blank=True,
+        help_text="Images only: the image as a downscaled PDF page, merged into the document PDF"
+    )
     filename = models.CharField(max_length=255)
     file_size = models.PositiveIntegerField(help_text="File size in bytes")
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -455,12 +536,19 @@ class PaymentForm(models.Model):
         help_text="Role level of approver who returned for revision. Resubmission routes back to this level."
     )
 
+    # Denormalized line item totals (incl. VAT), kept in sync by vouchers.signals
+    total_usd = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_khr = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_thb = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_rmb = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    line_count = models.PositiveIntegerField(default=0)
+
     class Meta:
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=['pf_number']),
             models.Index(fields=['status', 'current_approver']),
-            models.Index(fields=['created_at']),
+            models.Index(fields=['created_at', 'id']),
         ]
 
     def __str__(self):
@@ -476,9 +564,32 @@ class PaymentForm(models.Model):
 
         return dict(totals)
 
+    def get_stored_totals(self):
+        """Totals grouped by currency from the denormalized columns (no line item query)"""
+        totals = {}
+        for currency, field in CURRENCY_TOTAL_FIELDS.items():
+            amount = getattr(self, field)
+            if amount:
+                totals[currency] = amount
+        return totals
+
+    def refresh_totals(self):
+        """Recalculate the denormalized totals from line items and store them"""
+        values = compute_line_totals(
+            self.line_items.values_list('currency', 'amount', 'vat_applicable')
+        )
+        type(self).objects.filter(pk=self.pk).update(**values)
+        for field, value in values.items():
+            setattr(self, field, value)
+
+        index_values = {field: values[field] for field in CURRENCY_TOTAL_FIELDS.values()}
+        DocumentIndex.objects.filter(
+            doc_type=DocumentIndex.doc_type_for(self), document_id=self.pk
+        ).update(**index_values)
+
     def get_grand_total_display(self):
         """Return formatted grand total string for display"""
-        totals = self.calculate_grand_total()
+        totals = self.get_stored_totals()
         symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿', 'RMB': '¥'}
 
         if not totals:
@@ -553,6 +664,13 @@ class FormLineItem(models.Model):
     class Meta:
         ordering = ['line_number']
         unique_together = [['payment_form', 'line_number']]
+        indexes = [
+            # Amount search (vouchers.search.AmountQuery)
+            models.Index(fields=['amount']),
+            models.Index(fields=['currency', 'amount']),
+            # Department drill-down (MonthlyDisbursement.department_filter)
+            models.Index(fields=['department', 'payment_form']),
+        ]
 
     def __str__(self):
         return f"Line {self.line_number}: {self.description[:50]}"
@@ -600,6 +718,11 @@ class FormAttachment(models.Model):
         related_name='attachments'
     )
     file = models.FileField(upload_to=form_attachment_path)
+    pdf_derivative = models.FileField(
+        upload_to=attachment_derivative_path,
+        blank=True,
+        help_text="Images only: the image as a downscaled PDF page, merged into the document PDF"
+    )
     filename = models.CharField(max_length=255)
     file_size = models.PositiveIntegerField(help_text="File size in bytes")
     uploaded_at = models.DateTimeField(auto_now_add=True)
@@ -790,18 +913,24 @@ class SignatureBatch(models.Model):
         """Calculate total amount of all documents in batch"""
         total = {'USD': Decimal('0'), 'KHR': Decimal('0'), 'THB': Decimal('0'), 'RMB': Decimal('0')}
 
-        # Add voucher totals
-        for item in self.voucher_items.all():
-            voucher_totals = item.voucher.calculate_grand_total()
+        # Sum the denormalized document totals in SQL (one query per document type)
+        for items, prefix in ((self.voucher_items, 'voucher'), (self.form_items, 'payment_form')):
+            sums = items.aggregate(**{
+                currency: models.Sum(f'{prefix}__{field}')
+                for currency, field in CURRENCY_TOTAL_FIELDS.items()
+            })
             for currency in total.keys():
-                total[currency] += voucher_totals.get(currency, Decimal('0'))
+                total[currency] += sums[currency] or Decimal('0')
 
-        # Add form totals
-        for item in self.form_items.all():
-            form_totals = item.payment_form.calculate_grand_total()
-            for currency in total.keys():
-                total[currency] += form_totals.get(currency, Decimal('0'))
+        return total
 
+    def get_total_usd(self):
+        """Total of all documents in USD, each converted at the rate in effect on its payment date"""
+        from .currency import document_usd
+
+        total = Decimal('0')
+        for items, prefix in ((self.voucher_items, 'voucher__'), (self.form_items, 'payment_form__')):
+            total += items.aggregate(usd=models.Sum(document_usd(prefix)))['usd'] or Decimal('0')
         return total
 
     def get_total_amount_display(self):
@@ -900,3 +1029,783 @@ class BatchFormItem(models.Model):
 
     def __str__(self):
         return f"{self.batch.batch_number} - {self.payment_form.pf_number}"
+
+
+class DocumentIndex(models.Model):
+    """
+    One compact row per PaymentVoucher / PaymentForm for listing, counting and search.
+
+    Rows are maintained by vouchers.signals (document save/delete, line item changes)
+    and can be rebuilt with: python manage.py rebuild_document_index
+
+    The full-text index over number / payee_name / search_details lives outside
+    the ORM (see vouchers.search). On SQLite, a migration that rebuilds this
+    table drops the FTS triggers; run rebuild_document_index afterwards.
+    """
+
+    DOC_TYPE_CHOICES = [
+        ('pv', 'Payment Voucher'),
+        ('pf', 'Payment Form'),
+    ]
+
+    doc_type = models.CharField(max_length=2, choices=DOC_TYPE_CHOICES)
+    document_id = models.PositiveBigIntegerField()
+
+    number = models.CharField(max_length=20, null=True, blank=True)
+    payee_name = models.CharField(max_length=200)
+    status = models.CharField(max_length=20, choices=PaymentVoucher.STATUS_CHOICES)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    current_approver = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+'
+    )
+    payment_date = models.DateField()
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+
+    total_usd = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_khr = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_thb = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_rmb = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+
+    # Line item descriptions, programs and departments, for full-text search (vouchers.search)
+    search_details = models.TextField(blank=True, default='')
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        unique_together = [['doc_type', 'document_id']]
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+            models.Index(fields=['status', 'current_approver']),
+            models.Index(fields=['created_by', 'created_at']),
+            models.Index(fields=['payment_date']),
+            models.Index(fields=['number']),
+            # Amount search on document totals (vouchers.search.AmountQuery)
+            models.Index(fields=['doc_type', 'total_usd']),
+            models.Index(fields=['doc_type', 'total_khr']),
+            models.Index(fields=['doc_type', 'total_thb']),
+            models.Index(fields=['doc_type', 'total_rmb']),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type.upper()} {self.number or 'DRAFT'} - {self.payee_name}"
+
+    # ── Maintenance ──
+
+    @staticmethod
+    def doc_type_for(document):
+        """Return 'pv' or 'pf' for a PaymentVoucher / PaymentForm instance or class"""
+        model = document if isinstance(document, type) else type(document)
+        return 'pf' if issubclass(model, PaymentForm) else 'pv'
+
+    @classmethod
+    def values_for(cls, document):
+        """Index column values for a document instance"""
+        values = {
+            'number': document.pf_number if cls.doc_type_for(document) == 'pf' else document.pv_number,
+            'payee_name': document.payee_name,
+            'status': document.status,
+            'created_by_id': document.created_by_id,
+            'current_approver_id': document.current_approver_id,
+            'payment_date': document.payment_date,
+            'created_at': document.created_at,
+            'updated_at': document.updated_at,
+        }
+        for field in CURRENCY_TOTAL_FIELDS.values():
+            values[field] = getattr(document, field)
+        return values
+
+    @staticmethod
+    def details_from_rows(rows):
+        """Search text from (description, program, department name) line item rows"""
+        parts = []
+        for row in rows:
+            for value in row:
+                if value and value not in parts:
+                    parts.append(value)
+        return '\n'.join(parts)
+
+    @classmethod
+    def refresh_search_details(cls, document):
+        """Recalculate the line item search text for a document"""
+        rows = document.line_items.values_list('description', 'program', 'department__name')
+        cls.objects.filter(
+            doc_type=cls.doc_type_for(document), document_id=document.pk
+        ).update(search_details=cls.details_from_rows(rows))
+
+    @classmethod
+    def sync(cls, document):
+        """Insert or update the index row for one document"""
+        cls.objects.update_or_create(
+            doc_type=cls.doc_type_for(document),
+            document_id=document.pk,
+            defaults=cls.values_for(document),
+        )
+
+    @classmethod
+    def sync_many(cls, queryset):
+        """Re-index every document in a PaymentVoucher / PaymentForm queryset (e.g. after queryset.update())"""
+        for document in queryset.iterator():
+            cls.sync(document)
+
+    @classmethod
+    def remove(cls, document):
+        """Delete the index row for a document"""
+        cls.objects.filter(doc_type=cls.doc_type_for(document), document_id=document.pk).delete()
+
+    # ── Queries ──
+
+    @classmethod
+    def accessible_by(cls, user):
+        """
+        Rows a non-privileged user may see: documents they created, are
+        currently approving, or have acted on before (see DocumentAccess).
+        """
+        return cls.objects.filter(models.Exists(DocumentAccess.objects.filter(
+            user=user,
+            doc_type=models.OuterRef('doc_type'),
+            document_id=models.OuterRef('document_id'),
+        )))
+
+    # ── Display helpers (mirror the document models) ──
+
+    def get_document_model(self):
+        return PaymentForm if self.doc_type == 'pf' else PaymentVoucher
+
+    def get_document(self):
+        return self.get_document_model().objects.get(pk=self.document_id)
+
+    # Same column names as the document models, so the same implementations apply
+    get_stored_totals = PaymentVoucher.get_stored_totals
+    get_grand_total_display = PaymentVoucher.get_grand_total_display
+
+    def get_absolute_url(self):
+        from django.urls import reverse
+        if self.doc_type == 'pf':
+            return reverse('vouchers:pf_detail', args=[self.document_id])
+        return reverse('vouchers:detail', args=[self.document_id])
+
+
+class DocumentAccess(models.Model):
+    """
+    Materialized visibility: one row per (user, document) the user may see without
+    a privileged role - the creator, the current approver and everyone who has acted
+    on the document (approval history).
+
+    Rows are maintained by vouchers.signals (document save/delete, approval history
+    changes) and can be rebuilt with: python manage.py rebuild_document_access
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='document_access'
+    )
+    doc_type = models.CharField(max_length=2, choices=DocumentIndex.DOC_TYPE_CHOICES)
+    document_id = models.PositiveBigIntegerField()
+
+    class Meta:
+        # (user, doc_type, document_id) is the visibility lookup; the second index serves per-document sync
+        unique_together = [['user', 'doc_type', 'document_id']]
+        indexes = [
+            models.Index(fields=['doc_type', 'document_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.user} → {self.doc_type.upper()} #{self.document_id}"
+
+    # ── Maintenance ──
+
+    @staticmethod
+    def user_ids_for(document):
+        """Users who may see a document: creator, current approver and history actors"""
+        from workflow.models import ApprovalHistory, FormApprovalHistory
+
+        if DocumentIndex.doc_type_for(document) == 'pf':
+            history = FormApprovalHistory.objects.filter(payment_form_id=document.pk)
+        else:
+            history = ApprovalHistory.objects.filter(voucher_id=document.pk)
+
+        user_ids = set(history.values_list('actor_id', flat=True))
+        user_ids.add(document.created_by_id)
+        if document.current_approver_id:
+            user_ids.add(document.current_approver_id)
+        return user_ids
+
+    @classmethod
+    def sync(cls, document):
+        """Bring the access rows of one document in line with its current state"""
+        doc_type = DocumentIndex.doc_type_for(document)
+        rows = cls.objects.filter(doc_type=doc_type, document_id=document.pk)
+
+        wanted = cls.user_ids_for(document)
+        existing = set(rows.values_list('user_id', flat=True))
+
+        if existing - wanted:
+            rows.filter(user_id__in=existing - wanted).delete()
+        if wanted - existing:
+            cls.objects.bulk_create(
+                [cls(user_id=user_id, doc_type=doc_type, document_id=document.pk)
+                 for user_id in wanted - existing],
+                ignore_conflicts=True,
+            )
+
+    @classmethod
+    def sync_many(cls, queryset):
+        """Re-sync every document in a PaymentVoucher / PaymentForm queryset (e.g. after queryset.update())"""
+        for document in queryset.iterator():
+            cls.sync(document)
+
+    @classmethod
+    def rows_for(cls, model, ids):
+        """Unsaved access rows for a batch of PaymentVoucher / PaymentForm ids (three queries)"""
+        from workflow.models import ApprovalHistory, FormApprovalHistory
+
+        doc_type = DocumentIndex.doc_type_for(model)
+        if doc_type == 'pf':
+            history = FormApprovalHistory.objects.filter(payment_form_id__in=ids)
+            fk_name = 'payment_form_id'
+        else:
+            history = ApprovalHistory.objects.filter(voucher_id__in=ids)
+            fk_name = 'voucher_id'
+
+        pairs = set(history.values_list('actor_id', fk_name))
+        for pk, created_by_id, approver_id in model.objects.filter(pk__in=ids).values_list(
+            'pk', 'created_by_id', 'current_approver_id'
+        ):
+            pairs.add((created_by_id, pk))
+            if approver_id:
+                pairs.add((approver_id, pk))
+
+        return [cls(user_id=user_id, doc_type=doc_type, document_id=pk) for user_id, pk in pairs]
+
+    @classmethod
+    def grant(cls, user_id, document):
+        """Give one user access to a document (no-op if they already have it)"""
+        cls.objects.bulk_create(
+            [cls(user_id=user_id, doc_type=DocumentIndex.doc_type_for(document), document_id=document.pk)],
+            ignore_conflicts=True,
+        )
+
+    @classmethod
+    def remove(cls, document):
+        """Delete all access rows of a document"""
+        cls.objects.filter(doc_type=DocumentIndex.doc_type_for(document), document_id=document.pk).delete()
+
+    # ── Queries ──
+
+    @classmethod
+    def has_access(cls, user, document):
+        """Whether a (non-privileged) user may see one document - a single unique-index lookup"""
+        return cls.objects.filter(
+            user=user, doc_type=DocumentIndex.doc_type_for(document), document_id=document.pk
+        ).exists()
+
+    @classmethod
+    def visible(cls, queryset, user):
+        """
+        Narrow a PaymentVoucher / PaymentForm queryset to documents the user may see.
+
+        One indexed semi-join on (user, doc_type, document_id) - no join on approval
+        history and no .distinct().
+        """
+        return queryset.filter(pk__in=cls.objects.filter(
+            user=user, doc_type=DocumentIndex.doc_type_for(queryset.model)
+        ).values('document_id'))
+
+
+class MonthlyDisbursement(models.Model):
+    """
+    Pre-aggregated disbursements: one row per (month, doc_type, status, currency, department).
+
+    Only submitted documents count (pending approval or approved - not drafts,
+    revisions or rejected ones), bucketed by payment_date. total includes VAT;
+    total_usd is the same amount in USD at each document's ExchangeRate.
+    Keeping status in the key lets each report pick its own set of statuses
+    (the dashboard counts everything submitted, reports start after L2).
+
+    Each document's part of the cells is recorded in DisbursementShare. When a
+    counted document or one of its line items changes, vouchers.signals applies
+    the difference between its recorded and its new shares to the cells, in the
+    same transaction (refresh_documents). Exchange rate changes recompute whole
+    months (refresh_month).
+    Rebuild everything with: python manage.py rebuild_monthly_disbursements
+    """
+
+    DISBURSED_STATUSES = ['PENDING_L2', 'PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
+
+    month = models.DateField(help_text="First day of the payment month")
+    doc_type = models.CharField(max_length=2, choices=DocumentIndex.DOC_TYPE_CHOICES)
+    status = models.CharField(max_length=20, choices=PaymentVoucher.STATUS_CHOICES)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    total = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_usd = models.DecimalField(
+        max_digits=18,
+        decimal_places=3,
+        default=Decimal('0'),
+        help_text="total converted to USD at the rate in effect on each payment date"
+    )
+    count = models.PositiveIntegerField(default=0, help_text="Number of documents in this cell")
+    line_count = models.PositiveIntegerField(default=0, help_text="Number of line items in this cell")
+
+    class Meta:
+        ordering = ['month', 'doc_type', 'currency']
+        unique_together = [['month', 'doc_type', 'status', 'currency', 'department']]
+        indexes = [
+            # One department across months (drill-down and per-department history)
+            models.Index(fields=['department', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.doc_type.upper()} {self.currency}: {self.total}"
+
+    # ── Maintenance ──
+
+    @staticmethod
+    def month_of(day):
+        return day.replace(day=1)
+
+    @classmethod
+    def counts(cls, status):
+        """Whether a document in this status is included in the rollup"""
+        return status in cls.DISBURSED_STATUSES
+
+    @classmethod
+    def aggregate_shares(cls, model, **document_filter):
+        """
+        Unsaved DisbursementShare rows of the counted documents matching a filter, from their line items.
+
+        Usage:
+            MonthlyDisbursement.aggregate_shares(PaymentVoucher, pk__in=ids)
+            MonthlyDisbursement.aggregate_shares(PaymentForm, payment_date__gte=month, payment_date__lt=next_month)
+        """
+        from .currency import usd_amount
+
+        line_model = model.line_items.rel.related_model
+        fk_name = model.line_items.field.name
+        amount_with_vat = models.Case(
+            models.When(vat_applicable=True, then=models.F('amount') * Decimal('1.1')),
+            default=models.F('amount'),
+            output_field=models.DecimalField(max_digits=18, decimal_places=3),
+        )
+
+        lookups = {f'{fk_name}__{lookup}': value for lookup, value in document_filter.items()}
+        rows = (
+            line_model.objects
+            .filter(**lookups, **{f'{fk_name}__status__in': cls.DISBURSED_STATUSES})
+            .values(fk_name, f'{fk_name}__payment_date', f'{fk_name}__status', 'currency', 'department_id')
+            .annotate(
+                total=models.Sum(amount_with_vat),
+                total_usd=models.Sum(usd_amount(amount_with_vat, 'currency', f'{fk_name}__payment_date')),
+                line_count=models.Count('pk'),
+            )
+            .order_by()
+        )
+        doc_type = DocumentIndex.doc_type_for(model)
+        # Rounded like the columns, so cells stay the exact sum of their shares
+        places = Decimal('0.001')
+        return [
+            DisbursementShare(
+                doc_type=doc_type, document_id=row[fk_name],
+                month=cls.month_of(row[f'{fk_name}__payment_date']), status=row[f'{fk_name}__status'],
+                currency=row['currency'], department_id=row['department_id'],
+                total=(row['total'] or Decimal('0')).quantize(places),
+                total_usd=(row['total_usd'] or Decimal('0')).quantize(places),
+                line_count=row['line_count'],
+            )
+            for row in rows
+        ]
+
+    @classmethod
+    def cells_for(cls, shares):
+        """Unsaved rollup cells summing a list of shares (each share is one document of its cell)"""
+        cells = {}
+        for share in shares:
+            cell = cells.get((share.doc_type,) + share.cell_key())
+            if cell is None:
+                cell = cells[(share.doc_type,) + share.cell_key()] = cls(
+                    month=share.month, doc_type=share.doc_type, status=share.status,
+                    currency=share.currency, department_id=share.department_id,
+                )
+            cell.total += share.total
+            cell.total_usd += share.total_usd
+            cell.count += 1
+            cell.line_count += share.line_count
+        return list(cells.values())
+
+    @classmethod
+    def apply_shares(cls, doc_type, old, new):
+        """
+        Subtract old shares from the cells and add new ones, touching only the cells that change.
+
+        Every cell is an upsert: the row is created empty if missing (a no-op on
+        conflict) and incremented in place, so concurrent changes in one month
+        neither collide on the unique key nor overwrite each other. Cells are
+        updated in key order, and dropped once no document is left in them.
+
+        Returns:
+            The set of months that changed
+        """
+        deltas = {}
+        for sign, shares in ((-1, old), (1, new)):
+            for share in shares:
+                delta = deltas.setdefault(share.cell_key(), [Decimal('0'), Decimal('0'), 0, 0])
+                delta[0] += sign * share.total
+                delta[1] += sign * share.total_usd
+                delta[2] += sign
+                delta[3] += sign * share.line_count
+
+        months = set()
+        for (month, status, currency, department_id), delta in sorted(deltas.items()):
+            if not any(delta):
+                continue
+            total, total_usd, count, line_count = delta
+            key = dict(month=month, doc_type=doc_type, status=status, currency=currency,
+                       department_id=department_id)
+            cells = cls.objects.filter(**key)
+            changes = {
+                'total': models.F('total') + total,
+                'total_usd': models.F('total_usd') + total_usd,
+                'count': models.F('count') + count,
+                'line_count': models.F('line_count') + line_count,
+            }
+            while not cells.update(**changes):
+                cls.objects.bulk_create([cls(**key)], ignore_conflicts=True)
+            cells.filter(count=0).delete()
+            months.add(month)
+        return months
+
+    @classmethod
+    def refresh_documents(cls, model, ids):
+        """
+        Bring the rollup in line with the current state of some documents (e.g. after queryset.update()).
+
+        The documents' recorded shares are replaced by new ones computed from
+        their line items and only the difference is applied to the cells, so the
+        cost grows with the documents' line items, not with the month.
+
+        Returns:
+            The set of months that changed
+        """
+        doc_type = DocumentIndex.doc_type_for(model)
+        ids = list(ids)
+        with transaction.atomic():
+            # Changes to one document are applied one after the other
+            list(model.objects.select_for_update().filter(pk__in=ids).order_by('pk').values_list('pk'))
+            recorded = DisbursementShare.objects.filter(doc_type=doc_type, document_id__in=ids)
+            old = list(recorded.select_for_update())
+            new = cls.aggregate_shares(model, pk__in=ids)
+            recorded.delete()
+            DisbursementShare.objects.bulk_create(new)
+            return cls.apply_shares(doc_type, old, new)
+
+    @classmethod
+    def refresh_document(cls, document, *statuses):
+        """
+        Apply one document's change (a save, a line item edit or a delete).
+
+        Args:
+            document: PaymentVoucher / PaymentForm instance (only its type and pk are used)
+            statuses: Its status before and after the change. When none of them is
+                      counted (e.g. editing a draft) the rollup is untouched and no
+                      query is run.
+
+        Returns:
+            The set of months that changed
+        """
+        if not any(cls.counts(status) for status in statuses):
+            return set()
+        return cls.refresh_documents(type(document), [document.pk])
+
+    @classmethod
+    def refresh_month(cls, model, month):
+        """Recompute every cell and share of one document model in one month (e.g. after a rate change)"""
+        month = cls.month_of(month)
+        doc_type = DocumentIndex.doc_type_for(model)
+        next_month = (month + timedelta(days=32)).replace(day=1)
+
+        shares = cls.aggregate_shares(model, payment_date__gte=month, payment_date__lt=next_month)
+        DisbursementShare.objects.filter(month=month, doc_type=doc_type).delete()
+        cls.objects.filter(month=month, doc_type=doc_type).delete()
+        DisbursementShare.objects.bulk_create(shares)
+        cls.objects.bulk_create(cls.cells_for(shares))
+
+    @classmethod
+    def refresh_since(cls, day=None):
+        """Recompute every existing month from day's month on (all months if day is None), e.g. after a rate change"""
+        cells = cls.objects.all()
+        if day:
+            cells = cells.filter(month__gte=cls.month_of(day))
+        for month, doc_type in cells.values_list('month', 'doc_type').distinct().order_by('month'):
+            cls.refresh_month(PaymentForm if doc_type == 'pf' else PaymentVoucher, month)
+
+    # ── Queries ──
+
+    @classmethod
+    def department_totals(cls, queryset):
+        """
+        Per-department totals for a set of cells, in one grouped query.
+
+        Returns:
+            {department name: {'USD': Decimal, ..., 'usd_equivalent': Decimal, 'line_count': int}}
+            where usd_equivalent is every currency converted to USD
+        """
+        rows = (
+            queryset
+            .values('department__name', 'currency')
+            .annotate(total=models.Sum('total'), total_usd=models.Sum('total_usd'),
+                      line_count=models.Sum('line_count'))
+            .order_by()
+        )
+        totals = {}
+        for row in rows:
+            dept = totals.setdefault(row['department__name'], {'usd_equivalent': Decimal('0'), 'line_count': 0})
+            dept[row['currency']] = dept.get(row['currency'], Decimal('0')) + row['total']
+            dept['usd_equivalent'] += row['total_usd']
+            dept['line_count'] += row['line_count']
+        return totals
+
+    @staticmethod
+    def department_filter(model, **department_lookup):
+        """
+        Q for PaymentVoucher / PaymentForm rows with a line item in one department.
+
+        An IN subquery over the (department, document) line item index, so drilling
+        down from a department cell needs no join or .distinct() on the documents.
+
+        Usage:
+            PaymentVoucher.objects.filter(MonthlyDisbursement.department_filter(PaymentVoucher, department=dept))
+            PaymentForm.objects.filter(MonthlyDisbursement.department_filter(PaymentForm, department__name='HR'))
+        """
+        line_model = model.line_items.rel.related_model
+        fk_name = model.line_items.field.attname
+        return models.Q(pk__in=line_model.objects.filter(**department_lookup).values(fk_name))
+
+
+class DisbursementShare(models.Model):
+    """
+    One document's part of a MonthlyDisbursement cell: its line items in one currency and department.
+
+    Recording what each document added lets the rollup subtract exactly that
+    when the document changes (MonthlyDisbursement.refresh_documents).
+    Maintained together with the rollup; never edit by hand.
+    """
+
+    doc_type = models.CharField(max_length=2, choices=DocumentIndex.DOC_TYPE_CHOICES)
+    document_id = models.PositiveBigIntegerField()
+    month = models.DateField()
+    status = models.CharField(max_length=20, choices=PaymentVoucher.STATUS_CHOICES)
+    currency = models.CharField(max_length=3, choices=CURRENCY_CHOICES)
+    department = models.ForeignKey(
+        Department,
+        on_delete=models.CASCADE,
+        related_name='+'
+    )
+    total = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    total_usd = models.DecimalField(max_digits=18, decimal_places=3, default=Decimal('0'))
+    line_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = [['doc_type', 'document_id', 'currency', 'department']]
+        indexes = [
+            # Whole-month recompute (MonthlyDisbursement.refresh_month)
+            models.Index(fields=['month', 'doc_type']),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type.upper()} #{self.document_id} {self.currency}: {self.total}"
+
+    def cell_key(self):
+        """(month, status, currency, department_id) of the cell this share belongs to"""
+        return (self.month, self.status, self.currency, self.department_id)
+
+
+class ExchangeRate(models.Model):
+    """
+    Date-effective exchange rate: how many units of a currency buy 1 USD.
+
+    A rate applies from its effective_date until the next rate of the same
+    currency; documents are converted at the rate in effect on their payment_date
+    (dates before the first rate use the earliest one). USD itself has no rows.
+
+    Conversion goes through vouchers.currency. Adding, editing or deleting a rate
+    recomputes the affected MonthlyDisbursement months (see vouchers.signals).
+    """
+
+    currency = models.CharField(
+        max_length=3,
+        choices=[choice for choice in CURRENCY_CHOICES if choice[0] != 'USD']
+    )
+    effective_date = models.DateField()
+    rate = models.DecimalField(
+        max_digits=18,
+        decimal_places=6,
+        help_text="Units of this currency per 1 USD (e.g. 4100 for KHR)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['currency', '-effective_date']
+        unique_together = [['currency', 'effective_date']]
+
+    def __str__(self):
+        return f"1 USD = {self.rate:,} {self.currency} from {self.effective_date}"
+
+
+class ReportSnapshot(models.Model):
+    """
+    Materialized reports page analytics (vouchers.analytics.build_snapshot):
+    currency totals, monthly series, department and creator breakdowns.
+
+    Moved by the changed documents' shares after every commit that touches a
+    document in the report statuses (see vouchers.signals), recomputed after
+    exchange rate changes and nightly by: python manage.py refresh_report_snapshot
+    version is the vouchers.cache REPORTS scope version of the last full recompute.
+    """
+
+    name = models.CharField(max_length=50, unique=True)
+    data = models.JSONField(default=dict)
+    version = models.CharField(max_length=40, blank=True, default='')
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} snapshot at {self.computed_at:%Y-%m-%d %H:%M}"
+
+
+class ExportJob(models.Model):
+    """
+    A report export or signature batch bundle produced in the background by the
+    run_export_jobs worker (see vouchers.export_jobs) instead of inside the request.
+
+    The finished file is stored under MEDIA_ROOT/exports/ and downloaded through
+    the export_job_download view. fingerprint covers the kind, the filters and
+    the document data version, so identical requests made before the data
+    changes share one job.
+    started_at identifies the current claim; the worker touches heartbeat_at
+    while it works, so only jobs of a dead worker are queued again.
+    """
+
+    KIND_CHOICES = [
+        ('report_excel', 'Report (Excel)'),
+        ('report_pdf', 'Report (PDF)'),
+        ('template_excel', 'Payment Voucher Summary (Excel)'),
+        ('batch_bundle', 'Signature Batch Bundle (PDF)'),
+    ]
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Queued'),
+        ('RUNNING', 'Running'),
+        ('DONE', 'Ready'),
+        ('FAILED', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    filters = models.JSONField(default=dict, blank=True)
+    fingerprint = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    progress = models.PositiveSmallIntegerField(default=0, help_text="Percent complete")
+    file = models.FileField(upload_to='exports/%Y/%m/', blank=True)
+    filename = models.CharField(max_length=255, blank=True, help_text="Download file name")
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='export_jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, help_text="Last sign of life of the worker producing it"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Deduplication (export_jobs.request_export)
+            models.Index(fields=['fingerprint', 'status']),
+            # Worker queue (export_jobs.claim_next_job)
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+
+    @property
+    def is_finished(self):
+        return self.status in ('DONE', 'FAILED')
+
+
+class PDFRenderJob(models.Model):
+    """
+    Rendering of an approved document's PDF attachment (PV_/PF_<number>.pdf),
+    done by the run_pdf_workers process pool (see vouchers.pdf_jobs) instead of
+    inside the approval request.
+
+    One row per document, which is also its render status. A failed attempt is
+    queued again after a growing delay (available_at) until MAX_ATTEMPTS.
+    started_at identifies the current claim; the rendering worker touches
+    heartbeat_at while it works, so only jobs of a dead worker are requeued.
+    """
+
+    DOC_TYPE_CHOICES = DocumentIndex.DOC_TYPE_CHOICES
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Queued'),
+        ('RUNNING', 'Rendering'),
+        ('DONE', 'Attached'),
+        ('FAILED', 'Failed'),
+    ]
+
+    doc_type = models.CharField(max_length=2, choices=DOC_TYPE_CHOICES)
+    document_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not claimed before this time (retry backoff)")
+    error = models.TextField(blank=True)
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='pdf_render_jobs',
+        help_text="Recorded as the uploader of the attachment (the final approver)"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(
+        null=True, blank=True, help_text="Last sign of life of the worker rendering it"
+    )
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        unique_together = [['doc_type', 'document_id']]
+        indexes = [
+            # Worker queue (pdf_jobs.claim_jobs)
+            models.Index(fields=['status', 'available_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.doc_type.upper()} #{self.document_id} PDF ({self.get_status_display()})"
+
+    @property
+    def document_model(self):
+        return PaymentVoucher if self.doc_type == 'pv' else PaymentForm
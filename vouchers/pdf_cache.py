@@ -0,0 +1,323 @@
+"""
+Disk cache of rendered document PDFs.
+
+Rendering a voucher / form with WeasyPrint and merging its attachments takes
+seconds of CPU, and the same unchanged document is downloaded, previewed and
+re-attached many times. Rendered PDFs are stored under settings.PDF_CACHE_DIR,
+keyed by a fingerprint of everything the PDF shows:
+
+    - the template source, its stylesheets and RENDER_VERSION (bump it when the
+      rendering code changes)
+    - the document's own fields and its creator
+    - its line items (with department names)
+    - the APPROVE approval history and the approvers
+    - the attachments merged into it, by content checksum
+
+so an edit to any of them produces a new key and nothing has to be invalidated.
+The templates print nothing else that changes (the footer shows the document's
+updated_at, not the render time), so a cached file is never out of date.
+Files are evicted least recently used first once the directory grows past
+settings.PDF_CACHE_MAX_MB.
+
+Concurrent requests for the same key render once: the first takes a lock (a
+thread lock in the process plus, where fcntl is available, a file lock shared
+by every worker process) and the others wait for it, then read its file.
+
+PDFs never pass through memory as a whole: render() writes straight into a
+temporary file in the cache directory, which is renamed into place, and
+callers get an open file to stream (FileResponse) or copy in chunks (storage).
+
+Usage:
+    key = document_fingerprint(voucher, 'vouchers/voucher_pdf.html', attachments)
+    pdf_file = render_cache.get_or_render(key, lambda output: render(voucher, output))
+    return FileResponse(pdf_file, content_type='application/pdf')    # closes the file
+"""
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import get_template
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight within a process only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Part of every fingerprint; bump when the PDF generator (not the template) changes output
+RENDER_VERSION = 2
+
+# Attachment checksums are remembered per (path, size, mtime) this long
+CHECKSUM_TTL = 60 * 60 * 24 * 7
+
+CHECKSUM_CHUNK = 1024 * 1024
+
+
+# ── Fingerprint ──
+
+def template_digest(template_name):
+    """Hash of a template's source and its static stylesheets (pdf_renderer.STYLESHEETS)"""
+    from .pdf_renderer import stylesheet_paths
+
+    digest = hashlib.sha256(get_template(template_name).template.source.encode())
+    for path in stylesheet_paths(template_name):
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def file_checksum(field_file):
+    """
+    SHA-256 of a stored file's content (None when the file is missing).
+
+    Remembered in the cache by path, size and modification time, so unchanged
+    files are read once.
+    """
+    try:
+        path = field_file.path
+        stat = os.stat(path)
+    except (OSError, NotImplementedError, ValueError):
+        return None
+
+    key = 'pdf-checksum:' + hashlib.sha256(f'{path}:{stat.st_size}:{stat.st_mtime_ns}'.encode()).hexdigest()
+    checksum = cache.get(key)
+    if checksum is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHECKSUM_CHUNK), b''):
+                digest.update(chunk)
+        checksum = digest.hexdigest()
+        cache.set(key, checksum, CHECKSUM_TTL)
+    return checksum
+
+
+def field_values(instance):
+    """Concrete field values of a model instance"""
+    return [(field.attname, field.value_from_object(instance)) for field in instance._meta.concrete_fields]
+
+
+def user_values(user):
+    """The parts of a user a PDF shows (name, role and signature)"""
+    return [user.pk, user.username, user.first_name, user.last_name, user.role_level,
+            user.signature_image.name if user.signature_image else '']
+
+
+def document_fingerprint(document, template_name, attachments=()):
+    """
+    Cache key of a PaymentVoucher / PaymentForm PDF.
+
+    Args:
+        document: PaymentVoucher or PaymentForm
+        template_name: Template the PDF is rendered from
+        attachments: Attachments merged after the rendered pages, in merge order
+    """
+    line_items = document.line_items.order_by('line_number', 'pk')
+    line_fields = [field.attname for field in line_items.model._meta.concrete_fields]
+    approvals = (
+        document.approval_history.filter(action='APPROVE')
+        .select_related('actor').order_by('timestamp')
+    )
+
+    payload = {
+        'version': RENDER_VERSION,
+        'template': [template_name, template_digest(template_name)],
+        'document': [document._meta.label, field_values(document)],
+        'created_by': user_values(document.created_by),
+        'line_items': list(line_items.values_list(*line_fields, 'department__name')),
+        'approvals': [
+            [approval.pk, approval.actor_role_level, approval.timestamp, user_values(approval.actor)]
+            for approval in approvals
+        ],
+        'attachments': [
+            [attachment.pk, attachment.filename, attachment.file.name, file_checksum(attachment.file)]
+            for attachment in attachments
+        ],
+    }
+    data = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+# ── Disk store ──
+
+class _KeyLocks:
+    """One thread lock per key, dropped when no thread holds or waits for it"""
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}
+
+    @contextmanager
+    def hold(self, key):
+        with self._guard:
+            lock, users = self._locks.get(key, (None, 0))
+            lock = lock or threading.Lock()
+            self._locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self._guard:
+                lock, users = self._locks[key]
+                if users == 1:
+                    del self._locks[key]
+                else:
+                    self._locks[key] = (lock, users - 1)
+
+
+class PDFRenderCache:
+    """Rendered PDFs on disk, one <key>.pdf file each, LRU-evicted past a size cap"""
+
+    def __init__(self, directory=None, max_bytes=None):
+        """
+        Args:
+            directory: Cache directory (default: settings.PDF_CACHE_DIR)
+            max_bytes: Size cap (default: settings.PDF_CACHE_MAX_MB)
+        """
+        self._directory = directory
+        self._max_bytes = max_bytes
+        self._locks = _KeyLocks()
+
+    @property
+    def directory(self):
+        return str(self._directory or settings.PDF_CACHE_DIR)
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return settings.PDF_CACHE_MAX_MB * 1024 * 1024
+
+    def path(self, key):
+        return os.path.join(self.directory, f'{key}.pdf')
+
+    def open(self, key):
+        """Cached file for key opened for binary reading, or None; a hit marks it recently used"""
+        path = self.path(key)
+        try:
+            pdf_file = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return pdf_file
+
+    def put(self, key, write):
+        """
+        Store the PDF that write(file) writes under key (atomically), then
+        evict down to the size cap.
+
+        Returns:
+            The stored file, opened for binary reading (it stays readable even
+            if eviction removes it at once)
+        """
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        except OSError:
+            logger.exception('PDF cache directory %s is not writable', self.directory)
+            pdf_file = tempfile.TemporaryFile()
+            write(pdf_file)
+            pdf_file.seek(0)
+            return pdf_file
+
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                write(f)
+            os.replace(temp_path, self.path(key))
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        pdf_file = open(self.path(key), 'rb')
+        self.evict()
+        return pdf_file
+
+    def evict(self):
+        """Delete least recently used files until the directory fits max_bytes; returns how many"""
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith('.pdf'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+                total += stat.st_size
+
+        removed = 0
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            # The lock file goes too; at worst a waiter on it renders the key again
+            for stale in (path, path[:-len('.pdf')] + '.lock'):
+                try:
+                    os.remove(stale)
+                except FileNotFoundError:
+                    pass
+                except OSError:  # Windows: a file still being served cannot be removed
+                    logger.warning('Could not evict %s', stale)
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """Delete every cached file"""
+        if not os.path.isdir(self.directory):
+            return
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.name.endswith(('.pdf', '.lock')):
+                    os.remove(entry.path)
+
+    @contextmanager
+    def lock(self, key):
+        """Exclusive lock on key across threads and (with fcntl) processes"""
+        with self._locks.hold(key):
+            if fcntl is None:
+                yield
+                return
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                lock_file = open(os.path.join(self.directory, f'{key}.lock'), 'a')
+            except OSError:  # Unwritable cache directory: put() renders into a temporary file
+                yield
+                return
+            with lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def get_or_render(self, key, render):
+        """
+        Cached file for key opened for binary reading, rendered on a miss by
+        render(output), which writes the PDF into the binary file it is given.
+
+        Only one caller renders a given key at a time; the others wait and
+        open what it stored. The caller closes the returned file.
+        """
+        pdf_file = self.open(key)
+        if pdf_file is not None:
+            return pdf_file
+
+        with self.lock(key):
+            pdf_file = self.open(key)
+            if pdf_file is None:
+                pdf_file = self.put(key, render)
+        return pdf_file
+
+
+render_cache = PDFRenderCache()
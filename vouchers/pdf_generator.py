@@ -1,69 +1,37 @@
 from django.template.loader import render_to_string
-from django.http import HttpResponse
-from django.conf import settings
-from django.utils import timezone
-from django.core.files.base import ContentFile
-from weasyprint import HTML
+from django.http import FileResponse
 from pypdf import PdfWriter, PdfReader
-from PIL import Image
-import os
-import io
+from .derivatives import IMAGE_EXTENSIONS, open_derivative
+from .pdf_cache import document_fingerprint, render_cache
+from .pdf_renderer import get_renderer
+import shutil
 
 
 class VoucherPDFGenerator:
     """Service for generating PDF vouchers with WeasyPrint"""
 
-    @staticmethod
-    def _convert_image_to_pdf(image_path):
-        """
-        Convert an image file to PDF bytes.
-        Returns PDF bytes or None if conversion fails.
-        """
-        try:
-            # Open image
-            img = Image.open(image_path)
-
-            # Convert to RGB if necessary (for PNG with transparency)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Create PDF in memory
-            pdf_buffer = io.BytesIO()
-
-            # Convert image to PDF using Pillow
-            img.save(pdf_buffer, 'PDF', resolution=100.0)
-            pdf_buffer.seek(0)
-
-            return pdf_buffer.getvalue()
-        except Exception as e:
-            print(f"Error converting image to PDF: {e}")
-            return None
+    TEMPLATE = 'vouchers/voucher_pdf.html'
 
     @staticmethod
-    def _merge_attachments_to_pdf(main_pdf_bytes, attachments):
+    def _merge_attachments_to_pdf(main_pdf, attachments, output):
         """
-        Merge attachment files into the main PDF.
+        Merge attachment files into the main PDF, writing the result to output.
+
+        Attachment files are opened one at a time as they are merged and the
+        merged PDF is written straight to output, never into a memory buffer.
+        Images are merged from their PDF derivatives (vouchers.derivatives).
 
         Args:
-            main_pdf_bytes: The main voucher PDF as bytes
+            main_pdf: The main voucher PDF, a binary file
             attachments: QuerySet of VoucherAttachment objects
-
-        Returns:
-            Merged PDF as bytes
+            output: Binary file the merged PDF is written to
         """
         try:
             # Create PDF writer
             pdf_writer = PdfWriter()
 
             # Add main voucher pages
-            main_pdf = PdfReader(io.BytesIO(main_pdf_bytes))
-            for page in main_pdf.pages:
+            for page in PdfReader(main_pdf).pages:
                 pdf_writer.add_page(page)
 
             # Process each attachment
@@ -79,12 +47,10 @@ class VoucherPDFGenerator:
                     continue
 
                 try:
-                    # Handle images
-                    if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'tif']:
-                        image_pdf_bytes = VoucherPDFGenerator._convert_image_to_pdf(file_path)
-                        if image_pdf_bytes:
-                            image_pdf = PdfReader(io.BytesIO(image_pdf_bytes))
-                            for page in image_pdf.pages:
+                    # Handle images (merged from their pre-converted PDF derivative)
+                    if file_ext in IMAGE_EXTENSIONS:
+                        with open_derivative(attachment) as image_pdf:
+                            for page in PdfReader(image_pdf).pages:
                                 pdf_writer.add_page(page)
 
                     # Handle PDF files
@@ -102,17 +68,16 @@ class VoucherPDFGenerator:
                     print(f"Error processing attachment {attachment.filename}: {e}")
                     continue
 
-            # Write merged PDF to bytes
-            output_buffer = io.BytesIO()
-            pdf_writer.write(output_buffer)
-            output_buffer.seek(0)
-
-            return output_buffer.getvalue()
+            # Write merged PDF to the output file
+            pdf_writer.write(output)
 
         except Exception as e:
             print(f"Error merging attachments: {e}")
-            # Return original PDF if merging fails
-            return main_pdf_bytes
+            # Write original PDF if merging fails
+            output.seek(0)
+            output.truncate()
+            main_pdf.seek(0)
+            shutil.copyfileobj(main_pdf, output)
 
     @staticmethod
     def generate_pdf(voucher, include_attachments=True):
@@ -123,59 +88,84 @@ class VoucherPDFGenerator:
             voucher: PaymentVoucher instance
             include_attachments: If True, append user-uploaded attachments to PDF
         """
-        # Use generate_pdf_file to get PDF with attachments
-        pdf_bytes, filename = VoucherPDFGenerator.generate_pdf_file(voucher, include_attachments)
+        # Streamed from the cached file; the response closes it
+        pdf_file, filename = VoucherPDFGenerator.open_pdf_file(voucher, include_attachments)
 
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-        return response
+        return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
 
     @staticmethod
     def generate_pdf_preview(voucher):
         """Generate PDF preview (inline display)."""
-        grand_total = voucher.calculate_grand_total()
-
-        approval_history = voucher.approval_history.filter(
-            action='APPROVE'
-        ).order_by('timestamp')
+        pdf_file = VoucherPDFGenerator._cached_pdf(voucher, include_attachments=False)
 
-        context = {
-            'voucher': voucher,
-            'grand_total': grand_total,
-            'approval_history': approval_history,
-            'line_items': voucher.line_items.all(),
-        }
-
-        html_string = render_to_string('vouchers/voucher_pdf.html', context)
-
-        media_root = os.path.abspath(settings.MEDIA_ROOT)
-        media_root = media_root.replace('\\', '/')
-
-        if not media_root.endswith('/'):
-            media_root += '/'
-
-        base_url = f"file:///{media_root}"
-
-        html = HTML(string=html_string, base_url=base_url)
-        pdf_file = html.write_pdf()
-
-        response = HttpResponse(pdf_file, content_type='application/pdf')
+        response = FileResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = 'inline'
 
         return response
 
     @staticmethod
-    def generate_pdf_file(voucher, include_attachments=True):
+    def open_pdf_file(voucher, include_attachments=True):
         """
-        Generate PDF file content for saving as attachment.
+        Open the PDF file for streaming or saving as attachment (e.g. with
+        attachment.file.save(filename, File(pdf_file))); the caller closes it.
 
         Args:
             voucher: PaymentVoucher instance
             include_attachments: If True, append user-uploaded attachments to PDF
 
+        Returns tuple of (binary file, filename)
+        """
+        pdf_file = VoucherPDFGenerator._cached_pdf(voucher, include_attachments)
+        filename = f'PV_{voucher.pv_number}.pdf'
+
+        return pdf_file, filename
+
+    @staticmethod
+    def generate_pdf_file(voucher, include_attachments=True):
+        """
+        Generate PDF file content in memory (open_pdf_file avoids the copy).
+
         Returns tuple of (pdf_bytes, filename)
         """
+        pdf_file, filename = VoucherPDFGenerator.open_pdf_file(voucher, include_attachments)
+        with pdf_file:
+            return pdf_file.read(), filename
+
+    @staticmethod
+    def _cached_pdf(voucher, include_attachments):
+        """
+        Open PDF file from the render cache (vouchers.pdf_cache), rendered on a miss.
+
+        The merged PDF is cached separately from the rendered pages, so a new
+        attachment only repeats the merge.
+        """
+        key, attachments = VoucherPDFGenerator.cache_key(voucher, include_attachments)
+
+        def render(output):
+            if not attachments:
+                VoucherPDFGenerator._render_pdf(voucher, output)
+                return
+            with VoucherPDFGenerator._cached_pdf(voucher, include_attachments=False) as main_pdf:
+                VoucherPDFGenerator._merge_attachments_to_pdf(main_pdf, attachments, output)
+
+        return render_cache.get_or_render(key, render)
+
+    @staticmethod
+    def cache_key(voucher, include_attachments=True):
+        """Render cache key of the PDF, and the attachments merged into it"""
+        attachments = list(VoucherPDFGenerator._attachments(voucher)) if include_attachments else []
+        return document_fingerprint(voucher, VoucherPDFGenerator.TEMPLATE, attachments), attachments
+
+    @staticmethod
+    def _attachments(voucher):
+        """User-uploaded attachments, in the order they are appended to the PDF"""
+        return voucher.attachments.exclude(
+            filename__startswith='PV_'
+        ).order_by('uploaded_at')
+
+    @staticmethod
+    def _render_pdf(voucher, output):
+        """Render the voucher template with WeasyPrint (without attachments) into output"""
         grand_total = voucher.calculate_grand_total()
 
         approval_history = voucher.approval_history.filter(
@@ -189,87 +179,37 @@ class VoucherPDFGenerator:
             'line_items': voucher.line_items.all(),
         }
 
-        html_string = render_to_string('vouchers/voucher_pdf.html', context)
-
-        media_root = os.path.abspath(settings.MEDIA_ROOT)
-        media_root = media_root.replace('\\', '/')
-
-        if not media_root.endswith('/'):
-            media_root += '/'
-
-        base_url = f"file:///{media_root}"
-
-        html = HTML(string=html_string, base_url=base_url)
-        pdf_bytes = html.write_pdf()
-
-        # Merge user-uploaded attachments if requested
-        if include_attachments:
-            attachments = voucher.attachments.exclude(
-                filename__startswith='PV_'
-            ).order_by('uploaded_at')
-
-            if attachments.exists():
-                pdf_bytes = VoucherPDFGenerator._merge_attachments_to_pdf(pdf_bytes, attachments)
-
-        filename = f'PV_{voucher.pv_number}.pdf'
+        html_string = render_to_string(VoucherPDFGenerator.TEMPLATE, context)
 
-        return pdf_bytes, filename
+        # Fonts, stylesheets and images are shared by every render in this process
+        get_renderer().render(html_string, VoucherPDFGenerator.TEMPLATE, target=output)
 
 
 class FormPDFGenerator:
     """Service for generating PDF payment forms with WeasyPrint"""
 
-    @staticmethod
-    def _convert_image_to_pdf(image_path):
-        """
-        Convert an image file to PDF bytes.
-        Returns PDF bytes or None if conversion fails.
-        """
-        try:
-            # Open image
-            img = Image.open(image_path)
-
-            # Convert to RGB if necessary (for PNG with transparency)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = background
-            elif img.mode != 'RGB':
-                img = img.convert('RGB')
-
-            # Create PDF in memory
-            pdf_buffer = io.BytesIO()
-
-            # Convert image to PDF using Pillow
-            img.save(pdf_buffer, 'PDF', resolution=100.0)
-            pdf_buffer.seek(0)
-
-            return pdf_buffer.getvalue()
-        except Exception as e:
-            print(f"Error converting image to PDF: {e}")
-            return None
+    TEMPLATE = 'vouchers/pf/form_pdf.html'
 
     @staticmethod
-    def _merge_attachments_to_pdf(main_pdf_bytes, attachments):
+    def _merge_attachments_to_pdf(main_pdf, attachments, output):
         """
-        Merge attachment files into the main PDF.
+        Merge attachment files into the main PDF, writing the result to output.
+
+        Attachment files are opened one at a time as they are merged and the
+        merged PDF is written straight to output, never into a memory buffer.
+        Images are merged from their PDF derivatives (vouchers.derivatives).
 
         Args:
-            main_pdf_bytes: The main form PDF as bytes
+            main_pdf: The main form PDF, a binary file
             attachments: QuerySet of FormAttachment objects
-
-        Returns:
-            Merged PDF as bytes
+            output: Binary file the merged PDF is written to
         """
         try:
             # Create PDF writer
             pdf_writer = PdfWriter()
 
             # Add main form pages
-            main_pdf = PdfReader(io.BytesIO(main_pdf_bytes))
-            for page in main_pdf.pages:
+            for page in PdfReader(main_pdf).pages:
                 pdf_writer.add_page(page)
 
             # Process each attachment
@@ -285,12 +225,10 @@ class FormPDFGenerator:
                     continue
 
                 try:
-                    # Handle images
-                    if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'bmp', 'tiff', 'tif']:
-                        image_pdf_bytes = FormPDFGenerator._convert_image_to_pdf(file_path)
-                        if image_pdf_bytes:
-                            image_pdf = PdfReader(io.BytesIO(image_pdf_bytes))
-                            for page in image_pdf.pages:
+                    # Handle images (merged from their pre-converted PDF derivative)
+                    if file_ext in IMAGE_EXTENSIONS:
+                        with open_derivative(attachment) as image_pdf:
+                            for page in PdfReader(image_pdf).pages:
                                 pdf_writer.add_page(page)
 
                     # Handle PDF files
@@ -308,17 +246,16 @@ class FormPDFGenerator:
                     print(f"Error processing attachment {attachment.filename}: {e}")
                     continue
 
-            # Write merged PDF to bytes
-            output_buffer = io.BytesIO()
-            pdf_writer.write(output_buffer)
-            output_buffer.seek(0)
-
-            return output_buffer.getvalue()
+            # Write merged PDF to the output file
+            pdf_writer.write(output)
 
         except Exception as e:
             print(f"Error merging attachments: {e}")
-            # Return original PDF if merging fails
-            return main_pdf_bytes
+            # Write original PDF if merging fails
+            output.seek(0)
+            output.truncate()
+            main_pdf.seek(0)
+            shutil.copyfileobj(main_pdf, output)
 
     @staticmethod
     def generate_pdf(payment_form, include_attachments=True):
@@ -329,60 +266,84 @@ class FormPDFGenerator:
             payment_form: PaymentForm instance
             include_attachments: If True, append user-uploaded attachments to PDF
         """
-        # Use generate_pdf_file to get PDF with attachments
-        pdf_bytes, filename = FormPDFGenerator.generate_pdf_file(payment_form, include_attachments)
+        # Streamed from the cached file; the response closes it
+        pdf_file, filename = FormPDFGenerator.open_pdf_file(payment_form, include_attachments)
 
-        response = HttpResponse(pdf_bytes, content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-
-        return response
+        return FileResponse(pdf_file, as_attachment=True, filename=filename, content_type='application/pdf')
 
     @staticmethod
     def generate_pdf_preview(payment_form):
         """Generate PDF preview (inline display)."""
-        grand_total = payment_form.calculate_grand_total()
-
-        approval_history = payment_form.approval_history.filter(
-            action='APPROVE'
-        ).order_by('timestamp')
+        pdf_file = FormPDFGenerator._cached_pdf(payment_form, include_attachments=False)
 
-        context = {
-            'payment_form': payment_form,
-            'grand_total': grand_total,
-            'approval_history': approval_history,
-            'line_items': payment_form.line_items.all(),
-            'now': timezone.now(),
-        }
-
-        html_string = render_to_string('vouchers/pf/form_pdf.html', context)
-
-        media_root = os.path.abspath(settings.MEDIA_ROOT)
-        media_root = media_root.replace('\\', '/')
-
-        if not media_root.endswith('/'):
-            media_root += '/'
-
-        base_url = f"file:///{media_root}"
-
-        html = HTML(string=html_string, base_url=base_url)
-        pdf_file = html.write_pdf()
-
-        response = HttpResponse(pdf_file, content_type='application/pdf')
+        response = FileResponse(pdf_file, content_type='application/pdf')
         response['Content-Disposition'] = 'inline'
 
         return response
 
     @staticmethod
-    def generate_pdf_file(payment_form, include_attachments=True):
+    def open_pdf_file(payment_form, include_attachments=True):
         """
-        Generate PDF file content for saving as attachment.
+        Open the PDF file for streaming or saving as attachment (e.g. with
+        attachment.file.save(filename, File(pdf_file))); the caller closes it.
 
         Args:
             payment_form: PaymentForm instance
             include_attachments: If True, append user-uploaded attachments to PDF
 
+        Returns tuple of (binary file, filename)
+        """
+        pdf_file = FormPDFGenerator._cached_pdf(payment_form, include_attachments)
+        filename = f'PF_{payment_form.pf_number}.pdf'
+
+        return pdf_file, filename
+
+    @staticmethod
+    def generate_pdf_file(payment_form, include_attachments=True):
+        """
+        Generate PDF file content in memory (open_pdf_file avoids the copy).
+
         Returns tuple of (pdf_bytes, filename)
         """
+        pdf_file, filename = FormPDFGenerator.open_pdf_file(payment_form, include_attachments)
+        with pdf_file:
+            return pdf_file.read(), filename
+
+    @staticmethod
+    def _cached_pdf(payment_form, include_attachments):
+        """
+        Open PDF file from the render cache (vouchers.pdf_cache), rendered on a miss.
+
+        The merged PDF is cached separately from the rendered pages, so a new
+        attachment only repeats the merge.
+        """
+        key, attachments = FormPDFGenerator.cache_key(payment_form, include_attachments)
+
+        def render(output):
+            if not attachments:
+                FormPDFGenerator._render_pdf(payment_form, output)
+                return
+            with FormPDFGenerator._cached_pdf(payment_form, include_attachments=False) as main_pdf:
+                FormPDFGenerator._merge_attachments_to_pdf(main_pdf, attachments, output)
+
+        return render_cache.get_or_render(key, render)
+
+    @staticmethod
+    def cache_key(payment_form, include_attachments=True):
+        """Render cache key of the PDF, and the attachments merged into it"""
+        attachments = list(FormPDFGenerator._attachments(payment_form)) if include_attachments else []
+        return document_fingerprint(payment_form, FormPDFGenerator.TEMPLATE, attachments), attachments
+
+    @staticmethod
+    def _attachments(payment_form):
+        """User-uploaded attachments, in the order they are appended to the PDF"""
+        return payment_form.attachments.exclude(
+            filename__startswith='PF_'
+        ).order_by('uploaded_at')
+
+    @staticmethod
+    def _render_pdf(payment_form, output):
+        """Render the payment form template with WeasyPrint (without attachments) into output"""
         grand_total = payment_form.calculate_grand_total()
 
         approval_history = payment_form.approval_history.filter(
@@ -394,31 +355,9 @@ class FormPDFGenerator:
             'grand_total': grand_total,
             'approval_history': approval_history,
             'line_items': payment_form.line_items.all(),
-            'now': timezone.now(),
         }
 
-        html_string = render_to_string('vouchers/pf/form_pdf.html', context)
-
-        media_root = os.path.abspath(settings.MEDIA_ROOT)
-        media_root = media_root.replace('\\', '/')
-
-        if not media_root.endswith('/'):
-            media_root += '/'
-
-        base_url = f"file:///{media_root}"
-
-        html = HTML(string=html_string, base_url=base_url)
-        pdf_bytes = html.write_pdf()
-
-        # Merge user-uploaded attachments if requested
-        if include_attachments:
-            attachments = payment_form.attachments.exclude(
-                filename__startswith='PF_'
-            ).order_by('uploaded_at')
-
-            if attachments.exists():
-                pdf_bytes = FormPDFGenerator._merge_attachments_to_pdf(pdf_bytes, attachments)
-
-        filename = f'PF_{payment_form.pf_number}.pdf'
+        html_string = render_to_string(FormPDFGenerator.TEMPLATE, context)
 
-        return pdf_bytes, filename
\ No newline at end of file
+        # Fonts, stylesheets and images are shared by every render in this process
+        get_renderer().render(html_string, FormPDFGenerator.TEMPLATE, target=output)
@@ -0,0 +1,205 @@
+"""
+Background rendering of approved documents' PDF attachments.
+
+Final approval queues a PDFRenderJob in the approval's own transaction
+(AutoAttachmentService.queue_pdf, called from NotificationService), so the
+request returns at once. The run_pdf_workers management command claims queued
+jobs and renders them in a bounded process pool (settings.PDF_RENDER_WORKERS
+processes, each rendering one document at a time) with
+AutoAttachmentService.attach_pdf_to_approved_document.
+
+A failed attempt is queued again after RETRY_BASE_DELAY * 2 ** (attempt - 1),
+until MAX_ATTEMPTS. While a job renders, its worker touches heartbeat_at every
+HEARTBEAT_INTERVAL; a job whose heartbeat is older than RUNNING_TIMEOUT belongs
+to a worker that died and is treated as a failed attempt. A claim is identified
+by the job's started_at, and every change after the claim is a conditional
+update on it, so a worker that lost its claim (requeued as stale, then claimed
+again) cannot overwrite the newer attempt. The job row is the document's render
+status (render_status).
+
+Usage:
+    queue_pdf_render(document, approver)    # in the approval
+    job_ids = claim_jobs(4)                 # in the worker
+    render_job(job_id)                      # in a pool process (see pdf_pool)
+    render_status(document)                 # 'PENDING' / 'RUNNING' / 'DONE' / 'FAILED' / None
+"""
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .models import PaymentForm, PDFRenderJob
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+
+# Delay before the first retry, doubled on every further failure
+RETRY_BASE_DELAY = timedelta(seconds=30)
+
+# A rendering worker touches its job this often
+HEARTBEAT_INTERVAL = timedelta(seconds=30)
+
+# A running job without a heartbeat for this long is assumed to belong to a dead worker
+RUNNING_TIMEOUT = timedelta(minutes=5)
+
+
+def doc_type_of(document):
+    return 'pf' if isinstance(document, PaymentForm) else 'pv'
+
+
+# ── Queueing ──
+
+def queue_pdf_render(document, user):
+    """
+    Queue the PDF attachment render of a document, or queue a finished job again.
+
+    Args:
+        document: PaymentVoucher or PaymentForm
+        user: Recorded as the uploader of the attachment (the final approver)
+    """
+    job, created = PDFRenderJob.objects.get_or_create(
+        doc_type=doc_type_of(document), document_id=document.pk,
+        defaults={'requested_by': user},
+    )
+    if not created and job.status in ('DONE', 'FAILED'):
+        job.status = 'PENDING'
+        job.attempts = 0
+        job.available_at = timezone.now()
+        job.error = ''
+        job.requested_by = user
+        job.save(update_fields=['status', 'attempts', 'available_at', 'error', 'requested_by'])
+    return job
+
+
+def render_status(document):
+    """Render status of a document's PDF attachment (None when it was never queued)"""
+    return (
+        PDFRenderJob.objects
+        .filter(doc_type=doc_type_of(document), document_id=document.pk)
+        .values_list('status', flat=True)
+        .first()
+    )
+
+
+# ── Worker ──
+
+def claim_jobs(limit):
+    """Mark up to limit due queued jobs RUNNING and return their ids, oldest first"""
+    now = timezone.now()
+    candidates = (
+        PDFRenderJob.objects
+        .filter(status='PENDING', available_at__lte=now)
+        .order_by('available_at', 'pk')
+        .values_list('pk', flat=True)[:limit * 2]
+    )
+    claimed = []
+    for pk in candidates:
+        if len(claimed) >= limit:
+            break
+        # Conditional update, so two workers never claim the same job
+        if PDFRenderJob.objects.filter(pk=pk, status='PENDING').update(
+            status='RUNNING', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+        ):
+            claimed.append(pk)
+    return claimed
+
+
+def holding_claim(job):
+    """The job's row, as long as the claim the job instance was loaded with still holds"""
+    return PDFRenderJob.objects.filter(pk=job.pk, status='RUNNING', started_at=job.started_at)
+
+
+def finish(job, **changes):
+    """
+    Apply changes to a claimed job (and to the instance) if the claim still holds.
+
+    Returns:
+        The job; reloaded with its current state when the claim was lost
+    """
+    if holding_claim(job).update(**changes):
+        for field, value in changes.items():
+            setattr(job, field, value)
+    else:
+        logger.warning('PDF render job %s was claimed again meanwhile; result of this attempt dropped', job.pk)
+        job.refresh_from_db()
+    return job
+
+
+@contextmanager
+def heartbeat(job):
+    """Touch the job's heartbeat_at every HEARTBEAT_INTERVAL while the block runs"""
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(HEARTBEAT_INTERVAL.total_seconds()):
+                holding_claim(job).update(heartbeat_at=timezone.now())
+        finally:
+            connection.close()  # this thread's own connection
+
+    thread = threading.Thread(target=beat, name=f'pdf-job-{job.pk}-heartbeat', daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def render_job(job_id):
+    """
+    Render and attach one claimed job's PDF; failures are recorded on the job.
+
+    Returns:
+        The job, saved
+    """
+    from workflow.services import AutoAttachmentService
+
+    job = PDFRenderJob.objects.select_related('requested_by').get(pk=job_id)
+    try:
+        document = job.document_model.objects.select_related('created_by').get(pk=job.document_id)
+    except job.document_model.DoesNotExist:
+        return record_failure(job, 'Document no longer exists', retry=False)
+
+    try:
+        with heartbeat(job):
+            AutoAttachmentService.attach_pdf_to_approved_document(document, job.requested_by)
+    except Exception as e:
+        logger.exception('PDF render job %s failed', job.pk)
+        return record_failure(job, e)
+
+    return finish(job, status='DONE', error='', finished_at=timezone.now())
+
+
+def failure_changes(job, error, retry=True):
+    """Field changes queuing a failed job again after its backoff delay, or failing it after MAX_ATTEMPTS"""
+    if retry and job.attempts < MAX_ATTEMPTS:
+        return {
+            'status': 'PENDING', 'error': str(error),
+            'available_at': timezone.now() + RETRY_BASE_DELAY * 2 ** max(job.attempts - 1, 0),
+        }
+    return {'status': 'FAILED', 'error': str(error), 'finished_at': timezone.now()}
+
+
+def record_failure(job, error, retry=True):
+    """Record a failed attempt of a claimed job (see failure_changes)"""
+    return finish(job, **failure_changes(job, error, retry))
+
+
+def requeue_stale_jobs():
+    """Record jobs left RUNNING by a dead worker as failed attempts; returns how many"""
+    stale = PDFRenderJob.objects.filter(
+        status='RUNNING', heartbeat_at__lt=timezone.now() - RUNNING_TIMEOUT,
+    )
+    count = 0
+    for job in stale:
+        # Skipped if the worker finished or beat meanwhile
+        count += holding_claim(job).filter(heartbeat_at=job.heartbeat_at).update(
+            **failure_changes(job, 'Worker stopped while rendering')
+        )
+    return count
@@ -0,0 +1,43 @@
+"""
+Entry points of the PDF render pool processes (run_pdf_workers, and the
+signature batch bundles that run_export_jobs builds, see vouchers.bundles).
+
+Pool processes are started with the 'spawn' method (a fresh interpreter, no
+inherited database connections), so this module must be importable before
+Django is set up: models are only imported once init_process has run.
+"""
+
+
+def init_process():
+    """Set up Django in a new pool process and load the PDF fonts and stylesheets"""
+    import django
+
+    django.setup()
+
+    from .pdf_renderer import get_renderer
+
+    get_renderer().warmup()
+
+
+def render(job_id):
+    """Render one claimed PDFRenderJob; returns (job id, status, error)"""
+    from .pdf_jobs import render_job
+
+    job = render_job(job_id)
+    return job.pk, job.status, job.error
+
+
+
+def render_document(doc_type, document_id):
+    """Render one document's PDF (with attachments) into the render cache"""
+    from .pdf_generator import FormPDFGenerator, VoucherPDFGenerator
+    from .models import PaymentForm, PaymentVoucher
+
+    model, generator = {
+        'pv': (PaymentVoucher, VoucherPDFGenerator),
+        'pf': (PaymentForm, FormPDFGenerator),
+    }[doc_type]
+    document = model.objects.select_related('created_by').get(pk=document_id)
+    pdf_file, _ = generator.open_pdf_file(document)
+    pdf_file.close()
+    return doc_type, document_id
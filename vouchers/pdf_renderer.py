@@ -0,0 +1,230 @@
+"""
+Long-lived WeasyPrint renderer for the voucher / form PDFs, one per process.
+
+A fresh HTML(...).write_pdf() resolves the fonts, parses the stylesheets and
+fetches every image again on each render; the Khmer web fonts in
+static/css/pdf_fonts.css are even downloaded from fonts.gstatic.com every time.
+The renderer keeps, for the life of the process:
+
+    - one FontConfiguration, in which the @font-face fonts are loaded once
+    - the template stylesheets (STYLESHEETS) parsed into CSS objects once
+    - fetched resources (fonts, Logo.png, signature images) in memory, up to
+      RESOURCE_CACHE_MB; local files are fetched again when they change
+
+Renders in one process are serialized (a FontConfiguration is not safe to share
+between threads while rendering).
+
+warmup() loads the fonts, stylesheets and logo ahead of the first render. The
+run_pdf_workers pool processes call it on start; a web server can call it after
+forking its workers, e.g. in a gunicorn.conf.py:
+    def post_fork(server, worker):
+        from vouchers.pdf_renderer import get_renderer
+        get_renderer().warmup()
+
+Usage:
+    pdf_bytes = get_renderer().render(html_string, 'vouchers/voucher_pdf.html')
+    get_renderer().render(html_string, 'vouchers/voucher_pdf.html', target=pdf_file)
+"""
+import logging
+import os
+import threading
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from weasyprint import CSS, HTML
+from weasyprint.text.fonts import FontConfiguration
+
+try:
+    from weasyprint.urls import URLFetcher, URLFetcherResponse
+except ImportError:  # Older WeasyPrint: URL fetchers are functions returning a dict
+    from weasyprint import default_url_fetcher
+    URLFetcher = URLFetcherResponse = None
+
+logger = logging.getLogger(__name__)
+
+# Static stylesheets of each PDF template, in cascade order
+STYLESHEETS = {
+    'vouchers/voucher_pdf.html': ['css/pdf_fonts.css', 'css/voucher_pdf.css'],
+    'vouchers/pf/form_pdf.html': ['css/pdf_fonts.css', 'css/form_pdf.css'],
+    'vouchers/batch/bundle_pdf.html': ['css/pdf_fonts.css', 'css/bundle_pdf.css'],
+}
+
+# Resources fetched once at warmup, relative to MEDIA_ROOT (the base URL of the templates)
+WARMUP_RESOURCES = ['Logo.png']
+
+# Memory kept for fetched resources per process
+RESOURCE_CACHE_MB = 64
+
+
+def stylesheet_paths(template_name):
+    """Absolute paths of a template's STYLESHEETS"""
+    paths = []
+    for name in STYLESHEETS.get(template_name, []):
+        path = finders.find(name)
+        if path is None:
+            raise FileNotFoundError(f'PDF stylesheet not found in static files: {name}')
+        paths.append(path)
+    return paths
+
+
+def media_base_url():
+    """file:// URL of MEDIA_ROOT, which the templates' relative image paths resolve against"""
+    media_root = os.path.abspath(settings.MEDIA_ROOT)
+    media_root = media_root.replace('\\', '/')
+
+    if not media_root.endswith('/'):
+        media_root += '/'
+
+    return f"file:///{media_root}"
+
+
+class ResourceCache:
+    """Fetched resource bodies in memory, least recently used dropped past max_bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(url):
+        """Cache key of a URL; local files include their size and modification time"""
+        if url.startswith('file:'):
+            try:
+                stat = os.stat(unquote(urlparse(url).path))
+            except OSError:
+                return None
+            return url, stat.st_size, stat.st_mtime_ns
+        return url
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """entry: (final url, body bytes, content type, charset)"""
+        size = len(entry[1])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self.size -= len(dropped[1])
+
+
+class PDFRenderer:
+    """Shared fonts, parsed stylesheets and fetched resources for every render in a process"""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.font_config = FontConfiguration()
+        self.resources = ResourceCache(RESOURCE_CACHE_MB * 1024 * 1024)
+        self.url_fetcher = self._make_url_fetcher()
+        self._stylesheets = {}
+        self._lock = threading.RLock()
+
+    # ── Resources ──
+
+    def fetch(self, url):
+        """(final url, body, content type, charset) of a URL, from memory when unchanged"""
+        key = self.resources.key(url)
+        entry = self.resources.get(key) if key is not None else None
+        if entry is None:
+            entry = self._download(url)
+            if key is not None:
+                self.resources.put(key, entry)
+        return entry
+
+    def _download(self, url):
+        if URLFetcher is not None:
+            response = URLFetcher().fetch(url)
+            try:
+                return response.url, response.read(), response.content_type, response.charset
+            finally:
+                response.close()
+
+        result = default_url_fetcher(url)
+        body = result['string'] if 'string' in result else result['file_obj'].read()
+        if 'file_obj' in result:
+            result['file_obj'].close()
+        return result.get('redirected_url', url), body, result.get('mime_type'), result.get('encoding')
+
+    def _make_url_fetcher(self):
+        renderer = self
+
+        if URLFetcher is None:
+            def fetch_dict(url):
+                final_url, body, content_type, charset = renderer.fetch(url)
+                return {'string': body, 'mime_type': content_type, 'encoding': charset,
+                        'redirected_url': final_url}
+            return fetch_dict
+
+        class CachedURLFetcher(URLFetcher):
+            def fetch(self, url, headers=None):
+                final_url, body, content_type, charset = renderer.fetch(url)
+                response_headers = {}
+                if content_type:
+                    response_headers['Content-Type'] = (
+                        f'{content_type}; charset={charset}' if charset else content_type
+                    )
+                return URLFetcherResponse(final_url, body, response_headers)
+
+        return CachedURLFetcher()
+
+    # ── Stylesheets ──
+
+    def stylesheets(self, template_name):
+        """Parsed CSS objects of a template (their @font-face fonts are loaded into font_config)"""
+        with self._lock:
+            if template_name not in self._stylesheets:
+                self._stylesheets[template_name] = [
+                    CSS(filename=path, font_config=self.font_config, url_fetcher=self.url_fetcher)
+                    for path in stylesheet_paths(template_name)
+                ]
+            return self._stylesheets[template_name]
+
+    # ── Rendering ──
+
+    def render(self, html_string, template_name, target=None):
+        """PDF of a rendered template, written to target (a binary file) or returned as bytes"""
+        with self._lock:
+            html = HTML(string=html_string, base_url=media_base_url(), url_fetcher=self.url_fetcher)
+            return html.write_pdf(
+                target,
+                stylesheets=self.stylesheets(template_name),
+                font_config=self.font_config,
+            )
+
+    def warmup(self):
+        """Parse every template's stylesheets (loading the fonts) and fetch WARMUP_RESOURCES"""
+        for template_name in STYLESHEETS:
+            self.stylesheets(template_name)
+        for name in WARMUP_RESOURCES:
+            try:
+                self.fetch(media_base_url() + name)
+            except Exception as e:
+                logger.warning('PDF renderer warmup could not fetch %s: %s', name, e)
+        return self
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer():
+    """The PDFRenderer of this process (a forked child gets its own)"""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None or _renderer.pid != os.getpid():
+            _renderer = PDFRenderer()
+        return _renderer
@@ -0,0 +1,52 @@
+"""
+Per-user "pending my approval" badge counts, cached through vouchers.cache.
+
+The badge is rendered on every page (accounts.context_processors.pending_approvals),
+so the counts are cached per user under the WORKFLOW and BATCHES version scopes.
+Anything that can change a badge - a document changing status or approver, a
+signature batch being created, signed or rejected - bumps one of those scopes
+(see vouchers.signals), and old entries are simply never read again.
+
+In the steady state, rendering a page costs a few cache reads and no queries.
+"""
+from . import cache as app_cache
+from .models import PaymentVoucher, PaymentForm, SignatureBatch
+
+# Safety net for changes made outside the ORM (raw SQL, manual DB edits)
+COUNTS_TIMEOUT = 300
+
+
+def compute_pending_counts(user):
+    """
+    Count what is waiting for a user, straight from the database.
+
+    System Admin (99) sees every pending document, MD (6) only works through
+    signature batches, everyone else sees the documents assigned to them.
+    """
+    if user.role_level == 99:
+        pv_count = PaymentVoucher.objects.filter(status__startswith='PENDING').count()
+        pf_count = PaymentForm.objects.filter(status__startswith='PENDING').count()
+        batch_count = 0
+    elif user.role_level == 6:
+        pv_count = 0
+        pf_count = 0
+        batch_count = SignatureBatch.objects.filter(status='PENDING').count()
+    else:
+        pv_count = PaymentVoucher.objects.filter(current_approver=user).count()
+        pf_count = PaymentForm.objects.filter(current_approver=user).count()
+        batch_count = 0
+
+    return {
+        'pending_count': pv_count + pf_count + batch_count,
+        'pending_batches': batch_count,
+    }
+
+
+def get_pending_counts(user):
+    """Badge counts for a user, from the cache when nothing has changed since they were computed"""
+    return app_cache.get_or_compute(
+        f'pending-counts:{user.pk}',
+        (app_cache.WORKFLOW, app_cache.BATCHES),
+        COUNTS_TIMEOUT,
+        lambda: compute_pending_counts(user),
+    )
@@ -0,0 +1,173 @@
+"""
+Raw CSV / JSON Lines export of documents and line items, for reconciliation scripts.
+
+Takes the same filters as ReportGenerator.apply_filters. Rows are read as tuples
+with values_list(...).iterator(chunk_size=CHUNK_SIZE), so no model instances are
+built, and written to a StreamingHttpResponse as they are produced: memory stays
+flat however long the date range.
+
+Levels:
+    documents - one row per Payment Voucher / Payment Form with its stored
+                per-currency totals and USD equivalent
+    lines     - one row per line item with its document's number, status and
+                payment date
+
+Usage:
+    GET /vouchers/reports/export/csv/?date_from=2025-01-01&date_to=2025-12-31
+    GET /vouchers/reports/export/jsonl/?level=lines&status=APPROVED
+"""
+import csv
+import json
+from decimal import Decimal
+from itertools import chain
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .excel_export import CHUNK_SIZE
+from .models import VoucherLineItem, FormLineItem
+from .reports import ReportGenerator
+
+LEVELS = ('documents', 'lines')
+
+FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'jsonl': ('application/x-ndjson', 'jsonl'),
+}
+
+VAT_RATE = Decimal('1.1')
+
+# (column, voucher field, form field); None fields are filled in by the row builder
+DOCUMENT_COLUMNS = [
+    ('doc_type', None, None),
+    ('number', 'pv_number', 'pf_number'),
+    ('status', 'status', 'status'),
+    ('payment_date', 'payment_date', 'payment_date'),
+    ('payee_name', 'payee_name', 'payee_name'),
+    ('created_by', 'created_by__username', 'created_by__username'),
+    ('created_at', 'created_at', 'created_at'),
+    ('company_bank', 'company_bank_account__bank', 'company_bank_account__bank'),
+    ('company_account_number', 'company_bank_account__account_number', 'company_bank_account__account_number'),
+    ('payee_bank_name', 'bank_name', 'bank_name'),
+    ('payee_account_number', 'bank_account_number', 'bank_account_number'),
+    ('line_count', 'line_count', 'line_count'),
+    ('total_usd', 'total_usd', 'total_usd'),
+    ('total_khr', 'total_khr', 'total_khr'),
+    ('total_thb', 'total_thb', 'total_thb'),
+    ('total_rmb', 'total_rmb', 'total_rmb'),
+    ('usd_equivalent', 'usd_equivalent', 'usd_equivalent'),
+]
+
+LINE_COLUMNS = [
+    ('doc_type', None, None),
+    ('number', 'voucher__pv_number', 'payment_form__pf_number'),
+    ('status', 'voucher__status', 'payment_form__status'),
+    ('payment_date', 'voucher__payment_date', 'payment_form__payment_date'),
+    ('payee_name', 'voucher__payee_name', 'payment_form__payee_name'),
+    ('line_number', 'line_number', 'line_number'),
+    ('description', 'description', 'description'),
+    ('department', 'department__name', 'department__name'),
+    ('program', 'program', 'program'),
+    ('currency', 'currency', 'currency'),
+    ('amount', 'amount', 'amount'),
+    ('vat_applicable', 'vat_applicable', 'vat_applicable'),
+    ('amount_with_vat', None, None),
+]
+
+
+class RawExport:
+    """Row source for one export: filtered documents or their line items, as tuples"""
+
+    def __init__(self, filters=None, level='documents'):
+        if level not in LEVELS:
+            raise ValueError(f'Unknown export level: {level}')
+        self.level = level
+        self.generator = ReportGenerator(filters).apply_filters()
+
+    @property
+    def columns(self):
+        return [column for column, _, _ in (DOCUMENT_COLUMNS if self.level == 'documents' else LINE_COLUMNS)]
+
+    def rows(self):
+        """Vouchers then forms, each in payment date order, as tuples matching columns"""
+        return chain(self._rows('PV'), self._rows('PF'))
+
+    def _rows(self, doc_type):
+        # The report querysets select and prefetch for model rows; tuples need neither
+        documents = (self.generator.vouchers if doc_type == 'PV' else self.generator.forms)
+        documents = documents.select_related(None).prefetch_related(None)
+        index = 1 if doc_type == 'PV' else 2
+
+        if self.level == 'documents':
+            fields = [column[index] for column in DOCUMENT_COLUMNS[1:]]
+            queryset = documents.order_by('payment_date', 'pk').values_list(*fields)
+            for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+                yield (doc_type, *row)
+        else:
+            line_model, fk_name = (VoucherLineItem, 'voucher') if doc_type == 'PV' else (FormLineItem, 'payment_form')
+            fields = [column[index] for column in LINE_COLUMNS[1:-1]]
+            queryset = (
+                line_model.objects
+                .filter(**{f'{fk_name}__in': documents.values('pk')})
+                .order_by(f'{fk_name}__payment_date', fk_name, 'line_number')
+                .values_list(*fields)
+            )
+            for row in queryset.iterator(chunk_size=CHUNK_SIZE):
+                amount, vat_applicable = row[-2], row[-1]
+                yield (doc_type, *row, amount * VAT_RATE if vat_applicable else amount)
+
+
+# ── Output formats ──
+
+class Echo:
+    """File-like object whose write() returns the line, for csv.writer in a generator"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def jsonl_lines(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+def buffered(lines, size=CHUNK_SIZE):
+    """Join lines into chunks of up to size lines, so the response is not written line by line"""
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= size:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def streaming_export_response(filters, output_format, level='documents'):
+    """
+    StreamingHttpResponse with the filtered rows in output_format ('csv' or 'jsonl').
+
+    Raises:
+        ValueError: Unknown output format or level
+    """
+    if output_format not in FORMATS:
+        raise ValueError(f'Unknown export format: {output_format}')
+
+    export = RawExport(filters, level)
+    write_lines = csv_lines if output_format == 'csv' else jsonl_lines
+    content_type, extension = FORMATS[output_format]
+
+    response = StreamingHttpResponse(
+        buffered(write_lines(export.columns, export.rows())), content_type=content_type,
+    )
+    filename = f"vouchers_{level}_{timezone.now().strftime('%Y%m%d_%H%M%S')}.{extension}"
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
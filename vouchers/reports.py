@@ -8,11 +8,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from io import BytesIO
 from decimal import Decimal
-
-# Excel
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, PatternFill, Border, Side
-from openpyxl.utils import get_column_letter
+from itertools import chain
 
 # PDF
 from reportlab.lib import colors
@@ -22,16 +18,29 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 
-from .models import PaymentVoucher, PaymentForm, Department
+from .models import PaymentVoucher, PaymentForm, Department, MonthlyDisbursement, CURRENCY_TOTAL_FIELDS
+from .currency import document_usd
+from .excel_export import COMPANY_NAME, ExcelSheet, iter_documents
+from .search import filter_documents
 from accounts.models import User
 
+REPORT_CURRENCIES = ['USD', 'KHR', 'THB', 'RMB']
+CURRENCY_SYMBOLS = {'USD': '$', 'KHR': '៛', 'THB': '฿', 'RMB': '¥'}
+
 
 class ReportGenerator:
     """Main report generator class with advanced filtering"""
 
-    def __init__(self, filters=None):
-        """Initialize with optional filters"""
+    def __init__(self, filters=None, progress=None):
+        """
+        Initialize with optional filters.
+
+        Args:
+            progress: Optional callable(done, total) told about every document an
+                export writes (background export jobs report it, see export_jobs)
+        """
         self.filters = filters or {}
+        self.progress = progress
         self.vouchers = None
         self.forms = None
 
@@ -75,14 +84,16 @@ class ReportGenerator:
         # Department filter
         department_name = self.filters.get('department')
         if department_name:
-            vouchers_qs = vouchers_qs.filter(line_items__department__name=department_name).distinct()
-            forms_qs = forms_qs.filter(line_items__department__name=department_name).distinct()
+            vouchers_qs = vouchers_qs.filter(
+                MonthlyDisbursement.department_filter(PaymentVoucher, department__name=department_name))
+            forms_qs = forms_qs.filter(
+                MonthlyDisbursement.department_filter(PaymentForm, department__name=department_name))
 
         # Payee filter
         payee_name = self.filters.get('payee_name')
         if payee_name:
-            vouchers_qs = vouchers_qs.filter(payee_name__icontains=payee_name)
-            forms_qs = forms_qs.filter(payee_name__icontains=payee_name)
+            vouchers_qs = filter_documents(vouchers_qs, payee_name, 'payee', 'pv')
+            forms_qs = filter_documents(forms_qs, payee_name, 'payee', 'pf')
 
         # Document type filter
         doc_type = self.filters.get('doc_type', 'ALL')
@@ -91,57 +102,111 @@ class ReportGenerator:
         elif doc_type == 'PF':
             vouchers_qs = PaymentVoucher.objects.none()
 
-        self.vouchers = vouchers_qs.select_related('created_by').prefetch_related('line_items')
-        self.forms = forms_qs.select_related('created_by').prefetch_related('line_items')
+        # usd_equivalent: stored totals converted at the rate in effect on the payment date
+        self.vouchers = (vouchers_qs.select_related('created_by').prefetch_related('line_items')
+                         .annotate(usd_equivalent=document_usd()))
+        self.forms = (forms_qs.select_related('created_by').prefetch_related('line_items')
+                      .annotate(usd_equivalent=document_usd()))
 
         return self
 
+    def document_counter(self, *querysets):
+        """
+        Callable advancing the progress callback by one document (a no-op without
+        one); the total is the size of the querysets (default: vouchers and forms)
+        """
+        if not self.progress:
+            return lambda: None
+
+        total = sum(queryset.count() for queryset in querysets or (self.vouchers, self.forms))
+        done = 0
+
+        def advance():
+            nonlocal done
+            done += 1
+            self.progress(done, total)
+        return advance
+
     def get_summary_stats(self):
-        """Calculate summary statistics"""
+        """
+        Calculate summary statistics.
+
+        One grouped query per document type: the document count, the stored
+        per-currency totals and the USD equivalent of every status.
+        """
         if self.vouchers is None or self.forms is None:
             self.apply_filters()
 
         stats = {
-            'total_vouchers': self.vouchers.count(),
-            'total_forms': self.forms.count(),
-            'total_documents': self.vouchers.count() + self.forms.count(),
+            'total_vouchers': 0,
+            'total_forms': 0,
+            'total_documents': 0,
             'by_status': {},
-            'by_currency': {'USD': Decimal('0'), 'KHR': Decimal('0'), 'THB': Decimal('0')},
+            'by_currency': {currency: Decimal('0') for currency in REPORT_CURRENCIES},
+            'usd_equivalent': Decimal('0'),
         }
 
-        # Count by status
+        status_counts = {}
+        for key, documents in (('total_vouchers', self.vouchers), ('total_forms', self.forms)):
+            rows = (
+                documents.select_related(None).prefetch_related(None)
+                .order_by().values('status')
+                .annotate(
+                    count=Count('pk'),
+                    usd=Sum('usd_equivalent'),
+                    **{currency: Sum(field) for currency, field in CURRENCY_TOTAL_FIELDS.items()},
+                )
+            )
+            for row in rows:
+                stats[key] += row['count']
+                status_counts[row['status']] = status_counts.get(row['status'], 0) + row['count']
+                for currency in REPORT_CURRENCIES:
+                    stats['by_currency'][currency] += row[currency] or Decimal('0')
+                stats['usd_equivalent'] += row['usd'] or Decimal('0')
+
+        stats['total_documents'] = stats['total_vouchers'] + stats['total_forms']
+
+        # Count by status, in workflow order
         for status_code, status_label in PaymentVoucher.STATUS_CHOICES:
-            count = self.vouchers.filter(status=status_code).count() + self.forms.filter(status=status_code).count()
-            if count > 0:
-                stats['by_status'][status_label] = count
+            if status_counts.get(status_code):
+                stats['by_status'][status_label] = status_counts[status_code]
 
-        # Calculate totals by currency
-        for voucher in self.vouchers:
-            totals = voucher.calculate_grand_total()
-            for currency, amount in totals.items():
-                stats['by_currency'][currency] += amount
+        return stats
 
-        for form in self.forms:
-            totals = form.calculate_grand_total()
-            for currency, amount in totals.items():
-                stats['by_currency'][currency] += amount
+    # Bank sections of the Excel export, in sheet order. A document belongs to the AC
+    # section when its company bank name contains 'AC' (ACLEDA), otherwise to ABA
+    # when it contains 'ABA'; documents without a matching account are left out.
+    BANK_SECTIONS = [
+        {'code': 'AC', 'name': 'ACLEDA Bank', 'type': 'PV', 'title': 'AC PV'},
+        {'code': 'ABA', 'name': 'ABA Bank', 'type': 'PV', 'title': 'ABA PV'},
+        {'code': 'AC', 'name': 'ACLEDA Bank', 'type': 'PF', 'title': 'AC PF'},
+        {'code': 'ABA', 'name': 'ABA Bank', 'type': 'PF', 'title': 'ABA PF'},
+    ]
+
+    def section_documents(self, section):
+        """Queryset of one bank section's documents"""
+        ac_bank = Q(company_bank_account__bank__icontains='AC')
+        if section['code'] == 'AC':
+            bank_filter = ac_bank
+        else:
+            bank_filter = Q(company_bank_account__bank__icontains='ABA') & ~ac_bank
 
-        return stats
+        documents = self.vouchers if section['type'] == 'PV' else self.forms
+        return documents.filter(bank_filter).select_related('company_bank_account')
 
     def export_to_excel(self):
-        """Export filtered data to Excel grouped by bank account sections"""
+        """
+        Export filtered data to Excel grouped by bank account sections.
+
+        Rows are streamed into a write-only workbook section by section.
+
+        Returns:
+            Temporary .xlsx file object positioned at the start
+        """
         if self.vouchers is None or self.forms is None:
             self.apply_filters()
 
-        # Create workbook
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Payment Summary by Bank"
-
-        # ===========================================================================
-        # SET COLUMN WIDTHS
-        # ===========================================================================
-        column_widths = {
+        sheet = ExcelSheet("Payment Summary by Bank", {
             'A': 5.0,    # No
             'B': 15.0,   # PV/PF No.
             'C': 25.0,   # Supplier
@@ -150,423 +215,124 @@ class ReportGenerator:
             'F': 25.0,   # Receiver Account Name
             'G': 20.0,   # Receiver Account Number
             'H': 20.0    # Remark
-        }
-
-        for col, width in column_widths.items():
-            ws.column_dimensions[col].width = width
-
-        # ===========================================================================
-        # DEFINE STYLES
-        # ===========================================================================
-        header_font = Font(name='Calibri', size=11, bold=True, color='000000')
-        company_font = Font(name='Calibri', size=14, bold=True, color='000000')
-        title_font = Font(name='Calibri', size=13, bold=True, color='000000')
-        data_font = Font(name='Calibri', size=11, color='000000')
-
-        header_fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
-
-        border = Border(
-            left=Side(style='thin', color='000000'),
-            right=Side(style='thin', color='000000'),
-            top=Side(style='thin', color='000000'),
-            bottom=Side(style='thin', color='000000')
-        )
-
-        center_alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        left_alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
-        right_alignment = Alignment(horizontal='right', vertical='center')
-
-        # ===========================================================================
-        # ROW 1: COMPANY NAME
-        # ===========================================================================
-        ws.merge_cells('A1:H1')
-        company_cell = ws['A1']
-        company_cell.value = "Phat Phnom Penh  Co.,LTD  (Garden City Water Park)"
-        company_cell.font = company_font
-        company_cell.alignment = center_alignment
-
-        # ===========================================================================
-        # ROW 2: TITLE & DATE
-        # ===========================================================================
-        ws.merge_cells('A2:F2')
-        title_cell = ws['A2']
-        title_cell.value = "Payment Summary by Bank Account"
-        title_cell.font = title_font
-        title_cell.alignment = center_alignment
-
-        # Date on the right (G2:H2)
-        ws.merge_cells('G2:H2')
-        date_cell = ws['G2']
-        date_cell.value = f"Date: {timezone.now().strftime('%d-%b-%Y')}"
-        date_cell.font = Font(name='Calibri', size=11, bold=True)
-        date_cell.alignment = right_alignment
-
-        # ===========================================================================
-        # GROUP DOCUMENTS BY BANK AND TYPE
-        # ===========================================================================
-        # Define bank sections
-        bank_sections = [
-            {'code': 'AC', 'name': 'ACLEDA Bank', 'type': 'PV', 'title': 'AC PV'},
-            {'code': 'ABA', 'name': 'ABA Bank', 'type': 'PV', 'title': 'ABA PV'},
-            {'code': 'AC', 'name': 'ACLEDA Bank', 'type': 'PF', 'title': 'AC PF'},
-            {'code': 'ABA', 'name': 'ABA Bank', 'type': 'PF', 'title': 'ABA PF'},
-        ]
-
-        # Group documents by bank and type
-        def categorize_document(doc):
-            """Return bank code and document type"""
-            is_voucher = hasattr(doc, 'pv_number')
-            doc_type = 'PV' if is_voucher else 'PF'
-
-            if doc.company_bank_account:
-                bank_name = doc.company_bank_account.bank
-                if 'ACLEDA' in bank_name.upper() or 'AC' in bank_name.upper():
-                    return 'AC', doc_type
-                elif 'ABA' in bank_name.upper():
-                    return 'ABA', doc_type
-            return None, doc_type
-
-        # Organize documents into sections
-        sections_data = {
-            ('AC', 'PV'): [],
-            ('ABA', 'PV'): [],
-            ('AC', 'PF'): [],
-            ('ABA', 'PF'): [],
-        }
-
-        for voucher in self.vouchers:
-            bank_code, doc_type = categorize_document(voucher)
-            if bank_code and (bank_code, doc_type) in sections_data:
-                sections_data[(bank_code, doc_type)].append(voucher)
-
-        for form in self.forms:
-            bank_code, doc_type = categorize_document(form)
-            if bank_code and (bank_code, doc_type) in sections_data:
-                sections_data[(bank_code, doc_type)].append(form)
-
-        # ===========================================================================
-        # START BUILDING SECTIONS
-        # ===========================================================================
-        row = 4  # Start after title and date
-        grand_totals = {'USD': Decimal('0'), 'KHR': Decimal('0'), 'THB': Decimal('0')}
-
-        # ===========================================================================
-        # GENERATE SECTIONS
-        # ===========================================================================
-        # Professional color scheme
-        section_header_fill = PatternFill(start_color='FDB462', end_color='FDB462', fill_type='solid')  # Professional orange
-        table_header_fill = PatternFill(start_color='B3CDE3', end_color='B3CDE3', fill_type='solid')   # Professional blue
-        subtotal_fill = PatternFill(start_color='E6F3FF', end_color='E6F3FF', fill_type='solid')      # Light blue
-
-        for section in bank_sections:
-            row += 2  # Add spacing
-
-            bank_code = section['code']
-            doc_type = section['type']
+        })
+
+        # ── Row 1: company name, row 2: title & date ──
+        sheet.append({'A': (COMPANY_NAME, 'company')}, merge=['A:H'])
+        sheet.append({
+            'A': ("Payment Summary by Bank Account", 'report_title'),
+            'G': (f"Date: {timezone.now().strftime('%d-%b-%Y')}", 'bold_right'),
+        }, merge=['A:F', 'G:H'])
+        sheet.skip()
+
+        grand_totals = {currency: Decimal('0') for currency in REPORT_CURRENCIES}
+        grand_total_usd = Decimal('0')  # Every currency at its document's exchange rate
+        advance = self.document_counter(*(self.section_documents(section) for section in self.BANK_SECTIONS))
+
+        for section in self.BANK_SECTIONS:
+            sheet.skip(2)  # Spacing
             section_title = section['title']
 
-            # Get documents for this section
-            documents = sections_data.get((bank_code, doc_type), [])
-
-            # Get first document with bank account info (if exists)
-            sample_account = None
-            if documents:
-                for doc in documents:
-                    if doc.company_bank_account:
-                        sample_account = doc.company_bank_account
-                        break
-
-            # ===========================================================================
-            # SECTION HEADER ROW (Yellow/Orange background)
-            # ===========================================================================
-            ws.merge_cells(f'A{row}:G{row}')
-            header_cell = ws[f'A{row}']
-
-            if sample_account:
-                header_cell.value = f"Transfer by Account: {sample_account.company_name}, Account Number {sample_account.account_number} ({sample_account.currency}) {sample_account.bank}"
+            documents = iter_documents(self.section_documents(section))
+            first = next(documents, None)
+
+            # ── Section header (orange) with the first document's transfer account ──
+            if first:
+                account = first.company_bank_account
+                header = f"Transfer by Account: {account.company_name}, Account Number {account.account_number} ({account.currency}) {account.bank}"
             else:
-                header_cell.value = f"Transfer by Account: {section['name']} (No account assigned)"
-
-            header_cell.font = Font(name='Calibri', size=11, bold=True, color='000000')
-            header_cell.alignment = left_alignment
-            header_cell.fill = section_header_fill
-            header_cell.border = border
-
-            # Section title on right (H column)
-            title_cell = ws[f'H{row}']
-            title_cell.value = section_title
-            title_cell.font = Font(name='Calibri', size=12, bold=True, color='000000')
-            title_cell.alignment = center_alignment
-            title_cell.fill = section_header_fill
-            title_cell.border = border
-
-            row += 1
-
-            # ===========================================================================
-            # TABLE HEADERS
-            # ===========================================================================
-            table_headers = [
-                ('A', 'No'),
-                ('B', 'PV No.' if doc_type == 'PV' else 'PF No.'),
-                ('C', 'Supplier'),
-                ('D', 'Description'),
-                ('E', 'Amount'),
-                ('F', 'Receiver Bank Account\nAccount Name'),
-                ('G', 'Receiver Bank Account\nAccount Number'),
-                ('H', 'Remark')
-            ]
-
-            for col, header_text in table_headers:
-                cell = ws[f'{col}{row}']
-                cell.value = header_text
-                cell.font = Font(name='Calibri', size=10, bold=True, color='000000')
-                cell.alignment = center_alignment
-                cell.fill = table_header_fill
-                cell.border = border
-
-            row += 1
-
-            # ===========================================================================
-            # DATA ROWS
-            # ===========================================================================
-            section_totals = {'USD': Decimal('0'), 'KHR': Decimal('0'), 'THB': Decimal('0')}
-
-            if documents:
-                for idx, doc in enumerate(documents, 1):
-                    # Determine if this is a voucher or form
-                    is_voucher = hasattr(doc, 'pv_number')
-                    doc_number = doc.pv_number if is_voucher else doc.pf_number
-
-                    # Calculate totals for all currencies
-                    totals = doc.calculate_grand_total()
-
-                    # Currency symbols
-                    symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
-
-                    # Build amount display string with all currencies
+                header = f"Transfer by Account: {section['name']} (No account assigned)"
+            sheet.append({'A': (header, 'section'), 'H': (section_title, 'section_title')}, merge=['A:G'])
+
+            # ── Table headers ──
+            sheet.append({
+                'A': ('No', 'table_header'),
+                'B': ('PV No.' if section['type'] == 'PV' else 'PF No.', 'table_header'),
+                'C': ('Supplier', 'table_header'),
+                'D': ('Description', 'table_header'),
+                'E': ('Amount', 'table_header'),
+                'F': ('Receiver Bank Account\nAccount Name', 'table_header'),
+                'G': ('Receiver Bank Account\nAccount Number', 'table_header'),
+                'H': ('Remark', 'table_header'),
+            })
+
+            # ── Data rows ──
+            section_totals = {currency: Decimal('0') for currency in REPORT_CURRENCIES}
+
+            if first:
+                for idx, doc in enumerate(chain([first], documents), 1):
+                    doc_number = doc.pv_number if section['type'] == 'PV' else doc.pf_number
+
+                    # Amount display string with all currencies
+                    totals = doc.get_stored_totals()
+                    grand_total_usd += doc.usd_equivalent
                     amount_parts = []
-                    for currency in ['USD', 'KHR', 'THB']:
+                    for currency in REPORT_CURRENCIES:
                         if currency in totals and totals[currency] > 0:
-                            amount_parts.append(f"{symbols[currency]}{totals[currency]:,.2f}")
+                            amount_parts.append(f"{CURRENCY_SYMBOLS[currency]}{totals[currency]:,.2f}")
                             section_totals[currency] += totals[currency]
                             grand_totals[currency] += totals[currency]
 
-                    amount_display = '\n'.join(amount_parts) if amount_parts else '0.00'
-
                     # Combine all line item descriptions
                     descriptions = [item.description for item in doc.line_items.all()]
-                    combined_description = '\n'.join(descriptions) if descriptions else ''
-
-                    # Receiver bank info
-                    receiver_account_name = doc.bank_name or '-'
-                    receiver_account_number = doc.bank_account_number or '-'
-
-                    # Column A: No
-                    ws[f'A{row}'] = idx
-                    ws[f'A{row}'].font = data_font
-                    ws[f'A{row}'].alignment = center_alignment
-                    ws[f'A{row}'].border = border
-
-                    # Column B: Doc Number
-                    ws[f'B{row}'] = doc_number or 'DRAFT'
-                    ws[f'B{row}'].font = data_font
-                    ws[f'B{row}'].alignment = left_alignment
-                    ws[f'B{row}'].border = border
-
-                    # Column C: Supplier
-                    ws[f'C{row}'] = doc.payee_name
-                    ws[f'C{row}'].font = data_font
-                    ws[f'C{row}'].alignment = left_alignment
-                    ws[f'C{row}'].border = border
-
-                    # Column D: Description
-                    ws[f'D{row}'] = combined_description
-                    ws[f'D{row}'].font = data_font
-                    ws[f'D{row}'].alignment = left_alignment
-                    ws[f'D{row}'].border = border
-
-                    # Column E: Amount (with all currencies)
-                    ws[f'E{row}'] = amount_display
-                    ws[f'E{row}'].font = data_font
-                    ws[f'E{row}'].alignment = right_alignment
-                    ws[f'E{row}'].border = border
-
-                    # Column F: Receiver Account Name
-                    ws[f'F{row}'] = receiver_account_name
-                    ws[f'F{row}'].font = data_font
-                    ws[f'F{row}'].alignment = left_alignment
-                    ws[f'F{row}'].border = border
-
-                    # Column G: Receiver Account Number
-                    ws[f'G{row}'] = receiver_account_number
-                    ws[f'G{row}'].font = data_font
-                    ws[f'G{row}'].alignment = left_alignment
-                    ws[f'G{row}'].border = border
-
-                    # Column H: Remark (blank)
-                    ws[f'H{row}'] = ''
-                    ws[f'H{row}'].font = data_font
-                    ws[f'H{row}'].alignment = left_alignment
-                    ws[f'H{row}'].border = border
-
-                    row += 1
+
+                    sheet.append({
+                        'A': (idx, 'cell_center'),
+                        'B': (doc_number or 'DRAFT', 'cell'),
+                        'C': (doc.payee_name, 'cell'),
+                        'D': ('\n'.join(descriptions), 'cell'),
+                        'E': ('\n'.join(amount_parts) if amount_parts else '0.00', 'cell_right'),
+                        'F': (doc.bank_name or '-', 'cell'),
+                        'G': (doc.bank_account_number or '-', 'cell'),
+                        'H': ('', 'cell'),
+                    })
+                    advance()
             else:
-                # No documents - add 3 empty rows
+                # No documents - 3 empty bordered rows
                 for _ in range(3):
-                    for col in ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']:
-                        ws[f'{col}{row}'] = ''
-                        ws[f'{col}{row}'].border = border
-                    row += 1
+                    sheet.append(sheet.blank_cells('cell'))
 
-            # ===========================================================================
-            # SUBTOTAL ROWS - One row per currency
-            # ===========================================================================
-            symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
-
-            for currency in ['USD', 'KHR', 'THB']:
+            # ── Subtotal rows - one per currency ──
+            for currency in REPORT_CURRENCIES:
                 if section_totals[currency] > 0:
-                    ws.merge_cells(f'A{row}:D{row}')
-                    subtotal_label = ws[f'A{row}']
-                    subtotal_label.value = f"Subtotal - {section_title} ({currency})"
-                    subtotal_label.font = Font(name='Calibri', size=11, bold=True)
-                    subtotal_label.alignment = right_alignment
-                    subtotal_label.fill = subtotal_fill
-                    subtotal_label.border = border
-
-                    ws[f'E{row}'] = f"{symbols[currency]}{section_totals[currency]:,.2f}"
-                    ws[f'E{row}'].font = Font(name='Calibri', size=11, bold=True)
-                    ws[f'E{row}'].alignment = right_alignment
-                    ws[f'E{row}'].fill = subtotal_fill
-                    ws[f'E{row}'].border = border
-
-                    # Empty cells for subtotal row
-                    for col in ['F', 'G', 'H']:
-                        ws[f'{col}{row}'] = ''
-                        ws[f'{col}{row}'].fill = subtotal_fill
-                        ws[f'{col}{row}'].border = border
-
-                    row += 1
-
-        # ===========================================================================
-        # GRAND TOTAL ROWS - One row per currency
-        # ===========================================================================
-        row += 1
-        symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
-
-        for currency in ['USD', 'KHR', 'THB']:
-            if grand_totals[currency] > 0:
-                ws.merge_cells(f'A{row}:D{row}')
-                grand_total_label = ws[f'A{row}']
-                grand_total_label.value = f"GRAND TOTAL ({currency})"
-                grand_total_label.font = Font(name='Calibri', size=12, bold=True, color='FFFFFF')
-                grand_total_label.alignment = right_alignment
-                grand_total_label.fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-                grand_total_label.border = border
-
-                ws[f'E{row}'] = f"{symbols[currency]}{grand_totals[currency]:,.2f}"
-                ws[f'E{row}'].font = Font(name='Calibri', size=12, bold=True, color='FFFFFF')
-                ws[f'E{row}'].alignment = right_alignment
-                ws[f'E{row}'].fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-                ws[f'E{row}'].border = border
-
-                for col in ['F', 'G', 'H']:
-                    ws[f'{col}{row}'] = ''
-                    ws[f'{col}{row}'].fill = PatternFill(start_color='4472C4', end_color='4472C4', fill_type='solid')
-                    ws[f'{col}{row}'].border = border
-
-                row += 1
-
-        # ===========================================================================
-        # SIGNATURE FOOTER (3 COLUMNS)
-        # ===========================================================================
-        row += 3  # Add spacing
-
-        # Get current user for "Prepared By"
-        from django.contrib.auth import get_user_model
-        User = get_user_model()
-
-        # Prepared By (Columns A-B)
-        ws.merge_cells(f'A{row}:B{row}')
-        prepared_cell = ws[f'A{row}']
-        prepared_cell.value = "Prepared By:"
-        prepared_cell.font = Font(name='Calibri', size=11, bold=True)
-        prepared_cell.alignment = left_alignment
-
-        ws.merge_cells(f'A{row+1}:B{row+1}')
-        prepared_name = ws[f'A{row+1}']
-        prepared_name.value = "___________________________"
-        prepared_name.font = data_font
-        prepared_name.alignment = center_alignment
-
-        ws.merge_cells(f'A{row+2}:B{row+2}')
-        prepared_date = ws[f'A{row+2}']
-        prepared_date.value = "Date: ............"
-        prepared_date.font = data_font
-        prepared_date.alignment = center_alignment
-
-        # Checked By (Columns C-E)
-        ws.merge_cells(f'C{row}:E{row}')
-        checked_cell = ws[f'C{row}']
-        checked_cell.value = "Checked By: Finance Manager"
-        checked_cell.font = Font(name='Calibri', size=11, bold=True)
-        checked_cell.alignment = center_alignment
-
-        ws.merge_cells(f'C{row+1}:E{row+1}')
-        checked_name = ws[f'C{row+1}']
-        checked_name.value = "___________________________"
-        checked_name.font = data_font
-        checked_name.alignment = center_alignment
-
-        ws.merge_cells(f'C{row+2}:E{row+2}')
-        checked_date = ws[f'C{row+2}']
-        checked_date.value = "Date: ............"
-        checked_date.font = data_font
-        checked_date.alignment = center_alignment
-
-        # Approved By (Columns F-H)
-        ws.merge_cells(f'F{row}:H{row}')
-        approved_cell = ws[f'F{row}']
-        approved_cell.value = "Approved By: Managing Director"
-        approved_cell.font = Font(name='Calibri', size=11, bold=True)
-        approved_cell.alignment = center_alignment
-
-        ws.merge_cells(f'F{row+1}:H{row+1}')
-        approved_name = ws[f'F{row+1}']
-        approved_name.value = "___________________________"
-        approved_name.font = data_font
-        approved_name.alignment = center_alignment
-
-        ws.merge_cells(f'F{row+2}:H{row+2}')
-        approved_date = ws[f'F{row+2}']
-        approved_date.value = "Date: ............"
-        approved_date.font = data_font
-        approved_date.alignment = center_alignment
-
-        # ===========================================================================
-        # PAGE SETUP
-        # ===========================================================================
-        ws.page_setup.paperSize = 9  # A4
-        ws.page_setup.orientation = 'landscape'
-        ws.page_setup.fitToPage = True
-        ws.page_setup.fitToHeight = 0
-        ws.page_setup.fitToWidth = 1
-        ws.print_options.horizontalCentered = True
-        ws.print_options.verticalCentered = False
-
-        ws.page_margins.left = 0.4
-        ws.page_margins.right = 0.4
-        ws.page_margins.top = 0.5
-        ws.page_margins.bottom = 0.5
-
-        ws.print_area = f'A1:H{row+2}'
-        ws.print_options.gridLines = False
-
-        # Save to BytesIO
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        return output
+                    sheet.append({
+                        **sheet.blank_cells('subtotal', 'FGH'),
+                        'A': (f"Subtotal - {section_title} ({currency})", 'subtotal'),
+                        'E': (f"{CURRENCY_SYMBOLS[currency]}{section_totals[currency]:,.2f}", 'subtotal'),
+                    }, merge=['A:D'])
+
+        # ── Grand total rows - one per currency ──
+        sheet.skip()
+
+        grand_total_rows = [
+            (f"GRAND TOTAL ({currency})", f"{CURRENCY_SYMBOLS[currency]}{grand_totals[currency]:,.2f}")
+            for currency in REPORT_CURRENCIES
+            if grand_totals[currency] > 0
+        ]
+        # Non-USD amounts: one more row with everything converted to USD
+        if any(grand_totals[currency] > 0 for currency in REPORT_CURRENCIES if currency != 'USD'):
+            grand_total_rows.append(("GRAND TOTAL (USD equivalent)", f"${grand_total_usd:,.2f}"))
+
+        for label, amount_display in grand_total_rows:
+            sheet.append({
+                **sheet.blank_cells('grand_total', 'FGH'),
+                'A': (label, 'grand_total'),
+                'E': (amount_display, 'grand_total'),
+            }, merge=['A:D'])
+
+        # ── Signature footer (3 columns) ──
+        sheet.skip(3)
+        footer_spans = ['A:B', 'C:E', 'F:H']
+        sheet.append({
+            'A': ("Prepared By:", 'bold_left'),
+            'C': ("Checked By: Finance Manager", 'bold_center'),
+            'F': ("Approved By: Managing Director", 'bold_center'),
+        }, merge=footer_spans)
+        sheet.append({column: ("___________________________", 'text_center') for column in 'ACF'}, merge=footer_spans)
+        last_row = sheet.append({column: ("Date: ............", 'text_center') for column in 'ACF'}, merge=footer_spans)
+
+        sheet.landscape_a4(print_area=f'A1:H{last_row}')
+        return sheet.to_file()
 
     def export_to_pdf(self):
         """Export filtered data to PDF with professional formatting"""
@@ -627,18 +393,18 @@ class ReportGenerator:
 
         # Table data
         data = [['No', 'Type', 'Supplier', 'Description', 'Amount', 'Transfer by Account', 'Remark']]
+        advance = self.document_counter()
 
         # Add vouchers
         for voucher in self.vouchers:
-            totals = voucher.calculate_grand_total()
+            totals = voucher.get_stored_totals()
             descriptions = " | ".join([item.description for item in voucher.line_items.all()[:2]])[:60]
 
             # Format amount with currency
             amount_parts = []
-            for currency in ['USD', 'KHR', 'THB']:
+            for currency in REPORT_CURRENCIES:
                 if totals.get(currency, 0) > 0:
-                    symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
-                    amount_parts.append(f"{symbols[currency]}{totals[currency]:,.2f}")
+                    amount_parts.append(f"{CURRENCY_SYMBOLS[currency]}{totals[currency]:,.2f}")
             amount_display = " + ".join(amount_parts) if amount_parts else "$0.00"
 
             # Get transfer account info - prioritize company_bank_account
@@ -666,18 +432,18 @@ class ReportGenerator:
                 transfer_account,
                 ''  # Blank remark
             ])
+            advance()
 
         # Add forms
         for form in self.forms:
-            totals = form.calculate_grand_total()
+            totals = form.get_stored_totals()
             descriptions = " | ".join([item.description for item in form.line_items.all()[:2]])[:60]
 
             # Format amount with currency
             amount_parts = []
-            for currency in ['USD', 'KHR', 'THB']:
+            for currency in REPORT_CURRENCIES:
                 if totals.get(currency, 0) > 0:
-                    symbols = {'USD': '$', 'KHR': '៛', 'THB': '฿'}
-                    amount_parts.append(f"{symbols[currency]}{totals[currency]:,.2f}")
+                    amount_parts.append(f"{CURRENCY_SYMBOLS[currency]}{totals[currency]:,.2f}")
             amount_display = " + ".join(amount_parts) if amount_parts else "$0.00"
 
             # Get transfer account info - prioritize company_bank_account
@@ -705,6 +471,7 @@ class ReportGenerator:
                 transfer_account,
                 ''  # Blank remark
             ])
+            advance()
 
         # Create table with adjusted column widths for landscape A4
         table = Table(data, colWidths=[0.9*inch, 0.4*inch, 1.3*inch, 2.3*inch, 1.1*inch, 2.5*inch, 1.5*inch])
@@ -742,6 +509,8 @@ class ReportGenerator:
             ['Total Amount (USD):', f"${stats['by_currency']['USD']:,.2f}"],
             ['Total Amount (KHR):', f"៛{stats['by_currency']['KHR']:,.2f}"],
             ['Total Amount (THB):', f"฿{stats['by_currency']['THB']:,.2f}"],
+            ['Total Amount (RMB):', f"¥{stats['by_currency']['RMB']:,.2f}"],
+            ['Total (USD equivalent):', f"${stats['usd_equivalent']:,.2f}"],
         ]
 
         summary_table = Table(summary_data, colWidths=[2.5*inch, 2*inch])
@@ -0,0 +1,329 @@
+"""
+Full-text search over the DocumentIndex (document number, payee, and line item
+descriptions / programs / departments).
+
+The index is created by migration 0015 and depends on the database:
+    - SQLite (USE_SQLITE=True): FTS5 table vouchers_documentindex_fts, kept in
+      sync with vouchers_documentindex by triggers.
+    - PostgreSQL: generated, weighted tsvector column search_vector with a GIN index.
+Any other backend falls back to icontains on the index columns.
+
+Every search term is prefix-matched ("ric" finds "rice") and all terms must match.
+Results can be ordered by relevance with the search_rank annotation (lower is better).
+
+Amount searches (AmountQuery) are parsed instead of text-matched and run as
+indexed range lookups on line item amounts and the per-currency document totals.
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import DocumentIndex, VoucherLineItem, FormLineItem, CURRENCY_TOTAL_FIELDS
+
+INDEX_TABLE = DocumentIndex._meta.db_table
+FTS_TABLE = f'{INDEX_TABLE}_fts'
+
+# search_field -> (FTS5 column, tsvector weight); None searches every column
+SEARCH_COLUMNS = {
+    'all': (None, ''),
+    'number': ('number', 'A'),
+    'payee': ('payee_name', 'B'),
+    'description': ('search_details', 'C'),
+}
+
+# bm25() column weights (number, payee_name, search_details), mirroring tsvector weights A/B/C
+BM25_WEIGHTS = '10.0, 5.0, 1.0'
+
+# Looks like part of a date (2026, 2026-04, 04-15 ...)
+DATE_FRAGMENT = re.compile(r'^[\d\-/]+$')
+
+# Currency symbols / codes accepted in amount searches ("$500", "៛40000", "500 thb")
+CURRENCY_ALIASES = {
+    '$': 'USD', 'usd': 'USD',
+    '៛': 'KHR', 'khr': 'KHR', 'riel': 'KHR',
+    '฿': 'THB', 'thb': 'THB',
+    '¥': 'RMB', 'rmb': 'RMB', 'cny': 'RMB',
+}
+CURRENCY_PATTERN = re.compile(
+    r'\$|៛|฿|¥|\b(?:usd|khr|riel|thb|rmb|cny)\b', re.IGNORECASE
+)
+AMOUNT_NUMBER = r'\d[\d,]*(?:\.\d+)?'
+AMOUNT_PATTERN = re.compile(
+    rf'^(?P<op><=|>=|<|>)?\s*(?P<low>{AMOUNT_NUMBER})'
+    rf'(?:\s*(?:-|–|\.\.|to)\s*(?P<high>{AMOUNT_NUMBER}))?$',
+    re.IGNORECASE
+)
+
+
+class AmountQuery:
+    """
+    A parsed amount search: an exact value, a range or a bound, optionally in one currency.
+
+    Accepted forms: 1500, 1,500.50, 1000-2000, 1000..2000, >500, >=500, <500, <=500,
+    each optionally with a currency symbol or code ($500, ៛40000-50000, >100 THB).
+    """
+
+    OPERATORS = {'>': 'gt', '>=': 'gte', '<': 'lt', '<=': 'lte'}
+
+    def __init__(self, lookups, currency=None):
+        self.lookups = lookups      # e.g. {'gte': Decimal('1000'), 'lte': Decimal('2000')}
+        self.currency = currency    # 'USD' / 'KHR' / 'THB' / 'RMB' or None for any
+
+    @classmethod
+    def parse(cls, query):
+        """Return an AmountQuery, or None if the text is not an amount search"""
+        text = query.strip()
+        currency = None
+        match = CURRENCY_PATTERN.search(text)
+        if match:
+            currency = CURRENCY_ALIASES[match.group(0).lower()]
+            text = (text[:match.start()] + text[match.end():]).strip()
+
+        match = AMOUNT_PATTERN.match(text)
+        if not match:
+            return None
+
+        try:
+            low = Decimal(match.group('low').replace(',', ''))
+            high = Decimal(match.group('high').replace(',', '')) if match.group('high') else None
+        except InvalidOperation:
+            return None
+
+        op = match.group('op')
+        if high is not None:
+            if op:
+                return None
+            low, high = min(low, high), max(low, high)
+            lookups = {'gte': low, 'lte': high}
+        elif op:
+            lookups = {cls.OPERATORS[op]: low}
+        else:
+            lookups = {'exact': low}
+
+        return cls(lookups, currency)
+
+    @property
+    def is_range(self):
+        return 'gte' in self.lookups and 'lte' in self.lookups
+
+    def _condition(self, field):
+        return Q(**{f'{field}__{lookup}': value for lookup, value in self.lookups.items()})
+
+    def line_item_filter(self):
+        """Q for line items whose amount (before VAT) matches"""
+        condition = self._condition('amount')
+        if self.currency:
+            condition &= Q(currency=self.currency)
+        return condition
+
+    def total_filter(self):
+        """Q for DocumentIndex rows whose per-currency total (incl. VAT) matches"""
+        currencies = [self.currency] if self.currency else list(CURRENCY_TOTAL_FIELDS)
+        condition = Q()
+        for currency in currencies:
+            condition |= self._condition(CURRENCY_TOTAL_FIELDS[currency])
+        return condition
+
+    def document_filter(self, model, doc_type):
+        """
+        Q for PaymentVoucher / PaymentForm rows with a matching line item amount or total.
+
+        Both sides are indexed range lookups returned as IN subqueries, so no join
+        or .distinct() is needed on the document queryset.
+        """
+        line_model = model.line_items.rel.related_model
+        fk_name = model.line_items.field.attname
+        return (
+            Q(pk__in=line_model.objects.filter(self.line_item_filter()).values(fk_name)) |
+            Q(pk__in=DocumentIndex.objects.filter(
+                self.total_filter(), doc_type=doc_type).values('document_id'))
+        )
+
+    def index_filter(self):
+        """Q for DocumentIndex rows with a matching line item amount or total"""
+        line_filter = self.line_item_filter()
+        return (
+            Q(doc_type='pv', document_id__in=VoucherLineItem.objects.filter(line_filter).values('voucher_id')) |
+            Q(doc_type='pf', document_id__in=FormLineItem.objects.filter(line_filter).values('payment_form_id')) |
+            self.total_filter()
+        )
+
+
+def search_terms(query):
+    """Split a query into lower-case word terms (punctuation is ignored, like the tokenizers)"""
+    return re.findall(r'\w+', query.lower())
+
+
+def _fts5_expression(terms, column):
+    prefix = f'{column} : ' if column else ''
+    return ' AND '.join(f'{prefix}"{term}"*' for term in terms)
+
+
+def _tsquery_expression(terms, weight):
+    return ' & '.join(f'{term}:*{weight}' for term in terms)
+
+
+def search_index(query, field='all', queryset=None):
+    """
+    Filter DocumentIndex rows matching a search query.
+
+    Args:
+        query: Free text typed by the user
+        field: 'all', 'number', 'payee' or 'description'
+        queryset: DocumentIndex queryset to narrow (defaults to all rows)
+
+    Returns:
+        DocumentIndex queryset annotated with search_rank (lower = more relevant)
+    """
+    if queryset is None:
+        queryset = DocumentIndex.objects.all()
+
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    column, weight = SEARCH_COLUMNS.get(field, SEARCH_COLUMNS['all'])
+
+    if connection.vendor == 'sqlite':
+        expression = _fts5_expression(terms, column)
+        return queryset.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [expression])
+        ).annotate(search_rank=RawSQL(
+            f'SELECT bm25({FTS_TABLE}, {BM25_WEIGHTS}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = {INDEX_TABLE}.id',
+            [expression]
+        ))
+
+    if connection.vendor == 'postgresql':
+        expression = _tsquery_expression(terms, weight)
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT id FROM {INDEX_TABLE} WHERE search_vector @@ to_tsquery('simple', %s)",
+                [expression]
+            )
+        ).annotate(search_rank=RawSQL(
+            f"-ts_rank({INDEX_TABLE}.search_vector, to_tsquery('simple', %s))",
+            [expression]
+        ))
+
+    # No full-text support: substring match on the narrow index table
+    columns = [column] if column else ['number', 'payee_name', 'search_details']
+    for term in terms:
+        term_filter = Q()
+        for name in columns:
+            term_filter |= Q(**{f'{name}__icontains': term})
+        queryset = queryset.filter(term_filter)
+    return queryset.annotate(search_rank=RawSQL('0', []))
+
+
+def filter_documents(queryset, query, field, doc_type):
+    """
+    Apply a dashboard search to a PaymentVoucher or PaymentForm queryset.
+
+    Text fields ('all', 'number', 'payee', 'description') use the full-text index;
+    'amount' parses the input with AmountQuery and 'date' matches document dates.
+    Every condition is a subquery, so no join or .distinct() is needed.
+    """
+    amount = AmountQuery.parse(query)
+
+    def date_filter():
+        return Q(created_at__icontains=query) | Q(payment_date__icontains=query)
+
+    if field == 'amount':
+        if amount is None:
+            return queryset.none()
+        return queryset.filter(amount.document_filter(queryset.model, doc_type))
+
+    if field == 'date':
+        return queryset.filter(date_filter())
+
+    text_field = field if field in SEARCH_COLUMNS else 'all'
+    matches = search_index(query, text_field, DocumentIndex.objects.filter(doc_type=doc_type))
+    q_filter = Q(pk__in=matches.values('document_id'))
+
+    if text_field == 'all':
+        # Amounts and dates are not in the text index. A bare "2026-04" is a date or
+        # document number here, not an amount range, unless a currency is given.
+        if amount is not None and (amount.currency or not amount.is_range):
+            q_filter |= amount.document_filter(queryset.model, doc_type)
+        if DATE_FRAGMENT.match(query):
+            q_filter |= date_filter()
+
+    return queryset.filter(q_filter)
+
+
+def filter_index(queryset, query, field):
+    """
+    Apply a dashboard search to a DocumentIndex queryset.
+
+    Same rules as filter_documents(), for lists that read the index directly.
+    """
+    amount = AmountQuery.parse(query)
+
+    def date_filter():
+        return Q(created_at__icontains=query) | Q(payment_date__icontains=query)
+
+    if field == 'amount':
+        if amount is None:
+            return queryset.none()
+        return queryset.filter(amount.index_filter())
+
+    if field == 'date':
+        return queryset.filter(date_filter())
+
+    text_field = field if field in SEARCH_COLUMNS else 'all'
+    q_filter = Q(pk__in=search_index(query, text_field).values('pk'))
+
+    if text_field == 'all':
+        if amount is not None and (amount.currency or not amount.is_range):
+            q_filter |= amount.index_filter()
+        if DATE_FRAGMENT.match(query):
+            q_filter |= date_filter()
+
+    return queryset.filter(q_filter)
+
+
+def install_search_index():
+    """
+    Create the SQLite FTS5 table and sync triggers if they are missing.
+
+    Migration 0015 creates them; this repairs them after SQLite schema changes
+    that rebuild vouchers_documentindex (which silently drops its triggers).
+    PostgreSQL's generated column survives such changes, so nothing is needed there.
+    """
+    if connection.vendor != 'sqlite':
+        return
+
+    columns = 'number, payee_name, search_details'
+    new_values = 'new.id, new.number, new.payee_name, new.search_details'
+    old_values = 'old.id, old.number, old.payee_name, old.search_details'
+    statements = [
+        f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+            {columns}, content='{INDEX_TABLE}', content_rowid='id',
+            tokenize='unicode61', prefix='2 3'
+        )""",
+        f"""CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_fts_insert AFTER INSERT ON {INDEX_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES ({new_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_fts_delete AFTER DELETE ON {INDEX_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', {old_values});
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {INDEX_TABLE}_fts_update AFTER UPDATE OF {columns}
+            ON {INDEX_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) VALUES ('delete', {old_values});
+            INSERT INTO {FTS_TABLE}(rowid, {columns}) VALUES ({new_values});
+        END""",
+    ]
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def rebuild_search_index():
+    """Rebuild the SQLite FTS5 index from vouchers_documentindex (GIN needs no maintenance)"""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
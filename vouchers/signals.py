@@ -0,0 +1,223 @@
+"""
+Signals for vouchers app.
+Keep the denormalized totals on PaymentVoucher / PaymentForm in sync with their line items,
+and the DocumentIndex / DocumentAccess / MonthlyDisbursement tables in sync with the documents
+(and the rollup's USD amounts in sync with the ExchangeRate table).
+Changes to documents in the report statuses move the reports page snapshot by those
+documents' shares after commit (rate changes recompute it).
+Every change also bumps the matching vouchers.cache version scopes, which expires
+cached badge counts, dashboard charts and detail page fragments.
+Uploaded images get their PDF derivative (vouchers.derivatives) in the background.
+"""
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from workflow.models import ApprovalHistory, FormApprovalHistory
+from .models import (
+    PaymentVoucher, PaymentForm, VoucherLineItem, FormLineItem,
+    VoucherAttachment, FormAttachment,
+    SignatureBatch, BatchVoucherItem, BatchFormItem,
+    DocumentIndex, DocumentAccess, MonthlyDisbursement, ExchangeRate,
+)
+from . import cache as app_cache
+from .analytics import REPORT_STATUSES, report_states, schedule_snapshot_refresh, schedule_snapshot_update
+from .derivatives import schedule_derivative
+
+
+def _parent(line_item, field_name, model):
+    """Return the line item's document, reusing the cached instance so it sees the new totals"""
+    field = line_item._meta.get_field(field_name)
+    if field.is_cached(line_item):
+        return getattr(line_item, field_name)
+    return model(pk=getattr(line_item, field.attname))
+
+
+def _bump_document(document, rollup_months=None, *scopes):
+    """Expire cached data of one document (plus the dashboard charts if its rollup months changed)"""
+    if rollup_months:
+        scopes += (app_cache.ROLLUP,)
+    app_cache.bump(app_cache.DOCUMENTS, app_cache.document_scope(document), *scopes)
+
+
+def _report_state(document, status):
+    """The document's report_states() (empty, without a query, unless status is a report status)"""
+    if status not in REPORT_STATUSES:
+        return {}
+    return report_states(DocumentIndex.doc_type_for(document), [document.pk])
+
+
+def _report_changed(document, before, status):
+    """Move the reports page snapshot from the document's before state to its state at commit"""
+    if before or status in REPORT_STATUSES:
+        schedule_snapshot_update(DocumentIndex.doc_type_for(document), [document.pk], before)
+
+
+def _indexed_state(document, fields):
+    """Field values of a document as currently recorded in the DocumentIndex (None if not indexed)"""
+    return DocumentIndex.objects.filter(
+        doc_type=DocumentIndex.doc_type_for(document), document_id=document.pk
+    ).values_list(*fields).first()
+
+
+def _indexed_status(document):
+    """The document's status as recorded in the DocumentIndex (None if not indexed)"""
+    state = _indexed_state(document, ('status',))
+    return state and state[0]
+
+
+@receiver(post_save, sender=VoucherLineItem)
+@receiver(post_delete, sender=VoucherLineItem)
+def sync_voucher_totals(sender, instance, **kwargs):
+    """Recalculate voucher totals and search text when one of its line items changes"""
+    # Skip when the voucher itself is being deleted (cascade)
+    if isinstance(kwargs.get('origin'), PaymentVoucher):
+        return
+    voucher = _parent(instance, 'voucher', PaymentVoucher)
+    status = _indexed_status(voucher)
+    before = _report_state(voucher, status)
+    voucher.refresh_totals()
+    DocumentIndex.refresh_search_details(voucher)
+    months = MonthlyDisbursement.refresh_document(voucher, status)
+    _bump_document(voucher, months)
+    _report_changed(voucher, before, status)
+
+
+@receiver(post_save, sender=FormLineItem)
+@receiver(post_delete, sender=FormLineItem)
+def sync_form_totals(sender, instance, **kwargs):
+    """Recalculate payment form totals and search text when one of its line items changes"""
+    # Skip when the form itself is being deleted (cascade)
+    if isinstance(kwargs.get('origin'), PaymentForm):
+        return
+    payment_form = _parent(instance, 'payment_form', PaymentForm)
+    status = _indexed_status(payment_form)
+    before = _report_state(payment_form, status)
+    payment_form.refresh_totals()
+    DocumentIndex.refresh_search_details(payment_form)
+    months = MonthlyDisbursement.refresh_document(payment_form, status)
+    _bump_document(payment_form, months)
+    _report_changed(payment_form, before, status)
+
+
+@receiver(post_save, sender=PaymentVoucher)
+@receiver(post_save, sender=PaymentForm)
+def index_document(sender, instance, raw=False, **kwargs):
+    """Update the DocumentIndex, DocumentAccess and rollup rows on every save (covers workflow transitions too)"""
+    if raw:
+        return
+    previous = _indexed_state(instance, ('status', 'current_approver_id'))
+    before = _report_state(instance, previous and previous[0])
+    DocumentIndex.sync(instance)
+    DocumentAccess.sync(instance)
+    # The document's old cells lose its share and its new cells gain it (submitted, rejected or re-dated)
+    months = MonthlyDisbursement.refresh_document(instance, previous and previous[0], instance.status)
+    # Approval badges only change with the workflow state or the assigned approver
+    if previous != (instance.status, instance.current_approver_id):
+        _bump_document(instance, months, app_cache.WORKFLOW)
+    else:
+        _bump_document(instance, months)
+    _report_changed(instance, before, instance.status)
+
+
+@receiver(post_delete, sender=PaymentVoucher)
+@receiver(post_delete, sender=PaymentForm)
+def unindex_document(sender, instance, **kwargs):
+    """Drop the DocumentIndex and DocumentAccess rows of a deleted document"""
+    before = _report_state(instance, instance.status)
+    DocumentIndex.remove(instance)
+    DocumentAccess.remove(instance)
+    months = MonthlyDisbursement.refresh_document(instance, instance.status)
+    _bump_document(instance, months, app_cache.WORKFLOW)
+    _report_changed(instance, before, None)
+
+
+@receiver(post_save, sender=ApprovalHistory)
+@receiver(post_save, sender=FormApprovalHistory)
+def grant_actor_access(sender, instance, created, raw=False, **kwargs):
+    """Everyone who acts on a document keeps seeing it"""
+    if not created or raw:
+        return
+    document = instance.voucher if sender is ApprovalHistory else instance.payment_form
+    DocumentAccess.grant(instance.actor_id, document)
+    app_cache.bump(app_cache.document_scope(document))
+
+
+@receiver(post_delete, sender=ApprovalHistory)
+@receiver(post_delete, sender=FormApprovalHistory)
+def revoke_actor_access(sender, instance, **kwargs):
+    """Re-check access when history is removed (e.g. admin "Reset to Draft")"""
+    # Skip when the document itself is being deleted (cascade)
+    if isinstance(kwargs.get('origin'), (PaymentVoucher, PaymentForm)):
+        return
+    if sender is ApprovalHistory:
+        document = PaymentVoucher.objects.filter(pk=instance.voucher_id).first()
+    else:
+        document = PaymentForm.objects.filter(pk=instance.payment_form_id).first()
+    if document:
+        DocumentAccess.sync(document)
+        app_cache.bump(app_cache.document_scope(document))
+
+
+@receiver(post_save, sender=VoucherAttachment)
+@receiver(post_delete, sender=VoucherAttachment)
+@receiver(post_save, sender=FormAttachment)
+@receiver(post_delete, sender=FormAttachment)
+def expire_document_attachments(sender, instance, **kwargs):
+    """Attachment counts are shown on the detail page"""
+    if sender is VoucherAttachment:
+        document = PaymentVoucher(pk=instance.voucher_id)
+    else:
+        document = PaymentForm(pk=instance.payment_form_id)
+    app_cache.bump(app_cache.document_scope(document))
+
+
+@receiver(post_save, sender=VoucherAttachment)
+@receiver(post_save, sender=FormAttachment)
+def convert_uploaded_image(sender, instance, created, raw=False, **kwargs):
+    """Create the PDF derivative of an uploaded image in the background"""
+    if created and not raw:
+        schedule_derivative(instance)
+
+
+@receiver(post_delete, sender=VoucherAttachment)
+@receiver(post_delete, sender=FormAttachment)
+def delete_derivative(sender, instance, **kwargs):
+    """The derivative goes with its attachment (views delete the original file themselves)"""
+    if instance.pdf_derivative:
+        instance.pdf_derivative.delete(save=False)
+
+
+@receiver(post_save, sender=SignatureBatch)
+@receiver(post_delete, sender=SignatureBatch)
+@receiver(post_save, sender=BatchVoucherItem)
+@receiver(post_delete, sender=BatchVoucherItem)
+@receiver(post_save, sender=BatchFormItem)
+@receiver(post_delete, sender=BatchFormItem)
+def expire_batches(sender, instance, **kwargs):
+    """Batches created, signed, rejected, deleted or changing documents (MD badge and dashboard)"""
+    app_cache.bump(app_cache.BATCHES)
+
+
+@receiver(pre_save, sender=ExchangeRate)
+def remember_rate_date(sender, instance, raw=False, **kwargs):
+    """Keep the stored effective date, so moving a rate also recomputes the months it used to cover"""
+    instance._previous_effective_date = None
+    if instance.pk and not raw:
+        instance._previous_effective_date = (
+            ExchangeRate.objects.filter(pk=instance.pk).values_list('effective_date', flat=True).first()
+        )
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def reconvert_disbursements(sender, instance, raw=False, **kwargs):
+    """Recompute the rollup's USD amounts from the first month the rate affects"""
+    if raw:
+        return
+    dates = [instance.effective_date, getattr(instance, '_previous_effective_date', None)]
+    since = min(day for day in dates if day)
+    # The earliest rate of a currency also covers every date before it
+    if not ExchangeRate.objects.filter(currency=instance.currency, effective_date__lt=since).exists():
+        since = None
+    MonthlyDisbursement.refresh_since(since)
+    app_cache.bump(app_cache.RATES, app_cache.ROLLUP, app_cache.BATCHES)
+    schedule_snapshot_refresh()
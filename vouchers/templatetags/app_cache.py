@@ -0,0 +1,83 @@
+"""
+Versioned template fragment caching on top of vouchers.cache.
+
+    {% load app_cache %}
+    {% cachedfragment "dashboard-charts" scope="rollup" vary=chart_day ttl=3600 %}
+        ...
+    {% endcachedfragment %}
+
+    {% cachedfragment "voucher-sidebar" scope=voucher|document_scope %}...{% endcachedfragment %}
+
+Arguments:
+    name (required): fragment name, also the hit/miss stats namespace ("fragment-<name>")
+    scope: version scope name, comma-separated names, or a list (see vouchers.cache);
+        fragments with the same name and vary but different scopes are cached apart
+    vary: value the fragment differs by (e.g. user.pk); use a list for several
+    ttl: seconds (default FRAGMENT_TTL)
+"""
+import hashlib
+
+from django import template
+from django.template.base import token_kwargs
+
+from vouchers import cache as app_cache
+
+register = template.Library()
+
+FRAGMENT_TTL = 600
+
+FRAGMENT_OPTIONS = ('scope', 'vary', 'ttl')
+
+
+@register.filter
+def document_scope(document):
+    """Version scope of a document, for {% cachedfragment ... scope=voucher|document_scope %}"""
+    return app_cache.document_scope(document)
+
+
+class CachedFragmentNode(template.Node):
+    def __init__(self, nodelist, name, options):
+        self.nodelist = nodelist
+        self.name = name
+        self.options = options
+
+    def _option(self, context, option, default=None):
+        if option not in self.options:
+            return default
+        return self.options[option].resolve(context)
+
+    def render(self, context):
+        name = self.name.resolve(context)
+
+        scope = self._option(context, 'scope', ())
+        if isinstance(scope, str):
+            scope = [part.strip() for part in scope.split(',') if part.strip()]
+
+        vary = self._option(context, 'vary')
+        if not isinstance(vary, (list, tuple)):
+            vary = [] if vary is None else [vary]
+        digest = hashlib.md5(':'.join(str(value) for value in vary).encode()).hexdigest()
+
+        ttl = self._option(context, 'ttl', FRAGMENT_TTL)
+
+        return app_cache.get_or_compute(
+            f'fragment-{name}:{digest}', scope, ttl, lambda: self.nodelist.render(context)
+        )
+
+
+@register.tag('cachedfragment')
+def do_cachedfragment(parser, token):
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' requires a fragment name")
+
+    name = parser.compile_filter(bits[1])
+    options = token_kwargs(bits[2:], parser)
+    if len(options) != len(bits) - 2 or set(options) - set(FRAGMENT_OPTIONS):
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' only accepts {', '.join(f'{o}=...' for o in FRAGMENT_OPTIONS)} after the name"
+        )
+
+    nodelist = parser.parse(('endcachedfragment',))
+    parser.delete_first_token()
+    return CachedFragmentNode(nodelist, name, options)
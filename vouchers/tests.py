@@ -1,3 +1,1794 @@
-from django.test import TestCase
+import csv
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from decimal import Decimal
+from importlib import import_module
+from io import BytesIO, StringIO
+from itertools import chain
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, Sum
+from django.template import Context, Template
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from PIL import Image
+from pypdf import PdfReader, PdfWriter
+
+from accounts.models import User
+from workflow.models import ApprovalHistory, FormApprovalHistory
+from workflow.state_machine import VoucherStateMachine
+from . import cache as app_cache, export_jobs
+from .admin import update_documents
+from .bundles import batch_documents, render_missing, request_bundle
+from .analytics import SNAPSHOT_NAME, PendingSnapshotUpdate, build_snapshot, refresh_report_snapshot
+from .currency import convert_totals, document_usd, usd_amount
+from .derivatives import DERIVATIVE_DPI, convert_image_to_pdf, create_derivative, open_derivative
+from .excel_export import AMOUNT_FORMAT, COMPANY_NAME, XLSX_CONTENT_TYPE, iter_documents
+from .export_excel_template import build_template_sheet
+from .export_jobs import JobProgress, claim_next_job, request_export, run_job
+from .models import (
+    CompanyBankAccount, Department, DisbursementShare, DocumentAccess, DocumentIndex, ExchangeRate, ExportJob,
+    MonthlyDisbursement, PaymentVoucher, VoucherLineItem, PaymentForm, FormLineItem, FormAttachment, PDFRenderJob, ReportSnapshot,
+    SignatureBatch, BatchVoucherItem, BatchFormItem,
+)
+from .pdf_cache import PDFRenderCache
+from .pdf_jobs import (
+    MAX_ATTEMPTS, RETRY_BASE_DELAY, RUNNING_TIMEOUT, claim_jobs, queue_pdf_render, render_job,
+    requeue_stale_jobs,
+)
+from .raw_export import DOCUMENT_COLUMNS, LINE_COLUMNS
+from .reports import REPORT_CURRENCIES, ReportGenerator
+from .search import AmountQuery, filter_documents, filter_index, search_index
+
+try:
+    from .pdf_generator import FormPDFGenerator
+    from .pdf_renderer import PDFRenderer, ResourceCache
+except OSError:  # WeasyPrint without its system libraries (Pango)
+    FormPDFGenerator = PDFRenderer = ResourceCache = None
+
+
+class ReportDataTestCase(TestCase):
+    """Creators, departments and a generator of report documents"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='finance', password='x', role_level=3,
+            is_approved=True, email_verified=True,
+        )
+        cls.creators = [
+            User.objects.create_user(username=f'creator{i}', first_name='Creator', last_name=str(i), password='x')
+            for i in range(3)
+        ]
+        cls.departments = [
+            Department.objects.create(name=name, code=name[:3].upper())
+            for name in ('Operations', 'Finance', 'Marketing')
+        ]
+        cls.created = 0
+
+    def add_documents(self, count):
+        """Approved vouchers and forms in several months, departments and currencies"""
+        today = date.today()
+        for _ in range(count):
+            i = type(self).created
+            type(self).created += 1
+            creator = self.creators[i % len(self.creators)]
+            department = self.departments[i % len(self.departments)]
+            payment_date = today - timedelta(days=(i * 11) % 150)
+
+            voucher = PaymentVoucher.objects.create(
+                pv_number=f'BENCH-{i:04d}', created_by=creator, payee_name=f'Payee {i}',
+                payment_date=payment_date, status='APPROVED',
+            )
+            VoucherLineItem.objects.create(
+                voucher=voucher, line_number=1, description=f'Service {i}', department=department,
+                amount=Decimal('100') + i, currency='USD',
+            )
+            VoucherLineItem.objects.create(
+                voucher=voucher, line_number=2, description='Local costs', department=department,
+                amount=Decimal('41000'), currency='KHR',
+            )
+
+            payment_form = PaymentForm.objects.create(
+                pf_number=f'BENCH-{i:04d}', created_by=creator, payee_name=f'Vendor {i}',
+                payment_date=payment_date, status='PENDING_L4',
+            )
+            FormLineItem.objects.create(
+                payment_form=payment_form, line_number=1, description=f'Supplies {i}', department=department,
+                amount=Decimal('350') + i, currency='THB', vat_applicable=True,
+            )
+
+
+
+class ReportsQueryCountTests(ReportDataTestCase):
+    """Benchmark: the reports page costs the same number of queries however many documents exist"""
+
+    def setUp(self):
+        # As in production the snapshot row exists, so a live refresh updates it in place
+        refresh_report_snapshot()
+
+    def count_report_queries(self, live=True):
+        # Start from a cold cache so cached badge counts do not skew the comparison
+        cache.clear()
+        self.client.force_login(self.user)
+        url = reverse('vouchers:reports') + ('?live=1' if live else '')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_is_constant_as_documents_grow(self):
+        self.add_documents(3)
+        small_count, small = self.count_report_queries()
+
+        self.add_documents(60)
+        large_count, large = self.count_report_queries()
+
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(small.context['total_approved'], 6)
+        self.assertEqual(large.context['total_approved'], 126)
+
+    def test_records_are_paginated(self):
+        self.add_documents(30)
+        _, response = self.count_report_queries()
+
+        self.assertEqual(len(response.context['records']), 25)
+        self.assertEqual(response.context['records_page'].paginator.count, 60)
+        first = response.context['records'][0]
+        self.assertIn(first['department'], {d.name for d in self.departments})
+        self.assertNotEqual(first['description'], '-')
+
+    def test_breakdowns_cover_every_document(self):
+        self.add_documents(9)
+        _, response = self.count_report_queries()
+
+        creators = response.context['creator_breakdown']
+        self.assertEqual(sum(c['pv_count'] + c['pf_count'] for c in creators), 18)
+        self.assertEqual({c['name'] for c in creators}, {u.get_full_name() for u in self.creators})
+        self.assertEqual(sum(m for m in response.context['monthly_pv']), 9)
+
+        departments = response.context['dept_breakdown']
+        self.assertEqual({d['name'] for d in departments}, {d.name for d in self.departments})
+        self.assertAlmostEqual(sum(d['percentage'] for d in departments), 100)
+
+    def test_snapshot_is_read_without_recomputing(self):
+        self.add_documents(3)
+        live_count, live = self.count_report_queries()
+
+        # Documents added since are only counted after the snapshot is refreshed
+        self.add_documents(3)
+        snapshot_count, stored = self.count_report_queries(live=False)
+
+        self.assertLess(snapshot_count, live_count)
+        self.assertEqual(stored.context['total_approved'], 6)
+        self.assertEqual(stored.context['snapshot_at'], live.context['snapshot_at'])
+        self.assertEqual(stored.context['records_page'].paginator.count, 12)
+
+        _, refreshed = self.count_report_queries()
+        self.assertEqual(refreshed.context['total_approved'], 12)
+
+
+class ReportSnapshotUpdateTests(ReportDataTestCase):
+    """Document changes move the stored snapshot by their own shares"""
+
+    def setUp(self):
+        cache.clear()
+        self.add_documents(6)
+        refresh_report_snapshot()
+
+    @staticmethod
+    def rounded(data):
+        """Snapshot data with amounts to the cent and creators in name order"""
+        if isinstance(data, dict):
+            return {key: ReportSnapshotUpdateTests.rounded(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return sorted((ReportSnapshotUpdateTests.rounded(row) for row in data), key=lambda row: row['name'])
+        return round(data, 2) if isinstance(data, float) else data
+
+    def assertMatchesRecompute(self):
+        stored = ReportSnapshot.objects.get(name=SNAPSHOT_NAME).data
+        self.assertEqual(self.rounded(stored), self.rounded(build_snapshot()))
+
+    def test_document_changes_match_a_full_recompute(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_documents(2)
+        self.assertMatchesRecompute()
+
+        voucher = PaymentVoucher.objects.earliest('pk')
+        line = voucher.line_items.get(line_number=2)
+        with self.captureOnCommitCallbacks(execute=True):
+            line.amount = Decimal('82000')
+            line.save()
+        self.assertMatchesRecompute()
+
+        payment_form = PaymentForm.objects.earliest('pk')
+        with self.captureOnCommitCallbacks(execute=True):
+            payment_form.payment_date -= timedelta(days=40)
+            payment_form.save()
+            voucher.status = 'REJECTED'
+            voucher.save()
+        self.assertMatchesRecompute()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            PaymentVoucher.objects.latest('pk').delete()
+        self.assertMatchesRecompute()
+        self.assertEqual(ReportSnapshot.objects.get().data['totals']['total'], 14)
+
+    def test_admin_bulk_actions_update_the_snapshot(self):
+        vouchers = PaymentVoucher.objects.filter(pk__in=list(PaymentVoucher.objects.values_list('pk', flat=True)[:3]))
+        with self.captureOnCommitCallbacks(execute=True):
+            update_documents(PaymentVoucher, vouchers, status='DRAFT', current_approver=None)
+        self.assertMatchesRecompute()
+        self.assertEqual(ReportSnapshot.objects.get().data['totals']['pv'], 3)
+
+        forms = PaymentForm.objects.all()
+        with self.captureOnCommitCallbacks(execute=True):
+            update_documents(PaymentForm, forms, status='APPROVED', current_approver=None)
+        self.assertMatchesRecompute()
+
+    def test_update_cost_does_not_grow_with_the_documents(self):
+        def change_one():
+            voucher = PaymentVoucher.objects.latest('pk')
+            with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+                update_documents(PaymentVoucher, PaymentVoucher.objects.filter(pk=voucher.pk), status='PENDING_L5')
+            return len(queries)
+
+        small = change_one()
+        self.add_documents(40)
+        refresh_report_snapshot()
+        self.assertEqual(change_one(), small)
+        self.assertMatchesRecompute()
+
+    def test_one_update_per_transaction(self):
+        voucher = PaymentVoucher.objects.earliest('pk')
+        department = self.departments[0]
+        with self.captureOnCommitCallbacks() as callbacks, transaction.atomic():
+            for number in range(3, 13):
+                VoucherLineItem.objects.create(
+                    voucher=voucher, line_number=number, description=f'Extra {number}',
+                    department=department, amount=Decimal('10'), currency='USD',
+                )
+            payment_form = PaymentForm.objects.earliest('pk')
+            payment_form.status = 'REJECTED'
+            payment_form.save()
+
+        updates = [callback for callback in callbacks if getattr(callback, '__func__', None) is PendingSnapshotUpdate.apply]
+        self.assertEqual(len(updates), 1)
+        with CaptureQueriesContext(connection) as queries:
+            for callback in callbacks:
+                callback()
+        self.assertEqual(sum('reportsnapshot' in query['sql'] for query in queries), 2)  # read and save once
+        self.assertMatchesRecompute()
+
+    def test_rolled_back_changes_are_not_applied(self):
+        voucher = PaymentVoucher.objects.earliest('pk')
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            line = voucher.line_items.get(line_number=1)
+            try:
+                with transaction.atomic():
+                    line.amount = Decimal('5000')
+                    line.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            voucher.line_items.get(line_number=2).delete()
+        self.assertMatchesRecompute()
+
+
+class SummaryStatsQueryCountTests(ReportDataTestCase):
+    """ReportGenerator.get_summary_stats is one grouped query per document type"""
+
+    def test_query_count_is_constant_as_documents_grow(self):
+        self.add_documents(3)
+        with self.assertNumQueries(2):
+            ReportGenerator().get_summary_stats()
+
+        self.add_documents(30)
+        with self.assertNumQueries(2):
+            stats = ReportGenerator().get_summary_stats()
+
+        self.assertEqual(stats['total_vouchers'], 33)
+        self.assertEqual(stats['total_forms'], 33)
+        self.assertEqual(stats['total_documents'], 66)
+        # Labels in workflow order
+        self.assertEqual(list(stats['by_status'].items()), [('Pending Finance Controller', 33), ('Approved', 33)])
+
+    def test_totals_match_line_items(self):
+        self.add_documents(6)
+        voucher = PaymentVoucher.objects.first()
+        VoucherLineItem.objects.create(
+            voucher=voucher, line_number=3, description='Import duty', department=self.departments[0],
+            amount=Decimal('500'), currency='RMB',
+        )
+
+        stats = ReportGenerator().get_summary_stats()
+
+        expected = {currency: Decimal('0') for currency in REPORT_CURRENCIES}
+        for line in chain(VoucherLineItem.objects.all(), FormLineItem.objects.all()):
+            expected[line.currency] += line.get_total()
+        self.assertEqual(stats['by_currency'], expected)
+        self.assertEqual(stats['by_currency']['RMB'], Decimal('500'))
+
+        generator = ReportGenerator().apply_filters()
+        usd_equivalent = sum(doc.usd_equivalent for doc in chain(generator.vouchers, generator.forms))
+        self.assertAlmostEqual(stats['usd_equivalent'], usd_equivalent, places=6)
+
+    def test_filters_apply(self):
+        self.add_documents(4)
+        stats = ReportGenerator({'doc_type': 'PV', 'status': 'APPROVED'}).get_summary_stats()
+
+        self.assertEqual(stats['total_vouchers'], 4)
+        self.assertEqual(stats['total_forms'], 0)
+        self.assertEqual(stats['by_status'], {'Approved': 4})
+        self.assertEqual(stats['by_currency']['THB'], Decimal('0'))
+
+
+class DocumentTotalsTests(ReportDataTestCase):
+    """Denormalized per-currency totals and line counts follow line item changes"""
+
+    def setUp(self):
+        self.voucher = PaymentVoucher.objects.create(
+            created_by=self.creators[0], payee_name='Totals', payment_date=date.today(),
+        )
+
+    def stored(self, document):
+        document = type(document).objects.get(pk=document.pk)
+        index = DocumentIndex.objects.get(doc_type=DocumentIndex.doc_type_for(document), document_id=document.pk)
+        return document, index
+
+    def test_line_items_update_totals(self):
+        first = VoucherLineItem.objects.create(
+            voucher=self.voucher, line_number=1, description='Rent', department=self.departments[0],
+            amount=Decimal('100'), currency='USD', vat_applicable=True,
+        )
+        VoucherLineItem.objects.create(
+            voucher=self.voucher, line_number=2, description='Fuel', department=self.departments[0],
+            amount=Decimal('40000'), currency='KHR',
+        )
+
+        voucher, index = self.stored(self.voucher)
+        self.assertEqual(voucher.total_usd, Decimal('110'))
+        self.assertEqual(voucher.total_khr, Decimal('40000'))
+        self.assertEqual(voucher.line_count, 2)
+        self.assertEqual(voucher.get_stored_totals(), voucher.calculate_grand_total())
+        self.assertEqual((index.total_usd, index.total_khr), (Decimal('110'), Decimal('40000')))
+
+        first.amount = Decimal('200')
+        first.save()
+        voucher, index = self.stored(self.voucher)
+        self.assertEqual(voucher.total_usd, Decimal('220'))
+        self.assertEqual(index.total_usd, Decimal('220'))
+
+        first.delete()
+        voucher, index = self.stored(self.voucher)
+        self.assertEqual(voucher.total_usd, Decimal('0'))
+        self.assertEqual(voucher.line_count, 1)
+        self.assertEqual(index.total_usd, Decimal('0'))
+
+    def test_form_line_items_update_totals(self):
+        payment_form = PaymentForm.objects.create(
+            created_by=self.creators[0], payee_name='Totals', payment_date=date.today(),
+        )
+        FormLineItem.objects.create(
+            payment_form=payment_form, line_number=1, description='Supplies', department=self.departments[0],
+            amount=Decimal('1000'), currency='THB', vat_applicable=True,
+        )
+
+        payment_form, index = self.stored(payment_form)
+        self.assertEqual(payment_form.total_thb, Decimal('1100'))
+        self.assertEqual(payment_form.line_count, 1)
+        self.assertEqual(index.total_thb, Decimal('1100'))
+
+
+class DocumentSearchTests(ReportDataTestCase):
+    """Full-text search over document numbers, payees and line item text"""
+
+    def setUp(self):
+        self.rice = PaymentVoucher.objects.create(
+            pv_number='2604-0001', created_by=self.creators[0], payee_name='Golden Rice Trading',
+            payment_date=date.today(), status='APPROVED',
+        )
+        VoucherLineItem.objects.create(
+            voucher=self.rice, line_number=1, description='Jasmine rice, 40 sacks',
+            department=self.departments[0], amount=Decimal('900'), currency='USD',
+        )
+        self.fuel = PaymentForm.objects.create(
+            pf_number='2604-0002', created_by=self.creators[1], payee_name='Total Fuel Station',
+            payment_date=date.today(), status='APPROVED',
+        )
+        FormLineItem.objects.create(
+            payment_form=self.fuel, line_number=1, description='Diesel for generators',
+            department=self.departments[1], program='Golden Week', amount=Decimal('120'), currency='USD',
+        )
+
+    def found(self, query, field='all'):
+        return {(row.doc_type, row.document_id) for row in search_index(query, field)}
+
+    def test_terms_are_prefix_matched_and_all_required(self):
+        self.assertEqual(self.found('ric'), {('pv', self.rice.pk)})
+        self.assertEqual(self.found('golden'), {('pv', self.rice.pk), ('pf', self.fuel.pk)})
+        self.assertEqual(self.found('golden dies'), {('pf', self.fuel.pk)})
+        self.assertEqual(self.found('rice diesel'), set())
+        self.assertEqual(self.found('!!'), set())
+
+    def test_search_field_limits_the_columns(self):
+        self.assertEqual(self.found('golden', 'payee'), {('pv', self.rice.pk)})
+        self.assertEqual(self.found('golden', 'description'), {('pf', self.fuel.pk)})
+        self.assertEqual(self.found('2604', 'number'), {('pv', self.rice.pk), ('pf', self.fuel.pk)})
+
+    def test_line_item_changes_are_searchable(self):
+        line = self.rice.line_items.get()
+        line.description = 'Fragrant noodles'
+        line.save()
+
+        self.assertEqual(self.found('noodles'), {('pv', self.rice.pk)})
+        self.assertEqual(self.found('jasmine'), set())
+
+    def test_number_matches_rank_above_payee_matches(self):
+        by_payee = PaymentVoucher.objects.create(
+            pv_number='2604-0010', created_by=self.creators[0], payee_name='Supplier 0009',
+            payment_date=date.today(), status='APPROVED',
+        )
+        by_number = PaymentVoucher.objects.create(
+            pv_number='2604-0009', created_by=self.creators[0], payee_name='Supplier',
+            payment_date=date.today(), status='APPROVED',
+        )
+
+        ranked = [row.document_id for row in search_index('0009').order_by('search_rank')]
+        self.assertEqual(ranked, [by_number.pk, by_payee.pk])
+
+    def test_filter_documents_uses_the_index(self):
+        vouchers = filter_documents(PaymentVoucher.objects.all(), 'jasmine', 'all', 'pv')
+        forms = filter_documents(PaymentForm.objects.all(), 'jasmine', 'all', 'pf')
+
+        self.assertEqual(list(vouchers), [self.rice])
+        self.assertEqual(list(forms), [])
+
+
+class AmountSearchTests(ReportDataTestCase):
+    """Amount searches are parsed into range lookups on line amounts and document totals"""
+
+    def test_parse(self):
+        cases = {
+            '1500': ({'exact': Decimal('1500')}, None),
+            '1,500.50': ({'exact': Decimal('1500.50')}, None),
+            '2000-1000': ({'gte': Decimal('1000'), 'lte': Decimal('2000')}, None),
+            '1000..2000': ({'gte': Decimal('1000'), 'lte': Decimal('2000')}, None),
+            '>=500': ({'gte': Decimal('500')}, None),
+            '<500 thb': ({'lt': Decimal('500')}, 'THB'),
+            '$500': ({'exact': Decimal('500')}, 'USD'),
+            '៛40000-50000': ({'gte': Decimal('40000'), 'lte': Decimal('50000')}, 'KHR'),
+        }
+        for text, (lookups, currency) in cases.items():
+            with self.subTest(text=text):
+                amount = AmountQuery.parse(text)
+                self.assertEqual((amount.lookups, amount.currency), (lookups, currency))
+
+        for text in ('rice', '>100-200', '12abc', ''):
+            with self.subTest(text=text):
+                self.assertIsNone(AmountQuery.parse(text))
+
+    def test_matches_line_amounts_and_totals(self):
+        voucher = PaymentVoucher.objects.create(
+            created_by=self.creators[0], payee_name='Amounts', payment_date=date.today(),
+        )
+        for number, amount in enumerate(('300', '200'), start=1):
+            VoucherLineItem.objects.create(
+                voucher=voucher, line_number=number, description='Line', department=self.departments[0],
+                amount=Decimal(amount), currency='USD',
+            )
+        payment_form = PaymentForm.objects.create(
+            created_by=self.creators[0], payee_name='Amounts', payment_date=date.today(),
+        )
+        FormLineItem.objects.create(
+            payment_form=payment_form, line_number=1, description='Line', department=self.departments[0],
+            amount=Decimal('40000'), currency='KHR',
+        )
+
+        def found(query, field='amount'):
+            rows = filter_index(DocumentIndex.objects.all(), query, field)
+            return {(row.doc_type, row.document_id) for row in rows}
+
+        pv, pf = ('pv', voucher.pk), ('pf', payment_form.pk)
+        self.assertEqual(found('300'), {pv})                # line amount
+        self.assertEqual(found('500'), {pv})                # document total
+        self.assertEqual(found('$500'), {pv})
+        self.assertEqual(found('៛500'), set())
+        self.assertEqual(found('>1000'), {pf})
+        self.assertEqual(found('150-250'), {pv})
+        self.assertEqual(found('rice'), set())
+        # A bare range in the "all" field reads as a date or number, not an amount
+        self.assertEqual(found('150-250', 'all'), set())
+        self.assertEqual(found('40,000', 'all'), {pf})
+
+        vouchers = filter_documents(PaymentVoucher.objects.all(), '<=300', 'amount', 'pv')
+        self.assertEqual(list(vouchers), [voucher])
+
+
+class DocumentAccessTests(ReportDataTestCase):
+    """DocumentAccess rows follow the creator, the current approver and the approval history"""
+
+    def test_access_follows_the_workflow(self):
+        creator, first, second = self.creators
+        voucher = PaymentVoucher.objects.create(
+            created_by=creator, payee_name='Access', payment_date=date.today(),
+            status='PENDING_L2', current_approver=first,
+        )
+        self.assertTrue(DocumentAccess.has_access(first, voucher))
+        self.assertFalse(DocumentAccess.has_access(second, voucher))
+
+        # The first approver acts and hands the voucher on
+        history = ApprovalHistory.objects.create(voucher=voucher, action='APPROVE', actor=first, actor_role_level=2)
+        voucher.status, voucher.current_approver = 'PENDING_L3', second
+        voucher.save()
+
+        visible = {
+            user: list(DocumentAccess.visible(PaymentVoucher.objects.all(), user))
+            for user in (creator, first, second)
+        }
+        self.assertEqual(visible, {creator: [voucher], first: [voucher], second: [voucher]})
+        self.assertFalse(DocumentAccess.has_access(self.user, voucher))
+
+        # Removing the history (admin "Reset to Draft") revokes the former approver
+        history.delete()
+        self.assertFalse(DocumentAccess.has_access(first, voucher))
+        self.assertTrue(DocumentAccess.has_access(creator, voucher))
+
+        voucher.delete()
+        self.assertFalse(DocumentAccess.objects.filter(doc_type='pv', document_id=voucher.pk).exists())
+
+
+class MonthlyDisbursementTests(ReportDataTestCase):
+    """The rollup applies per-document deltas that always match a full recompute"""
+
+    def cells(self):
+        return {
+            (cell.month, cell.doc_type, cell.status, cell.currency, cell.department_id):
+                (cell.total, cell.total_usd, cell.count, cell.line_count)
+            for cell in MonthlyDisbursement.objects.all()
+        }
+
+    def assertMatchesRebuild(self):
+        expected = {}
+        for model in (PaymentVoucher, PaymentForm):
+            for cell in MonthlyDisbursement.cells_for(MonthlyDisbursement.aggregate_shares(model)):
+                key = (cell.month, cell.doc_type, cell.status, cell.currency, cell.department_id)
+                expected[key] = (cell.total, cell.total_usd, cell.count, cell.line_count)
+        self.assertEqual(self.cells(), expected)
+
+    def test_changes_match_a_full_rebuild(self):
+        self.add_documents(6)
+        self.assertMatchesRebuild()
+        voucher = PaymentVoucher.objects.earliest('pk')
+        payment_form = PaymentForm.objects.latest('pk')
+
+        payment_form.status = 'APPROVED'
+        payment_form.save()
+        self.assertMatchesRebuild()
+
+        voucher.payment_date -= timedelta(days=40)
+        voucher.save()
+        self.assertMatchesRebuild()
+
+        line = voucher.line_items.get(line_number=1)
+        line.amount, line.department = Decimal('999'), self.departments[2]
+        line.save()
+        self.assertMatchesRebuild()
+
+        voucher.line_items.get(line_number=2).delete()
+        self.assertMatchesRebuild()
+
+        voucher.status = 'REJECTED'
+        voucher.save()
+        self.assertMatchesRebuild()
+        self.assertFalse(DisbursementShare.objects.filter(doc_type='pv', document_id=voucher.pk).exists())
+
+        payment_form.delete()
+        self.assertMatchesRebuild()
+
+    def test_queryset_updates_are_refreshed(self):
+        self.add_documents(4)
+        ids = list(PaymentVoucher.objects.values_list('pk', flat=True)[:2])
+        PaymentVoucher.objects.filter(pk__in=ids).update(status='DRAFT')
+
+        months = MonthlyDisbursement.refresh_documents(PaymentVoucher, ids)
+
+        self.assertTrue(months)
+        self.assertMatchesRebuild()
+
+    def test_rebuild_command(self):
+        self.add_documents(3)
+        shares = set(DisbursementShare.objects.values_list('document_id', 'currency', 'total', 'total_usd'))
+        cells = self.cells()
+
+        call_command('rebuild_monthly_disbursements', stdout=StringIO())
+
+        self.assertEqual(self.cells(), cells)
+        self.assertEqual(
+            set(DisbursementShare.objects.values_list('document_id', 'currency', 'total', 'total_usd')), shares
+        )
+
+    def test_save_cost_does_not_grow_with_the_month(self):
+        def approve_cost():
+            payment_form = PaymentForm.objects.filter(status='PENDING_L4').earliest('pk')
+            payment_form.status = 'APPROVED'
+            with CaptureQueriesContext(connection) as queries:
+                payment_form.save()
+            return len(queries)
+
+        self.add_documents(2)
+        small = approve_cost()
+        self.add_documents(40)
+        large = approve_cost()
+
+        self.assertEqual(small, large)
+        self.assertMatchesRebuild()
+
+    def test_drafts_leave_the_rollup_alone(self):
+        voucher = PaymentVoucher.objects.create(
+            created_by=self.creators[0], payee_name='Draft', payment_date=date.today(),
+        )
+        with CaptureQueriesContext(connection) as queries:
+            VoucherLineItem.objects.create(
+                voucher=voucher, line_number=1, description='Draft line', department=self.departments[0],
+                amount=Decimal('10'), currency='USD',
+            )
+        self.assertFalse([q for q in queries if 'disbursement' in q['sql'].lower()])
+        self.assertEqual(self.cells(), {})
+
+    def line_item_totals(self):
+        """Per-department totals summed from the submitted documents' line items"""
+        expected = {}
+        lines = chain(
+            ((line, line.voucher) for line in VoucherLineItem.objects.select_related('voucher', 'department')),
+            ((line, line.payment_form) for line in FormLineItem.objects.select_related('payment_form', 'department')),
+        )
+        for line, document in lines:
+            if document.status not in MonthlyDisbursement.DISBURSED_STATUSES:
+                continue
+            department = expected.setdefault(line.department.name, {'usd_equivalent': Decimal('0'), 'line_count': 0})
+            department[line.currency] = department.get(line.currency, Decimal('0')) + line.get_total()
+            department['usd_equivalent'] += convert_totals([(document.payment_date, {line.currency: line.get_total()})])[0]
+            department['line_count'] += 1
+        return expected
+
+    def test_department_totals_match_the_line_items(self):
+        self.add_documents(6)
+        rejected = PaymentVoucher.objects.earliest('pk')
+        rejected.status = 'REJECTED'
+        rejected.save()
+
+        totals = MonthlyDisbursement.department_totals(MonthlyDisbursement.objects.all())
+        expected = self.line_item_totals()
+
+        self.assertEqual(set(totals), {d.name for d in self.departments})
+        for name, department in expected.items():
+            self.assertEqual(set(totals[name]), set(department), name)
+            for key, value in department.items():
+                self.assertAlmostEqual(float(totals[name][key]), float(value), places=2, msg=f'{name} {key}')
+
+    def test_department_filter_finds_documents_with_a_line_in_the_department(self):
+        self.add_documents(3)
+        operations, finance, _ = self.departments
+        split = PaymentVoucher.objects.create(
+            created_by=self.creators[0], payee_name='Split', payment_date=date.today(), status='APPROVED',
+        )
+        for number, department in enumerate((operations, finance, finance), start=1):
+            VoucherLineItem.objects.create(
+                voucher=split, line_number=number, description='Shared', department=department,
+                amount=Decimal('10'), currency='USD',
+            )
+
+        for model, lines in ((PaymentVoucher, VoucherLineItem), (PaymentForm, FormLineItem)):
+            fk_name = model.line_items.field.name
+            for department in self.departments:
+                expected = set(lines.objects.filter(department=department).values_list(f'{fk_name}_id', flat=True))
+                by_instance = model.objects.filter(MonthlyDisbursement.department_filter(model, department=department))
+                by_name = model.objects.filter(
+                    MonthlyDisbursement.department_filter(model, department__name=department.name)
+                )
+                # One row per document, however many of its lines are in the department
+                self.assertEqual(sorted(by_instance.values_list('pk', flat=True)), sorted(expected))
+                self.assertEqual(set(by_name.values_list('pk', flat=True)), expected)
+
+        finance_vouchers = PaymentVoucher.objects.filter(MonthlyDisbursement.department_filter(PaymentVoucher, department=finance))
+        self.assertIn(split, finance_vouchers)
+
+
+class CurrencyConversionTests(ReportDataTestCase):
+    """USD conversion at the date-effective rates (KHR is seeded at 4100 per USD from 2020)"""
+
+    def setUp(self):
+        # A new RATES version, so no rate table cached by an earlier (rolled back) test is reused
+        cache.clear()
+
+    def add_voucher(self, payment_date, amount='4000', currency='KHR'):
+        voucher = PaymentVoucher.objects.create(
+            pv_number=f'FX-{PaymentVoucher.objects.count():04d}', created_by=self.user,
+            payee_name='Exchange', payment_date=payment_date, status='APPROVED',
+        )
+        VoucherLineItem.objects.create(
+            voucher=voucher, line_number=1, description='Local costs', department=self.departments[0],
+            amount=Decimal(amount), currency=currency,
+        )
+        return voucher
+
+    def sql_usd(self, voucher):
+        line_usd = VoucherLineItem.objects.filter(voucher=voucher).aggregate(
+            usd=Sum(usd_amount(F('amount'), 'currency', 'voucher__payment_date'))
+        )['usd']
+        document = PaymentVoucher.objects.filter(pk=voucher.pk).aggregate(usd=Sum(document_usd()))['usd']
+        self.assertAlmostEqual(line_usd, document, places=3)
+        return document
+
+    def python_usd(self, voucher):
+        voucher.refresh_from_db()
+        return convert_totals([(voucher.payment_date, voucher.get_stored_totals())])[0]
+
+    def test_whole_amounts_convert_to_fractions(self):
+        voucher = self.add_voucher(date.today())
+
+        self.assertAlmostEqual(self.sql_usd(voucher), Decimal('0.976'), places=3)
+        self.assertAlmostEqual(self.python_usd(voucher), Decimal('0.976'), places=3)
+
+    def test_rates_apply_from_their_effective_date(self):
+        today = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.create(currency='KHR', effective_date=today - timedelta(days=10), rate=Decimal('4000'))
+        before = self.add_voucher(today - timedelta(days=11))
+        after = self.add_voucher(today)
+        earliest = self.add_voucher(date(2019, 6, 1))
+
+        for voucher, expected in ((before, '0.976'), (after, '1'), (earliest, '0.976')):
+            self.assertAlmostEqual(self.sql_usd(voucher), Decimal(expected), places=3)
+            self.assertAlmostEqual(self.python_usd(voucher), Decimal(expected), places=3)
+
+    def test_migration_converts_whole_amounts(self):
+        """0020 filled the rollup's total_usd with SQL division, which truncated on SQLite"""
+        self.add_voucher(date.today())
+        MonthlyDisbursement.objects.update(total_usd=Decimal('0'))
+
+        import_module('vouchers.migrations.0020_exchange_rates').populate_total_usd(apps, None)
+
+        cell = MonthlyDisbursement.objects.get(doc_type='pv', currency='KHR')
+        self.assertAlmostEqual(cell.total_usd, Decimal('0.976'), places=3)
+
+
+@skipIf(FormPDFGenerator is None, 'WeasyPrint system libraries are not installed')
+class PDFFingerprintTests(ReportDataTestCase):
+    """A cached PDF is keyed by everything it shows"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+        self.payment_form = PaymentForm.objects.create(
+            pf_number='PF-0001', created_by=self.user, payee_name='Vendor',
+            payment_date=date.today(), status='PENDING_L4',
+        )
+        self.line = FormLineItem.objects.create(
+            payment_form=self.payment_form, line_number=1, description='Supplies',
+            department=self.departments[0], amount=Decimal('350'), currency='THB',
+        )
+
+    def key(self, include_attachments=True):
+        payment_form = PaymentForm.objects.get(pk=self.payment_form.pk)
+        return FormPDFGenerator.cache_key(payment_form, include_attachments)[0]
+
+    def test_unchanged_form_keeps_its_key(self):
+        self.assertEqual(self.key(), self.key())
+
+    def test_line_item_change_gives_a_new_key(self):
+        before = self.key()
+        self.line.description = 'Supplies and delivery'
+        self.line.save()
+        self.assertNotEqual(self.key(), before)
+
+    def test_approval_gives_a_new_key(self):
+        before = self.key()
+        FormApprovalHistory.objects.create(
+            payment_form=self.payment_form, action='APPROVE', actor=self.user, actor_role_level=3,
+        )
+        self.assertNotEqual(self.key(), before)
+
+    def test_attachment_gives_a_new_key(self):
+        before, without_attachments = self.key(), self.key(include_attachments=False)
+        FormAttachment.objects.create(
+            payment_form=self.payment_form, file=SimpleUploadedFile('quote.pdf', b'%PDF-1.4 quote'),
+            filename='quote.pdf', file_size=14, uploaded_by=self.user,
+        )
+        self.assertNotEqual(self.key(), before)
+        self.assertEqual(self.key(include_attachments=False), without_attachments)
+
+
+class PDFRenderCacheTests(SimpleTestCase):
+    """Disk cache of rendered PDFs"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = PDFRenderCache(directory.name, max_bytes=1024 * 1024)
+
+    def test_concurrent_callers_render_once(self):
+        renders, results = [], []
+
+        def render(output):
+            renders.append(threading.get_ident())
+            time.sleep(0.2)
+            output.write(b'%PDF-1.4 form')
+
+        def download():
+            with self.store.get_or_render('form', render) as pdf_file:
+                results.append(pdf_file.read())
+
+        threads = [threading.Thread(target=download) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(renders), 1)
+        self.assertEqual(results, [b'%PDF-1.4 form'] * 5)
+
+    def test_evicts_least_recently_used(self):
+        self.store = PDFRenderCache(self.store.directory, max_bytes=25)
+        for key in ('first', 'second', 'third'):
+            self.store.put(key, lambda output: output.write(b'x' * 10)).close()
+            time.sleep(0.01)
+
+        self.assertIsNone(self.store.open('first'))
+        with self.store.open('third') as pdf_file:
+            self.assertEqual(pdf_file.read(), b'x' * 10)
+
+
+@skipIf(PDFRenderer is None, 'WeasyPrint system libraries are not installed')
+class ResourceCacheTests(SimpleTestCase):
+    """Fetched fonts and images are kept in memory until they change"""
+
+    def test_evicts_least_recently_used_past_max_bytes(self):
+        resources = ResourceCache(max_bytes=25)
+        for url in ('first', 'second'):
+            resources.put(url, (url, b'x' * 10, 'image/png', None))
+        resources.get('first')
+        resources.put('third', ('third', b'x' * 10, 'image/png', None))
+
+        self.assertIsNone(resources.get('second'))
+        self.assertIsNotNone(resources.get('first'))
+        self.assertEqual(resources.size, 20)
+
+        resources.put('large', ('large', b'x' * 26, 'image/png', None))
+        self.assertIsNone(resources.get('large'))
+        self.assertEqual(resources.size, 20)
+
+    def test_changed_local_file_is_fetched_again(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'Logo.png')
+        with open(path, 'wb') as image:
+            image.write(b'old logo')
+        url = f'file://{path}'
+
+        def download(url):
+            with open(path, 'rb') as image:
+                return url, image.read(), 'image/png', None
+
+        renderer = PDFRenderer()
+        with mock.patch.object(renderer, '_download', side_effect=download) as downloads:
+            self.assertEqual(renderer.fetch(url)[1], b'old logo')
+            self.assertEqual(renderer.fetch(url)[1], b'old logo')
+            self.assertEqual(downloads.call_count, 1)
+
+            with open(path, 'wb') as image:
+                image.write(b'new logo')
+            modified = os.stat(path).st_mtime_ns + 1_000_000_000
+            os.utime(path, ns=(modified, modified))
+
+            self.assertEqual(renderer.fetch(url)[1], b'new logo')
+            self.assertEqual(downloads.call_count, 2)
+
+    def test_missing_local_file_is_not_cached(self):
+        renderer = PDFRenderer()
+        with mock.patch.object(renderer, '_download', return_value=('', b'', None, None)) as downloads:
+            renderer.fetch('file:///nonexistent/Logo.png')
+            renderer.fetch('file:///nonexistent/Logo.png')
+        self.assertEqual(downloads.call_count, 2)
+        self.assertEqual(renderer.resources.size, 0)
+
+
+class PDFRenderJobTests(ReportDataTestCase):
+    """The PDF attachment queue worked by run_pdf_workers"""
+
+    def setUp(self):
+        self.jobs = []
+        for i in range(2):
+            voucher = PaymentVoucher.objects.create(
+                pv_number=f'PDF-{i}', created_by=self.user, payee_name='Payee',
+                payment_date=date.today(), status='APPROVED',
+            )
+            self.jobs.append(queue_pdf_render(voucher, self.user))
+        attach = mock.patch('workflow.services.AutoAttachmentService.attach_pdf_to_approved_document')
+        self.attach = attach.start()
+        self.addCleanup(attach.stop)
+
+    def job(self, index=0):
+        return PDFRenderJob.objects.get(pk=self.jobs[index].pk)
+
+    def make_due(self, index=0):
+        """Make a job due now, ahead of the other one"""
+        PDFRenderJob.objects.filter(pk=self.jobs[index].pk).update(available_at=timezone.now() - timedelta(hours=1))
+
+    def test_claim_takes_each_job_once(self):
+        PDFRenderJob.objects.filter(pk=self.jobs[1].pk).update(available_at=timezone.now() + timedelta(minutes=1))
+
+        self.assertEqual(claim_jobs(5), [self.jobs[0].pk])
+        self.assertEqual(claim_jobs(5), [])
+        job = self.job()
+        self.assertEqual((job.status, job.attempts), ('RUNNING', 1))
+        self.assertEqual(job.heartbeat_at, job.started_at)
+
+        self.assertEqual(render_job(job.pk).status, 'DONE')
+        self.assertEqual(self.job().status, 'DONE')
+
+    def test_failures_are_retried_with_backoff(self):
+        self.attach.side_effect = RuntimeError('Pango crashed')
+
+        for attempt in (1, 2, 3):
+            self.make_due()
+            claim_jobs(1)
+            started = timezone.now()
+            job = render_job(self.jobs[0].pk)
+            self.assertEqual((job.status, job.attempts, job.error), ('PENDING', attempt, 'Pango crashed'))
+            delay = RETRY_BASE_DELAY * 2 ** (attempt - 1)
+            self.assertGreaterEqual(self.job().available_at, started + delay)
+            self.assertEqual(claim_jobs(1), [self.jobs[1].pk] if attempt == 1 else [])
+
+    def test_failed_after_max_attempts(self):
+        self.attach.side_effect = RuntimeError('Pango crashed')
+
+        for _ in range(MAX_ATTEMPTS):
+            self.make_due()
+            claim_jobs(1)
+            job = render_job(self.jobs[0].pk)
+
+        self.assertEqual((job.status, job.attempts), ('FAILED', MAX_ATTEMPTS))
+        self.assertIsNotNone(self.job().finished_at)
+        self.make_due()
+        self.assertNotIn(self.jobs[0].pk, claim_jobs(5))
+
+    def test_live_render_is_not_requeued(self):
+        claim_jobs(1)
+        PDFRenderJob.objects.filter(pk=self.jobs[0].pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(requeue_stale_jobs(), 0)
+
+        PDFRenderJob.objects.filter(pk=self.jobs[0].pk).update(heartbeat_at=timezone.now() - RUNNING_TIMEOUT * 2)
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(self.job().status, 'PENDING')
+
+    def test_render_that_lost_its_claim_leaves_the_job_alone(self):
+        claim_jobs(1)
+
+        reclaimed = []
+
+        def render_while_requeued(document, user):
+            PDFRenderJob.objects.filter(pk=self.jobs[0].pk).update(heartbeat_at=timezone.now() - RUNNING_TIMEOUT * 2)
+            requeue_stale_jobs()
+            self.make_due()
+            reclaimed.extend(claim_jobs(1))
+
+        self.attach.side_effect = render_while_requeued
+        job = render_job(self.jobs[0].pk)
+
+        self.assertEqual(reclaimed, [self.jobs[0].pk])
+        self.assertEqual((job.status, job.attempts), ('RUNNING', 2))
+        self.assertEqual(self.job().status, 'RUNNING')
+
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+FILE_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': '/tmp'}}
+
+
+class CacheTests(TestCase):
+    """Versioned cache keys and the shared backend check"""
+
+    @override_settings(DEBUG=False, CACHES=LOCMEM)
+    def test_per_process_cache_is_flagged_outside_debug(self):
+        self.assertEqual([w.id for w in app_cache.check_shared_backend()], ['vouchers.W001'])
+
+    def test_shared_or_debug_caches_pass(self):
+        with override_settings(DEBUG=True, CACHES=LOCMEM):
+            self.assertEqual(app_cache.check_shared_backend(), [])
+        with override_settings(DEBUG=False, CACHES=FILE_CACHE):
+            self.assertEqual(app_cache.check_shared_backend(), [])
+
+    def setUp(self):
+        cache.clear()
+
+    def bump(self, *scopes):
+        with self.captureOnCommitCallbacks(execute=True):
+            app_cache.bump(*scopes)
+
+    def test_key_names_its_scopes(self):
+        key = app_cache.versioned_key('counts:1', (app_cache.WORKFLOW, app_cache.BATCHES))
+        self.assertRegex(key, r'^counts:1@workflow=\d+,batches=\d+$')
+        self.assertEqual(app_cache.versioned_key('counts:1', ()), 'counts:1')
+
+    def test_bump_invalidates_the_scope(self):
+        computed = []
+
+        def compute():
+            computed.append(1)
+            return len(computed)
+
+        self.assertEqual(app_cache.get_or_compute('counts:1', app_cache.WORKFLOW, None, compute), 1)
+        self.assertEqual(app_cache.get_or_compute('counts:1', app_cache.WORKFLOW, None, compute), 1)
+        self.bump(app_cache.BATCHES)
+        self.assertEqual(app_cache.get_or_compute('counts:1', app_cache.WORKFLOW, None, compute), 1)
+        self.bump(app_cache.WORKFLOW)
+        self.assertEqual(app_cache.get_or_compute('counts:1', app_cache.WORKFLOW, None, compute), 2)
+
+    def test_document_fragments_do_not_collide(self):
+        template = Template(
+            '{% load app_cache %}'
+            '{% cachedfragment "voucher-sidebar" scope=voucher|document_scope %}'
+            '{{ voucher.payee_name }}{% endcachedfragment %}'
+        )
+        first = PaymentVoucher(pk=1, payee_name='First')
+        second = PaymentVoucher(pk=2, payee_name='Second')
+        # Both scopes at the same version: only the scope names tell the entries apart
+        for document in (first, second):
+            cache.set(f'{app_cache.VERSION_PREFIX}{app_cache.document_scope(document)}', 1, None)
+
+        self.assertEqual(template.render(Context({'voucher': first})), 'First')
+        self.assertEqual(template.render(Context({'voucher': second})), 'Second')
+
+        first.payee_name = 'Renamed'
+        self.assertEqual(template.render(Context({'voucher': first})), 'First')
+        self.bump(app_cache.document_scope(first))
+        self.assertEqual(template.render(Context({'voucher': first})), 'Renamed')
+        self.assertEqual(template.render(Context({'voucher': second})), 'Second')
+
+
+class PendingCountsTests(ReportDataTestCase):
+    """The badge counts on every page are cached until a transition or batch changes them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.md = User.objects.create_user(
+            username='md', password='x', role_level=6, is_approved=True, email_verified=True,
+        )
+        cls.voucher = PaymentVoucher.objects.create(
+            pv_number='PV-PENDING', created_by=cls.creators[0], payee_name='Payee',
+            payment_date=date.today(), status='PENDING_L3', current_approver=cls.user,
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def render(self, user):
+        """Render a page as the user: (badge context, number of badge count queries)"""
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('accounts:profile'))
+        self.assertEqual(response.status_code, 200)
+        badge_queries = [
+            query['sql'] for query in queries
+            if 'COUNT(' in query['sql'] and ('current_approver_id' in query['sql'] or 'signaturebatch' in query['sql'])
+        ]
+        return (response.context['pending_count'], response.context['pending_batches']), len(badge_queries)
+
+    def test_second_render_runs_no_count_queries(self):
+        counts, first_queries = self.render(self.user)
+        self.assertEqual(counts, (1, 0))
+        self.assertEqual(first_queries, 2)
+
+        counts, second_queries = self.render(self.user)
+        self.assertEqual(counts, (1, 0))
+        self.assertEqual(second_queries, 0)
+
+    def test_transition_expires_the_counts(self):
+        self.render(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            VoucherStateMachine.transition(self.voucher, 'approve', self.user)
+
+        counts, queries = self.render(self.user)
+        self.assertEqual(counts, (0, 0))
+        self.assertEqual(queries, 2)
+
+    def test_batch_expires_the_counts(self):
+        self.assertEqual(self.render(self.md)[0], (0, 0))
+        with self.captureOnCommitCallbacks(execute=True):
+            SignatureBatch.objects.create(created_by=self.user)
+
+        counts, queries = self.render(self.md)
+        self.assertEqual(counts, (1, 1))
+        self.assertEqual(queries, 1)
+
+
+class ExcelExportTests(ReportDataTestCase):
+    """The report, template and batch workbooks written by the streaming Excel engine"""
+
+    def setUp(self):
+        cache.clear()
+        today = date.today()
+        self.acleda = CompanyBankAccount.objects.create(
+            company_name='Phat Phnom Penh', account_number='001', currency='USD', bank='ACLEDA Bank',
+        )
+        self.aba = CompanyBankAccount.objects.create(
+            company_name='Phat Phnom Penh', account_number='002', currency='USD', bank='ABA Bank',
+        )
+        self.first = self.add_document(PaymentVoucher, 'PV-1', self.acleda, today - timedelta(days=2), [
+            ('Service A', '100', 'USD'), ('Local costs', '41000', 'KHR'),
+        ])
+        self.second = self.add_document(PaymentVoucher, 'PV-2', self.aba, today - timedelta(days=1), [
+            ('Service B', '50', 'USD'),
+        ])
+        self.form = self.add_document(PaymentForm, 'PF-1', self.acleda, today - timedelta(days=1), [
+            ('Supplies', '20', 'USD'),
+        ])
+
+    def add_document(self, model, number, account, payment_date, lines):
+        voucher = model is PaymentVoucher
+        document = model.objects.create(
+            **{'pv_number' if voucher else 'pf_number': number}, created_by=self.user,
+            payee_name=f'Payee {number}', payment_date=payment_date, status='APPROVED',
+            company_bank_account=account, bank_name='Receiver', bank_account_number=f'R-{number}',
+        )
+        line_model, parent = (VoucherLineItem, 'voucher') if voucher else (FormLineItem, 'payment_form')
+        for line_number, (description, amount, currency) in enumerate(lines, 1):
+            line_model.objects.create(
+                **{parent: document}, line_number=line_number, description=description,
+                department=self.departments[0], amount=Decimal(amount), currency=currency,
+            )
+        return document
+
+    def load(self, output):
+        worksheet = load_workbook(output).active
+        rows = list(worksheet.iter_rows(values_only=True))
+        return worksheet, rows, {str(cell_range) for cell_range in worksheet.merged_cells.ranges}
+
+    def row_of(self, rows, column, value):
+        """1-based number of the first row with value in column (0-based)"""
+        return next(number for number, row in enumerate(rows, 1) if len(row) > column and row[column] == value)
+
+    def test_iter_documents_merges_by_key(self):
+        vouchers = PaymentVoucher.objects.order_by('payment_date', 'pk')
+        forms = PaymentForm.objects.order_by('payment_date', 'pk')
+        # Equal keys keep the order of the querysets: the voucher before the form
+        self.assertEqual(
+            list(iter_documents(vouchers, forms, key=lambda doc: doc.payment_date)),
+            [self.first, self.second, self.form],
+        )
+        self.assertEqual(
+            list(iter_documents(forms, vouchers, key=lambda doc: doc.payment_date)),
+            [self.first, self.form, self.second],
+        )
+        self.assertEqual(list(iter_documents(vouchers)), [self.first, self.second])
+
+    def test_report_workbook(self):
+        worksheet, rows, merged = self.load(ReportGenerator({'status': 'APPROVED'}).export_to_excel())
+
+        self.assertEqual(rows[0][0], COMPANY_NAME)
+        self.assertTrue({'A1:H1', 'A2:F2', 'G2:H2'} <= merged)
+
+        # Sections in BANK_SECTIONS order, with their documents and per-currency subtotals
+        ac_pv = self.row_of(rows, 7, 'AC PV')
+        self.assertEqual(rows[ac_pv - 1][0], 'Transfer by Account: Phat Phnom Penh, Account Number 001 (USD) ACLEDA Bank')
+        self.assertIn(f'A{ac_pv}:G{ac_pv}', merged)
+        self.assertEqual(rows[ac_pv + 1][:7], (1, 'PV-1', 'Payee PV-1', 'Service A\nLocal costs', '$100.00\n៛41,000.00', 'Receiver', 'R-PV-1'))
+        self.assertEqual(rows[ac_pv + 2][0], 'Subtotal - AC PV (USD)')
+        self.assertEqual(rows[ac_pv + 3][:5], ('Subtotal - AC PV (KHR)', None, None, None, '៛41,000.00'))
+        self.assertIn(f'A{ac_pv + 3}:D{ac_pv + 3}', merged)
+        self.assertLess(ac_pv, self.row_of(rows, 7, 'ABA PV'))
+        # Numbered per section
+        self.assertEqual(rows[self.row_of(rows, 1, 'PV-2') - 1][:2], (1, 'PV-2'))
+        self.assertEqual(rows[self.row_of(rows, 1, 'PF-1') - 1][:2], (1, 'PF-1'))
+        # A section without documents keeps three empty rows
+        aba_pf = self.row_of(rows, 7, 'ABA PF')
+        self.assertEqual(rows[aba_pf - 1][0], 'Transfer by Account: ABA Bank (No account assigned)')
+
+        totals = {row[0]: row[4] for row in rows if row and str(row[0]).startswith('GRAND TOTAL')}
+        self.assertEqual(totals, {
+            'GRAND TOTAL (USD)': '$170.00',
+            'GRAND TOTAL (KHR)': '៛41,000.00',
+            'GRAND TOTAL (USD equivalent)': '$180.00',
+        })
+        self.assertEqual(worksheet.print_area, f"'Payment Summary by Bank'!$A$1:$H${len(rows)}")
+
+    def test_template_workbook(self):
+        worksheet, rows, merged = self.load(build_template_sheet({}).to_file())
+
+        self.assertEqual(rows[1][0], 'Summary Payment Voucher')
+        self.assertEqual(rows[2][3], '001')
+        self.assertTrue({'A5:A6', 'B5:B6', 'E5:E6', 'H5:H6', 'F5:G5'} <= merged)
+        self.assertEqual(rows[5][5:7], ('Account Name', 'Account Number'))
+        # Documents from row 7, vouchers and forms merged by payment date
+        self.assertEqual([row[:3] for row in rows[6:9]], [
+            (1, 'PV-1', 'Payee PV-1'), (2, 'PV-2', 'Payee PV-2'), (3, 'PF-1', 'Payee PF-1'),
+        ])
+        self.assertEqual(rows[6][4:7], ('$100.00\n៛41,000.00', 'Phat Phnom Penh', '001'))
+        self.assertEqual([row[3:5] for row in rows[9:11]], [('Total (USD):', '$170.00'), ('Total (KHR):', '៛41,000.00')])
+
+        _, rows, _ = self.load(build_template_sheet({'doc_type': 'PF'}).to_file())
+        self.assertEqual(rows[6][:2], (1, 'PF-1'))
+        self.assertEqual(rows[7][3:5], ('Total (USD):', '$20.00'))
+
+    def test_batch_workbook(self):
+        batch = SignatureBatch.objects.create(created_by=self.user, fm_notes='Urgent')
+        BatchVoucherItem.objects.create(batch=batch, voucher=self.first)
+        BatchFormItem.objects.create(batch=batch, payment_form=self.form)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('vouchers:batch_export_excel', args=[batch.pk]))
+
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        self.assertIn(f'attachment; filename="Batch_{batch.batch_number}_', response['Content-Disposition'])
+        worksheet, rows, merged = self.load(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(rows[1][0], f'Signature Batch - {batch.batch_number}')
+        self.assertEqual(rows[3][0], 'FM Notes: Urgent')
+        header = self.row_of(rows, 1, 'Doc No.')
+        self.assertTrue({f'A{header}:A{header + 1}', f'G{header}:H{header}'} <= merged)
+        # Amounts in USD, the KHR line at the seeded 4100 per USD
+        self.assertEqual([row[1:6] for row in rows[header + 1:header + 3]], [
+            ('PV-1', 'Payee PV-1', 'Service A\nLocal costs', 110.0, 'ACLEDA Bank'),
+            ('PF-1', 'Payee PF-1', 'Supplies', 20.0, 'ACLEDA Bank'),
+        ])
+        self.assertEqual(rows[header + 3][3:5], ('GRAND TOTAL:', 130.0))
+        self.assertEqual(worksheet[f'E{header + 4}'].number_format, AMOUNT_FORMAT)
+
+
+class RawExportTests(ReportDataTestCase):
+    """CSV / JSON Lines exports of the filtered documents or line items"""
+
+    def setUp(self):
+        type(self).created = 0
+        self.add_documents(2)
+        self.client.force_login(self.user)
+
+    def export(self, output_format, **params):
+        response = self.client.get(reverse(f'vouchers:export_{output_format}'), params)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        if output_format == 'csv':
+            return response, list(csv.reader(StringIO(content)))
+        return response, [json.loads(line) for line in content.splitlines()]
+
+    def test_documents_csv(self):
+        response, rows = self.export('csv')
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertRegex(response['Content-Disposition'], r'attachment; filename="vouchers_documents_\d+_\d+\.csv"')
+        self.assertEqual(rows[0], [column for column, _, _ in DOCUMENT_COLUMNS])
+        columns = rows[0]
+        rows = [dict(zip(columns, row)) for row in rows[1:]]
+        # Vouchers first, then forms, each in payment date order (document 1 is paid first)
+        self.assertEqual([(row['doc_type'], row['number']) for row in rows], [
+            ('PV', 'BENCH-0001'), ('PV', 'BENCH-0000'), ('PF', 'BENCH-0001'), ('PF', 'BENCH-0000'),
+        ])
+        self.assertEqual(
+            [(row['status'], row['line_count'], Decimal(row['total_usd']), Decimal(row['total_khr'])) for row in rows[:2]],
+            [('APPROVED', '2', Decimal('101'), Decimal('41000')), ('APPROVED', '2', Decimal('100'), Decimal('41000'))],
+        )
+        # Form totals include VAT
+        self.assertEqual([Decimal(row['total_thb']) for row in rows[2:]], [Decimal('386.1'), Decimal('385')])
+        self.assertEqual(rows[1]['created_by'], 'creator0')
+
+    def test_filters_apply(self):
+        _, rows = self.export('csv', status='APPROVED')
+        self.assertEqual([row[0] for row in rows[1:]], ['PV', 'PV'])
+
+        _, rows = self.export('jsonl', doc_type='PF', department='Finance')
+        self.assertEqual([(row['doc_type'], row['payee_name']) for row in rows], [('PF', 'Vendor 1')])
+
+    def test_lines_jsonl(self):
+        response, rows = self.export('jsonl', level='lines')
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual(list(rows[0]), [column for column, _, _ in LINE_COLUMNS])
+        self.assertEqual(
+            [(row['doc_type'], row['number'], row['line_number']) for row in rows],
+            [('PV', 'BENCH-0001', 1), ('PV', 'BENCH-0001', 2), ('PV', 'BENCH-0000', 1), ('PV', 'BENCH-0000', 2),
+             ('PF', 'BENCH-0001', 1), ('PF', 'BENCH-0000', 1)],
+        )
+        voucher_line, form_line = rows[2], rows[5]
+        self.assertEqual((voucher_line['department'], voucher_line['currency']), ('Operations', 'USD'))
+        self.assertEqual(Decimal(voucher_line['amount_with_vat']), Decimal(voucher_line['amount']))
+        # VAT is added on VAT-applicable lines only
+        self.assertTrue(form_line['vat_applicable'])
+        self.assertEqual(Decimal(form_line['amount_with_vat']), Decimal('385'))
+
+    def test_lines_csv(self):
+        _, rows = self.export('csv', level='lines', status='PENDING_L4')
+        self.assertEqual(rows[0], [column for column, _, _ in LINE_COLUMNS])
+        self.assertEqual(
+            [(row[0], row[-4], row[-3], row[-1]) for row in rows[1:]],
+            [('PF', 'THB', '351.00', '386.100'), ('PF', 'THB', '350.00', '385.000')],
+        )
+
+    def test_unknown_level_is_refused(self):
+        response = self.client.get(reverse('vouchers:export_csv'), {'level': 'cells'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('level must be one of', response.json()['error'])
+
+
+class ExportJobTests(ReportDataTestCase):
+    """Report exports are queued, produced by the export worker and shared by identical requests"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def bump(self, *scopes):
+        with self.captureOnCommitCallbacks(execute=True):
+            app_cache.bump(*scopes)
+
+    def test_identical_requests_share_a_job_until_the_data_changes(self):
+        job, created = request_export('report_excel', {'status': 'APPROVED'}, self.user)
+        self.assertTrue(created)
+        self.assertEqual(request_export('report_excel', {'status': 'APPROVED'}, self.user), (job, False))
+        self.assertTrue(request_export('report_excel', {'status': 'REJECTED'}, self.user)[1])
+        self.assertTrue(request_export('report_pdf', {'status': 'APPROVED'}, self.user)[1])
+
+        self.bump(app_cache.RATES)
+        self.assertNotEqual(request_export('report_excel', {'status': 'APPROVED'}, self.user)[0], job)
+
+        with self.assertRaises(ValueError):
+            request_export('unknown', {}, self.user)
+
+    def test_failed_or_expired_jobs_are_not_reused(self):
+        job, _ = request_export('report_excel', {}, self.user)
+        ExportJob.objects.filter(pk=job.pk).update(status='FAILED')
+        retry, created = request_export('report_excel', {}, self.user)
+        self.assertTrue(created)
+
+        ExportJob.objects.filter(pk=retry.pk).update(created_at=timezone.now() - export_jobs.RETENTION * 2)
+        self.assertTrue(request_export('report_excel', {}, self.user)[1])
+
+    def test_worker_claims_the_oldest_job(self):
+        first, _ = request_export('report_excel', {'status': 'APPROVED'}, self.user)
+        second, _ = request_export('report_excel', {'status': 'REJECTED'}, self.user)
+        ExportJob.objects.filter(pk=first.pk).update(created_at=timezone.now() - timedelta(minutes=1))
+
+        job = claim_next_job()
+        self.assertEqual((job.pk, job.status), (first.pk, 'RUNNING'))
+        self.assertIsNotNone(job.heartbeat_at)
+        self.assertEqual(claim_next_job().pk, second.pk)
+        self.assertIsNone(claim_next_job())
+
+    def test_progress_is_saved_in_steps(self):
+        request_export('report_excel', {}, self.user)
+        job = claim_next_job()
+        progress = JobProgress(job)
+
+        progress(3, 100)
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).progress, 0)
+        progress(12, 100)
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).progress, 12)
+        progress(100, 100)
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).progress, 99)
+
+    def test_run_job_stores_the_export(self):
+        self.add_documents(3)
+        request_export('report_excel', {'status': 'APPROVED'}, self.user)
+
+        job = run_job(claim_next_job())
+
+        job = ExportJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.progress, job.error), ('DONE', 100, ''))
+        self.assertTrue(job.filename.endswith('.xlsx'))
+        with job.file.open('rb') as export:
+            self.assertEqual(export.read(2), b'PK')
+
+    def test_failures_are_recorded(self):
+        request_export('report_excel', {}, self.user)
+        with mock.patch.dict(export_jobs.EXPORTERS, report_excel=mock.Mock(side_effect=RuntimeError('boom'))):
+            job = run_job(claim_next_job())
+
+        job = ExportJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.error), ('FAILED', 'boom'))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_worker_that_lost_its_claim_keeps_the_newer_attempt(self):
+        request_export('report_excel', {}, self.user)
+        job = claim_next_job()
+
+        def slow_export(filters, progress):
+            # Meanwhile the job was requeued as stale and claimed by another worker
+            ExportJob.objects.filter(pk=job.pk).update(started_at=timezone.now() + timedelta(seconds=1))
+            progress(50, 100)
+            return BytesIO(b'late'), 'late.xlsx'
+
+        with mock.patch.dict(export_jobs.EXPORTERS, report_excel=slow_export):
+            run_job(job)
+
+        job = ExportJob.objects.get(pk=job.pk)
+        self.assertEqual((job.status, job.progress, job.file.name), ('RUNNING', 0, ''))
+        self.assertEqual([name for _, _, names in os.walk(settings.MEDIA_ROOT) for name in names], [])
+
+    def test_only_jobs_without_a_heartbeat_are_requeued(self):
+        for status in ('APPROVED', 'REJECTED'):
+            request_export('report_excel', {'status': status}, self.user)
+        stale, live = claim_next_job(), claim_next_job()
+        ExportJob.objects.filter(pk=stale.pk).update(heartbeat_at=timezone.now() - export_jobs.RUNNING_TIMEOUT * 2)
+        # A long export whose worker is alive keeps running
+        ExportJob.objects.filter(pk=live.pk).update(started_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(export_jobs.requeue_stale_jobs(), 1)
+        self.assertEqual(ExportJob.objects.get(pk=stale.pk).status, 'PENDING')
+        self.assertEqual(ExportJob.objects.get(pk=live.pk).status, 'RUNNING')
+
+    def test_expired_jobs_are_purged_with_their_files(self):
+        request_export('report_excel', {}, self.user)
+        request_export('report_pdf', {}, self.user)
+        with mock.patch.dict(export_jobs.EXPORTERS, report_excel=lambda filters, progress: (BytesIO(b'x'), 'old.xlsx')):
+            old = run_job(claim_next_job())
+        ExportJob.objects.filter(pk=old.pk).update(finished_at=timezone.now() - export_jobs.RETENTION * 2)
+
+        self.assertEqual(export_jobs.purge_expired_jobs(), 1)
+        self.assertFalse(old.file.storage.exists(old.file.name))
+        self.assertEqual(list(ExportJob.objects.values_list('kind', flat=True)), ['report_pdf'])
+
+    def test_views_queue_poll_and_download(self):
+        self.client.force_login(self.user)
+        url = reverse('vouchers:export_job_create')
+        self.assertEqual(self.client.get(url).status_code, 405)
+        self.assertEqual(self.client.post(url, {'kind': 'unknown'}).status_code, 400)
+
+        response = self.client.post(url, {'kind': 'report_excel', 'status': 'APPROVED', 'ignored': 'x'})
+        self.assertEqual(response.status_code, 201)
+        payload = response.json()
+        self.assertEqual((payload['status'], payload['download_url']), ('PENDING', None))
+        self.assertEqual(ExportJob.objects.get().filters, {'status': 'APPROVED'})
+        self.assertEqual(self.client.post(url, {'kind': 'report_excel', 'status': 'APPROVED'}).json()['id'], payload['id'])
+
+        download = reverse('vouchers:export_job_download', args=[payload['id']])
+        self.assertEqual(self.client.get(download).status_code, 404)
+
+        with mock.patch.dict(export_jobs.EXPORTERS, report_excel=lambda filters, progress: (BytesIO(b'xlsx'), 'report.xlsx')):
+            run_job(claim_next_job())
+        payload = self.client.get(payload['status_url']).json()
+        self.assertEqual((payload['status'], payload['progress'], payload['download_url']), ('DONE', 100, download))
+
+        response = self.client.get(download)
+        self.assertIn('attachment; filename="report.xlsx"', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), b'xlsx')
+
+
+class BatchBundleTests(ReportDataTestCase):
+    """Signature batch bundles hold the approved documents the user may open, built by the export worker"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.md = User.objects.create_user(
+            username='md', password='x', role_level=6, is_approved=True, email_verified=True,
+        )
+        cls.staff = User.objects.create_user(username='staff', password='x', is_staff=True)
+        cls.clerk, cls.other = cls.creators[:2]
+        cls.batch = SignatureBatch.objects.create(created_by=cls.user, status='SIGNED', signed_by=cls.md)
+        cls.own, cls.others = (
+            PaymentVoucher.objects.create(
+                pv_number=f'PV-{i}', created_by=creator, payee_name=f'Payee {i}',
+                payment_date=date.today(), status='APPROVED',
+            )
+            for i, creator in enumerate((cls.clerk, cls.other))
+        )
+        cls.own_form, cls.others_form, cls.pending = (
+            PaymentForm.objects.create(
+                pf_number=f'PF-{i}', created_by=creator, payee_name=f'Vendor {i}',
+                payment_date=date.today(), status=status,
+            )
+            for i, (creator, status) in enumerate((
+                (cls.clerk, 'APPROVED'), (cls.other, 'APPROVED'), (cls.clerk, 'PENDING_L4'),
+            ))
+        )
+        for voucher in (cls.own, cls.others):
+            BatchVoucherItem.objects.create(batch=cls.batch, voucher=voucher)
+        for payment_form in (cls.own_form, cls.others_form, cls.pending):
+            BatchFormItem.objects.create(batch=cls.batch, payment_form=payment_form)
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+    def get_bundle(self, user, batch=None, **headers):
+        self.client.force_login(user)
+        return self.client.get(reverse('vouchers:batch_bundle_pdf', args=[(batch or self.batch).pk]), headers=headers)
+
+    def test_documents_follow_document_access(self):
+        self.assertEqual(
+            batch_documents(self.batch, self.staff), [self.own, self.others, self.own_form, self.others_form]
+        )
+        # The MD opens every voucher, but only the payment forms they have access to (as form_pdf)
+        self.assertEqual(batch_documents(self.batch, self.md), [self.own, self.others])
+        self.assertEqual(batch_documents(self.batch, self.clerk), [self.own, self.own_form])
+        self.assertEqual(batch_documents(self.batch, self.user), [])
+
+    def test_user_without_documents_is_refused(self):
+        response = self.get_bundle(self.user)
+
+        self.assertRedirects(response, reverse('vouchers:batch_detail', args=[self.batch.pk]), fetch_redirect_response=False)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_unsigned_batch_has_no_bundle(self):
+        batch = SignatureBatch.objects.create(created_by=self.user)
+        voucher = PaymentVoucher.objects.create(
+            created_by=self.clerk, payee_name='Waiting', payment_date=date.today(), status='PENDING_L6',
+        )
+        BatchVoucherItem.objects.create(batch=batch, voucher=voucher)
+        self.client.force_login(self.md)
+
+        response = self.client.get(reverse('vouchers:batch_detail', args=[batch.pk]))
+        self.assertNotContains(response, reverse('vouchers:batch_bundle_pdf', args=[batch.pk]))
+        response = self.client.get(reverse('vouchers:batch_detail', args=[self.batch.pk]))
+        self.assertContains(response, reverse('vouchers:batch_bundle_pdf', args=[self.batch.pk]))
+
+        response = self.get_bundle(self.md, batch)
+        self.assertRedirects(response, reverse('vouchers:batch_detail', args=[batch.pk]), fetch_redirect_response=False)
+        self.assertFalse(ExportJob.objects.exists())
+
+    def test_requests_share_a_job_until_a_document_changes(self):
+        documents = batch_documents(self.batch, self.staff)
+        job, created = request_bundle(self.batch, self.staff, documents)
+        self.assertTrue(created)
+        self.assertEqual(job.filters, {'batch': self.batch.pk, 'user': None})
+        self.assertEqual(request_bundle(self.batch, self.staff, documents), (job, False))
+
+        # Users restricted to some documents get their own bundle
+        clerk_job, created = request_bundle(self.batch, self.clerk, [self.own, self.own_form])
+        self.assertTrue(created)
+        self.assertEqual(clerk_job.filters, {'batch': self.batch.pk, 'user': self.clerk.pk})
+        self.assertTrue(request_bundle(self.batch, self.md, [self.own, self.others])[1])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            app_cache.bump(app_cache.document_scope(self.others))
+        self.assertEqual(request_bundle(self.batch, self.clerk, [self.own, self.own_form]), (clerk_job, False))
+        self.assertTrue(request_bundle(self.batch, self.staff, documents)[1])
+
+    def test_queued_bundle_shows_the_waiting_page(self):
+        response = self.get_bundle(self.md)
+        self.assertTemplateUsed(response, 'vouchers/batch/bundle_wait.html')
+        job = ExportJob.objects.get()
+        self.assertEqual((job.kind, job.status), ('batch_bundle', 'PENDING'))
+
+        response = self.get_bundle(self.md, x_requested_with='XMLHttpRequest')
+        self.assertEqual(response.json()['status_url'], reverse('vouchers:export_job_status', args=[job.pk]))
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+    def test_worker_builds_the_bundle_for_the_view(self):
+        self.get_bundle(self.clerk)
+        built = []
+
+        def open_bundle(batch, documents, progress=None):
+            built.append(documents)
+            return BytesIO(b'%PDF-1.4 bundle'), f'Batch_{batch.batch_number}.pdf'
+
+        with mock.patch('vouchers.bundles.open_bundle', open_bundle):
+            job = run_job(claim_next_job())
+        self.assertEqual(job.status, 'DONE')
+        self.assertEqual(built, [[self.own, self.own_form]])
+
+        response = self.get_bundle(self.clerk)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertIn('inline', response['Content-Disposition'])
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 bundle')
+
+        # The generic download goes through the batch view's access check
+        response = self.client.get(reverse('vouchers:export_job_download', args=[job.pk]))
+        self.assertRedirects(response, reverse('vouchers:batch_bundle_pdf', args=[self.batch.pk]), fetch_redirect_response=False)
+
+    def test_missing_documents_render_in_the_pool(self):
+        documents = batch_documents(self.batch, self.staff)
+        keys = [f'key{i}' for i in range(len(documents))]
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        store = PDFRenderCache(cache_dir.name)
+        with open(store.path('key0'), 'wb') as cached:
+            cached.write(b'%PDF-1.4 cached')
+
+        progress = []
+        with (
+            mock.patch('vouchers.bundles.render_cache', store),
+            mock.patch('vouchers.bundles.get_pool', return_value=ThreadPoolExecutor(2)) as get_pool,
+            mock.patch('vouchers.pdf_pool.render_document', side_effect=lambda *args: args) as render_document,
+        ):
+            render_missing(documents, keys, lambda done, total: progress.append((done, total)))
+
+        get_pool.assert_called_once()
+        self.assertCountEqual(
+            [call.args for call in render_document.call_args_list],
+            [('pv', self.others.pk), ('pf', self.own_form.pk), ('pf', self.others_form.pk)],
+        )
+        self.assertEqual(progress, [(2, 4), (3, 4), (4, 4)])
+
+    def test_reports_page_cannot_queue_bundles(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('vouchers:export_job_create'), {'kind': 'batch_bundle', 'batch': self.batch.pk})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ExportJob.objects.exists())
+
+
+def image_file(size, mode='RGB', format='PNG', exif=None):
+    """An image of the given size, as bytes"""
+    output = BytesIO()
+    Image.new(mode, size, 'red').save(output, format, **({'exif': exif} if exif else {}))
+    return output.getvalue()
+
+
+class DerivativeTests(ReportDataTestCase):
+    """Image attachments are merged as downscaled one-page PDF derivatives"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+        self.payment_form = PaymentForm.objects.create(
+            created_by=self.user, payee_name='Vendor', payment_date=date.today(), status='DRAFT',
+        )
+
+    def page_size(self, image, **kwargs):
+        output = BytesIO()
+        convert_image_to_pdf(BytesIO(image_file(image, **kwargs)), output)
+        reader = PdfReader(output)
+        self.assertEqual(len(reader.pages), 1)
+        box = reader.pages[0].mediabox
+        return round(float(box.width)), round(float(box.height))
+
+    def attach(self, filename, content):
+        return FormAttachment.objects.create(
+            payment_form=self.payment_form, file=SimpleUploadedFile(filename, content),
+            filename=filename, file_size=len(content), uploaded_by=self.user,
+        )
+
+    def test_large_images_fit_an_a4_page(self):
+        # A4 at 300 dpi, in both orientations
+        self.assertEqual(self.page_size((2480, 3508), mode='RGBA'), (595, 842))
+        self.assertEqual(self.page_size((3508, 2480), mode='P'), (842, 595))
+        self.assertEqual(self.page_size((4000, 6000)), (561, 842))
+
+        output = BytesIO()
+        convert_image_to_pdf(BytesIO(image_file((4000, 6000))), output)
+        image = PdfReader(output).pages[0].images[0].image
+        self.assertLessEqual(image.height, round(11.69 * DERIVATIVE_DPI))
+        self.assertEqual(image.mode, 'RGB')
+
+    def test_small_images_keep_their_pixels(self):
+        self.assertEqual(self.page_size((200, 100)), (144, 72))
+
+    def test_exif_orientation_is_applied(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90 degrees: shown in portrait
+        self.assertEqual(self.page_size((300, 100), format='JPEG', exif=exif), (72, 216))
+
+    def test_derivative_is_stored_once(self):
+        attachment = self.attach('receipt.jpg', image_file((50, 50), format='JPEG'))
+
+        derivative = create_derivative(attachment)
+        self.assertTrue(derivative.name.endswith('receipt.jpg.pdf'))
+        self.assertEqual(FormAttachment.objects.get(pk=attachment.pk).pdf_derivative.name, derivative.name)
+        self.assertEqual(create_derivative(attachment).name, derivative.name)
+
+        self.assertIsNone(create_derivative(self.attach('quote.pdf', b'%PDF-1.4 quote')))
+
+    def test_first_stored_derivative_wins(self):
+        attachment = self.attach('receipt.png', image_file((50, 50)))
+        stale = FormAttachment.objects.get(pk=attachment.pk)
+        stored = create_derivative(attachment).name
+
+        # Another process converted it after this instance was loaded
+        self.assertEqual(create_derivative(stale).name, stored)
+        # and the duplicate file is removed
+        derivatives = [name for name in os.listdir(os.path.dirname(stale.pdf_derivative.path)) if name.endswith('.pdf')]
+        self.assertEqual(derivatives, [os.path.basename(stored)])
+
+    def test_missing_derivative_file_is_converted_again(self):
+        attachment = self.attach('receipt.png', image_file((50, 50)))
+        create_derivative(attachment)
+        attachment.pdf_derivative.storage.delete(attachment.pdf_derivative.name)
+
+        with open_derivative(attachment) as pdf_file:
+            self.assertEqual(len(PdfReader(pdf_file).pages), 1)
+        self.assertTrue(attachment.pdf_derivative.storage.exists(attachment.pdf_derivative.name))
+
+    def test_only_image_uploads_are_converted_in_the_background(self):
+        with mock.patch('vouchers.derivatives.threading.Thread') as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.attach('quote.pdf', b'%PDF-1.4 quote')
+            thread.assert_not_called()
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.attach('receipt.png', image_file((50, 50)))
+            thread.return_value.start.assert_called_once()
+
+
+def pdf_file(*widths):
+    """A PDF with one blank page per width (in points), as bytes"""
+    writer = PdfWriter()
+    for width in widths:
+        writer.add_blank_page(width=width, height=842)
+    output = BytesIO()
+    writer.write(output)
+    return output.getvalue()
+
+
+@skipIf(FormPDFGenerator is None, 'WeasyPrint system libraries are not installed')
+class AttachmentMergeTests(ReportDataTestCase):
+    """Attachments are appended to the document PDF in upload order"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root.name))
+
+        self.payment_form = PaymentForm.objects.create(
+            created_by=self.user, payee_name='Vendor', payment_date=date.today(), status='DRAFT',
+        )
+        self.main_pdf = tempfile.TemporaryFile()
+        self.addCleanup(self.main_pdf.close)
+        self.main_content = pdf_file(100, 101)
+        self.main_pdf.write(self.main_content)
+        self.main_pdf.seek(0)
+
+    def attach(self, filename, content):
+        return FormAttachment.objects.create(
+            payment_form=self.payment_form, file=SimpleUploadedFile(filename, content),
+            filename=filename, file_size=len(content), uploaded_by=self.user,
+        )
+
+    def merge(self, attachments):
+        with tempfile.TemporaryFile() as output:
+            FormPDFGenerator._merge_attachments_to_pdf(self.main_pdf, attachments, output)
+            output.seek(0)
+            content = output.read()
+        return content, [round(float(page.mediabox.width)) for page in PdfReader(BytesIO(content)).pages]
+
+    def test_pages_follow_the_main_pdf_in_order(self):
+        self.attach('quote.pdf', pdf_file(200, 201, 202))
+        self.attach('receipt.png', image_file((300, 100)))
+        self.attach('notes.docx', b'not merged')
+        self.attach('PF_previous.pdf', pdf_file(400))
+        self.attach('invoice.pdf', pdf_file(500))
+
+        _, widths = self.merge(self.payment_form.attachments.order_by('pk'))
+
+        self.assertEqual(widths, [100, 101, 200, 201, 202, 216, 500])
+
+    def test_corrupt_attachment_is_skipped(self):
+        self.attach('broken.pdf', b'%PDF-1.4 truncated')
+        self.attach('invoice.pdf', pdf_file(500))
+
+        _, widths = self.merge(self.payment_form.attachments.order_by('pk'))
+
+        self.assertEqual(widths, [100, 101, 500])
+
+    def test_failed_merge_keeps_the_main_pdf(self):
+        def attachments():
+            yield from self.payment_form.attachments.all()
+            raise OSError('storage unavailable')
+
+        self.attach('invoice.pdf', pdf_file(500))
+
+        content, widths = self.merge(attachments())
+
+        self.assertEqual(content, self.main_content)
+        self.assertEqual(widths, [100, 101])
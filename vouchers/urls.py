@@ -54,6 +54,11 @@ urlpatterns = [
     path('reports/', views.reports_view, name='reports'),
     path('reports/export/excel/', views.export_excel, name='export_excel'),
     path('reports/export/pdf/', views.export_pdf, name='export_pdf'),
+    path('reports/export/csv/', views.export_raw, {'output_format': 'csv'}, name='export_csv'),
+    path('reports/export/jsonl/', views.export_raw, {'output_format': 'jsonl'}, name='export_jsonl'),
+    path('reports/export/jobs/', views.export_job_create, name='export_job_create'),
+    path('reports/export/jobs/<int:pk>/', views.export_job_status, name='export_job_status'),
+    path('reports/export/jobs/<int:pk>/download/', views.export_job_download, name='export_job_download'),
 
     # Bulk Approval
     path('bulk-approval/', views.bulk_approval_view, name='bulk_approval'),
@@ -72,5 +77,6 @@ urlpatterns = [
     path('batch/bulk-sign/', batch_views.batch_bulk_sign, name='batch_bulk_sign'),
     path('batch/<int:batch_id>/remove-document/', batch_views.batch_remove_document, name='batch_remove_document'),
     path('batch/<int:batch_id>/export-excel/', batch_views.batch_export_excel, name='batch_export_excel'),
+    path('batch/<int:batch_id>/bundle-pdf/', batch_views.batch_bundle_pdf, name='batch_bundle_pdf'),
     path('md-dashboard/', batch_views.md_dashboard, name='md_dashboard'),
 ]
@@ -5,9 +5,9 @@ from django.contrib import messages
 from django.views.generic import CreateView, UpdateView, DetailView
 from django.urls import reverse_lazy
 from django.db import transaction
-from django.db.models import Q
 from django.http import FileResponse, Http404, JsonResponse
-from .models import PaymentVoucher, VoucherLineItem, VoucherAttachment, PaymentForm, FormLineItem, FormAttachment
+from .models import (PaymentVoucher, VoucherLineItem, VoucherAttachment, PaymentForm, FormLineItem, FormAttachment,
+                     DocumentAccess, ExportJob)
 from .forms import (PaymentVoucherForm, VoucherLineItemFormSet, VoucherAttachmentForm, ApprovalActionForm,
                    PaymentFormForm, FormLineItemFormSet, FormAttachmentForm)
 from workflow.state_machine import VoucherStateMachine, FormStateMachine
@@ -116,9 +116,7 @@ def voucher_repeat(request, pk):
     # but the error toast is only shown on POST — a GET just silently redirects away)
     if not (request.user.is_staff or
             request.user.role_level in [1, 6, 99] or  # Account Payable, MD, and System Admin see all
-            source_voucher.created_by == request.user or
-            source_voucher.current_approver == request.user or
-            source_voucher.approval_history.filter(actor=request.user).exists()):
+            DocumentAccess.has_access(request.user, source_voucher)):
         if request.method == 'POST':
             messages.error(request, 'You do not have permission to repeat this voucher.')
         return redirect('dashboard:home')
@@ -363,11 +361,7 @@ class VoucherDetailView(LoginRequiredMixin, DetailView):
             return PaymentVoucher.objects.all()
 
         # Other roles can see if: creator, current approver, or in approval history
-        return PaymentVoucher.objects.filter(
-            Q(created_by=user) |
-            Q(current_approver=user) |
-            Q(approval_history__actor=user)
-        ).distinct()
+        return DocumentAccess.visible(PaymentVoucher.objects.all(), user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -686,9 +680,7 @@ def download_attachment(request, pk, attachment_id):
     # Check access permissions
     user = request.user
     has_access = (
-        voucher.created_by == user or
-        voucher.current_approver == user or
-        voucher.approval_history.filter(actor=user).exists() or
+        DocumentAccess.has_access(user, voucher) or
         user.is_staff or
         user.role_level in [1, 6, 99]  # Account Payable, MD, and System Admin see all
     )
@@ -813,9 +805,7 @@ def download_form_attachment(request, pk, attachment_id):
         # Check access permissions
         user = request.user
         has_access = (
-                payment_form.created_by == user or
-                payment_form.current_approver == user or
-                payment_form.approval_history.filter(actor=user).exists() or
+                DocumentAccess.has_access(user, payment_form) or
                 user.is_staff or
                 user.role_level in [1, 6, 99]  # Account Payable, MD, and System Admin see all
         )
@@ -876,9 +866,7 @@ def voucher_pdf(request, pk):
     # Check access permissions
     user = request.user
     has_access = (
-        voucher.created_by == user or
-        voucher.current_approver == user or
-        voucher.approval_history.filter(actor=user).exists() or
+        DocumentAccess.has_access(user, voucher) or
         user.is_staff or
         user.role_level in [1, 6, 99]  # Account Payable, MD, and System Admin see all
     )
@@ -1035,9 +1023,7 @@ def form_repeat(request, pk):
     # but the error toast is only shown on POST — a GET just silently redirects away)
     if not (request.user.is_staff or
             request.user.role_level in [1, 6, 99] or  # Account Payable, MD, and System Admin see all
-            source_form.created_by == request.user or
-            source_form.current_approver == request.user or
-            source_form.approval_history.filter(actor=request.user).exists()):
+            DocumentAccess.has_access(request.user, source_form)):
         if request.method == 'POST':
             messages.error(request, 'You do not have permission to repeat this form.')
         return redirect('dashboard:home')
@@ -1283,11 +1269,7 @@ class FormDetailView(LoginRequiredMixin, DetailView):
             return PaymentForm.objects.all()
 
         # Other roles can see if: creator, current approver, or in approval history
-        return PaymentForm.objects.filter(
-            Q(created_by=user) |
-            Q(current_approver=user) |
-            Q(approval_history__actor=user)
-        ).distinct()
+        return DocumentAccess.visible(PaymentForm.objects.all(), user)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -1403,9 +1385,7 @@ def form_pdf(request, pk):
     # Check access permissions
     user = request.user
     has_access = (
-        payment_form.created_by == user or
-        payment_form.current_approver == user or
-        payment_form.approval_history.filter(actor=user).exists() or
+        DocumentAccess.has_access(user, payment_form) or
         user.is_staff
     )
 
@@ -1431,167 +1411,28 @@ def reports_view(request):
     """Display reports page with advanced filters and analytics"""
     from accounts.models import User
     from .models import Department
-    from django.db.models import Sum, Count
-    from collections import defaultdict
-    from datetime import datetime, timedelta
-
-    # Get documents after L2 (Account Supervisor) approval
-    # This includes: PENDING_L3, PENDING_L4, PENDING_L5, PENDING_L6, and APPROVED
-    allowed_statuses = ['PENDING_L3', 'PENDING_L4', 'PENDING_L5', 'PENDING_L6', 'APPROVED']
-    approved_vouchers = PaymentVoucher.objects.filter(status__in=allowed_statuses)
-    approved_forms = PaymentForm.objects.filter(status__in=allowed_statuses)
-
-    # Calculate totals by currency
-    currency_totals = {'USD': 0, 'KHR': 0, 'THB': 0, 'RMB': 0}
-    for voucher in approved_vouchers:
-        totals = voucher.calculate_grand_total()
-        for currency, amount in totals.items():
-            if currency not in currency_totals:
-                currency_totals[currency] = 0
-            currency_totals[currency] += float(amount)
-
-    for form in approved_forms:
-        totals = form.calculate_grand_total()
-        for currency, amount in totals.items():
-            if currency not in currency_totals:
-                currency_totals[currency] = 0
-            currency_totals[currency] += float(amount)
+    from .analytics import ReportAnalytics, get_report_snapshot, RECORDS_PER_PAGE, RECORDS_PER_PAGE_CHOICES
 
-    # Monthly data for last 6 months (all currencies converted to USD)
-    from dashboard.views import KHR_TO_USD, THB_TO_USD, RMB_TO_USD
-    monthly_data = defaultdict(lambda: {'PV': 0, 'PF': 0, 'amount': 0})
-    six_months_ago = datetime.now() - timedelta(days=180)
-
-    def to_usd(totals):
-        return (
-            float(totals.get('USD', 0))
-            + float(totals.get('KHR', 0)) / KHR_TO_USD
-            + float(totals.get('THB', 0)) * THB_TO_USD
-            + float(totals.get('RMB', 0)) * RMB_TO_USD
-        )
-
-    for voucher in approved_vouchers.filter(payment_date__gte=six_months_ago):
-        month_key = voucher.payment_date.strftime('%Y-%m')
-        monthly_data[month_key]['PV'] += 1
-        monthly_data[month_key]['amount'] += to_usd(voucher.calculate_grand_total())
+    # Documents after L2 (Account Supervisor) approval: PENDING_L3 .. PENDING_L6 and APPROVED.
+    # The analytics come from the stored report snapshot (refreshed on every
+    # relevant transition and nightly); ?live=1 recomputes it first.
+    analytics = ReportAnalytics()
+    snapshot = get_report_snapshot(live=request.GET.get('live') == '1')
 
-    for form in approved_forms.filter(payment_date__gte=six_months_ago):
-        month_key = form.payment_date.strftime('%Y-%m')
-        monthly_data[month_key]['PF'] += 1
-        monthly_data[month_key]['amount'] += to_usd(form.calculate_grand_total())
+    totals = snapshot.data['totals']
 
-    # Sort monthly data
+    # Monthly data for last 6 months (all currencies converted to USD)
+    monthly_data = snapshot.data['monthly']
     sorted_months = sorted(monthly_data.keys())
 
-    # Department Breakdown
-    dept_breakdown = []
-    dept_totals = defaultdict(lambda: {'count': 0, 'total_usd': 0})
-    grand_total_usd = 0
-
-    for voucher in approved_vouchers:
-        for item in voucher.line_items.all():
-            dept_name = item.department.name
-            dept_totals[dept_name]['count'] += 1
-            if item.currency == 'USD':
-                dept_totals[dept_name]['total_usd'] += float(item.get_total())
-            grand_total_usd += float(item.get_total()) if item.currency == 'USD' else 0
-
-    for form in approved_forms:
-        for item in form.line_items.all():
-            dept_name = item.department.name
-            dept_totals[dept_name]['count'] += 1
-            if item.currency == 'USD':
-                dept_totals[dept_name]['total_usd'] += float(item.get_total())
-            grand_total_usd += float(item.get_total()) if item.currency == 'USD' else 0
-
-    for dept_name, data in dept_totals.items():
-        percentage = (data['total_usd'] / grand_total_usd * 100) if grand_total_usd > 0 else 0
-        dept_breakdown.append({
-            'name': dept_name,
-            'count': data['count'],
-            'total_usd': data['total_usd'],
-            'percentage': percentage
-        })
-
-    dept_breakdown.sort(key=lambda x: x['total_usd'], reverse=True)
-
-    # Creator Breakdown (Top Creators)
-    creator_breakdown = []
-    creator_totals = defaultdict(lambda: {'pv_count': 0, 'pf_count': 0, 'total_usd': 0})
-
-    for voucher in approved_vouchers:
-        creator_name = voucher.created_by.get_full_name() or voucher.created_by.username
-        creator_totals[creator_name]['pv_count'] += 1
-        totals = voucher.calculate_grand_total()
-        creator_totals[creator_name]['total_usd'] += float(totals.get('USD', 0))
-
-    for form in approved_forms:
-        creator_name = form.created_by.get_full_name() or form.created_by.username
-        creator_totals[creator_name]['pf_count'] += 1
-        totals = form.calculate_grand_total()
-        creator_totals[creator_name]['total_usd'] += float(totals.get('USD', 0))
-
-    for creator_name, data in creator_totals.items():
-        creator_breakdown.append({
-            'name': creator_name,
-            'pv_count': data['pv_count'],
-            'pf_count': data['pf_count'],
-            'total_usd': data['total_usd']
-        })
-
-    creator_breakdown.sort(key=lambda x: x['total_usd'], reverse=True)
-
-    # All Documents Records Table
-    records = []
-
-    for voucher in approved_vouchers:
-        totals = voucher.calculate_grand_total()
-        # Get primary department from first line item
-        dept = voucher.line_items.first().department.name if voucher.line_items.exists() else '-'
-        # Get description from first line item
-        description = voucher.line_items.first().description if voucher.line_items.exists() else '-'
-
-        records.append({
-            'pk': voucher.pk,
-            'doc_type': 'PV',
-            'doc_number': voucher.pv_number or 'DRAFT',
-            'payee_name': voucher.payee_name,
-            'description': description,
-            'department': dept,
-            'payment_date': voucher.payment_date,
-            'created_by': voucher.created_by.get_full_name() or voucher.created_by.username,
-            'status': voucher.status,
-            'get_status_display': voucher.get_status_display(),
-            'total_usd': totals.get('USD', 0),
-            'total_khr': totals.get('KHR', 0),
-            'total_thb': totals.get('THB', 0),
-        })
-
-    for form in approved_forms:
-        totals = form.calculate_grand_total()
-        # Get primary department from first line item
-        dept = form.line_items.first().department.name if form.line_items.exists() else '-'
-        # Get description from first line item
-        description = form.line_items.first().description if form.line_items.exists() else '-'
-
-        records.append({
-            'pk': form.pk,
-            'doc_type': 'PF',
-            'doc_number': form.pf_number or 'DRAFT',
-            'payee_name': form.payee_name,
-            'description': description,
-            'department': dept,
-            'payment_date': form.payment_date,
-            'created_by': form.created_by.get_full_name() or form.created_by.username,
-            'status': form.status,
-            'get_status_display': form.get_status_display(),
-            'total_usd': totals.get('USD', 0),
-            'total_khr': totals.get('KHR', 0),
-            'total_thb': totals.get('THB', 0),
-        })
-
-    # Sort records by payment date descending
-    records.sort(key=lambda x: x['payment_date'], reverse=True)
+    # All Documents Records Table (one page at a time)
+    try:
+        per_page = int(request.GET.get('per_page', RECORDS_PER_PAGE))
+    except ValueError:
+        per_page = RECORDS_PER_PAGE
+    if per_page not in RECORDS_PER_PAGE_CHOICES:
+        per_page = RECORDS_PER_PAGE
+    records_page, records = analytics.records_page(request.GET.get('page'), per_page)
 
     context = {
         'users': User.objects.all().order_by('first_name', 'last_name'),
@@ -1600,34 +1441,33 @@ def reports_view(request):
         'doc_types': ['PV', 'PF'],
 
         # Analytics data
-        'total_approved': approved_vouchers.count() + approved_forms.count(),
-        'total_pv': approved_vouchers.count(),
-        'total_pf': approved_forms.count(),
-        'total_usd': currency_totals['USD'],
-        'total_khr': currency_totals['KHR'],
-        'total_thb': currency_totals['THB'],
+        'total_approved': totals['total'],
+        'total_pv': totals['pv'],
+        'total_pf': totals['pf'],
+        'total_usd': totals['USD'],
+        'total_khr': totals['KHR'],
+        'total_thb': totals['THB'],
         'monthly_labels': sorted_months,
         'monthly_pv': [monthly_data[m]['PV'] for m in sorted_months],
         'monthly_pf': [monthly_data[m]['PF'] for m in sorted_months],
         'monthly_amounts': [monthly_data[m]['amount'] for m in sorted_months],
 
         # New data for tables
-        'dept_breakdown': dept_breakdown,
-        'creator_breakdown': creator_breakdown,
+        'dept_breakdown': snapshot.data['departments'],
+        'creator_breakdown': snapshot.data['creators'],
         'records': records,
+        'records_page': records_page,
+        'per_page': per_page,
+        'per_page_choices': RECORDS_PER_PAGE_CHOICES,
+        'snapshot_at': snapshot.computed_at,
     }
 
     return render(request, 'vouchers/reports.html', context)
 
 
-@login_required
-def export_excel(request):
-    """Export filtered vouchers/forms to Excel"""
-    from .reports import ReportGenerator
-    from django.http import HttpResponse
-
-    # Get filter parameters
-    filters = {
+def report_filters(request):
+    """ReportGenerator filters from the reports page query string"""
+    return {
         'date_from': request.GET.get('date_from'),
         'date_to': request.GET.get('date_to'),
         'status': request.GET.get('status'),
@@ -1637,18 +1477,18 @@ def export_excel(request):
         'doc_type': request.GET.get('doc_type'),
     }
 
-    # Generate report
-    generator = ReportGenerator(filters)
-    excel_file = generator.export_to_excel()
 
-    # Return as download
-    response = HttpResponse(
-        excel_file,
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="vouchers_report.xlsx"'
+@login_required
+def export_excel(request):
+    """Export filtered vouchers/forms to Excel"""
+    from .reports import ReportGenerator
+    from .excel_export import xlsx_response
 
-    return response
+    filters = report_filters(request)
+
+    # Generate report and stream it as a download
+    generator = ReportGenerator(filters)
+    return xlsx_response(generator.export_to_excel(), 'vouchers_report.xlsx')
 
 
 @login_required
@@ -1657,16 +1497,7 @@ def export_pdf(request):
     from .reports import ReportGenerator
     from django.http import HttpResponse
 
-    # Get filter parameters
-    filters = {
-        'date_from': request.GET.get('date_from'),
-        'date_to': request.GET.get('date_to'),
-        'status': request.GET.get('status'),
-        'creator': request.GET.get('creator'),
-        'department': request.GET.get('department'),
-        'payee_name': request.GET.get('payee_name'),
-        'doc_type': request.GET.get('doc_type'),
-    }
+    filters = report_filters(request)
 
     # Generate report
     generator = ReportGenerator(filters)
@@ -1679,6 +1510,64 @@ def export_pdf(request):
     return response
 
 
+@login_required
+def export_raw(request, output_format):
+    """
+    Stream filtered documents (or, with ?level=lines, their line items) as raw
+    CSV or JSON Lines rows, for reconciliation scripts
+    """
+    from .raw_export import LEVELS, streaming_export_response
+
+    level = request.GET.get('level', 'documents')
+    if level not in LEVELS:
+        return JsonResponse({'error': f"level must be one of: {', '.join(LEVELS)}"}, status=400)
+
+    return streaming_export_response(report_filters(request), output_format, level)
+
+
+@login_required
+def export_job_create(request):
+    """
+    Queue a background export (POST kind plus the report filters); answers with
+    the job state to poll, reusing the job of an identical earlier request
+    """
+    from .export_jobs import REPORT_KINDS, clean_filters, job_payload, request_export
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+
+    kind = request.POST.get('kind')
+    if kind not in REPORT_KINDS:
+        return JsonResponse({'error': f"kind must be one of: {', '.join(REPORT_KINDS)}"}, status=400)
+
+    job, created = request_export(kind, clean_filters(request.POST), request.user)
+    return JsonResponse(job_payload(job), status=201 if created else 200)
+
+
+@login_required
+def export_job_status(request, pk):
+    """Progress of an export job (polled by the reports page)"""
+    from .export_jobs import job_payload
+
+    return JsonResponse(job_payload(get_object_or_404(ExportJob, pk=pk)))
+
+
+@login_required
+def export_job_download(request, pk):
+    """Download a finished export"""
+    job = get_object_or_404(ExportJob, pk=pk, status='DONE')
+    if job.kind == 'batch_bundle':
+        # Bundles are only served after the batch view's access check
+        return redirect('vouchers:batch_bundle_pdf', batch_id=job.filters['batch'])
+    if not job.file:
+        raise Http404("Export file not found")
+
+    try:
+        return FileResponse(job.file.open('rb'), as_attachment=True, filename=job.filename)
+    except FileNotFoundError:
+        raise Http404("Export file not found")
+
+
 # ============================================================================
 # BULK APPROVAL VIEWS
 # ============================================================================
@@ -2,7 +2,7 @@ from django.core.mail import send_mail
 from django.template.loader import render_to_string
 from django.utils.html import strip_tags
 from django.conf import settings
-from django.core.files.base import ContentFile
+from django.core.files import File
 import threading
 
 
@@ -35,6 +35,11 @@ class NotificationService:
             actor: User who performed the action
             comments: Optional comments
         """
+        # Final approval: queue the PDF attachment for the run_pdf_workers pool. Queued in
+        # this transaction, so it is only rendered once the approval is committed
+        if action == 'approve' and voucher.status == 'APPROVED':
+            AutoAttachmentService.queue_pdf(voucher, actor)
+
         # ⚡ Send emails in background thread for instant response (0.1s instead of 1s)
         def _send_in_background():
             if action == 'submit':
@@ -92,9 +97,6 @@ class NotificationService:
     @staticmethod
     def _notify_creator_approved(voucher, approver):
         """Notify creator that voucher was approved"""
-        # 🔥 AUTO-ATTACH PDF: Generate and save PDF as attachment
-        AutoAttachmentService.attach_pdf_to_approved_document(voucher, approver)
-
         doc_type, doc_number = NotificationService._get_document_info(voucher)
         subject = f"{doc_type} {doc_number} - APPROVED"
 
@@ -188,14 +190,32 @@ class NotificationService:
 class AutoAttachmentService:
     """Service for automatically attaching generated PDFs to approved documents"""
 
+    @staticmethod
+    def queue_pdf(document, system_user):
+        """
+        Queue the PDF attachment of an approved document for the run_pdf_workers
+        process pool (see vouchers.pdf_jobs).
+
+        Args:
+            document: PaymentVoucher or PaymentForm instance
+            system_user: User object to record as uploader (typically the last approver)
+        """
+        from vouchers.pdf_jobs import queue_pdf_render
+
+        return queue_pdf_render(document, system_user)
+
     @staticmethod
     def attach_pdf_to_approved_document(document, system_user):
         """
-        Automatically generate and attach PDF when document is approved.
+        Generate and attach the PDF of an approved document (run by the
+        run_pdf_workers pool for queued documents).
 
         Args:
             document: PaymentVoucher or PaymentForm instance (must be APPROVED)
             system_user: User object to record as uploader (typically the last approver)
+
+        Raises:
+            Exception: Rendering or saving failed (the job is retried)
         """
         # Only attach PDF if document is approved
         if document.status != 'APPROVED':
@@ -215,23 +235,24 @@ class AutoAttachmentService:
 
             # Generate PDF
             try:
-                pdf_bytes, filename = VoucherPDFGenerator.generate_pdf_file(document)
-
-                # Create attachment record
-                attachment = VoucherAttachment(
-                    voucher=document,
-                    filename=filename,
-                    file_size=len(pdf_bytes),
-                    uploaded_by=system_user
-                )
-
-                # Save PDF file using Django's file storage
-                attachment.file.save(filename, ContentFile(pdf_bytes), save=True)
+                pdf_file, filename = VoucherPDFGenerator.open_pdf_file(document)
+                with File(pdf_file, name=filename) as pdf_content:
+                    # Create attachment record
+                    attachment = VoucherAttachment(
+                        voucher=document,
+                        filename=filename,
+                        file_size=pdf_content.size,
+                        uploaded_by=system_user
+                    )
+
+                    # Save PDF file using Django's file storage (copied in chunks, not read into memory)
+                    attachment.file.save(filename, pdf_content, save=True)
 
                 print(f"✅ Auto-attached PDF: {filename} to {document.pv_number}")
 
             except Exception as e:
                 print(f"❌ Error auto-attaching PDF to {document.pv_number}: {e}")
+                raise
 
         elif hasattr(document, 'pf_number'):
             # This is a PaymentForm
@@ -246,20 +267,21 @@ class AutoAttachmentService:
 
             # Generate PDF
             try:
-                pdf_bytes, filename = FormPDFGenerator.generate_pdf_file(document)
-
-                # Create attachment record
-                attachment = FormAttachment(
-                    payment_form=document,
-                    filename=filename,
-                    file_size=len(pdf_bytes),
-                    uploaded_by=system_user
-                )
-
-                # Save PDF file using Django's file storage
-                attachment.file.save(filename, ContentFile(pdf_bytes), save=True)
+                pdf_file, filename = FormPDFGenerator.open_pdf_file(document)
+                with File(pdf_file, name=filename) as pdf_content:
+                    # Create attachment record
+                    attachment = FormAttachment(
+                        payment_form=document,
+                        filename=filename,
+                        file_size=pdf_content.size,
+                        uploaded_by=system_user
+                    )
+
+                    # Save PDF file using Django's file storage (copied in chunks, not read into memory)
+                    attachment.file.save(filename, pdf_content, save=True)
 
                 print(f"✅ Auto-attached PDF: {filename} to {document.pf_number}")
 
             except Exception as e:
                 print(f"❌ Error auto-attaching PDF to {document.pf_number}: {e}")
+                raise